@@ -0,0 +1,164 @@
+"""Cached node capabilities, so the controller link and lab changes do not wait on a health sweep.
+
+A deep ``detect_capabilities`` pass runs the managed-container sweeps and the student smoke tests
+through ``docker exec`` and can take a minute on a busy node; even the shallow pass forks
+``zfs``/``docker``/``nvidia-smi`` a dozen times. ``capabilities`` reuses a recent result instead:
+a deep pass stays fresh for ``DEEP_TTL_S`` and a shallow one for ``SHALLOW_TTL_S`` (a deep result
+also answers a shallow request, never the reverse).
+
+The latest deep result is also written to ``cfg.capabilities_cache`` so that ``hello`` can go
+out at once — even right after an agent restart — carrying the last known capabilities and when
+they were probed; the agent then re-probes in the background and pushes a ``capabilities`` frame.
+
+The agent's health watch (see ``healthwatch``) ``store``s every re-evaluation, so while it runs
+the cache tracks the node's inputs rather than its TTLs; a re-evaluation is stored as old as the
+oldest unwatched value it reused, and the watch re-runs those within ``DEEP_TTL_S`` (see
+``system.UNWATCHED_MAX_AGE_S``). Anything that changes what the probes would see also calls
+``invalidate``: node repair, container create/recreate and lab destroy in the agent, and
+``host-prepare`` from the CLI. Invalidation keeps the file (a stale snapshot is still better than
+nothing for ``hello``) but marks it unprobed; the agent notices a file rewritten by another process
+and drops its in-memory copy.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any
+
+from . import system
+from .config import AgentConfig
+
+DEEP_TTL_S = 900.0
+SHALLOW_TTL_S = 60.0
+
+
+class CapabilityCache:
+    """One node's cached capabilities. Thread-safe: read from the task worker and the event
+    loop's helper threads."""
+
+    def __init__(self, path: str, clock=time.time) -> None:
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        # deep flag -> (probed_at, Capabilities)
+        self._memory: dict[bool, tuple[float, system.Capabilities]] = {}
+        # (inode, mtime_ns) of the file as this process last wrote it; every write is a fresh
+        # inode (tmp + replace), so a rewrite by another process is always noticed.
+        self._stamp: tuple[int, int] | None = None
+
+    def _file_stamp(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _fresh(self, deep: bool, max_age_s: float) -> system.Capabilities | None:
+        if self._stamp is not None and self._file_stamp() != self._stamp:
+            self._memory.clear()  # invalidated or replaced by another process
+            self._stamp = None
+        now = self._clock()
+        for depth in (True,) if deep else (False, True):
+            entry = self._memory.get(depth)
+            if entry is not None and now - entry[0] <= max_age_s:
+                return entry[1]
+        return None
+
+    def get(self, cfg: AgentConfig, *, deep: bool = True,
+            max_age_s: float | None = None) -> system.Capabilities:
+        """Capabilities no older than ``max_age_s`` (default: the depth's TTL), probing if
+        needed. ``max_age_s=0`` always probes."""
+        if max_age_s is None:
+            max_age_s = DEEP_TTL_S if deep else SHALLOW_TTL_S
+        with self._lock:
+            cached = self._fresh(deep, max_age_s)
+        if cached is not None:
+            return cached
+        caps = system.detect_capabilities(cfg, deep=deep)
+        self.store(caps, deep=deep)
+        return caps
+
+    def store(self, caps: system.Capabilities, *, deep: bool,
+              probed_at: float | None = None) -> None:
+        """Record ``caps`` as the latest result, probed at ``probed_at`` (epoch seconds; now by
+        default). A result that reuses earlier values is as old as the oldest of them."""
+        now = self._clock() if probed_at is None else probed_at
+        with self._lock:
+            self._memory[deep] = (now, caps)
+            if deep:
+                # Only deep results are persisted: hello reports the full picture.
+                self._write({"probed_at": int(now * 1000), "capabilities": caps.to_dict()})
+
+    def last(self) -> tuple[dict[str, Any], int] | None:
+        """The latest deep capabilities dict and when it was probed (epoch ms, 0 once
+        invalidated), however old — from memory, else from the file."""
+        with self._lock:
+            entry = self._memory.get(True)
+            if entry is not None and (self._stamp is None or self._file_stamp() == self._stamp):
+                return entry[1].to_dict(), int(entry[0] * 1000)
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+            return dict(data["capabilities"]), int(data.get("probed_at") or 0)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            try:
+                with open(self.path, encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                return
+            if isinstance(data, dict):
+                data["probed_at"] = 0
+                self._write(data)
+
+    def _write(self, data: dict[str, Any]) -> None:
+        # Best-effort: doctor may run before install, when the state dir does not exist yet.
+        try:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, self.path)
+            self._stamp = self._file_stamp()
+        except OSError:
+            self._stamp = None
+
+
+_caches: dict[str, CapabilityCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _cache(cfg: AgentConfig) -> CapabilityCache:
+    with _caches_lock:
+        cache = _caches.get(cfg.capabilities_cache)
+        if cache is None:
+            cache = _caches[cfg.capabilities_cache] = CapabilityCache(cfg.capabilities_cache)
+        return cache
+
+
+def capabilities(cfg: AgentConfig, *, deep: bool = True,
+                 max_age_s: float | None = None) -> system.Capabilities:
+    return _cache(cfg).get(cfg, deep=deep, max_age_s=max_age_s)
+
+
+def store(cfg: AgentConfig, caps: system.Capabilities, *, deep: bool,
+          probed_at: float | None = None) -> None:
+    """Record a result probed elsewhere (``healthwatch``) as the latest."""
+    _cache(cfg).store(caps, deep=deep, probed_at=probed_at)
+
+
+def last_snapshot(cfg: AgentConfig) -> tuple[dict[str, Any], int] | None:
+    return _cache(cfg).last()
+
+
+def invalidate(cfg: AgentConfig) -> None:
+    _cache(cfg).invalidate()
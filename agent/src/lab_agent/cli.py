@@ -143,13 +143,29 @@ def _cmd_doctor(args: argparse.Namespace) -> int:
     from . import maintenance_state
     from .installer import service_status
 
-    caps = detect_capabilities(cfg, deep=True)
+    watch = None
+    if args.watch:
+        from .healthwatch import HealthWatch
+
+        # Explicitly asked for, so it runs even where the agent's watch is disabled.
+        watch = HealthWatch(cfg, poll_s=cfg.health_watch_interval_s or 5)
+        caps = watch.start()
+    else:
+        caps = detect_capabilities(cfg, deep=True)
     print(f"node: {cfg.node_name}")
     # Service state (best-effort; works before/after install).
     status = service_status()
     print(f"  service: {status['active']} ({status['enabled']})")
     for field, value in caps.to_dict().items():
         print(f"  {field}: {value}")
+    # Probes run concurrently; list the slow, failed and timed-out ones.
+    notable = [t for t in getattr(caps, "probes", [])
+               if t.timed_out or t.error or t.elapsed_s >= 5]
+    if notable:
+        print("probes:")
+        for t in sorted(notable, key=lambda t: -t.elapsed_s):
+            state = "timed out" if t.timed_out else f"error: {t.error}" if t.error else "ok"
+            print(f"  {t.name}: {t.elapsed_s:.1f}s ({state})")
     # Persistent weekly-patch bookkeeping: when each lab's container was last apt-upgraded.
     patched = maintenance_state.all_apt_upgrades(cfg)
     if patched:
@@ -160,9 +176,38 @@ def _cmd_doctor(args: argparse.Namespace) -> int:
         print("issues:")
         for issue in caps.health.issues:
             print(f"  - [{issue.severity}] {issue.code}: {issue.message}")
-        return 1
-    print("all checks passed")
-    return 0
+    else:
+        print("all checks passed")
+    if watch is not None:
+        return _watch_health(watch)
+    return 1 if caps.health.issues else 0
+
+
+def _watch_health(watch) -> int:
+    """Print issue transitions as the watched inputs change, until interrupted."""
+    import time
+
+    print("watching for changes (Ctrl-C to stop)", flush=True)
+    try:
+        while True:
+            changed = watch.wait(60.0)
+            if not changed:
+                continue
+            transition = watch.evaluate(changed)
+            if transition is None:
+                continue
+            stamp = time.strftime("%H:%M:%S")
+            print(f"[{stamp}] {transition.status} after {', '.join(transition.inputs)}")
+            for issue in transition.raised:
+                print(f"  + [{issue.severity}] {issue.code}: {issue.message}")
+            for issue in transition.cleared:
+                print(f"  - {issue.code}: cleared")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watch.close()
+    return 1 if watch.caps.health.issues else 0
 
 
 def _cmd_host_prepare(args: argparse.Namespace) -> int:
@@ -177,12 +222,75 @@ def _cmd_host_prepare(args: argparse.Namespace) -> int:
     except (PermissionError, RuntimeError, ValueError) as exc:
         print(f"host preparation failed: {exc}", file=sys.stderr)
         return 1
+    from . import capcache
+
+    # The running agent drops its cached capabilities and re-probes on next use.
+    capcache.invalidate(cfg)
     for key, value in result.items():
         print(f"{key}: {value}")
     print("host preparation complete; run `lab-agent doctor` with a provisioned lab")
     return 0
 
 
+def _cmd_gpu_replay(args: argparse.Namespace) -> int:
+    import json
+
+    from .gpu import replay, trace
+    from .gpu.policy import GpuPolicy
+
+    if args.benchmark:
+        result = replay.benchmark(args.benchmark)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"evaluate() over {result['processes']} processes, {result['ticks']} ticks: "
+                  f"mean {result['mean_ms']} ms, max {result['max_ms']} ms "
+                  f"({result['per_process_us']} us/process)")
+        return 0
+
+    paths = args.trace
+    if not paths:
+        try:
+            cfg = load_config(Path(args.config) if args.config else None)
+        except FileNotFoundError:
+            cfg = AgentConfig(controller_url="", token="")
+        paths = trace.trace_files(cfg.gpu_trace_dir)
+    if not paths:
+        print("no GPU traces found; pass trace files or enable gpu_trace_retain_days",
+              file=sys.stderr)
+        return 1
+    settings: dict = {}
+    if args.policy:
+        try:
+            with open(args.policy, encoding="utf-8") as fh:
+                settings = json.load(fh)
+        except (OSError, ValueError) as exc:
+            print(f"cannot read policy: {exc}", file=sys.stderr)
+            return 1
+    for key in ("util_threshold", "idle_minutes", "grace_minutes", "window_s", "util_percentile",
+                "pressure_free_fraction", "pressure_idle_minutes", "pressure_grace_minutes"):
+        value = getattr(args, key)
+        if value is not None:
+            settings[key] = value
+    policy = GpuPolicy.from_dict({**settings, "enabled": True})
+    report = replay.replay(trace.read_trace(paths), policy).to_dict()
+    if args.json:
+        print(json.dumps(report))
+        return 0
+    print(f"replayed {report['snapshots']} snapshots ({report['span_h']} h) with "
+          f"threshold {policy.util_threshold}%, idle {policy.idle_minutes} min, "
+          f"grace {policy.grace_minutes} min, p{policy.util_percentile:g} over "
+          f"{policy.window_s:g} s")
+    print(f"  warns: {report['warns']}")
+    print(f"  kills: {report['kills']}")
+    print(f"  reclaimed VRAM: {report['reclaimed_vram_gib_hours']} GiB-hours")
+    fps = report["false_positive_candidates"]
+    print(f"  false-positive candidates: {len(fps)}")
+    for fp in fps:
+        print(f"    pid {fp['pid']} lab={fp['lab']} user={fp['user']}")
+    return 0
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="lab-agent", description="Lab manager node agent")
     parser.add_argument("--version", action="version", version=f"lab-agent {__version__}")
@@ -233,6 +341,8 @@ def build_parser() -> argparse.ArgumentParser:
     p_set_token.set_defaults(func=_cmd_set_token)
 
     p_doctor = sub.add_parser("doctor", help="check service + zfs/docker/nvidia/pools")
+    p_doctor.add_argument("--watch", action="store_true",
+                          help="keep running; re-check only what changes and print transitions")
     p_doctor.set_defaults(func=_cmd_doctor)
 
     p_prepare = sub.add_parser(
@@ -240,6 +350,25 @@ def build_parser() -> argparse.ArgumentParser:
     )
     p_prepare.set_defaults(func=_cmd_host_prepare)
 
+    p_replay = sub.add_parser(
+        "gpu-replay", help="replay recorded GPU snapshots through an idle-kill policy"
+    )
+    p_replay.add_argument("trace", nargs="*",
+                          help="trace files (default: every trace in the agent state dir)")
+    p_replay.add_argument("--policy", help="JSON file of gpu.policy.update settings")
+    p_replay.add_argument("--util-threshold", dest="util_threshold", type=float)
+    p_replay.add_argument("--idle-minutes", dest="idle_minutes", type=float)
+    p_replay.add_argument("--grace-minutes", dest="grace_minutes", type=float)
+    p_replay.add_argument("--window-s", dest="window_s", type=float)
+    p_replay.add_argument("--util-percentile", dest="util_percentile", type=float)
+    p_replay.add_argument("--pressure-free-fraction", dest="pressure_free_fraction", type=float)
+    p_replay.add_argument("--pressure-idle-minutes", dest="pressure_idle_minutes", type=float)
+    p_replay.add_argument("--pressure-grace-minutes", dest="pressure_grace_minutes", type=float)
+    p_replay.add_argument("--benchmark", type=int, metavar="N",
+                          help="instead, time the killer over N synthetic processes")
+    p_replay.add_argument("--json", action="store_true", help="machine-readable output")
+    p_replay.set_defaults(func=_cmd_gpu_replay)
+
     return parser
 
 
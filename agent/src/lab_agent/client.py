@@ -14,24 +14,44 @@ agent restart or a controller outage never drops work — buffered items flush o
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import json
+import signal
 import ssl
-import threading
 from typing import Any
 
 import websockets
 
+from . import capcache, scanthrottle, usagereport
 from . import protocol as P
-from . import usagereport
 from .config import AgentConfig
 from .dispatcher import Dispatcher
+from .gpu.devices import DeviceHistory
+from .gpu.ledger import GpuLedger
+from .gpu.snapshot import SnapshotFeed
+from .gpu.trace import TraceRecorder
 from .localq import LocalQueues
 from .logbus import LogBus
-from .system import detect_capabilities
+from .refreshwatch import RefreshWatcher
+from .scanindex import ScanIndex
+from .scanqueue import (
+    PRIORITY_ON_DEMAND,
+    PRIORITY_REFRESH,
+    PRIORITY_SCHEDULED,
+    SCOPE_STUDENTS,
+    ScanJob,
+    ScanScheduler,
+)
 from .usagereport import UsageState
 
 INITIAL_BACKOFF = 1.0
 MAX_BACKOFF = 30.0
+# Background GPU utilization sampling period while NVML is available (see gpu.sampler).
+GPU_SAMPLE_INTERVAL_S = 2.0
+# How often closed hours of the GPU-time ledger are looked for and shipped.
+GPU_LEDGER_SHIP_INTERVAL_S = 300
+# Device memory readings older than this are not used for the killer's memory-pressure schedule.
+GPU_MEMORY_MAX_AGE_S = 60
 
 
 class Agent:
@@ -40,13 +60,37 @@ class Agent:
         self.localq = LocalQueues(cfg.state_db)
         self.log = LogBus(cfg.node_name, sink=self.localq.enqueue_outbound)
         self.dispatcher = Dispatcher(cfg, self.log)
-        self.usage = UsageState()
-        self._container_lock = threading.Lock()  # single-flight guard for the container-layer scan
+        # Checkpointed to the state dir, so a restart keeps every lab's scan age (no rescan storm).
+        self.usage = UsageState(cfg.usage_state)
+        # Rewrites each lab's usage.json only when its content changed.
+        self.publisher = usagereport.SnapshotPublisher()
+        # Per-directory index behind the per-student scan: unchanged subtrees are not re-walked.
+        self.scan_index = ScanIndex(cfg.scan_index)
+        self.gpu_ledger = GpuLedger(cfg.gpu_ledger)
+        self.gpu_trace = TraceRecorder(cfg.gpu_trace_dir, cfg.gpu_trace_retain_days)
+        # Shared per-tier inode-rate limits, adapted to live pool latency (see ``scanthrottle``).
+        self.scan_throttles = scanthrottle.tier_throttles(cfg)
+        # Priority queue for the per-student scan: on-demand > student refresh > scheduled, a
+        # bounded number of labs at once, with per-tier walker limits.
+        self.scans = ScanScheduler(
+            self._run_scan_job,
+            concurrency=cfg.usage_scan_concurrency,
+            pool_limits={"fast": cfg.usage_scan_fast_concurrency,
+                         "slow": cfg.usage_scan_slow_concurrency},
+            on_change=self._publish_scan_queue,
+        )
+        # inotify watches on every home for ``labquota --refresh`` markers (polling fallback).
+        self.refresh_watch = RefreshWatcher()
+        self._refresh_wakeup = asyncio.Event()
         # On-demand usage scan (Stats page "Scan now"). Registered here rather than in the
-        # dispatcher's builtins because it reuses the agent's shared scan cache + single-flight
-        # lock, which live on the Agent, not the Dispatcher.
+        # dispatcher's builtins because it reuses the agent's shared scan cache + scan queue,
+        # which live on the Agent, not the Dispatcher.
         self.dispatcher.register(P.A_USAGE_SCAN, self._handle_usage_scan)
         self._connected = asyncio.Event()
+        # The latest GPU process reading, shared by the heartbeat and the idle killer.
+        self.gpu_feed = SnapshotFeed()
+        # Per-device GPU health samples, summarised into each heartbeat.
+        self.gpu_devices = DeviceHistory()
 
     # ------------------------------------------------------------------ helpers
     def _ssl_context(self):
@@ -71,19 +115,35 @@ class Agent:
         """Run forever: persistent task worker + GPU killer + reconnecting connection loop."""
         worker = asyncio.create_task(self._task_worker(), name="task-worker")
         gpu = asyncio.create_task(self._gpu_loop(), name="gpu-killer")
+        gpu_snapshot = asyncio.create_task(self._gpu_snapshot_loop(), name="gpu-snapshot")
+        gpu_devices = asyncio.create_task(self._gpu_device_loop(), name="gpu-devices")
+        gpu_sample = asyncio.create_task(self._gpu_sample_loop(), name="gpu-sampler")
+        gpu_ledger = asyncio.create_task(self._gpu_ledger_loop(), name="gpu-ledger")
         publish = asyncio.create_task(self._usage_publish_loop(), name="usage-publish")
         lab_usage = asyncio.create_task(self._lab_usage_loop(), name="lab-usage")
         usage_scan = asyncio.create_task(self._container_scan_loop(), name="usage-scan")
         pkg_update = asyncio.create_task(self._pkg_update_loop(), name="pkg-update")
+        health = asyncio.create_task(self._health_watch_loop(), name="health-watch")
+        self.scans.start()
         try:
             await self._connection_loop()
         finally:
             worker.cancel()
             gpu.cancel()
+            gpu_sample.cancel()
+            gpu_snapshot.cancel()
+            gpu_devices.cancel()
+            gpu_ledger.cancel()
             publish.cancel()
             lab_usage.cancel()
             usage_scan.cancel()
             pkg_update.cancel()
+            health.cancel()
+            self.scans.stop()
+            self.scan_index.close()
+            self.gpu_ledger.close()
+            self.gpu_trace.close()
+            self.refresh_watch.close()
             self.localq.close()
 
     async def _connection_loop(self) -> None:
@@ -121,16 +181,26 @@ class Agent:
             backoff = min(backoff * 2, MAX_BACKOFF)
 
     async def _on_connected(self, ws) -> None:
-        caps = detect_capabilities(self.cfg)
-        await ws.send(json.dumps(P.hello_frame(self.cfg.node_name, self.cfg.token, caps.to_dict())))
+        # Say hello with the last known capabilities instead of holding the link idle through a
+        # deep probe; a fresh set follows from _refresh_capabilities (see capcache).
+        cached = await asyncio.to_thread(capcache.last_snapshot, self.cfg)
+        if cached is None:
+            caps = await asyncio.to_thread(capcache.capabilities, self.cfg, deep=False)
+            cached = (caps.to_dict(), P.now_ms())
+        hello_caps, probed_at = cached
+        await ws.send(json.dumps(
+            P.hello_frame(self.cfg.node_name, self.cfg.token, hello_caps, probed_at)))
         self._connected.set()
         self.log.info("client", f"connected to controller as node '{self.cfg.node_name}'")
+        refresh = asyncio.create_task(self._refresh_capabilities(ws, hello_caps),
+                                      name="capabilities")
         receiver = asyncio.create_task(self._receiver(ws), name="receiver")
         sender = asyncio.create_task(self._outbox_sender(ws), name="outbox-sender")
         heartbeat = asyncio.create_task(self._heartbeat(ws), name="heartbeat")
         done, pending = await asyncio.wait(
             {receiver, sender, heartbeat}, return_when=asyncio.FIRST_COMPLETED
         )
+        refresh.cancel()
         for task in pending:
             task.cancel()
         # Surface the first exception (if any) so the connection loop logs + reconnects.
@@ -139,6 +209,17 @@ class Agent:
             if exc and not isinstance(exc, asyncio.CancelledError):
                 raise exc
 
+    async def _refresh_capabilities(self, ws, sent: dict[str, Any]) -> None:
+        """Re-probe (deep, within the cache TTL) after hello and push a ``capabilities`` frame if
+        the result differs from what hello carried."""
+        try:
+            caps = await asyncio.to_thread(capcache.capabilities, self.cfg, deep=True)
+            current = caps.to_dict()
+            if current != sent:
+                await ws.send(json.dumps(P.capabilities_frame(self.cfg.node_name, current)))
+        except Exception as exc:  # a failed probe must not drop the connection
+            self.log.warn("client", f"capability refresh failed: {exc}")
+
     async def _receiver(self, ws) -> None:
         async for raw in ws:
             try:
@@ -211,24 +292,49 @@ class Agent:
                 await asyncio.to_thread(job.retry, 1, "send failed")
                 raise
 
-    async def _gpu_loop(self) -> None:
-        """Persistent idle-GPU governor. Emits warn/kill events even while disconnected."""
+    async def _gpu_snapshot_loop(self) -> None:
+        """Take the one GPU process reading the heartbeat and the idle killer share (see
+        ``gpu.snapshot``): every heartbeat, or every killer interval when that is shorter."""
         import time
 
+        from .gpu import monitor
+        from .gpu.policy import get_policy
+
+        while True:
+            policy = get_policy()
+            interval = self.cfg.heartbeat_interval_s
+            if policy.enabled:
+                interval = min(interval, max(5, policy.interval_s))
+            try:
+                taken_at = time.time()
+                procs = await asyncio.to_thread(monitor.list_gpu_processes, policy)
+                memory = self.gpu_devices.memory(GPU_MEMORY_MAX_AGE_S)
+                snapshot = await self.gpu_feed.publish(procs, taken_at, memory)
+                await asyncio.to_thread(self.gpu_ledger.record, snapshot)
+                await asyncio.to_thread(self.gpu_trace.record, snapshot)
+            except Exception as exc:  # never let the sampler die
+                self.log.error("gpu", f"gpu snapshot error: {exc}")
+            await asyncio.sleep(interval)
+
+    async def _gpu_loop(self) -> None:
+        """Persistent idle-GPU governor: evaluates every new GPU snapshot. Emits warn/kill events
+        even while disconnected."""
         from .gpu import monitor
         from .gpu.killer import GpuKiller
         from .gpu.policy import get_policy
 
-        killer = GpuKiller()
+        killer = GpuKiller(self.cfg.gpu_killer_state)
+        seq = 0
         while True:
+            snapshot = await self.gpu_feed.next_after(seq)
+            seq = snapshot.seq
             policy = get_policy()
-            interval = max(5, policy.interval_s)
             if not policy.enabled:
-                await asyncio.sleep(interval)
                 continue
             try:
-                procs = await asyncio.to_thread(monitor.list_gpu_processes)
-                decisions = killer.evaluate(procs, policy, time.time())
+                # Judge as of when the reading was taken, not when this loop got to it.
+                decisions = killer.evaluate(list(snapshot.processes), policy, snapshot.taken_at,
+                                            snapshot.devices)
                 for d in decisions:
                     payload = {
                         "pid": d.pid,
@@ -238,6 +344,8 @@ class Agent:
                         "state": "killed" if d.action == "kill" else "warned",
                         "cmd": d.proc.get("cmd"),
                         "idle_s": d.idle_s,
+                        "snapshot_age_s": snapshot.age_s(),
+                        "pressure_device": d.pressure,
                     }
                     if d.action == "kill":
                         # Re-verify the PID identity right before killing (M-06): if the original
@@ -255,9 +363,56 @@ class Agent:
                         self.log.warn("gpu", f"warned idle GPU pid {d.pid} (user={d.user})",
                                       lab=d.lab, user=d.user)
                     self.log.event("gpu", payload)
+                await asyncio.to_thread(killer.save)
             except Exception as exc:  # never let the governor die
                 self.log.error("gpu", f"gpu killer error: {exc}")
-            await asyncio.sleep(interval)
+
+    async def _gpu_sample_loop(self) -> None:
+        """Feed the killer's utilization window between its ticks (NVML only; see
+        ``monitor.sample_utilization``). Without NVML, re-check for it occasionally."""
+        from .gpu import monitor
+
+        while True:
+            try:
+                sampled = await asyncio.to_thread(monitor.sample_utilization)
+            except Exception as exc:  # never let the sampler die
+                self.log.error("gpu", f"gpu sampler error: {exc}")
+                sampled = False
+            await asyncio.sleep(GPU_SAMPLE_INTERVAL_S if sampled else monitor.NVML_RETRY_S)
+
+    async def _gpu_ledger_loop(self) -> None:
+        """Ship closed hours of the GPU-time ledger as ``gpu_usage`` events (durable outbox)."""
+        import time
+
+        while True:
+            try:
+                now = time.time()
+                buckets = await asyncio.to_thread(self.gpu_ledger.closed, now)
+                for bucket in buckets:
+                    self.log.event("gpu_usage", bucket)
+                if buckets:
+                    await asyncio.to_thread(self.gpu_ledger.mark_shipped, buckets, now)
+            except Exception as exc:  # never let the ledger die
+                self.log.error("gpu", f"gpu ledger error: {exc}")
+            await asyncio.sleep(GPU_LEDGER_SHIP_INTERVAL_S)
+
+    async def _gpu_device_loop(self) -> None:
+        """Sample per-device GPU health into ``gpu_devices`` every
+        ``gpu_device_sample_interval_s``. A node without GPUs re-checks only every five minutes."""
+        from .gpu import devices
+
+        interval = self.cfg.gpu_device_sample_interval_s
+        if interval <= 0:
+            return
+        while True:
+            try:
+                samples = await asyncio.to_thread(devices.query_devices)
+            except Exception as exc:  # never let the sampler die
+                self.log.error("gpu", f"gpu device sampler error: {exc}")
+                samples = []
+            if samples:
+                self.gpu_devices.record(samples)
+            await asyncio.sleep(interval if samples else max(interval, 300))
 
     async def _heartbeat(self, ws) -> None:
         """Periodically emit a telemetry frame (pool free space, dataset usage, scrub, GPU)."""
@@ -265,12 +420,46 @@ class Agent:
             try:
                 from .telemetry import collect_heartbeat
 
-                payload = await asyncio.to_thread(collect_heartbeat, self.cfg, self.usage)
+                payload = await asyncio.to_thread(
+                    collect_heartbeat, self.cfg, self.usage, self.gpu_feed.latest,
+                    self.gpu_devices,
+                )
             except Exception as exc:
                 payload = {"error": str(exc)}
             self.log.telemetry(payload)
             await asyncio.sleep(self.cfg.heartbeat_interval_s)
 
+    async def _health_watch_loop(self) -> None:
+        """Keep node health current from its probes' inputs (see ``healthwatch``): push every
+        issue transition as a ``health`` event and keep ``capcache`` at the latest evaluation."""
+        from .healthwatch import HealthWatch
+
+        interval = self.cfg.health_watch_interval_s
+        if interval <= 0:
+            return
+        watch = HealthWatch(self.cfg, poll_s=interval)
+        try:
+            while True:
+                try:
+                    if watch.caps is None:
+                        caps = await asyncio.to_thread(watch.start)
+                        await asyncio.to_thread(capcache.store, self.cfg, caps, deep=True,
+                                                probed_at=watch.probed_at)
+                        continue
+                    changed = await asyncio.to_thread(watch.wait, 60.0)
+                    if not changed:
+                        continue
+                    transition = await asyncio.to_thread(watch.evaluate, changed)
+                    await asyncio.to_thread(capcache.store, self.cfg, watch.caps, deep=True,
+                                            probed_at=watch.probed_at)
+                    if transition is not None:
+                        self.log.event("health", transition.to_event())
+                except Exception as exc:  # never let the watch die
+                    self.log.error("health", f"health watch error: {exc}")
+                    await asyncio.sleep(max(interval, 30))
+        finally:
+            watch.close()
+
     # ----------------------------------------------------------------- labquota usage report
 
     async def _usage_publish_loop(self) -> None:
@@ -287,13 +476,16 @@ class Agent:
         fixed cadence and cache it; the heartbeat re-reports the cached snapshot. Moved off the
         per-15s heartbeat path so the agent does one ``zfs list`` / ``docker inspect`` per interval,
         not per heartbeat. The (expensive) per-student du breakdown is a separate, slower cache (see
-        ``_container_scan_loop``)."""
+        ``_container_scan_loop``). The first refresh waits out the checkpointed snapshot's
+        remaining age, so a restart does not re-measure every lab immediately."""
+        interval = max(30, self.cfg.lab_usage_interval_s)
+        await asyncio.sleep(self.usage.lab_level_due_in(interval))
         while True:
             try:
                 await asyncio.to_thread(self._refresh_lab_usage)
             except Exception as exc:  # never let the refresher die
                 self.log.error("usage", f"lab usage refresh error: {exc}")
-            await asyncio.sleep(max(30, self.cfg.lab_usage_interval_s))
+            await asyncio.sleep(interval)
 
     def _refresh_lab_usage(self) -> None:
         self.usage.replace_lab_level(usagereport.collect_lab_level(self.cfg, self.usage))
@@ -311,62 +503,132 @@ class Agent:
                     self.cfg, lab, lab_usage, self.usage.container_for(lab), roster=roster,
                     rootfs_quota=usagereport.lab_rootfs_quota(self.cfg, lab),
                 )
-                usagereport.publish_snapshot(self.cfg, lab, snapshot)
+                self.publisher.publish(self.cfg, lab, snapshot)
             except Exception as exc:  # one bad lab must not stop the others
                 self.log.warn("usage", f"publish failed for lab '{lab}': {exc}", lab=lab)
 
     async def _container_scan_loop(self) -> None:
-        """Refresh the (expensive) per-student du breakdown on a daily fallback cadence / on demand.
+        """Queue the (expensive) per-student du breakdown on a daily fallback cadence / on demand.
 
         A lab is (re)scanned when its cached data is older than ``usage_scan_interval_s`` (a daily
-        safety net; the controller drives the precise nightly scan, by default at midnight), or when
-        a student dropped a refresh marker and the cache is older than the forced floor (5 min). The
+        safety net; the controller drives the precise nightly scan, by default at midnight). A
+        student's refresh marker rescans only that student (see ``_submit_refresh_requests``). The
         container-level writable-layer total is NOT scanned here — it lives in the lab-level cache,
-        refreshed on its own faster cadence (see ``_lab_usage_loop``).
+        refreshed on its own faster cadence (see ``_lab_usage_loop``). Scan ages are checkpointed
+        (see ``UsageState``), so after a restart only labs that are genuinely due are rescanned.
+
+        Markers arrive through inotify (``refreshwatch``): an event wakes this loop immediately, and
+        the minute tick re-syncs watches with the roster and polls any home that has no watch.
+        This loop only decides what is due; the scans themselves run on the priority queue (see
+        ``scanqueue``), which deduplicates a lab that is still queued or scanning from a prior tick.
         """
         floor_ms = 5 * 60 * 1000
-        while True:
-            try:
-                # Single-flight: if the previous tick's scan is still running (a big lab can take a
-                # while), skip this tick rather than piling concurrent scans on top of it.
-                if self._container_lock.acquire(blocking=False):
-                    try:
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.to_thread(usagereport.reset_stale_status, self.cfg, self.usage)
+        except Exception as exc:  # best-effort cleanup of an interrupted scan's status
+            self.log.warn("usage", f"could not reset stale scan status: {exc}")
+        if self.refresh_watch.available:
+            loop.add_reader(self.refresh_watch.fileno(), self._on_refresh_events)
+        next_tick = 0.0
+        try:
+            while True:
+                self._refresh_wakeup.clear()
+                try:
+                    if loop.time() >= next_tick:
+                        next_tick = loop.time() + 60
                         await asyncio.to_thread(self._scan_due_container, floor_ms)
-                    finally:
-                        self._container_lock.release()
-            except Exception as exc:  # never let the scanner die
-                self.log.error("usage", f"usage scan loop error: {exc}")
-            await asyncio.sleep(60)
+                    else:
+                        await asyncio.to_thread(self._submit_refresh_requests, floor_ms)
+                except Exception as exc:  # never let the scanner die
+                    self.log.error("usage", f"usage scan loop error: {exc}")
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._refresh_wakeup.wait(),
+                                           timeout=max(0.0, next_tick - loop.time()))
+        finally:
+            if self.refresh_watch.available:
+                loop.remove_reader(self.refresh_watch.fileno())
+
+    def _on_refresh_events(self) -> None:
+        try:
+            if self.refresh_watch.drain():
+                self._refresh_wakeup.set()
+        except Exception as exc:  # a bad event must not unregister the reader
+            self.log.warn("usage", f"refresh watch error: {exc}")
 
     def _scan_due_container(self, floor_ms: int) -> None:
         now = P.now_ms()
         interval_ms = max(60, self.cfg.usage_scan_interval_s) * 1000
         grouped = usagereport.collect_zfs_usage(self.cfg)
+        homes = {
+            (lab, user): path
+            for lab in grouped
+            for user, path in usagereport.lab_homes(self.cfg, lab).items()
+        }
+        self.refresh_watch.sync(homes)
+        self.refresh_watch.poll_unwatched()
         for lab in grouped:
             cached = self.usage.container_for(lab)
-            age = None if cached.scanned_at is None else now - cached.scanned_at
-            users_list = usagereport.list_lab_students(self.cfg, lab)
-            requested = usagereport.newest_request(self.cfg, lab, users_list)
-            due = age is None or age >= interval_ms
-            # Honor a student request only if it is newer than the last scan (so one touch triggers
-            # at most one scan) and the forced-refresh floor has elapsed (so a touch-loop cannot
-            # make us scan more than once per floor).
-            fresh_request = requested is not None and (
-                cached.scanned_at is None or requested > cached.scanned_at
-            )
-            forced = fresh_request and (age is None or age >= floor_ms)
-            if not (due or forced):
+            if cached.scanned_at is None or now - cached.scanned_at >= interval_ms:
+                self.scans.submit(ScanJob(lab, priority=PRIORITY_SCHEDULED, requested_at=now))
+        self._submit_refresh_requests(floor_ms)
+
+    def _submit_refresh_requests(self, floor_ms: int) -> None:
+        """Queue a targeted rescan for each student with a pending refresh marker.
+
+        A request is honored only if it is newer than that student's last measurement (so one touch
+        triggers at most one scan) and the student's forced-refresh floor has elapsed (so a
+        touch-loop cannot scan them more than once per floor); a request inside the floor stays
+        pending and is reconsidered on the next tick.
+        """
+        now = P.now_ms()
+        for (lab, user), requested in self.refresh_watch.pending().items():
+            last = self.usage.container_for(lab).scanned_at_for(user)
+            if last is not None and requested <= last:
+                self.refresh_watch.discard((lab, user), requested)  # already covered by a scan
+                continue
+            if last is not None and now - last < floor_ms:
+                continue
+            self.scans.submit(ScanJob(lab, scope=SCOPE_STUDENTS, priority=PRIORITY_REFRESH,
+                                      users=[user], requested_at=requested))
+
+    def _run_scan_job(self, job: ScanJob) -> None:
+        if self.cfg.usage_scan_idle_io:
+            scanthrottle.set_idle_io_class()  # per worker thread; best-effort
+        users_list = job.users or usagereport.list_lab_students(self.cfg, job.lab)
+        self._scan_container_lab(job.lab, users_list, partial=job.scope == SCOPE_STUDENTS)
+
+    def _publish_scan_queue(self, positions: dict[str, int]) -> None:
+        """Report each queued lab's queue position in ``status.json`` for ``labquota --refresh``.
+
+        A lab already scanning keeps its "running" status; its queued follow-up shows once started.
+        """
+        running = set(self.scans.running())
+        for lab, position in positions.items():
+            if lab in running:
+                continue
+            try:
+                usagereport.ensure_labquota_dirs(self.cfg, lab)
+                usagereport.write_status(
+                    self.cfg, lab,
+                    {"status": "queued", "position": position, "queued": len(positions),
+                     "scanned_at": self.usage.container_for(lab).scanned_at, "ts": P.now_ms()},
+                )
+            except Exception:  # status is best-effort
                 continue
-            self._scan_container_lab(lab, users_list)
 
-    def _scan_container_lab(self, lab: str, usernames: list[str]) -> None:
+    def _scan_container_lab(self, lab: str, usernames: list[str], *, partial: bool = False) -> None:
+        """Scan ``usernames`` of ``lab``. A ``partial`` scan merges into the cached result instead
+        of replacing it, and its status names the students it covered."""
+        pacer = scanthrottle.ScanPacer(self.scan_throttles)
+
         def progress(done: int, total: int, current: str) -> None:
             try:
                 usagereport.write_status(
                     self.cfg,
                     lab,
                     {"status": "running", "done": done, "total": total,
-                     "current": current, "ts": P.now_ms()},
+                     "current": current, "ts": P.now_ms(), **pacer.stats()},
                 )
             except Exception:  # status is best-effort
                 pass
@@ -374,12 +636,26 @@ class Agent:
         try:
             usagereport.ensure_labquota_dirs(self.cfg, lab)
             progress(0, len(usernames), "")
-            usage = usagereport.run_container_scan(self.cfg, lab, usernames, progress=progress)
+            usage = usagereport.run_container_scan(
+                self.cfg, lab, usernames, progress=progress, index=self.scan_index,
+                slot=self.scans.slot, pacer=pacer,
+            )
+            scanned_at = usage.scanned_at
+            if partial:
+                usage = usagereport.merge_student_scan(
+                    self.usage.container_for(lab), usage, usernames
+                )
             self.usage.set_container(lab, usage)
+            try:
+                usagereport.publish_cold_usage(self.cfg, lab, usage)
+            except Exception as exc:  # clients keep the previous summary; the scan still counts
+                self.log.warn("usage", f"cold usage summary not published for '{lab}': {exc}",
+                              lab=lab)
             usagereport.clear_requests(self.cfg, lab, usernames)
-            usagereport.write_status(
-                self.cfg, lab, {"status": "idle", "scanned_at": usage.scanned_at}
-            )
+            status = {"status": "idle", "scanned_at": scanned_at, **pacer.stats()}
+            if partial:
+                status["users"] = sorted(usernames)
+            usagereport.write_status(self.cfg, lab, status)
             # Republish immediately so the student sees fresh numbers without waiting a cycle.
             grouped = usagereport.collect_zfs_usage(self.cfg)
             roster = usagereport.list_lab_students(self.cfg, lab)
@@ -387,23 +663,31 @@ class Agent:
                 self.cfg, lab, grouped.get(lab, usagereport.LabUsage()), usage, roster=roster,
                 rootfs_quota=usagereport.lab_rootfs_quota(self.cfg, lab),
             )
-            usagereport.publish_snapshot(self.cfg, lab, snapshot)
+            self.publisher.publish(self.cfg, lab, snapshot)
         except Exception as exc:
             self.log.warn("usage", f"usage scan failed for lab '{lab}': {exc}", lab=lab)
+            raise  # recorded on the ScanJob, so a controller-triggered scan reports the failure
 
     def _handle_usage_scan(self, cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
         """Controller-triggered usage scan for one lab (Stats page "Scan now").
 
         Refreshes **both** caches the Stats page reads so a single trigger updates the whole page:
         the lab-level totals (fast/slow ZFS + container writable layer) and the per-student ``du``
-        breakdown. The per-student scan blocks on the same single-flight lock the background loop
-        uses, so it never double-scans a container. The fresh numbers reach the controller on the
-        next heartbeat; the returned ``scanned_at`` is the per-student freshness timestamp.
+        breakdown. The per-student scan is queued at on-demand priority — ahead of every scheduled
+        or student-requested scan — and merged with any scan of the lab already queued, so it never
+        double-scans a container. The fresh numbers reach the controller on the next heartbeat; the
+        returned ``scanned_at`` is the per-student freshness timestamp.
         """
         lab = params["lab"]
-        users_list = params.get("users") or usagereport.list_lab_students(cfg, lab)
-        with self._container_lock:
-            self._scan_container_lab(lab, users_list)
+        job = self.scans.submit(
+            ScanJob(lab, priority=PRIORITY_ON_DEMAND, users=params.get("users") or None)
+        )
+        if not job.wait(cfg.usage_scan_timeout_s):
+            raise RuntimeError(
+                f"usage scan for '{lab}' did not finish within {cfg.usage_scan_timeout_s}s"
+            )
+        if job.error:
+            raise RuntimeError(f"usage scan failed for '{lab}': {job.error}")
         # Also recompute the lab-level snapshot now, so fast/cold/image refresh on the same trigger
         # rather than waiting for the next lab-usage cycle.
         try:
@@ -451,4 +735,12 @@ class Agent:
 
 
 def run_agent(cfg: AgentConfig) -> None:
-    asyncio.run(Agent(cfg).run())
+    async def main() -> None:
+        # systemctl stop/restart sends SIGTERM: unwind through Agent.run's cleanup (closing the
+        # GPU trace, ledger and queues) instead of dying with them half-written.
+        task = asyncio.current_task()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        with contextlib.suppress(asyncio.CancelledError):
+            await Agent(cfg).run()
+
+    asyncio.run(main())
@@ -16,7 +16,9 @@ on the slow tier so the backend choice lives in exactly one place. Usage is alwa
 
 from __future__ import annotations
 
+import json
 import os
+import stat
 from typing import Any
 
 from . import paths
@@ -85,7 +87,76 @@ def lab_mount(cfg: AgentConfig, lab: str) -> str:
 
 # --------------------------------------------------------------------------- usage
 # On the SMB backend this node does not monitor cold storage — the owner node (zfs) reports usage
-# and scrubs the same data. So the usage helpers return "nothing here".
+# and scrubs the same data. So the usage helpers return "nothing here", and per-student numbers
+# come from the summary the owner publishes on the share.
+
+
+# Per-student cold usage the owner measured, published beside the data so SMB clients of the same
+# lab read it instead of re-walking every cold directory over CIFS. It sits in the lab's cold root
+# (root-owned 0711, so students can neither list nor replace it) and is world-readable 0644: SMB
+# clients read it through their own CIFS credential mapping, which need not be root on the owner.
+STUDENT_USAGE_FILE = ".lab-agent-cold-usage.json"
+# A summary larger than this is not ours; refuse it rather than parse it.
+STUDENT_USAGE_MAX_BYTES = 8 * 1024 * 1024
+
+
+def student_usage_path(cfg: AgentConfig, lab: str) -> str:
+    """The lab's published cold usage summary: the same file on the owner and its SMB clients."""
+    return os.path.join(paths.cold_lab(cfg, lab), STUDENT_USAGE_FILE)
+
+
+def publish_student_usage(
+    cfg: AgentConfig, lab: str, per_user: dict[str, int], scanned_at: dict[str, int]
+) -> None:
+    """Owner only: atomically (re)write the lab's per-student cold usage summary on the share."""
+    if not cfg.slow_is_zfs:
+        return
+    path = student_usage_path(cfg, lab)
+    payload = {"lab": lab, "owner": cfg.node_name, "per_user": per_user, "scanned_at": scanned_at}
+    tmp = f"{path}.tmp"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o644)
+        os.fchmod(fd, 0o644)  # not narrowed by the agent's umask
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def published_student_usage(
+    cfg: AgentConfig, lab: str
+) -> tuple[dict[str, int], dict[str, int]] | None:
+    """SMB client: the owner's ``(per_user bytes, per_user scanned_at)`` for ``lab``, or None when
+    the owner has not published one yet (or it is unreadable/implausible). Never follows a link."""
+    path = student_usage_path(cfg, lab)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_size > STUDENT_USAGE_MAX_BYTES:
+            return None
+        with os.fdopen(fd, "rb", closefd=False) as fh:
+            data = json.loads(fh.read(STUDENT_USAGE_MAX_BYTES + 1))
+    except (OSError, ValueError):
+        return None
+    finally:
+        os.close(fd)
+    if not isinstance(data, dict) or data.get("lab") != lab:
+        return None
+
+    def ints(value: Any) -> dict[str, int]:
+        if not isinstance(value, dict):
+            return {}
+        return {str(k): v for k, v in value.items() if isinstance(v, int) and v >= 0}
+
+    return ints(data.get("per_user")), ints(data.get("scanned_at"))
 
 
 def lab_usage(cfg: AgentConfig, lab: str) -> Usage:
@@ -77,6 +77,15 @@ class AgentConfig:
     # Local cache DB for the durable task buffer + offline event/log buffer.
     state_db: str = "/var/lib/lab-agent/state.db"
     heartbeat_interval_s: int = 15
+    # Watch mode for node health (see ``healthwatch``): how often inputs without change
+    # notification (procfs files, unwatchable directories) are re-read. Issue transitions are
+    # pushed as ``health`` events. 0 disables watch mode.
+    health_watch_interval_s: int = 5
+    # Per-device GPU health sampling (see ``gpu.devices``); heartbeats carry min/avg/max over the
+    # samples since the previous heartbeat. 0 disables it.
+    gpu_device_sample_interval_s: int = 5
+    # Days of GPU snapshot traces kept for `lab-agent gpu-replay` (see ``gpu.trace``). 0 disables.
+    gpu_trace_retain_days: int = 7
     # How often the per-lab labquota usage snapshot is republished (live ZFS metadata only — cheap).
     usage_publish_interval_s: int = 120
     # How often the lab-level storage totals (fast/slow ZFS + container writable-layer "image") are
@@ -89,6 +98,27 @@ class AgentConfig:
     # The controller schedules the precise off-peak nightly scan (Settings -> per-student usage
     # scan); this daily fallback just keeps per-student numbers from going fully stale if disabled.
     usage_scan_interval_s: int = 86400
+    # The per-student scan re-lists only directories that changed since the last walk (see
+    # ``scanindex``). A directory re-listed longer ago than this is re-listed anyway, bounding the
+    # drift from files rewritten in place (which do not bump their directory's mtime).
+    usage_index_verify_interval_s: int = 604800
+    # Per-student scans run through a priority queue (see ``scanqueue``): this many labs scan at
+    # once, with at most this many concurrent walkers on the fast and slow tiers respectively.
+    usage_scan_concurrency: int = 2
+    usage_scan_fast_concurrency: int = 2
+    usage_scan_slow_concurrency: int = 1
+    # Ceiling on how long a controller "Scan now" task waits for its queued scan to finish.
+    usage_scan_timeout_s: int = 14400
+    # Scan I/O pacing (see ``scanthrottle``): walker threads drop to the idle I/O class, and each
+    # tier's walk is rate-limited in inodes/s (0 = unlimited). The rate backs off while the pool's
+    # live ``zpool iostat -l`` wait time exceeds the tier's target, recovers below it, and is
+    # allowed to rise to the night rate during ``usage_scan_night_hours`` (local "start-end").
+    usage_scan_idle_io: bool = True
+    usage_scan_rate_inodes_s: int = 20000
+    usage_scan_night_rate_inodes_s: int = 100000
+    usage_scan_night_hours: str = "0-6"
+    usage_scan_fast_latency_ms: int = 5
+    usage_scan_slow_latency_ms: int = 50
     # Weekly in-container security patching (docker exec apt-get update && upgrade), driven by the
     # agent off a persistent local record so the pinned base image never needs rebuilding for CVEs.
     apt_update_enabled: bool = True
@@ -127,6 +157,42 @@ class AgentConfig:
         durable state DB so it shares the agent's private state directory."""
         return os.path.join(os.path.dirname(self.state_db) or ".", "maintenance.json")
 
+    @property
+    def usage_state(self) -> str:
+        """Checkpoint of the usage caches (per-student scan + lab-level totals), so a restart
+        neither loses them nor rescans every lab at once."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "usage_state.json")
+
+    @property
+    def scan_index(self) -> str:
+        """Persistent per-directory usage-scan index (SQLite), in the agent's private state dir."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "scanindex.db")
+
+    @property
+    def gpu_killer_state(self) -> str:
+        """Idle-GPU killer timers, so a restart does not reset every idle process's clock."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "gpu_killer.json")
+
+    @property
+    def gpu_trace_dir(self) -> str:
+        """Daily GPU snapshot traces for offline idle-policy replay."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "gpu-trace")
+
+    @property
+    def capabilities_cache(self) -> str:
+        """Last deep capability probe, so hello does not wait for a fresh one (see capcache)."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "capabilities.json")
+
+    @property
+    def gpu_assignments(self) -> str:
+        """Per-lab GPU subsets picked for lab containers (see ``gpuassign``)."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "gpu_assignments.json")
+
+    @property
+    def gpu_ledger(self) -> str:
+        """Hourly per-lab/per-student GPU-time ledger (SQLite), in the agent's private state dir."""
+        return os.path.join(os.path.dirname(self.state_db) or ".", "gpu_ledger.db")
+
     @property
     def scrub_pools(self) -> list[str]:
         """ZFS pools this node owns and can scrub. The slow pool is excluded on SMB cold storage."""
@@ -172,9 +238,23 @@ def load_config(path: Path | None = None) -> AgentConfig:
         "apparmor_profile",
         "state_db",
         "heartbeat_interval_s",
+        "health_watch_interval_s",
+        "gpu_device_sample_interval_s",
+        "gpu_trace_retain_days",
         "usage_publish_interval_s",
         "lab_usage_interval_s",
         "usage_scan_interval_s",
+        "usage_index_verify_interval_s",
+        "usage_scan_concurrency",
+        "usage_scan_fast_concurrency",
+        "usage_scan_slow_concurrency",
+        "usage_scan_timeout_s",
+        "usage_scan_idle_io",
+        "usage_scan_rate_inodes_s",
+        "usage_scan_night_rate_inodes_s",
+        "usage_scan_night_hours",
+        "usage_scan_fast_latency_ms",
+        "usage_scan_slow_latency_ms",
         "apt_update_enabled",
         "apt_update_interval_s",
         "apt_update_check_interval_s",
@@ -222,9 +302,23 @@ def render_config(cfg: AgentConfig) -> str:
         "apparmor_profile",
         "state_db",
         "heartbeat_interval_s",
+        "health_watch_interval_s",
+        "gpu_device_sample_interval_s",
+        "gpu_trace_retain_days",
         "usage_publish_interval_s",
         "lab_usage_interval_s",
         "usage_scan_interval_s",
+        "usage_index_verify_interval_s",
+        "usage_scan_concurrency",
+        "usage_scan_fast_concurrency",
+        "usage_scan_slow_concurrency",
+        "usage_scan_timeout_s",
+        "usage_scan_idle_io",
+        "usage_scan_rate_inodes_s",
+        "usage_scan_night_rate_inodes_s",
+        "usage_scan_night_hours",
+        "usage_scan_fast_latency_ms",
+        "usage_scan_slow_latency_ms",
         "apt_update_enabled",
         "apt_update_interval_s",
         "apt_update_check_interval_s",
@@ -6,15 +6,15 @@ container's writable layer, so removing + recreating the container keeps everyth
 
 from __future__ import annotations
 
-import os
+import dataclasses
+import time
 from typing import Any
 
-from . import coldstore, maintenance_state, usagereport
+from . import capcache, coldstore, gpuassign, maintenance_state, numaplace, usagereport
 from .config import AgentConfig
 from .executors import docker, zfs
 from .executors.docker import ContainerOptions, Mounts
 from .paths import lab_fast
-from .system import detect_capabilities
 
 
 # Docker labels stamped on every lab container. lab-agent.managed=true is the authoritative signal
@@ -48,7 +48,8 @@ def _mounts(cfg: AgentConfig, lab: str) -> Mounts:
 
 
 def assert_node_ready(cfg: AgentConfig) -> Any:
-    caps = detect_capabilities(cfg, deep=False)
+    # Served from the capability cache for up to capcache.SHALLOW_TTL_S.
+    caps = capcache.capabilities(cfg, deep=False)
     runtime_ok = caps.runtime.docker_ok and caps.runtime.userns_ok and caps.runtime.bwrap_ok
     if not runtime_ok or caps.health.status == "critical":
         raise docker.DockerError(
@@ -57,30 +58,66 @@ def assert_node_ready(cfg: AgentConfig) -> Any:
     return caps
 
 
+def _gpu_devices(cfg: AgentConfig, lab: str, params: dict[str, Any], caps: Any,
+                 gpus: bool) -> list[str] | None:
+    """The lab's pinned GPU indices for this placement, or None for every GPU."""
+    try:
+        request = gpuassign.requested(params)
+        if not gpus or request is None:
+            return None
+        return gpuassign.pick(cfg, lab, request, caps.nvidia.cdi_devices)
+    except gpuassign.GpuAssignmentError as exc:
+        raise docker.DockerError(f"cannot place lab '{lab}' on GPUs: {exc}") from exc
+
+
+def _placed(lab: str, opts: ContainerOptions,
+            gpu_devices: list[str] | None) -> tuple[ContainerOptions, dict[str, str]]:
+    """``opts`` with the lab's NUMA cpuset filled in, plus the labels recording it."""
+    placement = numaplace.place(lab, opts.cpus, gpu_devices, opts.memory)
+    if placement is None:
+        return opts, {}
+    opts = dataclasses.replace(opts, cpuset_cpus=placement.cpuset_cpus,
+                               cpuset_mems=placement.cpuset_mems)
+    return opts, placement.labels(opts.cpus)
+
+
 def ensure_container(cfg: AgentConfig, lab: str, params: dict[str, Any]) -> str:
     """Create the lab container fresh and verify that sshd becomes ready."""
     name = docker.container_name(lab, cfg.node_name)
     opts = ContainerOptions.from_params(params)
     mounts = _mounts(cfg, lab)
     caps = assert_node_ready(cfg)
+    gpus = caps.nvidia_gpu and caps.nvidia_cdi
+    gpu_devices = _gpu_devices(cfg, lab, params, caps, gpus)
+    opts, placement_labels = _placed(lab, opts, gpu_devices)
     # Pull before removing the old container: mutable tags such as :latest must resolve to the
     # newest registry image, and a registry failure must leave the existing container untouched.
     docker.ensure_image(opts.image)
-    docker.remove_container(name)
-    # GPUs are attached directly to the outer runc container through CDI.
-    container_id = docker.create_container(
-        name,
-        opts,
-        mounts,
-        gpus=caps.nvidia_gpu and caps.nvidia_cdi,
-        labels=_labels(cfg, lab),
-        hostname=docker.container_hostname(lab, cfg.node_name),
-    )
-    if not docker.wait_ssh_ready(name):
-        logs = docker.container_logs(name)
+    try:
         docker.remove_container(name)
-        detail = f": {logs}" if logs else ""
-        raise docker.DockerError(f"container did not become ready (SSH handshake failed){detail}")
+        # GPUs are attached directly to the outer runc container through CDI.
+        container_id = docker.create_container(
+            name,
+            opts,
+            mounts,
+            gpus=gpus,
+            labels={**_labels(cfg, lab), **placement_labels},
+            hostname=docker.container_hostname(lab, cfg.node_name),
+            gpu_devices=gpu_devices,
+        )
+        if not docker.wait_ssh_ready(name):
+            logs = docker.container_logs(name)
+            docker.remove_container(name)
+            detail = f": {logs}" if logs else ""
+            raise docker.DockerError(
+                f"container did not become ready (SSH handshake failed){detail}"
+            )
+    finally:
+        # The rootfs quota is fixed per container; re-read it for whichever one now exists.
+        usagereport.forget_rootfs_quota(lab)
+        # The container sweeps and smoke tests would now see a different set of labs.
+        capcache.invalidate(cfg)
+    gpuassign.record(cfg, lab, gpu_devices)
     return container_id
 
 
@@ -89,8 +126,11 @@ def recreate_container(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, s
     bind-mounted ZFS datasets, not the container's writable layer).
 
     Flow that never leaves the lab without a working container on failure:
-      1. Validate + ensure the proposed image is available BEFORE stopping the running container.
-      2. Stop the old container and rename it aside (<lab>-<node>-old) — preserved for rollback.
+      1. Validate + ensure the proposed image is available BEFORE stopping the running container,
+         plan the students' storage and apply the steps that are safe online
+         (``studentops.plan_storage``).
+      2. Stop the old container and rename it aside (<lab>-<node>-old) — preserved for rollback —
+         and run the remaining storage migrations in parallel while it is down.
       3. Create the candidate under the real name and wait for sshd readiness.
       4. On success, delete the preserved old container (promote). On any failure, remove the
          candidate and restore + restart the old container, then surface the error.
@@ -102,10 +142,31 @@ def recreate_container(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, s
     mounts = _mounts(cfg, lab)
     caps = assert_node_ready(cfg)
     gpus = caps.nvidia_gpu and caps.nvidia_cdi
+    gpu_devices = _gpu_devices(cfg, lab, params, caps, gpus)
+    opts, placement_labels = _placed(lab, opts, gpu_devices)
 
     # 1. Fail early if the image is bad/unavailable — the working container is still untouched.
     docker.ensure_image(opts.image)
 
+    # Changing per-student quota mode is only allowed as part of recreation. Quota updates and
+    # ownership fixes apply live, so they run now; promoting an existing directory to a child
+    # dataset must not race student writes, so it waits for the stop below. Quota-disabled
+    # placements retain the original flat directory layout.
+    from . import studentops
+    fast_quota = params.get("student_fast_quota_bytes")
+    cold_quota = params.get("student_cold_quota_bytes")
+    storage = studentops.lab_storage(cfg, lab)
+    plan = studentops.plan_storage(cfg, lab, usagereport.list_lab_students(cfg, lab),
+                                   fast_quota, cold_quota, storage)
+    by_action = {action: [p for p in plan if p.action == action]
+                 for action in (studentops.UNCHANGED, studentops.ONLINE, studentops.MIGRATE)}
+    failed = studentops.apply_storage_plan(cfg, lab, by_action[studentops.ONLINE],
+                                           fast_quota, cold_quota, storage)
+    if failed:
+        username, exc = failed[0]
+        raise docker.DockerError(
+            f"student quota preparation failed for '{username}': {exc}") from exc
+
     had_old = docker.container_exists(name)
     if had_old:
         # 2. Preserve the current container aside (clear any stale -old first).
@@ -113,32 +174,23 @@ def recreate_container(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, s
         docker.remove_container(old)
         docker.rename_container(name, old)
 
-    # Changing per-student quota mode is only allowed as part of recreation. The old container is
-    # stopped here, so existing directories can be promoted to child datasets without concurrent
-    # student writes. Quota-disabled placements retain the original flat directory layout.
-    from . import studentops
-    fast_quota = params.get("student_fast_quota_bytes")
-    cold_quota = params.get("student_cold_quota_bytes")
-    root = zfs.get_mountpoint(lab_fast(cfg, lab))
-    for username in usagereport.list_lab_students(cfg, lab):
-        try:
-            stat = os.stat(f"{root}/{username}")
-            studentops.prepare_student_storage(
-                cfg, lab, username, stat.st_uid, stat.st_gid, fast_quota, cold_quota,
-            )
-        except Exception as exc:
-            if had_old and docker.container_exists(old):
-                docker.rename_container(old, name)
-                docker.start_container(name)
-            raise docker.DockerError(
-                f"student quota preparation failed for '{username}': {exc}"
-            ) from exc
+    started = time.monotonic()
+    failed = studentops.apply_storage_plan(cfg, lab, by_action[studentops.MIGRATE],
+                                           fast_quota, cold_quota, storage)
+    storage_downtime_ms = int((time.monotonic() - started) * 1000)
+    if failed:
+        if had_old and docker.container_exists(old):
+            docker.rename_container(old, name)
+            docker.start_container(name)
+        username, exc = failed[0]
+        raise docker.DockerError(
+            f"student quota preparation failed for '{username}': {exc}") from exc
 
     try:
         # 3. Bring up the candidate under the real name and verify it actually started.
         container_id = docker.create_container(
-            name, opts, mounts, gpus=gpus, labels=_labels(cfg, lab),
-            hostname=docker.container_hostname(lab, cfg.node_name),
+            name, opts, mounts, gpus=gpus, labels={**_labels(cfg, lab), **placement_labels},
+            hostname=docker.container_hostname(lab, cfg.node_name), gpu_devices=gpu_devices,
         )
         if not docker.wait_ssh_ready(name):
             logs = docker.container_logs(name)
@@ -158,12 +210,23 @@ def recreate_container(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, s
         raise docker.DockerError(
             f"recreate failed for lab '{lab}', rolled back to the previous container: {exc}"
         ) from exc
+    finally:
+        usagereport.forget_rootfs_quota(lab)
+        capcache.invalidate(cfg)
 
     # 4b. Promote: remove the preserved old container now the candidate is confirmed healthy.
     if had_old:
         docker.remove_container(old)
+    gpuassign.record(cfg, lab, gpu_devices)
 
     # A recreated container has a fresh writable layer = the unpatched pinned base image. Clear the
     # apt-upgrade record so the weekly package loop re-patches it on its next tick.
     maintenance_state.mark_unpatched(cfg, lab)
-    return {"lab": lab, "container": container_id}, f"recreated container for lab '{lab}'"
+    storage_plan = {action: len(entries) for action, entries in by_action.items()}
+    storage_plan["downtime_ms"] = storage_downtime_ms
+    return ({"lab": lab, "container": container_id, "gpu_devices": gpu_devices,
+             "storage_plan": storage_plan},
+            f"recreated container for lab '{lab}'; student storage: "
+            f"{storage_plan[studentops.UNCHANGED]} unchanged, "
+            f"{storage_plan[studentops.ONLINE]} updated online, "
+            f"{storage_plan[studentops.MIGRATE]} migrated in {storage_downtime_ms} ms of downtime")
@@ -11,10 +11,10 @@ import traceback
 from collections.abc import Callable
 from typing import Any
 
+from . import capcache
 from . import protocol as P
 from .config import AgentConfig
 from .logbus import LogBus
-from .system import detect_capabilities
 
 # A handler takes (cfg, params) and returns (result_payload, logs_text).
 Handler = Callable[[AgentConfig, dict[str, Any]], tuple[Any, str]]
@@ -44,12 +44,13 @@ class Dispatcher:
         self.register(P.A_LAB_DESTROY, labops.destroy_lab)
         self.register(P.A_CONTAINER_RECREATE, containerops.recreate_container)
         self.register(P.A_STUDENT_ADD, studentops.add_student)
+        self.register(P.A_STUDENT_ADD_BATCH, studentops.add_students)
         self.register(P.A_STUDENT_REMOVE, studentops.remove_student)
         self.register(P.A_STUDENT_DELETE_COLD, studentops.delete_cold_student)
         self.register(P.A_GPU_POLICY_UPDATE, gpu_policy.update_policy_handler)
 
     def _report_state(self, cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
-        caps = detect_capabilities(cfg)
+        caps = capcache.capabilities(cfg)
         return caps.to_dict(), ""
 
     def handle(self, task: P.Task) -> dict[str, Any]:
@@ -3,7 +3,8 @@
 One container per lab (name+hostname ``<lab>-<node>``). Creation options (cpu/ram/shm/image-quota/
 port/restart) are baked into ``docker run`` and frozen for the container's life; changing them means
 ``recreate`` (which preserves the ZFS data, since data lives in bind-mounted datasets, not the
-container layer). All NVIDIA GPUs are always passed.
+container layer). NVIDIA GPUs are passed as CDI devices: every GPU, or the lab's pinned subset
+(see ``gpuassign``).
 
 The persistent mounts are the lab's fast root at ``/home`` and cold root at ``/cold-storage``, plus
 read-only agent-published quota snapshot at ``/run/labquota``. There is no lab-side engine or
@@ -88,6 +89,9 @@ class ContainerOptions:
     ssh_port: int = 0
     restart: str = "unless-stopped"
     extra_env: dict[str, str] = field(default_factory=dict)
+    # Set by the agent's NUMA placement (see numaplace), not by the controller.
+    cpuset_cpus: str = ""
+    cpuset_mems: str = ""
 
     @classmethod
     def from_params(cls, params: dict) -> ContainerOptions:
@@ -123,14 +127,20 @@ def build_run_args(
     storage_quota_supported: bool = True,
     labels: dict[str, str] | None = None,
     hostname: str | None = None,
+    gpu_devices: list[str] | None = None,
 ) -> list[str]:
-    """Pure function building the `docker run` argv (unit-tested without Docker)."""
+    """Pure function building the `docker run` argv (unit-tested without Docker). With ``gpus``,
+    ``gpu_devices`` limits the container to those GPU indices; None passes every GPU."""
     args = ["docker", "run", "-d", "--name", name]
     if hostname:
         args += ["--hostname", hostname]
     if opts.ssh_port:
         args += ["-p", f"{opts.ssh_port}:22"]
     args += ["--cpus", opts.cpus, "--memory", opts.memory, "--shm-size", opts.shm_size]
+    if opts.cpuset_cpus:
+        args += ["--cpuset-cpus", opts.cpuset_cpus]
+    if opts.cpuset_mems:
+        args += ["--cpuset-mems", opts.cpuset_mems]
     # A daemon-remapped parent user namespace locks inherited mounts against a student's nested
     # namespace, so bubblewrap cannot change root mount propagation. Labs use the initial user
     # namespace; students are non-root by default and sudo requires their password.
@@ -155,7 +165,8 @@ def build_run_args(
     # AppArmor profile carries the equivalent system-path restrictions without those overmounts.
     args += ["--security-opt", "systempaths=unconfined"]
     if gpus:
-        args += ["--device", "nvidia.com/gpu=all"]
+        for device in gpu_devices or ["all"]:
+            args += ["--device", f"nvidia.com/gpu={device}"]
     if storage_quota_supported and opts.rootfs_quota:
         args += ["--storage-opt", f"size={opts.rootfs_quota}"]
     args += ["--restart", opts.restart]
@@ -184,6 +195,27 @@ def container_exists(name: str) -> bool:
     return res.ok and name in res.stdout.split()
 
 
+def container_id(name: str) -> str | None:
+    """Full ID of the container named ``name``, or None if it does not exist."""
+    res = run(["docker", "inspect", "--format", "{{.Id}}", name], timeout=30)
+    cid = res.stdout.strip() if res.ok else ""
+    return cid or None
+
+
+def managed_container_ids() -> dict[str, str] | None:
+    """Name -> full ID of every agent-managed container (one ``docker ps``), None if it failed."""
+    res = run(["docker", "ps", "-a", "--no-trunc", "--filter", "label=lab-agent.managed=true",
+               "--format", "{{.Names}}\t{{.ID}}"], timeout=30)
+    if not res.ok:
+        return None
+    out: dict[str, str] = {}
+    for line in res.stdout.splitlines():
+        name, _, cid = line.partition("\t")
+        if name and cid:
+            out[name] = cid.strip()
+    return out
+
+
 def remove_container(name: str) -> None:
     if container_exists(name):
         res = run(["docker", "rm", "-f", name], timeout=120)
@@ -199,9 +231,11 @@ def create_container(
     gpus: bool,
     labels: dict[str, str] | None = None,
     hostname: str | None = None,
+    gpu_devices: list[str] | None = None,
 ) -> str:
     res = run(
-        build_run_args(name, opts, mounts, gpus=gpus, labels=labels, hostname=hostname),
+        build_run_args(name, opts, mounts, gpus=gpus, labels=labels, hostname=hostname,
+                       gpu_devices=gpu_devices),
         timeout=180,
     )
     if not res.ok:
@@ -295,6 +329,33 @@ def writable_layer_size(name: str) -> int | None:
         return None
 
 
+def layer_dataset(name: str) -> tuple[str, str] | None:
+    """``(container ID, ZFS dataset)`` of the container's writable layer, or None.
+
+    With the ``zfs`` storage driver every container's writable layer is its own ZFS clone, named in
+    ``GraphDriver.Data.Dataset``; its ``used``/``quota`` are then plain ZFS properties, readable for
+    every container from one ``zfs list`` instead of a ``docker inspect --size`` filesystem walk.
+    None for a missing container or any other storage driver.
+    """
+    res = run(
+        ["docker", "inspect", "--format", "{{.Id}} {{json .GraphDriver}}", name], timeout=30
+    )
+    if not res.ok:
+        return None
+    cid, _, raw = res.stdout.strip().partition(" ")
+    try:
+        graph = json.loads(raw or "null") or {}
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(graph, dict) or graph.get("Name") != "zfs":
+        return None
+    data = graph.get("Data")
+    dataset = data.get("Dataset") if isinstance(data, dict) else None
+    if not cid or not isinstance(dataset, str) or not dataset:
+        return None
+    return cid, dataset
+
+
 # Human sizes as docker parses them for --storage-opt size= (binary multiples, optional i?B).
 SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4, "p": 1024**5}
 SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([bkmgtp]?)(?:i?b)?$", re.IGNORECASE)
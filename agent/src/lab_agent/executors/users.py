@@ -12,6 +12,7 @@ appears in the host process list.
 from __future__ import annotations
 
 import re
+from dataclasses import dataclass
 
 from .base import CommandResult
 from .docker import DockerError, exec_in
@@ -47,22 +48,87 @@ def validate_uid(uid: int, gid: int) -> None:
         )
 
 
-def add_user(container: str, username: str, password: str, uid: int, gid: int) -> CommandResult:
-    validate_username(username)
-    validate_uid(uid, gid)
-    # Password is embedded in the stdin-piped script body, never in argv.
-    #
-    # Full sudo is retained, but it must require the student's password. A late-sorted per-user rule
-    # overrides NOPASSWD defaults that may be supplied by the base image.
-    script = f"""set -e
-u={username}
+def validate_password(password: str) -> None:
+    # chpasswd reads one "user:password" per line.
+    if not password or any(c in password for c in "\r\n\0"):
+        raise DockerError("password must be non-empty and a single line")
+
+
+OWNERSHIP_MARKER = "lab-agent-ownership"
+
+
+@dataclass
+class Ownership:
+    """What converging a new account's home ownership cost (see ``_account_script``)."""
+
+    inodes: int  # inodes whose ownership was rewritten
+    elapsed_ms: int
+    walked: bool  # the home root was not the student's, so the whole tree was walked
+
+
+def ownership_reports(stdout: str) -> dict[str, Ownership]:
+    """username -> ``Ownership`` from the marker lines an account script printed."""
+    out: dict[str, Ownership] = {}
+    for line in stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 5 and parts[0] == OWNERSHIP_MARKER:
+            try:
+                out[parts[1]] = Ownership(int(parts[2]), int(parts[3]), parts[4] == "1")
+            except ValueError:
+                continue
+    return out
+
+
+def _ownership_block(uid: int, gid: int, *, home: str = '/home/"$u"',
+                     skel: str = "/etc/skel") -> str:
+    """The shell that converges a new account's home ownership (see ``_account_script``).
+
+    ``home`` and ``skel`` are shell words (``$u`` is the username); tests run the block against a
+    scratch tree. Prints the ``OWNERSHIP_MARKER`` line.
+    """
+    wrong = f"\\( ! -uid {uid} -o ! -gid {gid} \\) -exec chown -h {uid}:{gid} {{}} + -printf x"
+    return f"""  started=$(date +%s%N)
+  touched=0
+  for src in {skel}/.[!.]* {skel}/..?* {skel}/*; do
+    if [ ! -e "$src" ] && [ ! -L "$src" ]; then continue; fi
+    dest={home}/"${{src##*/}}"
+    if [ -e "$dest" ] || [ -L "$dest" ]; then continue; fi
+    cp -a "$src" "$dest"
+    n=$(find "$dest" -exec chown -h {uid}:{gid} {{}} + -printf x)
+    touched=$((touched + ${{#n}}))
+  done
+  walked=0
+  if [ "$(stat -c %u:%g {home})" = "{uid}:{gid}" ]; then
+    n=$(find {home} -mindepth 1 -maxdepth 1 {wrong})
+  else
+    walked=1
+    n=$(find {home} -xdev {wrong})
+  fi
+  touched=$((touched + ${{#n}}))
+  elapsed=$(( ($(date +%s%N) - started) / 1000000 ))
+  printf '%s\\t%s\\t%s\\t%s\\t%s\\n' {OWNERSHIP_MARKER} "$u" "$touched" "$elapsed" "$walked"
+"""
+
+
+def _account_script(username: str, uid: int, gid: int) -> str:
+    """Create/converge one account (no password); runs under ``set -e``.
+
+    A new account's home is usually not new: a returning student or a recreated container brings
+    a persistent home that may hold millions of files, so ownership is converged without
+    ``chown -R``. Only skeleton entries the home lacks are copied, and only those are chowned;
+    when the home root already belongs to the student just its top-level entries are checked;
+    otherwise (a home left by another uid) the tree is walked but only inodes with the wrong
+    owner are rewritten. The cost is printed as an ``OWNERSHIP_MARKER`` line.
+
+    Full sudo is retained, but it must require the student's password. A late-sorted per-user rule
+    overrides NOPASSWD defaults that may be supplied by the base image.
+    """
+    return f"""u={username}
 existing_group=$(getent group {gid} | cut -d: -f1 || true)
 if [ -z "$existing_group" ]; then groupadd -g {gid} "$u"; else test "$existing_group" = "$u"; fi
 if ! id "$u" >/dev/null 2>&1; then
   useradd -M -d /home/"$u" -u {uid} -g {gid} -s /bin/bash "$u"
-  cp -a -n /etc/skel/. /home/"$u"/
-  chown -R {uid}:{gid} /home/"$u"/
-fi
+{_ownership_block(uid, gid)}fi
 test "$(id -u "$u")" = "{uid}"
 test "$(id -g "$u")" = "{gid}"
 usermod -aG sudo "$u"
@@ -76,11 +142,76 @@ fi
 ln -sfn /cold-storage/"$u" /home/"$u"/cold-storage
 chown -h {uid}:{gid} /home/"$u"/cold-storage
 grep -q '^umask ' /home/"$u"/.bashrc 2>/dev/null || echo 'umask 027' >> /home/"$u"/.bashrc
-printf '%s:%s' "$u" {_shell_quote(password)} | chpasswd
 """
+
+
+def add_user(container: str, username: str, password: str, uid: int, gid: int) -> CommandResult:
+    validate_username(username)
+    validate_uid(uid, gid)
+    # Password is embedded in the stdin-piped script body, never in argv.
+    script = (
+        "set -e\n"
+        + _account_script(username, uid, gid)
+        + f"printf '%s:%s' \"$u\" {_shell_quote(password)} | chpasswd\n"
+    )
     return _run_script(container, script)
 
 
+BATCH_MARKER = "lab-agent-account"
+# No "user:password" line can equal it: it has no colon.
+_PASSWORDS_EOF = "LAB_AGENT_PASSWORDS"
+
+
+def add_users(container: str, accounts: list[tuple[str, str, int, int]]
+              ) -> tuple[dict[str, str | None], dict[str, Ownership]]:
+    """Create many accounts with one ``docker exec``: each account as in ``add_user``, then every
+    password through one ``chpasswd`` stream. ``accounts`` are ``(username, password, uid, gid)``.
+
+    Accounts are independent — each runs in its own ``set -e`` subshell and one failing does not
+    stop the rest; only accounts that were created get a password. Returns username -> None on
+    success or the error, and the ``Ownership`` report of every account that was new. Passwords
+    live only in the stdin-piped script's here-document.
+    """
+    for username, password, uid, gid in accounts:
+        validate_username(username)
+        validate_uid(uid, gid)
+        validate_password(password)
+    # Each account's stderr is captured for its result; its stdout (the ownership report) is not.
+    lines = ["exec 3>&1", 'ok=" "']
+    for username, _password, uid, gid in accounts:
+        lines += [
+            "err=$( (",
+            "set -e",
+            _account_script(username, uid, gid).rstrip("\n"),
+            ") 2>&1 >&3 )",
+            "rc=$?",
+            f'if [ "$rc" = 0 ]; then ok="${{ok}}{username} "; fi',
+            f"printf '%s\\t%s\\t%s\\t%s\\n' {BATCH_MARKER} {username} \"$rc\" "
+            "\"$(printf '%s' \"$err\" | tr '\\t\\n' '  ')\"",
+        ]
+    lines += [
+        "while IFS= read -r line; do",
+        '  case "$ok" in *" ${line%%:*} "*) printf \'%s\\n\' "$line" ;; esac',
+        f"done <<'{_PASSWORDS_EOF}' | chpasswd",
+        *(f"{username}:{password}" for username, password, _uid, _gid in accounts),
+        _PASSWORDS_EOF,
+    ]
+    res = exec_in(container, ["sh", "-s"], input_text="\n".join(lines) + "\n",
+                  timeout=120 + 5 * len(accounts))
+    out: dict[str, str | None] = {}
+    for line in res.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 4 and parts[0] == BATCH_MARKER:
+            out[parts[1]] = None if parts[2] == "0" else (parts[3].strip() or f"exit {parts[2]}")
+    for username, *_ in accounts:
+        if username not in out:
+            out[username] = ((res.stderr.strip() if not res.ok else "")
+                             or "batch account script did not report this account")
+        elif out[username] is None and not res.ok and f"(user {username})" in res.stderr:
+            out[username] = f"chpasswd failed: {res.stderr.strip()}"
+    return out, ownership_reports(res.stdout)
+
+
 def set_password(container: str, username: str, password: str) -> CommandResult:
     validate_username(username)
     script = f"printf '%s:%s' {username} {_shell_quote(password)} | chpasswd\n"
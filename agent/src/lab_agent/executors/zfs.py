@@ -107,6 +107,18 @@ def list_usage(root: str) -> list[Usage]:
     return out
 
 
+def list_children(parent: str) -> dict[str, int | None]:
+    """Direct child datasets of ``parent`` -> their quota (None when unset), in one ``zfs list``."""
+    res = _checked(run(["zfs", "list", "-Hp", "-d", "1", "-o", "name,quota", parent], timeout=60))
+    out: dict[str, int | None] = {}
+    for line in res.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) < 2 or parts[0] == parent:
+            continue
+        out[parts[0]] = _parse_int(parts[1]) or None  # -p reports an unset quota as 0
+    return out
+
+
 def get_mountpoint(dataset: str) -> str:
     res = _checked(run(["zfs", "get", "-H", "-o", "value", "mountpoint", dataset], timeout=20))
     return res.stdout.strip()
@@ -0,0 +1,146 @@
+"""Per-device GPU health: sampled locally, summarised per heartbeat.
+
+One ``nvidia-smi --query-gpu`` call reads every device's utilization, memory, temperature, power,
+clocks, ECC error count and active throttle reasons. The agent samples it every
+``gpu_device_sample_interval_s`` into a bounded ring (``DeviceHistory``); each heartbeat carries
+only a min/avg/max summary of the samples since the previous one, so the controller can chart
+device health — and tell thermal or power throttling from contention — without high-rate frames.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from ..executors.base import run
+
+# (nvidia-smi field, sample key, scale) — MiB is reported as bytes.
+_FIELDS: tuple[tuple[str, str, float], ...] = (
+    ("utilization.gpu", "util_pct", 1),
+    ("utilization.memory", "mem_util_pct", 1),
+    ("memory.used", "mem_used_bytes", 1024 * 1024),
+    ("memory.total", "mem_total_bytes", 1024 * 1024),
+    ("temperature.gpu", "temp_c", 1),
+    ("power.draw", "power_w", 1),
+    ("clocks.sm", "sm_clock_mhz", 1),
+    ("clocks.mem", "mem_clock_mhz", 1),
+)
+# Summarised as min/avg/max.
+GAUGES = tuple(key for _f, key, _s in _FIELDS)
+QUERY = ",".join(
+    ["index", "uuid", *(f for f, _k, _s in _FIELDS),
+     "ecc.errors.uncorrected.volatile.total", "clocks_throttle_reasons.active"]
+)
+
+# Samples kept per device (an hour at the default 5 s cadence).
+HISTORY = 720
+
+
+def _number(value: str) -> float | None:
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "[N/A]", "[Not Supported]"
+
+
+def parse_query_gpu(text: str) -> list[dict[str, Any]]:
+    """Parse ``nvidia-smi --query-gpu=<QUERY> --format=csv,noheader,nounits``. Pure, for tests."""
+    devices: list[dict[str, Any]] = []
+    for line in text.splitlines():
+        cols = [c.strip() for c in line.split(",")]
+        if len(cols) != len(_FIELDS) + 4:
+            continue
+        try:
+            index = int(cols[0])
+        except ValueError:
+            continue
+        sample: dict[str, Any] = {"index": index, "uuid": cols[1]}
+        for (_field, key, scale), raw in zip(_FIELDS, cols[2:], strict=False):
+            number = _number(raw)
+            sample[key] = None if number is None else (
+                int(number * scale) if scale != 1 else number)
+        ecc = _number(cols[-2])
+        sample["ecc_uncorrected"] = int(ecc) if ecc is not None else None
+        try:
+            sample["throttle_reasons"] = int(cols[-1], 16)
+        except ValueError:
+            sample["throttle_reasons"] = None
+        devices.append(sample)
+    return devices
+
+
+def query_devices() -> list[dict[str, Any]]:
+    """One reading of every GPU; empty when nvidia-smi is missing or fails."""
+    res = run(["nvidia-smi", f"--query-gpu={QUERY}", "--format=csv,noheader,nounits"], timeout=20)
+    if not res.ok:
+        return []
+    return parse_query_gpu(res.stdout)
+
+
+class DeviceHistory:
+    """Bounded per-device ring of samples. Thread-safe: recorded from a worker thread, summarised
+    from the heartbeat's."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rings: dict[int, deque[tuple[float, dict[str, Any]]]] = {}
+
+    def record(self, samples: list[dict[str, Any]], now: float | None = None) -> None:
+        now = self._clock() if now is None else now
+        with self._lock:
+            for sample in samples:
+                ring = self._rings.setdefault(sample["index"], deque(maxlen=HISTORY))
+                ring.append((now, sample))
+
+    def memory(self, max_age_s: float) -> dict[str, dict[str, int]]:
+        """Latest ``{"used_bytes", "total_bytes"}`` per GPU index (a string, like process
+        placements), from samples no older than ``max_age_s``. Feeds the killer's memory-pressure
+        schedule."""
+        now = self._clock()
+        out: dict[str, dict[str, int]] = {}
+        with self._lock:
+            for index, ring in self._rings.items():
+                if not ring:
+                    continue
+                t, sample = ring[-1]
+                used, total = sample.get("mem_used_bytes"), sample.get("mem_total_bytes")
+                if t >= now - max_age_s and used is not None and total:
+                    out[str(index)] = {"used_bytes": used, "total_bytes": total}
+        return out
+
+    def summary(self, window_s: float) -> list[dict[str, Any]]:
+        """Per device over the last ``window_s``: min/avg/max of each gauge, the highest ECC
+        count, and every throttle reason that was active in any sample (OR of the bitmasks)."""
+        now = self._clock()
+        with self._lock:
+            windows = {
+                index: [s for t, s in ring if t >= now - window_s]
+                for index, ring in self._rings.items()
+            }
+        out: list[dict[str, Any]] = []
+        for index, samples in sorted(windows.items()):
+            if not samples:
+                continue
+            row: dict[str, Any] = {"index": index, "uuid": samples[-1]["uuid"],
+                                   "samples": len(samples)}
+            for key in GAUGES:
+                values = [s[key] for s in samples if s.get(key) is not None]
+                row[key] = {
+                    "min": min(values), "avg": round(sum(values) / len(values), 1),
+                    "max": max(values),
+                } if values else None
+            ecc = [s["ecc_uncorrected"] for s in samples if s.get("ecc_uncorrected") is not None]
+            row["ecc_uncorrected"] = max(ecc) if ecc else None
+            reasons = [s["throttle_reasons"] for s in samples
+                       if s.get("throttle_reasons") is not None]
+            mask = 0
+            for r in reasons:
+                mask |= r
+            row["throttle_reasons"] = mask if reasons else None
+            out.append(row)
+        return out
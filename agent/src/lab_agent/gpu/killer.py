@@ -1,16 +1,44 @@
 """Idle-GPU-process state machine: active -> idle -> warned -> killed.
 
-A process counts as *idle* when it holds VRAM but its SM utilization is at/below the threshold. The
-machine tracks how long each PID has been idle and decides when to warn (notify the owner) and,
-after the grace period, kill. ``evaluate`` is deterministic given (processes, policy, now) so it
-can be unit-tested across simulated time; the surrounding loop performs the kill + event emission.
+A process counts as *idle* when it holds VRAM but its SM utilization is at/below the threshold —
+judged over the policy's trailing window once ``util_window`` holds enough samples, else from the
+latest reading. The machine tracks how long each PID has been idle and decides when to warn (notify
+the owner) and, after the grace period, kill. ``evaluate`` is deterministic given (processes,
+policy, now, devices) so it can be unit-tested across simulated time; the surrounding loop performs
+the kill + event emission.
+
+With per-device memory readings the schedule follows memory pressure (see ``GpuPolicy``): idle
+processes on a device short of free VRAM are reclaimed on the shorter pressure schedule, biggest
+VRAM x idle time first and only as many as it takes to get the device back above the threshold;
+on devices with plenty free the schedule is stretched.
 """
 
 from __future__ import annotations
 
+import json
+import math
+import os
+import time
+from collections.abc import Callable
 from dataclasses import dataclass
 from typing import Any
 
+from .sampler import MIN_SAMPLES
+
+# While timers are tracked, the state file is rewritten at least this often so its
+# ``observed_at`` bounds the unobserved gap after a restart.
+OBSERVED_RESAVE_S = 60.0
+
+
+def restore_max_gap_s(policy) -> float:
+    """How long the agent may be down and keep its idle timers, shifted past the unobserved gap.
+
+    Scaled to the policy's idle window: an upgrade or a slow restart keeps the schedule, but after
+    an outage longer than a whole idle window nobody knows what the processes did, so their timers
+    start over (a process warned before gets a fresh warning and a full grace).
+    """
+    return policy.idle_minutes * 60
+
 
 def lab_from_container(container: str | None) -> str | None:
     if container and container.startswith("lab-"):
@@ -31,15 +59,133 @@ class Decision:
     lab: str | None
     user: str | None
     idle_s: int = 0  # how long the process had been idle when the decision fired
+    pressure: str | None = None  # GPU index whose memory pressure shortened the schedule
+
+
+Identity = tuple[int, int | None]  # (pid, start time): a recycled PID is a different process
+
+
+def _identity(proc: dict[str, Any]) -> Identity:
+    return (proc["pid"], proc.get("start_time"))
+
+
+def _free_fractions(devices: dict[str, dict[str, int]] | None) -> dict[str, float]:
+    out: dict[str, float] = {}
+    for index, mem in (devices or {}).items():
+        total = mem.get("total_bytes") or 0
+        if total > 0 and mem.get("used_bytes") is not None:
+            out[index] = max(0.0, total - mem["used_bytes"]) / total
+    return out
+
+
+def _on_devices(proc: dict[str, Any], free: dict[str, float]) -> list[str]:
+    """The GPUs ``proc`` holds memory on; without a placement, the only GPU if there is one."""
+    placed = proc.get("devices")
+    if placed:
+        return [d for d in placed if d in free]
+    return list(free) if len(free) == 1 else []
+
+
+def _vram_on(proc: dict[str, Any], device: str) -> int:
+    placed = (proc.get("devices") or {}).get(device)
+    if placed is not None:
+        return placed.get("vram_bytes") or 0
+    return proc.get("vram_bytes") or 0
 
 
 class GpuKiller:
-    def __init__(self):
-        # pid -> {"idle_since": float|None, "warned_at": float|None}
-        self._state: dict[int, dict[str, float | None]] = {}
+    """Idle timers per process identity. With ``state_path`` the timers survive agent restarts:
+    they are reloaded on construction (dropping any whose process is gone or whose PID now
+    belongs to another process) and written back by ``save``, so an agent upgrade does not hand
+    every idle process a fresh ``idle_minutes + grace_minutes``. Time the agent was down is never
+    credited as idle time (see ``restore_max_gap_s``)."""
+
+    def __init__(self, state_path: str | None = None,
+                 start_time: Callable[[int], int | None] | None = None,
+                 clock: Callable[[], float] = time.time):
+        # (pid, start_time) -> {"idle_since": float|None, "warned_at": float|None,
+        #                       "pressured": bool (warned on the pressure schedule)}
+        self._state: dict[Identity, dict[str, Any]] = {}
+        self._state_path = state_path
+        self._saved: list | None = None
+        self._observed_at: float | None = None  # ``now`` of the latest evaluation
+        self._saved_observed_at: float | None = None
+        # Unobserved seconds before the restored timers; checked against the first policy.
+        self._restore_gap: float | None = None
+        if state_path is not None:
+            self._load(state_path, start_time, clock())
+
+    def _load(self, path: str, start_time: Callable[[int], int | None] | None,
+              now: float) -> None:
+        if start_time is None:
+            from .monitor import pid_start_time as start_time
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return  # best-effort: a missing or corrupt file just restarts the timers
+        if not isinstance(data, dict):
+            return
+        entries = data.get("procs")
+        observed_at = data.get("observed_at")
+        gap = (now - observed_at if isinstance(observed_at, (int, float)) and observed_at <= now
+               else math.inf)
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                pid, started, idle_since, warned_at, *rest = entry
+                pid, started = int(pid), int(started)
+            except (TypeError, ValueError):
+                continue
+            pressured = bool(rest[0]) if rest else False
+            if not all(v is None or isinstance(v, (int, float)) for v in (idle_since, warned_at)):
+                continue
+            if start_time(pid) != started:
+                continue  # exited, or the PID was recycled
+            if gap != math.inf:
+                idle_since = idle_since + gap if idle_since is not None else None
+                warned_at = warned_at + gap if warned_at is not None else None
+            self._state[(pid, started)] = {"idle_since": idle_since, "warned_at": warned_at,
+                                           "pressured": pressured and warned_at is not None}
+        self._saved = self._entries()
+        self._restore_gap = gap
+
+    def _entries(self) -> list:
+        # Only identities with a start time can be re-verified after a restart.
+        return sorted([pid, started, st["idle_since"], st["warned_at"], int(st["pressured"])]
+                      for (pid, started), st in self._state.items() if started is not None)
+
+    def save(self) -> None:
+        """Persist the timers if they changed since the last save/load, or every
+        ``OBSERVED_RESAVE_S`` while any are tracked (atomic replace, mode 0600)."""
+        if self._state_path is None:
+            return
+        entries = self._entries()
+        if entries == self._saved and not (
+            entries and self._observed_at is not None
+            and (self._saved_observed_at is None
+                 or self._observed_at - self._saved_observed_at >= OBSERVED_RESAVE_S)
+        ):
+            return
+        parent = os.path.dirname(self._state_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = f"{self._state_path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)  # a tmp file left over from an older agent keeps its own mode
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"procs": entries, "observed_at": self._observed_at}, fh,
+                      separators=(",", ":"))
+        os.replace(tmp, self._state_path)
+        self._saved = entries
+        self._saved_observed_at = self._observed_at
 
     def _is_idle(self, proc: dict[str, Any], policy) -> bool:
         vram = proc.get("vram_bytes") or 0
+        window = proc.get("util_window")
+        if window and window.get("samples", 0) >= MIN_SAMPLES:
+            # Enough history: judge the window's percentile, so a bursty job that happened to be
+            # at 0% for the latest reading is not mistaken for idle.
+            return vram > 0 and window["quantile"] <= policy.util_threshold
         util = proc.get("util")
         # Unknown utilization is treated as active (conservative — never kill on missing data).
         return vram > 0 and util is not None and util <= policy.util_threshold
@@ -49,30 +195,79 @@ class GpuKiller:
         lab = _lab_of(proc)
         return (user in policy.whitelist_users) or (lab in policy.whitelist_labs)
 
-    def evaluate(self, processes: list[dict[str, Any]], policy, now: float) -> list[Decision]:
+    def _schedule(self, proc: dict[str, Any], free: dict[str, float],
+                  policy) -> tuple[float, float, str | None]:
+        """(idle seconds before the warning, grace seconds before the kill, pressured GPU)."""
+        on = _on_devices(proc, free)
+        if on and policy.pressure_free_fraction > 0:
+            tightest = min(on, key=lambda d: free[d])
+            if free[tightest] < policy.pressure_free_fraction:
+                return (policy.pressure_idle_minutes * 60, policy.pressure_grace_minutes * 60,
+                        tightest)
+        idle_s, grace_s = policy.idle_minutes * 60, policy.grace_minutes * 60
+        if (on and policy.relaxed_free_fraction > 0
+                and all(free[d] >= policy.relaxed_free_fraction for d in on)):
+            return idle_s * policy.relaxed_factor, grace_s * policy.relaxed_factor, None
+        return idle_s, grace_s, None
+
+    def _reclaim(self, due: list[tuple[Decision, Identity]],
+                 devices: dict[str, dict[str, int]] | None, policy) -> list[Decision]:
+        """Pressure kills that are due, ranked by VRAM x idle time, until each pressured device
+        would be back at ``pressure_free_fraction`` free. The rest keep their timers and are
+        reconsidered on the next evaluation."""
+        due.sort(key=lambda item: _vram_on(item[0].proc, item[0].pressure or "")
+                 * item[0].idle_s, reverse=True)
+        freed: dict[str, int] = {}
+        out: list[Decision] = []
+        for decision, key in due:
+            device = decision.pressure or ""
+            mem = (devices or {})[device]
+            deficit = (policy.pressure_free_fraction * mem["total_bytes"]
+                       - (mem["total_bytes"] - mem["used_bytes"]))
+            if freed.get(device, 0) >= deficit:
+                continue
+            freed[device] = freed.get(device, 0) + _vram_on(decision.proc, device)
+            out.append(decision)
+            self._state.pop(key, None)
+        return out
+
+    def evaluate(self, processes: list[dict[str, Any]], policy, now: float,
+                 devices: dict[str, dict[str, int]] | None = None) -> list[Decision]:
+        """``devices`` maps GPU index to ``{"used_bytes", "total_bytes"}``; without it every
+        process is on the normal schedule."""
+        self._observed_at = now
+        if self._restore_gap is not None:
+            if self._restore_gap > restore_max_gap_s(policy):
+                for st in self._state.values():  # restart each timer on its next idle reading
+                    st.update(idle_since=None, warned_at=None, pressured=False)
+            self._restore_gap = None
         decisions: list[Decision] = []
-        present = set()
+        present: set[Identity] = set()
+        free = _free_fractions(devices)
+        pressured: list[tuple[Decision, Identity]] = []
 
         for proc in processes:
             pid = proc.get("pid")
             if pid is None:
                 continue
-            present.add(pid)
+            key = _identity(proc)
+            present.add(key)
 
             # SAFETY GATE: only ever act on processes inside an agent-managed lab container. A host
             # process or an unmanaged container (managed=False) is NEVER warned or killed, no matter
             # how idle — this is the hard guarantee that the killer can't touch system/admin work.
             if not proc.get("managed"):
-                self._state.pop(pid, None)
+                self._state.pop(key, None)
                 continue
 
             if (not policy.enabled or self._whitelisted(proc, policy)
                     or not self._is_idle(proc, policy)):
                 # Active / exempt -> clear any idle tracking so the timer restarts next time.
-                self._state.pop(pid, None)
+                self._state.pop(key, None)
                 continue
 
-            st = self._state.setdefault(pid, {"idle_since": now, "warned_at": None})
+            st = self._state.setdefault(key, {"idle_since": now, "warned_at": None,
+                                              "pressured": False})
             if st["idle_since"] is None:
                 st["idle_since"] = now
             idle_for = now - st["idle_since"]
@@ -81,21 +276,37 @@ class GpuKiller:
 
             if policy.immediate:
                 decisions.append(Decision(pid, "kill", proc, lab, user, int(idle_for)))
-                self._state.pop(pid, None)
+                self._state.pop(key, None)
                 continue
 
+            idle_s, grace_s, pressure = self._schedule(proc, free, policy)
+            warned_at = st["warned_at"]
+            if warned_at is not None and st["pressured"] and pressure is None:
+                # Pressure has cleared since the early warning: the relaxed schedule applies as if
+                # it had never been pressured, re-warning a process not yet due for its warning.
+                if idle_for < idle_s:
+                    st["warned_at"], st["pressured"] = None, False
+                else:
+                    warned_at = max(warned_at, st["idle_since"] + idle_s)
             if st["warned_at"] is None:
-                if idle_for >= policy.idle_minutes * 60:
-                    st["warned_at"] = now
-                    decisions.append(Decision(pid, "warn", proc, lab, user, int(idle_for)))
-            else:
-                if now - st["warned_at"] >= policy.grace_minutes * 60:
-                    decisions.append(Decision(pid, "kill", proc, lab, user, int(idle_for)))
-                    self._state.pop(pid, None)
+                if idle_for >= idle_s:
+                    st["warned_at"], st["pressured"] = now, pressure is not None
+                    decisions.append(
+                        Decision(pid, "warn", proc, lab, user, int(idle_for), pressure))
+            elif now - warned_at >= grace_s:
+                decision = Decision(pid, "kill", proc, lab, user, int(idle_for), pressure)
+                if pressure is not None:
+                    pressured.append((decision, key))
+                else:
+                    decisions.append(decision)
+                    self._state.pop(key, None)
+
+        if pressured:
+            decisions.extend(self._reclaim(pressured, devices, policy))
 
         # Forget processes that are gone (finished or already killed).
-        for pid in list(self._state):
-            if pid not in present:
-                self._state.pop(pid, None)
+        for key in list(self._state):
+            if key not in present:
+                self._state.pop(key, None)
 
         return decisions
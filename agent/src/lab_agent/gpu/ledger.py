@@ -0,0 +1,141 @@
+"""GPU-time accounting: who held which GPU, and how hard they used it, per hour.
+
+Every shared GPU snapshot (see ``gpu.snapshot``) is integrated into hourly buckets keyed by
+``(hour, lab, user, device)``:
+
+  - ``held_s``       seconds a process of that student held memory on the device,
+  - ``vram_byte_s``  VRAM bytes x seconds,
+  - ``sm_pct_s``     SM utilization % x seconds (100 x held_s is one fully busy GPU),
+
+attributed through the processes' ``lab``/``user`` (only lab-attributed processes are counted).
+Each snapshot stands for the time since the previous one, capped at ``MAX_GAP_S`` so an agent
+restart or a stalled sampler is not billed as continuous use.
+
+The ledger is its own SQLite file in the agent state dir (``cfg.gpu_ledger``), so an hour's
+figures survive restarts. Once an hour has closed its buckets are shipped as ``gpu_usage`` event
+frames through the durable outbox and marked shipped; a crash between the two re-sends them, so
+the controller upserts on ``(node, hour, lab, user, device)``. Shipped rows are kept for
+``RETAIN_S`` for local inspection, then pruned.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import Any
+
+from .snapshot import GpuSnapshot
+
+HOUR_S = 3600
+MAX_GAP_S = 120.0
+RETAIN_S = 14 * 86400
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS usage ("
+    "hour INTEGER NOT NULL, lab TEXT NOT NULL, user TEXT NOT NULL, device TEXT NOT NULL, "
+    "held_s REAL NOT NULL DEFAULT 0, vram_byte_s REAL NOT NULL DEFAULT 0, "
+    "sm_pct_s REAL NOT NULL DEFAULT 0, samples INTEGER NOT NULL DEFAULT 0, "
+    "shipped INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (hour, lab, user, device))"
+)
+
+Bucket = tuple[int, str, str, str]  # (hour epoch seconds, lab, user, device)
+
+
+def accrue(snapshot: GpuSnapshot, dt: float) -> dict[Bucket, list[float]]:
+    """``[held_s, vram_byte_s, sm_pct_s]`` per bucket for one snapshot standing for ``dt``
+    seconds. Pure, for easy unit tests."""
+    hour = int(snapshot.taken_at) // HOUR_S * HOUR_S
+    out: dict[Bucket, list[float]] = {}
+    for proc in snapshot.processes:
+        lab = proc.get("lab")
+        if not lab:
+            continue
+        user = proc.get("user") or ""
+        devices = proc.get("devices") or {
+            "": {"vram_bytes": proc.get("vram_bytes") or 0, "util": proc.get("util")}
+        }
+        for device, d in devices.items():
+            acc = out.setdefault((hour, lab, user, device), [0.0, 0.0, 0.0])
+            acc[0] += dt
+            acc[1] += (d.get("vram_bytes") or 0) * dt
+            if d.get("util") is not None:
+                acc[2] += d["util"] * dt
+    return out
+
+
+class GpuLedger:
+    """SQLite-backed hourly GPU-time ledger. Thread-safe: recorded and drained from worker
+    threads."""
+
+    def __init__(self, path: str) -> None:
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        # check_same_thread=False: calls arrive via asyncio.to_thread; the lock serializes.
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+        self._last_taken_at: float | None = None
+
+    def record(self, snapshot: GpuSnapshot) -> None:
+        """Integrate one snapshot. The first after startup only sets the baseline."""
+        with self._lock:
+            last, self._last_taken_at = self._last_taken_at, snapshot.taken_at
+            if last is None or snapshot.taken_at <= last:
+                return
+            dt = min(snapshot.taken_at - last, MAX_GAP_S)
+            rows = accrue(snapshot, dt)
+            self.conn.executemany(
+                "INSERT INTO usage (hour, lab, user, device, held_s, vram_byte_s, sm_pct_s, "
+                "samples) VALUES (?, ?, ?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (hour, lab, user, device) DO UPDATE SET "
+                "held_s = held_s + excluded.held_s, "
+                "vram_byte_s = vram_byte_s + excluded.vram_byte_s, "
+                "sm_pct_s = sm_pct_s + excluded.sm_pct_s, samples = samples + 1",
+                [(*key, *acc) for key, acc in rows.items()],
+            )
+            self.conn.commit()
+
+    def closed(self, now: float) -> list[dict[str, Any]]:
+        """Unshipped buckets of hours that have ended, oldest first."""
+        current = int(now) // HOUR_S * HOUR_S
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT hour, lab, user, device, held_s, vram_byte_s, sm_pct_s, samples "
+                "FROM usage WHERE shipped = 0 AND hour < ? ORDER BY hour, lab, user, device",
+                (current,),
+            ).fetchall()
+        return [
+            {
+                "hour": hour * 1000, "lab": lab, "user": user or None, "device": device or None,
+                "held_s": round(held), "vram_byte_s": int(vram), "sm_pct_s": round(sm),
+                "samples": samples,
+            }
+            for hour, lab, user, device, held, vram, sm, samples in rows
+        ]
+
+    def mark_shipped(self, buckets: list[dict[str, Any]], now: float) -> None:
+        """Flag ``buckets`` (as returned by ``closed``) shipped and prune old shipped rows."""
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE usage SET shipped = 1 WHERE hour = ? AND lab = ? AND user = ? "
+                "AND device = ?",
+                [(b["hour"] // 1000, b["lab"], b["user"] or "", b["device"] or "")
+                 for b in buckets],
+            )
+            self.conn.execute("DELETE FROM usage WHERE shipped = 1 AND hour < ?",
+                              (int(now) - RETAIN_S,))
+            self.conn.commit()
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:  # pragma: no cover - best-effort
+            pass
@@ -1,24 +1,42 @@
 """Live GPU process listing and PID -> container -> student-user resolution.
 
 `list_gpu_processes()` powers the telemetry snapshot (and phase 4's idle killer). It merges:
-  - `nvidia-smi --query-compute-apps=pid,used_gpu_memory` (VRAM held per PID), and
-  - `nvidia-smi pmon -c 1` (per-PID SM utilization), the signal for "idle but holding VRAM".
+  - VRAM held per PID, and
+  - per-PID SM utilization, the signal for "idle but holding VRAM".
+
+Both come from NVML in-process (see `nvml`), through one library handle held for the agent's
+lifetime. Where NVML cannot be loaded or a call fails, the tick falls back to
+`nvidia-smi --query-compute-apps=pid,used_gpu_memory` and `nvidia-smi pmon -c 1`, and NVML is
+retried after `NVML_RETRY_S`.
 
 Each process is resolved to its Docker container (via the host PID's cgroup) and to the student's
-in-container username (via `getent passwd <uid>` inside that container), so the controller can map a
-process to the right lab/student and email them.
+in-container username (from the container's own /etc/passwd), so the controller can map a process to
+the right lab/student and email them.
+
+Attribution is cached (`AttributionCache`) so a steady tick forks nothing: per-process facts by
+(pid, start time), container labels by container ID (labels are immutable for an ID), and usernames
+by (container, uid) — read through `/proc/<pid>/root/etc/passwd` and re-read whenever that file's
+identity changes, which a container restart or a `useradd` inside it always does.
 """
 
 from __future__ import annotations
 
 import os
 import re
+import threading
+import time
 from dataclasses import asdict, dataclass
 
 from ..executors.base import run
+from .nvml import Nvml, NvmlError
+from .policy import GpuPolicy
+from .sampler import UtilWindow
 
 _DOCKER_CGROUP = re.compile(r"docker[-/]([0-9a-f]{12,64})")
 
+# After NVML fails to load or errors mid-call, use nvidia-smi for this long before trying again.
+NVML_RETRY_S = 300.0
+
 
 @dataclass
 class GpuProcess:
@@ -34,6 +52,9 @@ class GpuProcess:
     lab: str | None = None  # from the lab-agent.lab label (not the container name)
     cmd: str | None = None  # process command line (path + args), for kill-event forensics
     started_at: int | None = None  # wall-clock epoch milliseconds, for the controller's live table
+    util_window: dict | None = None  # windowed SM statistics (see sampler.UtilWindow.stats)
+    # Per GPU index (a string, for JSON): {"vram_bytes", "util"} of this process on that device.
+    devices: dict[str, dict] | None = None
 
 
 def _query_compute_apps() -> dict[int, int]:
@@ -59,10 +80,11 @@ def _query_compute_apps() -> dict[int, int]:
     return out
 
 
-def _pmon_util() -> dict[int, float]:
-    """pid -> SM utilization %. `nvidia-smi pmon -c 1` columns: gpu pid type sm mem enc dec cmd."""
+def _pmon_rows() -> list[tuple[int, int, float]]:
+    """(gpu index, pid, SM %) rows. `nvidia-smi pmon -c 1` columns: gpu pid type sm mem enc dec
+    cmd. A process on several GPUs has one row per GPU."""
     res = run(["nvidia-smi", "pmon", "-c", "1"], timeout=20)
-    out: dict[int, float] = {}
+    out: list[tuple[int, int, float]] = []
     if not res.ok:
         return out
     for line in res.stdout.splitlines():
@@ -72,17 +94,118 @@ def _pmon_util() -> dict[int, float]:
         if len(cols) < 4:
             continue
         try:
+            gpu = int(cols[0])
             pid = int(cols[1])
         except ValueError:
             continue
         sm = cols[3]
         try:
-            out[pid] = float(sm)
+            out.append((gpu, pid, float(sm)))
         except ValueError:
-            out[pid] = 0.0  # '-' means no compute this sample -> treat as idle
+            out.append((gpu, pid, 0.0))  # '-' means no compute this sample -> treat as idle
     return out
 
 
+def _pmon_util(rows: list[tuple[int, int, float]] | None = None) -> dict[int, float]:
+    """pid -> SM utilization % (a PID on several GPUs keeps its peak)."""
+    out: dict[int, float] = {}
+    for _gpu, pid, sm in _pmon_rows() if rows is None else rows:
+        out[pid] = max(out.get(pid, 0.0), sm)
+    return out
+
+
+def _pmon_placement(vram: dict[int, int],
+                    rows: list[tuple[int, int, float]]) -> dict[int, dict[int, dict]]:
+    """Per-device placement from pmon rows. ``--query-compute-apps`` reports one VRAM figure per
+    PID, so a PID on several GPUs has it split evenly between them."""
+    devices: dict[int, dict[int, float]] = {}
+    for gpu, pid, sm in rows:
+        devices.setdefault(pid, {})[gpu] = sm
+    placement: dict[int, dict[int, dict]] = {}
+    for pid, used in vram.items():
+        on = devices.get(pid)
+        if on:
+            placement[pid] = {gpu: {"vram_bytes": used // len(on), "util": sm}
+                              for gpu, sm in on.items()}
+    return placement
+
+
+_nvml_lock = threading.Lock()
+_nvml_handle: Nvml | None = None
+_nvml_retry_at = 0.0
+
+
+def _nvml() -> Nvml | None:
+    """The process-wide NVML session, opened on first use. None while NVML is unavailable."""
+    global _nvml_handle, _nvml_retry_at
+    if _nvml_handle is None and time.monotonic() >= _nvml_retry_at:
+        try:
+            _nvml_handle = Nvml()
+        except NvmlError:
+            _nvml_retry_at = time.monotonic() + NVML_RETRY_S
+    return _nvml_handle
+
+
+def _drop_nvml() -> None:
+    global _nvml_handle, _nvml_retry_at
+    if _nvml_handle is not None:
+        _nvml_handle.shutdown()
+    _nvml_handle = None
+    _nvml_retry_at = time.monotonic() + NVML_RETRY_S
+
+
+# Every utilization reading, whoever took it, lands here for windowed idle detection.
+_window = UtilWindow()
+
+
+def _record(util: dict[int, float]) -> None:
+    keyed = {}
+    for pid, sm in util.items():
+        start_time = pid_start_time(pid)
+        if start_time is not None:
+            keyed[(pid, start_time)] = sm
+    _window.record(keyed)
+
+
+def _sample() -> tuple[dict[int, int], dict[int, float], dict[int, dict[int, dict]]]:
+    """(pid -> VRAM bytes, pid -> SM %, pid -> per-device placement) from NVML, or from
+    nvidia-smi when NVML is unavailable.
+
+    Serialised: the NVML utilization cursor is shared, and telemetry and the killer both sample.
+    """
+    with _nvml_lock:
+        nvml = _nvml()
+        if nvml is not None:
+            try:
+                vram, util, placement = nvml.sample()
+            except NvmlError:
+                _drop_nvml()  # e.g. a driver reload; re-initialise after the retry delay
+            else:
+                _record(util)
+                return vram, util, placement
+    vram, rows = _query_compute_apps(), _pmon_rows()
+    util = _pmon_util(rows)
+    _record(util)
+    return vram, util, _pmon_placement(vram, rows)
+
+
+def sample_utilization() -> bool:
+    """Take one background utilization reading for the window. Only through NVML — forking
+    nvidia-smi every few seconds would cost more than the better idle signal is worth — so this
+    returns False (nothing sampled) while NVML is unavailable."""
+    with _nvml_lock:
+        nvml = _nvml()
+        if nvml is None:
+            return False
+        try:
+            _vram, util, _placement = nvml.sample()
+        except NvmlError:
+            _drop_nvml()
+            return False
+    _record(util)
+    return True
+
+
 # One docker inspect yields name + the two labels we trust, '|'-joined. A managed lab container
 # reads e.g. "/lab-bio|true|bio"; an unmanaged container has no labels, so Go templates emit the
 # literal "<no value>" (treated as absent), and managed stays False.
@@ -102,23 +225,34 @@ def _parse_inspect(stdout: str) -> tuple[str | None, bool, str | None]:
     return (name, managed, lab)
 
 
-def _container_info(pid: int) -> tuple[str | None, bool, str | None]:
-    """Resolve a host PID's container to (name, managed, lab). managed/lab come from the container's
-    labels, NOT its name, so only genuinely agent-created containers are ever flagged managed."""
+def _container_id(pid: int) -> str | None:
+    """The Docker container ID from a host PID's cgroup, or None for a host process."""
     try:
         with open(f"/proc/{pid}/cgroup", encoding="utf-8") as fh:
             text = fh.read()
     except OSError:
-        return (None, False, None)
+        return None
     m = _DOCKER_CGROUP.search(text)
-    if not m:
-        return (None, False, None)
-    res = run(["docker", "inspect", "--format", _INSPECT_FORMAT, m.group(1)], timeout=15)
+    return m.group(1) if m else None
+
+
+def _inspect_container(container_id: str) -> tuple[str | None, bool, str | None] | None:
+    """(name, managed, lab) from ``docker inspect``, or None if the inspect failed."""
+    res = run(["docker", "inspect", "--format", _INSPECT_FORMAT, container_id], timeout=15)
     if not res.ok:
-        return (None, False, None)
+        return None
     return _parse_inspect(res.stdout)
 
 
+def _container_info(pid: int) -> tuple[str | None, bool, str | None]:
+    """Resolve a host PID's container to (name, managed, lab). managed/lab come from the container's
+    labels, NOT its name, so only genuinely agent-created containers are ever flagged managed."""
+    container_id = _container_id(pid)
+    if container_id is None:
+        return (None, False, None)
+    return _attribution.labels(container_id) or (None, False, None)
+
+
 def _proc_uid(pid: int) -> int | None:
     """Return the process's effective UID as seen inside its own user namespace.
 
@@ -144,6 +278,24 @@ def _proc_uid(pid: int) -> int | None:
     return None
 
 
+def _passwd_name(text: str, uid: int) -> str | None:
+    """The first passwd entry's name for ``uid``. Pure, for easy unit tests."""
+    for line in text.splitlines():
+        fields = line.split(":")
+        if len(fields) >= 3 and fields[2].strip() == str(uid):
+            return fields[0].strip() or None
+    return None
+
+
+def _getent_user(container: str, uid: int) -> str | None:
+    """``getent passwd`` inside the container: the fallback when its passwd is not readable from
+    the host (e.g. users served by NSS rather than /etc/passwd)."""
+    res = run(["docker", "exec", container, "getent", "passwd", str(uid)], timeout=15)
+    if not res.ok or ":" not in res.stdout:
+        return None
+    return res.stdout.split(":", 1)[0].strip() or None
+
+
 def _student_user(container: str | None, pid: int) -> str | None:
     """Resolve the in-container username for a host PID's namespace UID."""
     if not container:
@@ -151,10 +303,7 @@ def _student_user(container: str | None, pid: int) -> str | None:
     uid = _proc_uid(pid)
     if uid is None:
         return None
-    res = run(["docker", "exec", container, "getent", "passwd", str(uid)], timeout=15)
-    if not res.ok or ":" not in res.stdout:
-        return None
-    return res.stdout.split(":", 1)[0].strip() or None
+    return _attribution.user(container, pid, uid)
 
 
 def proc_cmd(pid: int, max_len: int = 200) -> str | None:
@@ -198,18 +347,121 @@ def pid_start_time(pid: int) -> int | None:
         return None
 
 
+_boot_time: int | None = None
+
+
+def _started_at(ticks: int) -> int | None:
+    """Epoch milliseconds for a kernel start tick. Boot time is read from /proc/stat only once."""
+    global _boot_time
+    try:
+        if _boot_time is None:
+            with open("/proc/stat", encoding="utf-8") as fh:
+                _boot_time = next(int(line.split()[1]) for line in fh if line.startswith("btime "))
+        hz = os.sysconf("SC_CLK_TCK")
+        return int((_boot_time + ticks / hz) * 1000)
+    except (OSError, StopIteration, ValueError):
+        return None
+
+
 def pid_started_at(pid: int) -> int | None:
     """Convert the kernel start tick to an epoch-millisecond wall-clock timestamp."""
     ticks = pid_start_time(pid)
     if ticks is None:
         return None
-    try:
-        with open("/proc/stat", encoding="utf-8") as fh:
-            boot = next(int(line.split()[1]) for line in fh if line.startswith("btime "))
-        hz = os.sysconf("SC_CLK_TCK")
-        return int((boot + ticks / hz) * 1000)
-    except (OSError, StopIteration, ValueError):
-        return None
+    return _started_at(ticks)
+
+
+class AttributionCache:
+    """Who a GPU process belongs to, remembered across ticks. Thread-safe (telemetry and the idle
+    killer sample concurrently).
+
+    - ``process``: everything but VRAM/util for one process, keyed by (pid, start time) so a
+      reused PID is a new entry. Entries for processes absent from a tick are dropped.
+    - ``labels``: (name, managed, lab) per container ID. A failed inspect is not remembered.
+    - ``user``: username per (container, uid), stamped with the identity (device, inode, mtime) of
+      the container's /etc/passwd as seen through the process's root. A restarted or recreated
+      container has a new root, and ``useradd`` rewrites the file, so a stale name is re-read.
+
+    Label and user entries not used for ``ttl_s`` are forgotten along with removed containers.
+    """
+
+    def __init__(self, ttl_s: float = 600.0, clock=time.monotonic) -> None:
+        self._ttl_s = ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._procs: dict[tuple[int, int], dict] = {}
+        self._labels: dict[str, tuple[tuple[str | None, bool, str | None], float]] = {}
+        self._users: dict[tuple[str, int], tuple[tuple[int, int, int], str | None, float]] = {}
+
+    def labels(self, container_id: str) -> tuple[str | None, bool, str | None] | None:
+        with self._lock:
+            hit = self._labels.get(container_id)
+            if hit is not None:
+                self._labels[container_id] = (hit[0], self._clock())
+                return hit[0]
+        info = _inspect_container(container_id)
+        if info is not None:
+            with self._lock:
+                self._labels[container_id] = (info, self._clock())
+        return info
+
+    def user(self, container: str, pid: int, uid: int) -> str | None:
+        path = f"/proc/{pid}/root/etc/passwd"
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _getent_user(container, uid)
+        stamp = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            hit = self._users.get((container, uid))
+            if hit is not None and hit[0] == stamp:
+                self._users[(container, uid)] = (stamp, hit[1], self._clock())
+                return hit[1]
+        try:
+            with open(path, encoding="utf-8", errors="replace") as fh:
+                name = _passwd_name(fh.read(), uid)
+        except OSError:
+            return _getent_user(container, uid)
+        with self._lock:
+            self._users[(container, uid)] = (stamp, name, self._clock())
+        return name
+
+    def process(self, pid: int, start_time: int | None) -> dict:
+        """container/managed/lab/user/cmd/started_at for a process, resolved once per process."""
+        key = (pid, start_time) if start_time is not None else None
+        if key is not None:
+            with self._lock:
+                hit = self._procs.get(key)
+            if hit is not None:
+                return hit
+        container, managed, lab = _container_info(pid)
+        facts = {
+            "container": container,
+            "managed": managed,
+            "lab": lab,
+            "user": _student_user(container, pid),
+            "cmd": proc_cmd(pid),
+            "started_at": _started_at(start_time) if start_time is not None else None,
+        }
+        # A container process that did not fully resolve (inspect failed, name not found yet) is
+        # retried next tick; the label and user caches keep that retry cheap.
+        if key is not None and (facts["user"] is not None or _container_id(pid) is None):
+            with self._lock:
+                self._procs[key] = facts
+        return facts
+
+    def retain(self, keys: set[tuple[int, int | None]]) -> None:
+        """Drop processes not in ``keys`` (this tick's) and labels/users unused for the TTL."""
+        cutoff = self._clock() - self._ttl_s
+        with self._lock:
+            self._procs = {k: v for k, v in self._procs.items() if k in keys}
+            self._labels = {k: v for k, v in self._labels.items() if v[1] >= cutoff}
+            self._users = {k: v for k, v in self._users.items() if v[2] >= cutoff}
+
+
+_attribution = AttributionCache()
+
+
 def kill_pid(pid: int, expected_start_time: int | None = None) -> bool:
     """Kill a host process (the agent runs as root). Returns True if the signal was sent.
 
@@ -231,26 +483,33 @@ def kill_pid(pid: int, expected_start_time: int | None = None) -> bool:
         return False
 
 
-def list_gpu_processes() -> list[dict]:
-    vram = _query_compute_apps()
-    util = _pmon_util()
+def list_gpu_processes(policy: GpuPolicy | None = None) -> list[dict]:
+    """Live GPU processes. Each carries ``util`` (the latest reading) and ``util_window``
+    (``UtilWindow.stats`` over ``policy``'s window, None without history)."""
+    policy = policy or GpuPolicy()
+    vram, util, placement = _sample()
     procs: list[dict] = []
+    seen: set[tuple[int, int | None]] = set()
     for pid, vram_bytes in vram.items():
-        container, managed, lab = _container_info(pid)
+        start_time = pid_start_time(pid)
+        seen.add((pid, start_time))
+        facts = _attribution.process(pid, start_time)
+        window = None
+        if start_time is not None:
+            window = _window.stats((pid, start_time), window_s=policy.window_s,
+                                   pct=policy.util_percentile, threshold=policy.util_threshold)
         procs.append(
             asdict(
                 GpuProcess(
                     pid=pid,
                     vram_bytes=vram_bytes,
                     util=util.get(pid),
-                    container=container,
-                    user=_student_user(container, pid),
-                    start_time=pid_start_time(pid),
-                    managed=managed,
-                    lab=lab,
-                    cmd=proc_cmd(pid),
-                    started_at=pid_started_at(pid),
+                    start_time=start_time,
+                    util_window=window,
+                    devices={str(gpu): d for gpu, d in placement.get(pid, {}).items()} or None,
+                    **facts,
                 )
             )
         )
+    _attribution.retain(seen)
     return procs
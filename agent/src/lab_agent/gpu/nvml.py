@@ -0,0 +1,195 @@
+"""Minimal NVML binding (ctypes over ``libnvidia-ml.so.1``) for the GPU process monitor.
+
+``nvidia-smi --query-compute-apps`` plus ``nvidia-smi pmon -c 1`` cost two forks per tick, and pmon
+sleeps for a sampling interval. NVML answers the same two questions in-process:
+
+  - ``nvmlDeviceGetComputeRunningProcesses_v3``: PIDs holding a compute context + their VRAM, and
+  - ``nvmlDeviceGetProcessUtilization``: per-PID SM utilization samples newer than a timestamp.
+
+The library is loaded and initialised once and kept for the agent's lifetime (see ``monitor``).
+Utilization is read with a per-device timestamp cursor, so each call sees only samples taken since
+the previous one. A compute process with no sample since the cursor did no SM work in that window
+and reads as 0% — the same as pmon's ``-``. A device that does not support per-process
+utilization reports None (unknown), which the idle killer treats as active.
+
+Only the handful of entry points used here are bound. Functions are called with ctypes instances
+(never ``byref``), which ctypes passes by reference per ``argtypes``; tests substitute a
+pure-Python stand-in for the shared library that fills those instances in.
+"""
+
+from __future__ import annotations
+
+import ctypes
+from typing import Any
+
+NVML_SUCCESS = 0
+NVML_ERROR_NOT_SUPPORTED = 3
+NVML_ERROR_NOT_FOUND = 6
+NVML_ERROR_INSUFFICIENT_SIZE = 7
+
+# usedGpuMemory when the driver cannot attribute memory (e.g. under some virtualization modes).
+NVML_VALUE_NOT_AVAILABLE = 2**64 - 1
+
+LIBRARY = "libnvidia-ml.so.1"
+
+
+class NvmlError(RuntimeError):
+    def __init__(self, func: str, code: int, text: str = "") -> None:
+        super().__init__(f"{func} failed: {text or 'NVML error'} ({code})")
+        self.func = func
+        self.code = code
+
+
+class ProcessInfo(ctypes.Structure):
+    """``nvmlProcessInfo_t`` (v2/v3 layout)."""
+
+    _fields_ = [
+        ("pid", ctypes.c_uint),
+        ("usedGpuMemory", ctypes.c_ulonglong),
+        ("gpuInstanceId", ctypes.c_uint),
+        ("computeInstanceId", ctypes.c_uint),
+    ]
+
+
+class ProcessUtilizationSample(ctypes.Structure):
+    """``nvmlProcessUtilizationSample_t``."""
+
+    _fields_ = [
+        ("pid", ctypes.c_uint),
+        ("timeStamp", ctypes.c_ulonglong),  # CPU timestamp in microseconds
+        ("smUtil", ctypes.c_uint),
+        ("memUtil", ctypes.c_uint),
+        ("encUtil", ctypes.c_uint),
+        ("decUtil", ctypes.c_uint),
+    ]
+
+
+_Device = ctypes.c_void_p
+
+
+def _bind(lib: Any) -> None:
+    signatures = {
+        "nvmlInit_v2": [],
+        "nvmlShutdown": [],
+        "nvmlDeviceGetCount_v2": [ctypes.POINTER(ctypes.c_uint)],
+        "nvmlDeviceGetHandleByIndex_v2": [ctypes.c_uint, ctypes.POINTER(_Device)],
+        "nvmlDeviceGetComputeRunningProcesses_v3": [
+            _Device, ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ProcessInfo),
+        ],
+        "nvmlDeviceGetProcessUtilization": [
+            _Device, ctypes.POINTER(ProcessUtilizationSample), ctypes.POINTER(ctypes.c_uint),
+            ctypes.c_ulonglong,
+        ],
+    }
+    for name, argtypes in signatures.items():
+        fn = getattr(lib, name)
+        fn.argtypes = argtypes
+        fn.restype = ctypes.c_int
+    lib.nvmlErrorString.argtypes = [ctypes.c_int]
+    lib.nvmlErrorString.restype = ctypes.c_char_p
+
+
+class Nvml:
+    """One initialised NVML session. Not thread-safe; ``monitor`` serialises access."""
+
+    def __init__(self, lib: Any = None) -> None:
+        if lib is None:
+            try:
+                lib = ctypes.CDLL(LIBRARY)
+            except OSError as exc:
+                raise NvmlError("dlopen", -1, str(exc)) from exc
+        try:
+            _bind(lib)
+        except AttributeError as exc:  # a driver too old for the _v2/_v3 entry points
+            raise NvmlError("bind", -1, str(exc)) from exc
+        self._lib = lib
+        self._check("nvmlInit_v2", lib.nvmlInit_v2())
+        count = ctypes.c_uint(0)
+        self._check("nvmlDeviceGetCount_v2", lib.nvmlDeviceGetCount_v2(count))
+        self.devices: list[_Device] = []
+        for index in range(count.value):
+            handle = _Device()
+            self._check("nvmlDeviceGetHandleByIndex_v2",
+                        lib.nvmlDeviceGetHandleByIndex_v2(index, handle))
+            self.devices.append(handle)
+        self._cursor = [0] * len(self.devices)  # last utilization sample timestamp per device
+
+    def _check(self, func: str, code: int) -> None:
+        if code != NVML_SUCCESS:
+            raise NvmlError(func, code, self._error_string(code))
+
+    def _error_string(self, code: int) -> str:
+        try:
+            text = self._lib.nvmlErrorString(code)
+        except Exception:
+            return ""
+        return text.decode("utf-8", "replace") if isinstance(text, bytes) else str(text or "")
+
+    def compute_processes(self, index: int) -> dict[int, int]:
+        """pid -> VRAM bytes on device ``index`` (0 where the driver cannot attribute memory)."""
+        fn = self._lib.nvmlDeviceGetComputeRunningProcesses_v3
+        device = self.devices[index]
+        count = ctypes.c_uint(0)
+        code = fn(device, count, None)
+        if code == NVML_SUCCESS:
+            return {}
+        if code != NVML_ERROR_INSUFFICIENT_SIZE:
+            self._check("nvmlDeviceGetComputeRunningProcesses_v3", code)
+        # Headroom for processes that start between the sizing call and the real one.
+        count.value += 8
+        infos = (ProcessInfo * count.value)()
+        self._check("nvmlDeviceGetComputeRunningProcesses_v3", fn(device, count, infos))
+        out: dict[int, int] = {}
+        for info in infos[:count.value]:
+            used = info.usedGpuMemory
+            out[info.pid] = out.get(info.pid, 0) + (0 if used == NVML_VALUE_NOT_AVAILABLE else used)
+        return out
+
+    def process_utilization(self, index: int) -> dict[int, float] | None:
+        """pid -> peak SM % on device ``index`` since the previous call; None if unsupported."""
+        fn = self._lib.nvmlDeviceGetProcessUtilization
+        device = self.devices[index]
+        since = self._cursor[index]
+        count = ctypes.c_uint(0)
+        code = fn(device, None, count, since)
+        if code in (NVML_SUCCESS, NVML_ERROR_NOT_FOUND):
+            return {}  # no samples in the window
+        if code == NVML_ERROR_NOT_SUPPORTED:
+            return None
+        if code != NVML_ERROR_INSUFFICIENT_SIZE:
+            self._check("nvmlDeviceGetProcessUtilization", code)
+        samples = (ProcessUtilizationSample * count.value)()
+        code = fn(device, samples, count, since)
+        if code == NVML_ERROR_NOT_FOUND:
+            return {}
+        self._check("nvmlDeviceGetProcessUtilization", code)
+        out: dict[int, float] = {}
+        for sample in samples[:count.value]:
+            out[sample.pid] = max(out.get(sample.pid, 0.0), float(sample.smUtil))
+            self._cursor[index] = max(self._cursor[index], sample.timeStamp)
+        return out
+
+    def sample(self) -> tuple[dict[int, int], dict[int, float], dict[int, dict[int, dict]]]:
+        """(pid -> VRAM bytes, pid -> SM %, pid -> placement) across all devices. The first two
+        are in the shape the nvidia-smi parsers produce: a PID on several devices sums its VRAM
+        and keeps its peak utilization. PIDs on a device without per-process utilization support
+        are left out of the util map. Placement is ``{device index: {"vram_bytes", "util"}}``."""
+        vram: dict[int, int] = {}
+        util: dict[int, float] = {}
+        placement: dict[int, dict[int, dict]] = {}
+        for index in range(len(self.devices)):
+            procs = self.compute_processes(index)
+            samples = self.process_utilization(index)
+            for pid, used in procs.items():
+                vram[pid] = vram.get(pid, 0) + used
+                sm = None if samples is None else samples.get(pid, 0.0)
+                placement.setdefault(pid, {})[index] = {"vram_bytes": used, "util": sm}
+                if sm is not None:
+                    util[pid] = max(util.get(pid, 0.0), sm)
+        return vram, util, placement
+
+    def shutdown(self) -> None:
+        try:
+            self._lib.nvmlShutdown()
+        except Exception:  # pragma: no cover - best-effort at exit
+            pass
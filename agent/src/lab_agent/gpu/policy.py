@@ -17,6 +17,20 @@ class GpuPolicy:
     grace_minutes: float = 10.0  # after warning, wait this long -> kill
     immediate: bool = False  # skip the grace period (kill as soon as idle threshold crossed)
     interval_s: int = 30  # how often the killer evaluates
+    # Idle is judged over the trailing window_s of utilization samples: the util_percentile-th
+    # percentile SM% must be at/below util_threshold (95 -> idle for at least 95% of the window).
+    window_s: float = 300.0
+    util_percentile: float = 95.0
+    # Memory pressure: on a device with less than pressure_free_fraction of its VRAM free, idle
+    # processes are warned after pressure_idle_minutes and killed pressure_grace_minutes later —
+    # largest VRAM x idle time first, and only until the device is back above the threshold. A
+    # process whose devices all have at least relaxed_free_fraction free gets relaxed_factor x
+    # the normal schedule. A fraction of 0 disables that mode.
+    pressure_free_fraction: float = 0.0
+    pressure_idle_minutes: float = 5.0
+    pressure_grace_minutes: float = 2.0
+    relaxed_free_fraction: float = 0.0
+    relaxed_factor: float = 2.0
     whitelist_users: set[str] = field(default_factory=set)
     whitelist_labs: set[str] = field(default_factory=set)
 
@@ -26,13 +40,22 @@ class GpuPolicy:
         for key in ("enabled", "immediate"):
             if key in d:
                 p.__dict__[key] = bool(d[key])
-        for key in ("util_threshold", "idle_minutes", "grace_minutes"):
+        for key in ("util_threshold", "idle_minutes", "grace_minutes", "window_s",
+                    "util_percentile", "pressure_free_fraction", "pressure_idle_minutes",
+                    "pressure_grace_minutes", "relaxed_free_fraction", "relaxed_factor"):
             if key in d and d[key] is not None:
                 p.__dict__[key] = float(d[key])
         if d.get("interval_s"):
             p.interval_s = int(d["interval_s"])
         p.whitelist_users = set(d.get("whitelist_users", []) or [])
         p.whitelist_labs = set(d.get("whitelist_labs", []) or [])
+        p.window_s = max(0.0, p.window_s)
+        p.util_percentile = min(100.0, max(1.0, p.util_percentile))
+        p.pressure_free_fraction = min(1.0, max(0.0, p.pressure_free_fraction))
+        p.relaxed_free_fraction = min(1.0, max(0.0, p.relaxed_free_fraction))
+        p.pressure_idle_minutes = max(0.0, p.pressure_idle_minutes)
+        p.pressure_grace_minutes = max(0.0, p.pressure_grace_minutes)
+        p.relaxed_factor = max(1.0, p.relaxed_factor)
         return p
 
 
@@ -0,0 +1,80 @@
+"""Per-process GPU utilization history for windowed idle detection.
+
+One instantaneous SM reading per killer tick misjudges bursty jobs: a data-loader-bound trainer can
+sit at 0% for the second ``pmon`` happens to look and still be busy. ``UtilWindow`` keeps a bounded
+ring of ``(time, SM %)`` samples per process — keyed by (pid, start time), so a recycled PID starts
+an empty history — and summarises any trailing window as mean / percentile / active fraction.
+
+Samples arrive from every GPU read (``monitor._sample``): the agent's background sampler every few
+seconds while NVML is available, otherwise only the killer's and heartbeat's own nvidia-smi ticks,
+so the window still fills, just more coarsely.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+
+# History kept per process, and the most samples held for one process within it.
+MAX_WINDOW_S = 3600.0
+MAX_SAMPLES = 2048
+# Fewer samples than this in a window is too little history to judge by.
+MIN_SAMPLES = 3
+
+Key = tuple[int, int]  # (pid, start time)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list. Pure, for easy unit tests."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class UtilWindow:
+    """Thread-safe ring buffers of SM utilization samples per process."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._samples: dict[Key, deque[tuple[float, float]]] = {}
+
+    def record(self, util: dict[Key, float], now: float | None = None) -> None:
+        """Append one reading per process and forget processes unseen for ``MAX_WINDOW_S``."""
+        now = self._clock() if now is None else now
+        cutoff = now - MAX_WINDOW_S
+        with self._lock:
+            for key, sm in util.items():
+                ring = self._samples.get(key)
+                if ring is None:
+                    ring = self._samples[key] = deque(maxlen=MAX_SAMPLES)
+                ring.append((now, sm))
+            for key in [k for k, ring in self._samples.items() if ring[-1][0] < cutoff]:
+                del self._samples[key]
+
+    def stats(self, key: Key, *, window_s: float, pct: float,
+              threshold: float) -> dict[str, float | int] | None:
+        """Summary of the last ``window_s`` seconds for one process, or None without history.
+
+        ``quantile`` is the ``pct``-th percentile SM % (the idle killer's signal: at or below the
+        threshold means the process was idle for at least ``pct``% of the window), ``active`` the
+        fraction of samples above ``threshold``, ``span_s`` how much history the window holds.
+        """
+        now = self._clock()
+        with self._lock:
+            ring = self._samples.get(key)
+            points = [(t, sm) for t, sm in ring if t >= now - window_s] if ring else []
+        if not points:
+            return None
+        values = [sm for _t, sm in points]
+        return {
+            "samples": len(values),
+            "span_s": round(now - points[0][0], 1),
+            "mean": round(sum(values) / len(values), 1),
+            "quantile": percentile(values, pct),
+            "q": pct,
+            "active": round(sum(1 for v in values if v > threshold) / len(values), 3),
+        }
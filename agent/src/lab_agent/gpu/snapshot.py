@@ -0,0 +1,63 @@
+"""One GPU process reading, shared by the heartbeat and the idle killer.
+
+The agent's GPU sampler task calls ``monitor.list_gpu_processes`` on one cadence and publishes each
+result as an immutable ``GpuSnapshot``. The killer evaluates every new snapshot exactly once; the
+heartbeat attaches whichever is latest. Both report the snapshot's age, so the controller can tell
+a stale GPU table (a wedged driver, a hung ``docker inspect``) from a quiet one, and the two never
+disagree about a PID because they read the same snapshot. Each snapshot also carries the
+freshest per-device memory reading, which the killer's memory-pressure schedule reads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(frozen=True)
+class GpuSnapshot:
+    seq: int  # increases by one per published snapshot
+    taken_at: float  # epoch seconds when the reading was taken
+    processes: tuple[dict[str, Any], ...]  # list_gpu_processes() output; do not mutate
+    # GPU index -> {"used_bytes", "total_bytes"} (DeviceHistory.memory); empty when unknown
+    devices: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    def age_s(self, now: float | None = None) -> float:
+        return round(max(0.0, (time.time() if now is None else now) - self.taken_at), 1)
+
+    def to_dict(self, now: float | None = None) -> dict[str, Any]:
+        """Snapshot metadata for a telemetry frame (the processes travel separately)."""
+        return {"seq": self.seq, "taken_at": int(self.taken_at * 1000), "age_s": self.age_s(now)}
+
+
+class SnapshotFeed:
+    """Latest snapshot plus a wakeup for consumers waiting on the next one. Event-loop only."""
+
+    def __init__(self) -> None:
+        self._latest: GpuSnapshot | None = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def latest(self) -> GpuSnapshot | None:
+        return self._latest
+
+    async def publish(self, processes: list[dict[str, Any]], taken_at: float,
+                      devices: dict[str, dict[str, int]] | None = None) -> GpuSnapshot:
+        seq = self._latest.seq + 1 if self._latest is not None else 1
+        snapshot = GpuSnapshot(seq, taken_at, tuple(processes), dict(devices or {}))
+        async with self._changed:
+            self._latest = snapshot
+            self._changed.notify_all()
+        return snapshot
+
+    async def next_after(self, seq: int) -> GpuSnapshot:
+        """The latest snapshot newer than ``seq``, waiting for one if needed. A slow consumer
+        skips straight to the newest snapshot rather than replaying the ones it missed."""
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self._latest is not None and self._latest.seq > seq
+            )
+            assert self._latest is not None
+            return self._latest
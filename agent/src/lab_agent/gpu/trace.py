@@ -0,0 +1,186 @@
+"""Compact on-disk trace of the agent's GPU snapshots, for offline policy replay.
+
+Each shared GPU snapshot (see ``gpu.snapshot``) is appended as one JSON line to a gzip segment
+under ``cfg.gpu_trace_dir``, one per UTC day and agent start (``<day>-<start>.jsonl.gz``), keeping
+only what the idle killer reads::
+
+    {"t": <epoch s>, "p": [[pid, start_time, vram_bytes, util, managed, lab, user, place], ...],
+     "d": {"<gpu index>": [used_bytes, total_bytes], ...}}
+
+``place`` (``{"<gpu index>": vram_bytes}``) and ``"d"`` (device memory) feed the memory-pressure
+schedule; they are omitted when not known, and lines written before they existed still decode.
+
+Windowed utilization is not stored: ``replay`` rebuilds it from the per-snapshot readings under
+whichever window the replayed policy asks for. The file is flushed after every line, so a trace is
+readable while the agent is still writing it (and after a crash, up to the last whole line). An
+agent killed without ``close`` leaves its gzip member without a trailer, and a member appended
+after that would be unreadable, so a restarted agent never reopens an earlier segment. Days older
+than ``gpu_trace_retain_days`` are deleted as new days start.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from .snapshot import GpuSnapshot
+
+SUFFIX = ".jsonl.gz"
+
+
+def encode(snapshot: GpuSnapshot) -> str:
+    rows = []
+    for p in snapshot.processes:
+        row = [p.get("pid"), p.get("start_time"), p.get("vram_bytes") or 0, p.get("util"),
+               1 if p.get("managed") else 0, p.get("lab"), p.get("user")]
+        if p.get("devices"):
+            row.append({i: d.get("vram_bytes") or 0 for i, d in p["devices"].items()})
+        rows.append(row)
+    data: dict[str, Any] = {"t": round(snapshot.taken_at, 1), "p": rows}
+    if snapshot.devices:
+        data["d"] = {index: [mem["used_bytes"], mem["total_bytes"]]
+                     for index, mem in snapshot.devices.items()}
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _decode_row(row: list) -> dict[str, Any]:
+    pid, start_time, vram, util, managed, lab, user, *rest = row
+    proc = {"pid": int(pid), "start_time": start_time, "vram_bytes": vram, "util": util,
+            "managed": bool(managed), "lab": lab, "user": user}
+    if rest and rest[0]:
+        proc["devices"] = {str(i): {"vram_bytes": v} for i, v in rest[0].items()}
+    return proc
+
+
+def decode(line: str, seq: int = 0) -> GpuSnapshot | None:
+    """One trace line back into a snapshot of killer-shaped process dicts; None if malformed."""
+    try:
+        data = json.loads(line)
+        procs = tuple(_decode_row(row) for row in data["p"])
+        devices = {
+            str(index): {"used_bytes": int(used), "total_bytes": int(total)}
+            for index, (used, total) in (data.get("d") or {}).items()
+        }
+        return GpuSnapshot(seq, float(data["t"]), procs, devices)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def trace_files(directory: str) -> list[str]:
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(SUFFIX))
+    except OSError:
+        return []
+    return [os.path.join(directory, n) for n in names]
+
+
+def _day_of(path: str) -> str:
+    return os.path.basename(path)[:10]  # ``YYYY-MM-DD``, with or without a ``-<start>`` suffix
+
+
+def _inflate(d: Any, data: bytes) -> tuple[bytes, bool]:
+    """(output, whether ``data`` was corrupt). On corruption the output is everything ``data``
+    inflates to before the damage, found by re-feeding it a byte at a time."""
+    saved = d.copy()
+    try:
+        return d.decompress(data), False
+    except zlib.error:
+        pass
+    out = []
+    for i in range(len(data)):
+        try:
+            out.append(saved.decompress(data[i:i + 1]))
+        except zlib.error:
+            break
+        if saved.eof:
+            break
+    return b"".join(out), True
+
+
+def _lines(path: str) -> Iterator[bytes]:
+    """Complete lines of a (multi-member) gzip file, up to a truncated tail or damaged member."""
+    with open(path, "rb") as fh:
+        d, buf = zlib.decompressobj(wbits=31), b""
+        while chunk := fh.read(64 * 1024):
+            while chunk:
+                out, damaged = _inflate(d, chunk)
+                *complete, buf = (buf + out).split(b"\n")
+                yield from complete
+                if damaged:
+                    return
+                if not d.eof:
+                    break
+                chunk, d = d.unused_data, zlib.decompressobj(wbits=31)  # next member
+
+
+def read_trace(paths: Iterable[str]) -> Iterator[GpuSnapshot]:
+    """Snapshots from trace files in order. A truncated tail (agent killed mid-write) or a damaged
+    member ends that file quietly after the lines before it; malformed lines are skipped."""
+    seq = 0
+    for path in paths:
+        try:
+            for line in _lines(path):
+                snapshot = decode(line.decode("utf-8", "replace"), seq + 1)
+                if snapshot is not None:
+                    seq += 1
+                    yield snapshot
+        except OSError:
+            continue
+
+
+class TraceRecorder:
+    """Appends snapshots to this agent run's segment of the current day. Thread-safe."""
+
+    def __init__(self, directory: str, retain_days: int, started: float | None = None) -> None:
+        self.directory = directory
+        self.retain_days = retain_days
+        self.started = int(time.time() if started is None else started)
+        self._lock = threading.Lock()
+        self._day: str | None = None
+        self._fh: Any = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retain_days > 0
+
+    def record(self, snapshot: GpuSnapshot) -> None:
+        if not self.enabled:
+            return
+        day = time.strftime("%Y-%m-%d", time.gmtime(snapshot.taken_at))
+        with self._lock:
+            if day != self._day:
+                self._rotate(day)
+            self._fh.write(encode(snapshot) + "\n")
+            self._fh.flush()
+
+    def _rotate(self, day: str) -> None:
+        if self._fh is not None:
+            self._fh.close()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # Only this run ever appends to its segment, and only after a clean close (a new member).
+        name = f"{day}-{self.started:010d}{SUFFIX}"
+        self._fh = gzip.open(os.path.join(self.directory, name), "at", encoding="utf-8")
+        self._day = day
+        files = trace_files(self.directory)
+        days = sorted({_day_of(path) for path in files})
+        keep = set(days[-self.retain_days:])
+        for path in files:
+            if _day_of(path) in keep:
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+                self._day = None
@@ -0,0 +1,185 @@
+"""Per-lab GPU subsets: which CDI devices each lab container is given.
+
+By default a lab container gets ``nvidia.com/gpu=all``. A placement may instead carry
+``gpu_count`` (the agent picks the devices) or ``gpu_devices`` (explicit GPU indices); the chosen
+indices are passed to ``docker run`` as one ``--device nvidia.com/gpu=<i>`` each.
+
+Picking balances contention first: each candidate device is weighted by how many other labs are
+already pinned to it, and the subset with the lowest total (then lowest maximum) wins. Between
+equally loaded subsets, one that stays on a single NUMA node beats one that spans several, so a
+multi-GPU lab's devices share a host memory/PCIe root. An existing assignment that still fits the
+request and still exists in ``nvidia-ctk cdi list`` is kept, so recreating a container does not
+move its lab to other GPUs.
+
+Assignments live in a small JSON file beside the state DB (``cfg.gpu_assignments``), written
+atomically once the container they were picked for is up, and are reported in the node's
+capabilities. Like ``maintenance_state`` the file is a best-effort record: a corrupt one reads as
+empty and the next container create/recreate re-picks.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import re
+from typing import Any
+
+from .config import AgentConfig
+from .executors.base import run
+
+# CDI exposes every GPU by index, by UUID, and as "all"; only the index entries are picked from.
+_CDI_INDEX = re.compile(r"^nvidia\.com/gpu=(\d+)$")
+
+
+class GpuAssignmentError(RuntimeError):
+    pass
+
+
+def _load(cfg: AgentConfig) -> dict[str, list[str]]:
+    try:
+        with open(cfg.gpu_assignments, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        lab: [str(i) for i in devices]
+        for lab, devices in data.items()
+        if isinstance(devices, list) and all(isinstance(i, (int, str)) for i in devices)
+    }
+
+
+def _save(cfg: AgentConfig, data: dict[str, list[str]]) -> None:
+    path = cfg.gpu_assignments
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def assignments(cfg: AgentConfig) -> dict[str, list[str]]:
+    """Map of lab -> pinned GPU indices. Labs given every GPU are absent."""
+    return _load(cfg)
+
+
+def record(cfg: AgentConfig, lab: str, devices: list[str] | None) -> None:
+    """Persist ``lab``'s subset once its container is up; None (every GPU) clears it."""
+    data = _load(cfg)
+    if devices is None:
+        if data.pop(lab, None) is None:
+            return
+    else:
+        data[lab] = list(devices)
+    _save(cfg, data)
+
+
+def release(cfg: AgentConfig, lab: str) -> None:
+    """Forget ``lab``'s subset (lab destroyed), freeing its devices for the balancer."""
+    record(cfg, lab, None)
+
+
+def cdi_indices(cdi_devices: list[str]) -> list[str]:
+    """GPU indices with a CDI entry, numerically sorted (from ``system._cdi_devices``)."""
+    found = (_CDI_INDEX.match(name) for name in cdi_devices)
+    return sorted((m.group(1) for m in found if m), key=int)
+
+
+def requested(params: dict[str, Any]) -> int | list[str] | None:
+    """The placement's GPU request: explicit indices, a count, or None for every GPU."""
+    devices = params.get("gpu_devices")
+    if devices:
+        try:
+            indices = {int(i) for i in devices}
+        except (TypeError, ValueError) as exc:
+            raise GpuAssignmentError(f"invalid gpu_devices {devices!r}") from exc
+        if min(indices) < 0:
+            raise GpuAssignmentError(f"invalid gpu_devices {devices!r}")
+        return [str(i) for i in sorted(indices)]
+    try:
+        count = int(params.get("gpu_count") or 0)
+    except (TypeError, ValueError) as exc:
+        raise GpuAssignmentError(f"invalid gpu_count {params.get('gpu_count')!r}") from exc
+    if count < 0:
+        raise GpuAssignmentError(f"invalid gpu_count {count}")
+    return count or None
+
+
+def _numa_path(bus_id: str) -> str:
+    # nvidia-smi reports an 8-hex-digit PCI domain ("00000000:3B:00.0"); sysfs uses 4, lowercase.
+    domain, _, rest = bus_id.strip().partition(":")
+    return f"/sys/bus/pci/devices/{domain[-4:]}:{rest}".lower() + "/numa_node"
+
+
+def numa_nodes() -> dict[str, int]:
+    """GPU index -> NUMA node (-1 when the platform does not say). Empty without nvidia-smi."""
+    res = run(["nvidia-smi", "--query-gpu=index,pci.bus_id", "--format=csv,noheader"],
+              timeout=20)
+    if not res.ok:
+        return {}
+    out: dict[str, int] = {}
+    for line in res.stdout.splitlines():
+        index, _, bus_id = (c.strip() for c in line.partition(","))
+        if not index.isdigit() or not bus_id:
+            continue
+        try:
+            with open(_numa_path(bus_id), encoding="utf-8") as fh:
+                out[index] = int(fh.read().strip())
+        except (OSError, ValueError):
+            out[index] = -1
+    return out
+
+
+def choose(available: list[str], count: int, taken: dict[str, list[str]],
+           numa: dict[str, int]) -> list[str]:
+    """``count`` of ``available`` GPU indices, least contended first (see module docstring).
+    ``taken`` holds the other labs' assignments. Pure, for tests."""
+    if count > len(available):
+        raise GpuAssignmentError(
+            f"{count} GPUs requested but only {len(available)} are available")
+    load = {index: 0 for index in available}
+    for devices in taken.values():
+        for index in devices:
+            if index in load:
+                load[index] += 1
+
+    def score(subset: tuple[str, ...]) -> tuple:
+        loads = [load[i] for i in subset]
+        nodes = {numa.get(i, -1) for i in subset}
+        return (sum(loads), max(loads), len(nodes), [int(i) for i in subset])
+
+    # Exhaustive over combinations is fine at node scale (8 GPUs choose 4 = 70 subsets); past
+    # that, keep the search to the least loaded devices of each NUMA node and overall.
+    if len(available) <= 10:
+        pool = [tuple(c) for c in itertools.combinations(available, count)]
+    else:
+        ranked = sorted(available, key=lambda i: (load[i], int(i)))
+        pool = [tuple(ranked[:count])]
+        for node in {numa.get(i, -1) for i in available}:
+            local = [i for i in ranked if numa.get(i, -1) == node]
+            if len(local) >= count:
+                pool.append(tuple(local[:count]))
+    return sorted(min(pool, key=score), key=int)
+
+
+def pick(cfg: AgentConfig, lab: str, request: int | list[str] | None,
+         cdi_devices: list[str]) -> list[str] | None:
+    """The GPU indices ``lab``'s container should get, or None for every GPU. Does not persist;
+    call ``record`` once the container is up."""
+    if request is None:
+        return None
+    available = cdi_indices(cdi_devices)
+    if isinstance(request, list):
+        missing = [i for i in request if i not in available]
+        if missing:
+            raise GpuAssignmentError(f"GPU(s) {', '.join(missing)} have no CDI device")
+        return request
+    data = _load(cfg)
+    current = data.pop(lab, None)
+    if current and len(current) == request and all(i in available for i in current):
+        return current
+    return choose(available, request, data, numa_nodes())
@@ -0,0 +1,413 @@
+"""Watch mode for node health: re-run only the probes whose inputs changed.
+
+A full ``detect_capabilities`` sweep answers "is this node healthy right now" at the cost of every
+probe; run periodically it is either expensive or stale. Each probe instead declares what it reads
+(see ``system._probes``) and ``HealthWatch`` watches exactly that:
+
+  - files (the seccomp profile, ``/etc/subuid``/``subgid``, the CDI spec, the GPU assignments) by
+    an inotify watch on their directory, confirmed by a content digest so a touch is not a change;
+    a file inotify cannot watch (procfs, e.g. ``/proc/driver/nvidia/version``, or a missing
+    directory) is digested every ``poll_s`` instead;
+  - mounts (the ZFS lab roots, the SMB cold share) by their ``/proc/self/mountinfo`` entry, which
+    the kernel flags as readable-priority on every mount table change;
+  - the Docker daemon and its managed containers through ``docker events``: a lifecycle event of a
+    ``lab-agent.managed`` container changes the containers input, the stream ending (or coming back)
+    changes the daemon input.
+
+``evaluate`` re-runs the probes reading a changed input, plus anything whose dependencies' values
+changed (``probegraph.execute``) and any probe that timed out or failed last time, and diffs the
+issues by code. A probe its inputs do not fully cover (the GPU list, the fabric and SSH checks,
+the CUDA smoke test) declares a ``max_age_s`` instead (see ``system._probes``): once its value is
+that old it is due again, which ``wait`` reports as the ``PROBE_AGE`` input. Watched probes never
+expire, so a quiet node is not swept periodically. ``probed_at`` is when the oldest of those
+unwatched values was actually probed. The agent pushes every ``Transition`` to the
+controller as a ``health`` event; ``lab-agent doctor --watch`` prints them.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import select
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from . import system
+from .config import AgentConfig
+from .probegraph import DOCKER_CONTAINERS, DOCKER_DAEMON
+from .refreshwatch import (
+    IN_ATTRIB,
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_IGNORED,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+    Inotify,
+)
+from .system import Capabilities, HealthIssue
+
+IN_MOVED_FROM = 0x00000040
+IN_DELETE = 0x00000200
+
+# Written in place or replaced (tmp + rename), created, deleted, or re-permissioned.
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ATTRIB
+              | IN_ONLYDIR)
+MOUNTINFO = "/proc/self/mountinfo"
+# Container lifecycle only: the deep probes' own ``docker exec`` smoke tests would otherwise
+# re-trigger the sweep that runs them.
+DOCKER_EVENTS = ("create", "start", "die", "destroy", "rename", "update")
+DOCKER_RETRY_S = (5.0, 60.0)  # first and longest wait before re-attaching to the event stream
+# Changes are collected for this long after the first one, so a container recreate
+# (die/destroy/create/start) costs one evaluation rather than four.
+SETTLE_S = 2.0
+# Reported by ``wait`` when some probe's value has reached its ``max_age_s``.
+PROBE_AGE = "age:probes"
+
+
+def file_digest(path: str) -> str | None:
+    """sha256 of ``path``'s content, or None when it cannot be read."""
+    try:
+        with open(path, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _unescape(text: str) -> str:
+    # mountinfo escapes space, tab, newline and backslash as three-digit octal.
+    out, i = [], 0
+    while i < len(text):
+        if text[i] == "\\" and text[i + 1:i + 4].isdigit():
+            out.append(chr(int(text[i + 1:i + 4], 8)))
+            i += 4
+        else:
+            out.append(text[i])
+            i += 1
+    return "".join(out)
+
+
+def mount_table(text: str) -> dict[str, str]:
+    """mountinfo text -> mount point -> ``"<fstype> <source> <options>"`` of the topmost mount."""
+    out: dict[str, str] = {}
+    for line in text.splitlines():
+        left, sep, right = line.partition(" - ")
+        parts, tail = left.split(), right.split()
+        if not sep or len(parts) < 6 or len(tail) < 2:
+            continue
+        out[_unescape(parts[4])] = " ".join([*tail[:2], parts[5]])
+    return out
+
+
+def diff(before: list[HealthIssue], after: list[HealthIssue]) -> tuple[list[HealthIssue],
+                                                                        list[HealthIssue]]:
+    """(raised, cleared) by issue code; a code whose severity changed counts as raised."""
+    old = {i.code: i for i in before}
+    new = {i.code: i for i in after}
+    raised = [i for i in after if i.code not in old or old[i.code].severity != i.severity]
+    cleared = [i for i in before if i.code not in new]
+    return raised, cleared
+
+
+@dataclass
+class Transition:
+    status: str
+    raised: list[HealthIssue]
+    cleared: list[HealthIssue]
+    inputs: list[str] = field(default_factory=list)  # what changed
+    probes: list[str] = field(default_factory=list)  # what was re-run
+
+    def to_event(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "raised": [asdict(i) for i in self.raised],
+            "cleared": [i.code for i in self.cleared],
+            "inputs": self.inputs,
+            "probes": self.probes,
+        }
+
+
+class DockerEvents:
+    """``docker events`` for managed containers as a non-blocking line stream."""
+
+    def __init__(self, spawn=subprocess.Popen, clock=time.monotonic) -> None:
+        self._spawn = spawn
+        self._clock = clock
+        self._proc: subprocess.Popen | None = None
+        self._buf = b""
+        self._retry_at = 0.0
+        self._backoff = DOCKER_RETRY_S[0]
+
+    def fileno(self) -> int | None:
+        return self._proc.stdout.fileno() if self._proc is not None else None
+
+    def due(self) -> bool:
+        return self._proc is None and self._clock() >= self._retry_at
+
+    def start(self) -> bool:
+        argv = ["docker", "events", "--filter", "label=lab-agent.managed=true",
+                "--filter", "type=container", "--format", "{{.Action}} {{.Actor.ID}}"]
+        for event in DOCKER_EVENTS:
+            argv += ["--filter", f"event={event}"]
+        try:
+            proc = self._spawn(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               stdin=subprocess.DEVNULL)
+        except OSError:
+            self._ended()
+            return False
+        os.set_blocking(proc.stdout.fileno(), False)
+        self._proc = proc
+        return True
+
+    def read(self) -> tuple[int, bool]:
+        """(complete event lines read, whether the stream ended)."""
+        if self._proc is None:
+            return 0, False
+        lines = 0
+        while True:
+            try:
+                chunk = os.read(self._proc.stdout.fileno(), 64 * 1024)
+            except BlockingIOError:
+                return lines, False
+            if not chunk:
+                self._ended()
+                return lines, True
+            self._buf += chunk
+            *complete, self._buf = self._buf.split(b"\n")
+            lines += sum(1 for line in complete if line.strip())
+            # A stream that delivered events is healthy: the next outage retries promptly.
+            self._backoff = DOCKER_RETRY_S[0]
+
+    def _ended(self) -> None:
+        self.close()
+        self._retry_at = self._clock() + self._backoff
+        self._backoff = min(self._backoff * 2, DOCKER_RETRY_S[1])
+
+    def close(self) -> None:
+        proc, self._proc, self._buf = self._proc, None, b""
+        if proc is None:
+            return
+        with contextlib.suppress(OSError):
+            proc.kill()
+        with contextlib.suppress(OSError, subprocess.TimeoutExpired):
+            proc.wait(timeout=5)
+        with contextlib.suppress(OSError):
+            proc.stdout.close()
+
+
+class HealthWatch:
+    """Incremental health for one node. Not thread-safe: ``start``, ``wait`` and ``evaluate``
+    run on one thread (the agent's watch loop or the doctor CLI)."""
+
+    def __init__(self, cfg: AgentConfig, *, deep: bool = True, poll_s: float = 5.0,
+                 inotify: Inotify | None = None, events: DockerEvents | None = None,
+                 mountinfo: str = MOUNTINFO, clock=time.monotonic, wall=time.time) -> None:
+        self.cfg = cfg
+        self.deep = deep
+        self.poll_s = poll_s
+        self.caps: Capabilities | None = None
+        self._inputs = system.probe_inputs(cfg, deep=deep)
+        self._max_ages = system.probe_max_ages(cfg, deep=deep)
+        watched = {i for inputs in self._inputs.values() for i in inputs}
+        self._files = sorted(i.partition(":")[2] for i in watched if i.startswith("file:"))
+        self._mounts = sorted(i.partition(":")[2] for i in watched if i.startswith("mount:"))
+        self._docker = bool({DOCKER_DAEMON, DOCKER_CONTAINERS} & watched)
+        self._ino = inotify
+        self._events = events if events is not None else DockerEvents(clock=clock)
+        self._mountinfo_path = mountinfo
+        self._mountinfo: Any = None
+        self._clock = clock
+        self._wall = wall
+        self._ran: dict[str, float] = {}  # probe with a max age -> wall time it last ran
+        self._evaluated = 0.0  # wall time of the latest start/evaluate
+        self._digests: dict[str, str | None] = {}
+        self._mount_state: dict[str, str | None] = {}
+        self._dirs: dict[int, str] = {}  # inotify wd -> watched directory
+        self._next_poll = 0.0
+
+    # ------------------------------------------------------------------ inputs
+    def _polled(self) -> list[str]:
+        watched = set(self._dirs.values())
+        return [f for f in self._files if os.path.dirname(f) not in watched]
+
+    def _watch_files(self) -> None:
+        if self._ino is None:
+            try:
+                self._ino = Inotify()
+            except OSError:
+                return
+        current = set(self._dirs.values())
+        for directory in sorted({os.path.dirname(f) for f in self._files}):
+            # procfs/sysfs never report content changes through inotify: polled instead.
+            if directory in current or directory.startswith(("/proc/", "/sys/")):
+                continue
+            try:
+                self._dirs[self._ino.add_watch(directory, WATCH_MASK)] = directory
+            except OSError:
+                continue  # missing directory: polled until it can be watched
+
+    def _check_files(self, paths: list[str]) -> set[str]:
+        changed: set[str] = set()
+        for path in paths:
+            digest = file_digest(path)
+            if digest != self._digests.get(path):
+                self._digests[path] = digest
+                changed.add(f"file:{path}")
+        return changed
+
+    def _read_mounts(self) -> dict[str, str]:
+        if self._mountinfo is None:
+            try:
+                self._mountinfo = open(self._mountinfo_path, encoding="utf-8")
+            except OSError:
+                return {}
+        # Reading from the start re-arms the kernel's change notification on this descriptor.
+        self._mountinfo.seek(0)
+        return mount_table(self._mountinfo.read())
+
+    def _check_mounts(self) -> set[str]:
+        table = self._read_mounts()
+        changed: set[str] = set()
+        for path in self._mounts:
+            entry = table.get(path)
+            if entry != self._mount_state.get(path):
+                self._mount_state[path] = entry
+                changed.add(f"mount:{path}")
+        return changed
+
+    def _drain_inotify(self) -> set[str]:
+        candidates: set[str] = set()
+        for wd, mask, name in self._ino.read():
+            if mask & IN_Q_OVERFLOW:
+                candidates.update(self._files)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._dirs[wd]  # directory removed: polled, re-watched on the next poll
+                candidates.update(f for f in self._files if os.path.dirname(f) == directory)
+                continue
+            path = os.path.join(directory, name)
+            if path in self._files:
+                candidates.add(path)
+        return self._check_files(sorted(candidates))
+
+    # ------------------------------------------------------------------ probe ages
+    @property
+    def probed_at(self) -> float:
+        """Wall time of the oldest unwatched value in ``caps`` (reused values keep their first
+        probe's age); a watched value is current as of the latest evaluation."""
+        return min(self._ran.values(), default=self._evaluated)
+
+    def _due_in(self) -> float:
+        now = self._wall()
+        return min((ran + self._max_ages[name] - now for name, ran in self._ran.items()),
+                   default=float("inf"))
+
+    def expired(self) -> set[str]:
+        """Probes whose value has reached their ``max_age_s``."""
+        now = self._wall()
+        return {name for name, ran in self._ran.items() if now - ran >= self._max_ages[name]}
+
+    def _record_runs(self, caps: Capabilities) -> None:
+        now = self._evaluated = self._wall()
+        for t in caps.probes:
+            if not t.reused and t.name in self._max_ages:
+                self._ran[t.name] = now
+
+    # ------------------------------------------------------------------ lifecycle
+    def start(self) -> Capabilities:
+        """Take the baseline: every input's current state, then one full sweep."""
+        self._watch_files()
+        self._check_files(self._files)
+        self._check_mounts()
+        if self._docker and self._events.fileno() is None:
+            self._events.start()
+        self._next_poll = self._clock() + self.poll_s
+        self.caps = system.detect_capabilities(self.cfg, deep=self.deep)
+        self._ran = dict.fromkeys(self._max_ages, self._wall())
+        self._record_runs(self.caps)
+        return self.caps
+
+    def wait(self, timeout: float) -> set[str]:
+        """Block up to ``timeout`` for input changes; returns the changed inputs (may be empty).
+        Once something changed, keeps collecting for ``SETTLE_S`` more. ``PROBE_AGE`` is among
+        them once a probe's value reaches its ``max_age_s``."""
+        deadline = self._clock() + timeout
+        changed: set[str] = set()
+        while True:
+            now = self._clock()
+            if now >= self._next_poll:
+                self._next_poll = now + self.poll_s
+                self._watch_files()
+                changed |= self._check_files(self._polled())
+                changed |= self._check_mounts()
+            if self._docker and self._events.due() and self._events.start():
+                # Attached again after an outage: the daemon may have restarted with any config.
+                changed |= {DOCKER_DAEMON, DOCKER_CONTAINERS}
+            aged_in = self._due_in()
+            if aged_in <= 0:
+                changed.add(PROBE_AGE)
+            if changed:
+                deadline = min(deadline, now + SETTLE_S)
+            remaining = min(deadline, self._next_poll, now + max(0.0, aged_in)) - now
+            if now >= deadline:
+                return changed
+            changed |= self._select(max(0.0, remaining))
+
+    def _select(self, timeout: float) -> set[str]:
+        poller = select.poll()
+        ino_fd = self._ino.fd if self._ino is not None and self._dirs else None
+        events_fd = self._events.fileno() if self._docker else None
+        mount_fd = self._mountinfo.fileno() if self._mountinfo is not None else None
+        if ino_fd is not None:
+            poller.register(ino_fd, select.POLLIN)
+        if events_fd is not None:
+            poller.register(events_fd, select.POLLIN)
+        if mount_fd is not None:
+            poller.register(mount_fd, select.POLLPRI | select.POLLERR)
+        changed: set[str] = set()
+        for fd, _mask in poller.poll(timeout * 1000):
+            if fd == ino_fd:
+                changed |= self._drain_inotify()
+            elif fd == events_fd:
+                lines, ended = self._events.read()
+                if lines:
+                    changed.add(DOCKER_CONTAINERS)
+                if ended:
+                    changed |= {DOCKER_DAEMON, DOCKER_CONTAINERS}
+            elif fd == mount_fd:
+                changed |= self._check_mounts()
+        return changed
+
+    def evaluate(self, inputs: set[str]) -> Transition | None:
+        """Re-run what ``inputs`` affect; the issue transition, or None when none changed."""
+        if self.caps is None:
+            raise RuntimeError("HealthWatch.start() has not run")
+        stale = {name for name, reads in self._inputs.items() if inputs.intersection(reads)}
+        # A probe that timed out or failed had no real answer: ask it again.
+        stale |= {t.name for t in self.caps.probes if t.timed_out or t.error}
+        stale |= self.expired()
+        before = self.caps
+        self.caps = system.detect_capabilities(self.cfg, deep=self.deep,
+                                               previous=before.values, changed=stale)
+        self._record_runs(self.caps)
+        raised, cleared = diff(before.issues, self.caps.issues)
+        if not raised and not cleared:
+            return None
+        rerun = [t.name for t in self.caps.probes if not t.reused and not t.skipped]
+        return Transition(self.caps.health.status, raised, cleared, sorted(inputs), rerun)
+
+    def close(self) -> None:
+        self._events.close()
+        if self._ino is not None:
+            self._ino.close()
+            self._ino = None
+        self._dirs.clear()
+        if self._mountinfo is not None:
+            self._mountinfo.close()
+            self._mountinfo = None
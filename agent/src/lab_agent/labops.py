@@ -8,7 +8,7 @@ from __future__ import annotations
 
 from typing import Any
 
-from . import coldstore
+from . import capcache, coldstore, gpuassign, scanindex, usagereport
 from .config import AgentConfig
 from .executors import zfs
 from .paths import (
@@ -53,6 +53,7 @@ def create_lab(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
     result = {
         "lab": lab,
         "container": container,
+        "gpu_devices": gpuassign.assignments(cfg).get(lab),
         "fast": _usage_dict(zfs.get_usage(lab_fast(cfg, lab))),
         "slow": _usage_dict(coldstore.lab_usage(cfg, lab)),
     }
@@ -84,6 +85,10 @@ def destroy_lab(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
     from .executors import docker
 
     docker.remove_container(docker.container_name(lab, cfg.node_name))
+    usagereport.forget_rootfs_quota(lab)
     zfs.destroy_dataset(lab_fast(cfg, lab), recursive=True)
     coldstore.destroy_lab(cfg, lab)
+    scanindex.prune(cfg, lab)
+    gpuassign.release(cfg, lab)
+    capcache.invalidate(cfg)
     return {"lab": lab, "destroyed": True}, f"destroyed container + datasets for lab '{lab}'"
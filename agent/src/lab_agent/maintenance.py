@@ -14,14 +14,15 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Any
 
+from . import capcache
 from .config import AgentConfig
 from .executors import docker, zfs
 from .executors.base import run
-from .system import detect_capabilities
 
 
 def run_check(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
-    caps = detect_capabilities(cfg, deep=True)
+    # An explicit check always probes; the result refreshes the capability cache.
+    caps = capcache.capabilities(cfg, deep=True, max_age_s=0)
     return caps.to_dict(), f"node health is {caps.health.status}"
 
 
@@ -56,7 +57,8 @@ def run_repair(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
             for name in containers:
                 if run(["docker", "restart", name], timeout=120).ok:
                     repaired.append(f"container_restarted:{name}")
-    caps = detect_capabilities(cfg, deep=True)
+    capcache.invalidate(cfg)
+    caps = capcache.capabilities(cfg, deep=True, max_age_s=0)
     note = ", ".join(repaired) or "no safe repair applied"
     return {"repaired": repaired, "health": caps.to_dict()}, note
 
@@ -0,0 +1,196 @@
+"""NUMA placement of lab containers: which CPUs and memory nodes a lab may run on.
+
+``--cpus`` caps a lab's CPU time but lets the kernel spread its threads over every socket. On a
+multi-socket GPU node that puts data loaders far from the GPUs' PCIe root and their buffers in the
+other socket's memory. ``place`` confines a lab with ``--cpuset-cpus``/``--cpuset-mems`` to:
+
+  - the NUMA nodes of its pinned GPUs (see ``gpuassign``), or, for a lab without a GPU subset,
+    the node with the least CPU quota already placed on it per CPU;
+  - widened by the next least loaded nodes while the chosen nodes have fewer CPUs than the lab's
+    ``--cpus`` quota, or less memory (``MemTotal`` of each node's ``meminfo``) than its
+    ``--memory`` limit: ``--cpuset-mems`` confines every page the lab allocates to those nodes.
+
+A placement covering every node would restrict nothing, so it is left unpinned, as is everything
+on a single-node host. Topology comes from ``/sys/devices/system/node``; the load of the other labs
+comes from the ``lab-agent.cpus``/``lab-agent.cpuset-mems`` labels on their containers, which also
+record the placement so doctor can flag containers whose cpuset drifted from it.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+
+from . import gpuassign
+from .executors.base import run
+from .executors.docker import parse_human_size
+
+NODE_ROOT = "/sys/devices/system/node"
+
+LABEL_CPUS = "lab-agent.cpus"
+LABEL_CPUSET_CPUS = "lab-agent.cpuset-cpus"
+LABEL_CPUSET_MEMS = "lab-agent.cpuset-mems"
+
+
+@dataclass(frozen=True)
+class Placement:
+    cpuset_cpus: str
+    cpuset_mems: str
+
+    def labels(self, cpus: str) -> dict[str, str]:
+        return {LABEL_CPUS: cpus, LABEL_CPUSET_CPUS: self.cpuset_cpus,
+                LABEL_CPUSET_MEMS: self.cpuset_mems}
+
+
+def parse_cpulist(text: str) -> list[int]:
+    """Kernel list format (``0-3,8,10-11``) to sorted ids; malformed parts are skipped."""
+    out: set[int] = set()
+    for part in text.strip().split(","):
+        lo, _, hi = part.strip().partition("-")
+        try:
+            out.update(range(int(lo), int(hi or lo) + 1))
+        except ValueError:
+            continue
+    return sorted(out)
+
+
+def format_cpulist(ids: list[int]) -> str:
+    """Sorted ids back to the compact list format Docker accepts."""
+    ranges: list[str] = []
+    ids = sorted(set(ids))
+    start = prev = None
+    for i in [*ids, None]:
+        if start is not None and (i is None or i != prev + 1):
+            ranges.append(str(start) if start == prev else f"{start}-{prev}")
+            start = None
+        if i is not None and start is None:
+            start = i
+        prev = i
+    return ",".join(ranges)
+
+
+def topology(root: str = NODE_ROOT) -> dict[int, list[int]]:
+    """NUMA node -> its online CPUs. Memory-only nodes (no CPUs) are left out."""
+    nodes: dict[int, list[int]] = {}
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return {}
+    for name in names:
+        if not name.startswith("node") or not name[4:].isdigit():
+            continue
+        try:
+            with open(os.path.join(root, name, "cpulist"), encoding="utf-8") as fh:
+                cpus = parse_cpulist(fh.read())
+        except OSError:
+            continue
+        if cpus:
+            nodes[int(name[4:])] = cpus
+    return nodes
+
+
+def node_memory(root: str = NODE_ROOT) -> dict[int, int]:
+    """NUMA node -> its ``MemTotal`` in bytes, for the nodes whose ``meminfo`` says."""
+    out: dict[int, int] = {}
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return {}
+    for name in names:
+        if not name.startswith("node") or not name[4:].isdigit():
+            continue
+        try:
+            with open(os.path.join(root, name, "meminfo"), encoding="utf-8") as fh:
+                text = fh.read()
+        except OSError:
+            continue
+        for line in text.splitlines():
+            # "Node 0 MemTotal:       131876092 kB"
+            fields = line.split()
+            if len(fields) >= 4 and fields[2] == "MemTotal:" and fields[3].isdigit():
+                out[int(name[4:])] = int(fields[3]) * 1024
+                break
+    return out
+
+
+def placed_labs() -> dict[str, tuple[float, list[int]]]:
+    """lab -> (CPU quota, memory nodes) of every pinned managed container, from its labels."""
+    listed = run([
+        "docker", "ps", "-a", "--filter", "label=lab-agent.managed=true", "--format",
+        f'{{{{.Label "lab-agent.lab"}}}}\t{{{{.Label "{LABEL_CPUS}"}}}}\t'
+        f'{{{{.Label "{LABEL_CPUSET_MEMS}"}}}}',
+    ], timeout=20)
+    if not listed.ok:
+        return {}
+    out: dict[str, tuple[float, list[int]]] = {}
+    for line in listed.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) != 3 or not parts[0] or not parts[2]:
+            continue
+        try:
+            cpus = float(parts[1])
+        except ValueError:
+            continue
+        out[parts[0]] = (cpus, parse_cpulist(parts[2]))
+    return out
+
+
+def plan(cpus: float, gpu_nodes: list[int], nodes: dict[int, list[int]],
+         others: dict[str, tuple[float, list[int]]], memory: int | None = None,
+         node_mem: dict[int, int] | None = None) -> Placement | None:
+    """Pure placement (see module docstring). ``others`` is ``placed_labs()`` minus this lab;
+    ``memory`` is the lab's limit in bytes, checked against ``node_mem`` (``node_memory()``). A
+    lab whose limit no proper subset of the nodes is known to hold is left unpinned."""
+    if len(nodes) < 2:
+        return None
+    load = {node: 0.0 for node in nodes}
+    for quota, mems in others.values():
+        spread = [m for m in mems if m in load]
+        for m in spread:
+            load[m] += quota / len(spread)
+
+    def pressure(node: int) -> tuple[float, int]:
+        return (load[node] / len(nodes[node]), node)
+
+    chosen = sorted({n for n in gpu_nodes if n in nodes}) or [min(nodes, key=pressure)]
+    need = math.ceil(cpus)
+    node_mem = node_mem or {}
+
+    def fits() -> bool:
+        if sum(len(nodes[n]) for n in chosen) < need:
+            return False
+        return not memory or sum(node_mem.get(n, 0) for n in chosen) >= memory
+
+    if memory and not all(n in node_mem for n in nodes):
+        return None  # cannot tell whether the memory limit fits
+    for node in sorted(nodes, key=pressure):
+        if fits():
+            break
+        if node not in chosen:
+            chosen.append(node)
+    if len(chosen) == len(nodes) or not fits():
+        return None
+    return Placement(format_cpulist([c for n in chosen for c in nodes[n]]),
+                     format_cpulist(chosen))
+
+
+def place(lab: str, cpus: str, gpu_devices: list[str] | None,
+          memory: str | None = None) -> Placement | None:
+    """The lab container's cpuset, or None to leave it unpinned. ``memory`` is its ``--memory``."""
+    nodes = topology()
+    if len(nodes) < 2:
+        return None
+    try:
+        quota = float(cpus)
+    except ValueError:
+        return None
+    limit = parse_human_size(memory) if memory else None
+    if memory and limit is None:
+        return None  # a limit we cannot read might not fit any subset
+    gpu_nodes: list[int] = []
+    if gpu_devices:
+        numa = gpuassign.numa_nodes()
+        gpu_nodes = [numa[i] for i in gpu_devices if numa.get(i, -1) >= 0]
+    others = {name: v for name, v in placed_labs().items() if name != lab}
+    return plan(quota, gpu_nodes, nodes, others, limit, node_memory() if limit else None)
@@ -0,0 +1,162 @@
+"""Run independent health probes concurrently, in dependency order, each under its own deadline.
+
+``system.detect_capabilities`` is a few dozen probes — ``zfs``/``docker``/``nvidia-smi`` forks,
+managed-container sweeps, student smoke tests through ``docker exec`` — most of which do not depend
+on each other. Run one after another their timeouts add up to minutes on a sick node. Here each
+probe names the probes whose values it needs; ``execute`` starts probes whose dependencies are
+done, at most ``workers`` at a time in declaration order, and waits for each up to its deadline.
+A probe's deadline runs from when it starts, never from when it became ready, so a probe waiting
+for a free worker is not charged for the wait.
+
+A probe that overruns its deadline or raises yields its ``default`` and is reported as such; its
+dependents still run with that value, so one hung command costs its deadline and never the whole
+sweep. (A thread that overran cannot be killed; it finishes in the background, bounded by the
+timeouts ``executors.base.run`` already enforces, and no longer counts against ``workers``.) A
+probe whose ``when`` is false is skipped and also yields its default — how "only if Docker is up"
+is expressed.
+
+A probe may also name its ``inputs``: what it reads that can change under it (a file, a mount, the
+managed containers; see the ``*_input`` helpers). ``execute`` given the ``previous`` values and the
+names of the probes whose inputs ``changed`` re-runs just those, plus any probe whose dependencies
+now have different values, and reuses every other value — how ``healthwatch`` keeps health current
+without full sweeps. What no input can watch is declared as a probe's ``max_age_s`` instead.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import Any
+
+Values = dict[str, Any]
+
+# Input kinds (see ``healthwatch``): a file's content, a mount point's mount entry, and the
+# Docker daemon / its managed containers as seen through ``docker events``.
+DOCKER_DAEMON = "docker:daemon"
+DOCKER_CONTAINERS = "docker:containers"
+
+
+def file_input(path: str) -> str:
+    return f"file:{path}"
+
+
+def mount_input(path: str) -> str:
+    return f"mount:{path}"
+
+
+@dataclass
+class Probe:
+    name: str
+    fn: Callable[[Values], Any]  # receives the values of every finished probe
+    deps: tuple[str, ...] = ()
+    deadline_s: float = 30.0
+    default: Any = None
+    when: Callable[[Values], bool] | None = None
+    inputs: tuple[str, ...] = ()
+    # Re-run at least this often (seconds) even if no input changed: for what ``inputs`` cannot
+    # watch (a GPU falling off the bus, sshd dying in a container). None: the inputs cover it.
+    max_age_s: float | None = None
+
+
+@dataclass
+class ProbeTiming:
+    name: str
+    elapsed_s: float
+    timed_out: bool = False
+    skipped: bool = False
+    error: str | None = None
+    reused: bool = False  # value carried over from ``previous`` (see ``execute``)
+
+
+def watching(probes: list[Probe], inputs: set[str]) -> list[str]:
+    """Names of the probes that read any of ``inputs``, in declaration order."""
+    return [p.name for p in probes if inputs.intersection(p.inputs)]
+
+
+def _start(p: Probe, values: Values) -> Future:
+    """Run ``p`` on its own daemon thread, so one that overran can be abandoned."""
+    future: Future = Future()
+
+    def target() -> None:
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(p.fn(values))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=target, name=f"probe-{p.name}", daemon=True).start()
+    return future
+
+
+def execute(probes: list[Probe], *, workers: int = 8,
+            clock: Callable[[], float] = time.monotonic, previous: Values | None = None,
+            changed: set[str] | None = None) -> tuple[Values, list[ProbeTiming]]:
+    """Run ``probes``; returns every probe's value and its timing, in declaration order.
+
+    With ``previous`` (an earlier run's values) only the probes named in ``changed``, and those
+    whose dependencies' values differ from ``previous``, run; the rest keep their earlier value."""
+    by_name = {p.name: p for p in probes}
+    for p in probes:
+        unknown = [d for d in p.deps if d not in by_name]
+        if unknown:
+            raise ValueError(f"probe {p.name} depends on unknown {', '.join(unknown)}")
+    values: Values = {}
+    timings: dict[str, ProbeTiming] = {}
+    pending = list(probes)
+    ready: list[Probe] = []  # dependencies settled, waiting for a free worker
+    running: dict[Future, tuple[Probe, float]] = {}
+    workers = max(1, workers)
+    while pending or ready or running:
+        # Queue (or skip) everything whose dependencies have settled.
+        progressed = True
+        while progressed:
+            progressed = False
+            for p in list(pending):
+                if not all(d in values for d in p.deps):
+                    continue
+                pending.remove(p)
+                progressed = True
+                if (previous is not None and p.name in previous
+                        and p.name not in (changed or ())
+                        and all(values[d] == previous.get(d) for d in p.deps)):
+                    values[p.name] = previous[p.name]
+                    timings[p.name] = ProbeTiming(p.name, 0.0, reused=True)
+                    continue
+                if p.when is not None and not p.when(values):
+                    values[p.name] = p.default
+                    timings[p.name] = ProbeTiming(p.name, 0.0, skipped=True)
+                    continue
+                ready.append(p)
+        ready.sort(key=probes.index)
+        while ready and len(running) < workers:
+            p = ready.pop(0)
+            running[_start(p, dict(values))] = (p, clock())
+        if not running:
+            if pending:  # only reachable with a dependency cycle
+                raise ValueError(f"probe dependency cycle: {[p.name for p in pending]}")
+            break
+        now = clock()
+        next_deadline = min(started + p.deadline_s for p, started in running.values())
+        done, _ = wait(running, timeout=max(0.0, next_deadline - now),
+                       return_when=FIRST_COMPLETED)
+        now = clock()
+        for future in list(running):
+            p, started = running[future]
+            if future in done:
+                del running[future]
+                try:
+                    values[p.name] = future.result()
+                    timings[p.name] = ProbeTiming(p.name, round(now - started, 3))
+                except Exception as exc:
+                    values[p.name] = p.default
+                    timings[p.name] = ProbeTiming(p.name, round(now - started, 3),
+                                                  error=str(exc) or type(exc).__name__)
+            elif now - started >= p.deadline_s:
+                del running[future]  # abandoned: its worker slot goes to the next probe
+                values[p.name] = p.default
+                timings[p.name] = ProbeTiming(p.name, round(now - started, 3),
+                                              timed_out=True)
+    return values, [timings[p.name] for p in probes]
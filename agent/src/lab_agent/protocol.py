@@ -23,6 +23,7 @@ T_RECEIPT = "receipt"  # agent -> controller: durable receipt of a pushed task (
 T_LOG = "log"  # agent -> controller: a structured log line
 T_EVENT = "event"  # agent -> controller: gpu/quota event
 T_TELEMETRY = "telemetry"  # agent -> controller: heartbeat snapshot
+T_CAPABILITIES = "capabilities"  # agent -> controller: re-probed capabilities after hello
 T_ACK = "ack"  # controller -> agent: acknowledge receipt (optional)
 
 # Task actions.
@@ -30,6 +31,7 @@ A_LAB_CREATE = "lab.create"
 A_LAB_SET_QUOTA = "lab.set_quota"
 A_LAB_DESTROY = "lab.destroy"
 A_STUDENT_ADD = "student.add"
+A_STUDENT_ADD_BATCH = "student.add_batch"
 A_STUDENT_REMOVE = "student.remove"
 A_STUDENT_DELETE_COLD = "student.delete_cold"
 A_CONTAINER_RECREATE = "container.recreate"
@@ -84,8 +86,11 @@ def receipt_frame(task_id: str) -> dict[str, Any]:
     return {"type": T_RECEIPT, "id": task_id, "ts": now_ms()}
 
 
-def hello_frame(node_name: str, token: str, capabilities: dict[str, Any]) -> dict[str, Any]:
-    return {
+def hello_frame(node_name: str, token: str, capabilities: dict[str, Any],
+                probed_at: int | None = None) -> dict[str, Any]:
+    """``probed_at`` (epoch ms, 0 if known stale) marks cached capabilities; a ``capabilities``
+    frame follows once they are re-probed."""
+    frame = {
         "type": T_HELLO,
         "v": PROTOCOL_VERSION,
         "node": node_name,
@@ -93,6 +98,13 @@ def hello_frame(node_name: str, token: str, capabilities: dict[str, Any]) -> dic
         "capabilities": capabilities,
         "ts": now_ms(),
     }
+    if probed_at is not None:
+        frame["capabilities_probed_at"] = probed_at
+    return frame
+
+
+def capabilities_frame(node: str, capabilities: dict[str, Any]) -> dict[str, Any]:
+    return {"type": T_CAPABILITIES, "node": node, "capabilities": capabilities, "ts": now_ms()}
 
 
 def log_frame(node: str, level: str, source: str, msg: str, *, lab: str | None = None,
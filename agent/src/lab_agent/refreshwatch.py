@@ -0,0 +1,207 @@
+"""inotify watches on student homes for ``labquota --refresh`` markers.
+
+A student requests a fresh per-student scan by touching ``~/.labquota-refresh`` (see
+``usagereport.marker_path``). Rather than ``lstat``-ing that marker in every home of every lab each
+minute, the agent holds one inotify watch per provisioned home and hears about the marker the moment
+it is created, rewritten, or touched. Each event is re-checked with ``lstat``: only a regular file
+counts, exactly as the polling path, so a symlink or directory a student plants is ignored and never
+followed (the watch itself is added with ``IN_DONT_FOLLOW | IN_ONLYDIR``).
+
+Watches are reconciled against the roster on the scan loop's cadence (``sync``). A home that could
+not be watched — inotify unavailable, ``max_user_watches`` exhausted, or a watch the kernel dropped
+because the home went away — stays in ``unwatched`` and is polled instead, so a request is never
+lost, only noticed later. A queue overflow re-checks every watched home once.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+
+from .usagereport import REFRESH_MARKER, marker_mtime
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+
+# Marker appeared (create/rename) or was written/touched (labquota opens it for writing, then
+# bumps the mtime, which is an attribute change).
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB | IN_ONLYDIR | IN_DONT_FOLLOW
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len — then ``len`` bytes of NUL-padded name
+
+Key = tuple[str, str]  # (lab, username)
+
+
+class Inotify:
+    """Minimal non-blocking inotify instance over libc (the stdlib has no binding)."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        try:
+            self._init1 = libc.inotify_init1
+            self._add = libc.inotify_add_watch
+            self._rm = libc.inotify_rm_watch
+        except AttributeError as exc:
+            raise OSError("inotify is not available on this platform") from exc
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = self._init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._rm(self.fd, wd)  # EINVAL for a watch the kernel already dropped: nothing to do
+
+    def read(self) -> list[tuple[int, int, str]]:
+        """Every queued event as ``(wd, mask, name)``; empty when nothing is pending."""
+        events: list[tuple[int, int, str]] = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            if not buf:
+                return events
+            offset = 0
+            while offset + _EVENT.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size
+                name = buf[offset:offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class RefreshWatcher:
+    """Pending refresh requests, ``(lab, user) -> marker mtime (epoch ms)``. Thread-safe: ``sync``
+    and ``poll_unwatched`` run on the scan loop's worker thread, ``drain`` on the event loop."""
+
+    def __init__(self, inotify: Inotify | None = None) -> None:
+        if inotify is None:
+            try:
+                inotify = Inotify()
+            except OSError:
+                inotify = None
+        self._ino = inotify
+        self._lock = threading.Lock()
+        self._homes: dict[Key, str] = {}
+        self._watched: dict[Key, int] = {}
+        self._by_wd: dict[int, Key] = {}
+        self._pending: dict[Key, int] = {}
+
+    @property
+    def available(self) -> bool:
+        return self._ino is not None
+
+    def fileno(self) -> int:
+        if self._ino is None:
+            raise OSError("inotify is not available")
+        return self._ino.fd
+
+    @property
+    def unwatched(self) -> list[Key]:
+        with self._lock:
+            return sorted(k for k in self._homes if k not in self._watched)
+
+    def sync(self, homes: dict[Key, str]) -> None:
+        """Watch exactly ``homes`` (``(lab, user) -> home path``); retry previously failed ones."""
+        with self._lock:
+            for key in [k for k in self._homes if homes.get(k) != self._homes[k]]:
+                self._unwatch(key)
+                self._homes.pop(key, None)
+                self._pending.pop(key, None)
+            for key, path in homes.items():
+                self._homes[key] = path
+                if key in self._watched or self._ino is None:
+                    continue
+                try:
+                    wd = self._ino.add_watch(path, WATCH_MASK)
+                except OSError:
+                    continue  # polled via ``unwatched`` until a later sync succeeds
+                self._watched[key] = wd
+                self._by_wd[wd] = key
+                # A marker written before the watch existed would otherwise go unnoticed.
+                self._check(key)
+
+    def _unwatch(self, key: Key) -> None:
+        wd = self._watched.pop(key, None)
+        if wd is None:
+            return
+        self._by_wd.pop(wd, None)
+        if self._ino is not None:
+            self._ino.rm_watch(wd)
+
+    def _check(self, key: Key) -> None:
+        mtime = marker_mtime(os.path.join(self._homes[key], REFRESH_MARKER))
+        if mtime is not None:
+            self._pending[key] = max(mtime, self._pending.get(key, 0))
+
+    def drain(self) -> int:
+        """Consume queued inotify events. Returns how many refresh requests they raised."""
+        if self._ino is None:
+            return 0
+        events = self._ino.read()
+        raised = 0
+        with self._lock:
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    for key in self._watched:
+                        self._check(key)
+                    raised += 1
+                    continue
+                key = self._by_wd.get(wd)
+                if key is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # The home was removed or unmounted; the next sync re-watches or forgets it.
+                    self._watched.pop(key, None)
+                    self._by_wd.pop(wd, None)
+                    continue
+                if name == REFRESH_MARKER:
+                    before = self._pending.get(key)
+                    self._check(key)
+                    raised += self._pending.get(key) != before
+        return raised
+
+    def poll_unwatched(self) -> None:
+        """``lstat`` the marker of every home without a watch (the polling fallback)."""
+        with self._lock:
+            for key in self._homes:
+                if key not in self._watched:
+                    self._check(key)
+
+    def pending(self) -> dict[Key, int]:
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self, key: Key, upto: int) -> None:
+        """Forget ``key``'s request if it is no newer than ``upto`` (a scan that has covered it)."""
+        with self._lock:
+            if self._pending.get(key, upto + 1) <= upto:
+                del self._pending[key]
+
+    def close(self) -> None:
+        if self._ino is not None:
+            self._ino.close()
@@ -0,0 +1,297 @@
+"""Persistent per-directory index for the per-student usage scan.
+
+A plain ``du`` re-walks every inode of every student home on every scan, and a home with millions of
+small files simply times out (``docker.du_path`` gives up after 60s), so that student never gets a
+number at all. This index remembers, per directory, what the last walk saw:
+
+    (lab, user, tier, path) -> inode, mtime_ns, ctime_ns,
+                               own allocated bytes/entries (the dir + its non-directory children),
+                               aggregated allocated bytes/entries (the whole subtree)
+
+A rescan re-lists only directories whose inode/mtime/ctime changed (an entry was created, removed,
+or renamed in them) and reuses the cached figures for the rest, so an unchanged tree costs one
+``fstat`` per directory instead of one ``lstat`` per file. Creating or deleting a file bumps its
+parent's mtime, but rewriting a file in place does not; a directory re-listed longer ago than
+``usage_index_verify_interval_s`` is therefore re-listed anyway, which bounds that drift.
+
+The walk runs as root on the host over student-writable trees, so it never follows a link: every
+directory is opened relative to its parent's fd with ``O_NOFOLLOW | O_DIRECTORY`` and entries are
+only ever ``lstat``-ed, never opened. Sizes are allocated blocks (``st_blocks * 512``), matching
+``du -sB1``; hard links are counted once per directory entry, not deduplicated as ``du`` does.
+
+The index is a cache: it lives in its own SQLite file in the agent state dir (``cfg.scan_index``),
+survives restarts, and is pruned when a student or lab goes away. Losing it costs one full walk.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import stat
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from .config import AgentConfig
+from .protocol import now_ms
+
+# Deepest directory nesting the walk follows. Each level holds one open directory fd, so this also
+# bounds fd usage; a deeper tree reports no measurement and the scan falls back to ``du``.
+MAX_DEPTH = 512
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS dirs ("
+    "lab TEXT NOT NULL, user TEXT NOT NULL, tier TEXT NOT NULL, path TEXT NOT NULL, "
+    "parent TEXT, ino INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, ctime_ns INTEGER NOT NULL, "
+    "own_bytes INTEGER NOT NULL, own_entries INTEGER NOT NULL, "
+    "total_bytes INTEGER NOT NULL, total_entries INTEGER NOT NULL, "
+    "verified_at INTEGER NOT NULL, "
+    "PRIMARY KEY (lab, user, tier, path))"
+)
+
+
+class ScanIndexError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class DirRecord:
+    """One indexed directory. ``path`` is relative to the measured root ('' is the root itself)."""
+
+    path: str
+    parent: str | None
+    ino: int
+    mtime_ns: int
+    ctime_ns: int
+    own_bytes: int
+    own_entries: int
+    total_bytes: int
+    total_entries: int
+    verified_at: int
+
+
+@dataclass
+class Measurement:
+    """Result of one indexed walk."""
+
+    used_bytes: int
+    entries: int
+    dirs_listed: int = 0  # directories whose entries were re-read this walk
+    dirs_reused: int = 0  # directories whose cached figures were reused unchanged
+
+
+def _join(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+def _open_dir(name: str, dir_fd: int | None = None) -> int:
+    return os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=dir_fd)
+
+
+def _list_dir(fd: int) -> tuple[int, int, list[str]]:
+    """(own bytes, own entries, subdirectory names) of one open directory, without following."""
+    own_bytes = 0
+    own_entries = 0
+    subdirs: list[str] = []
+    with os.scandir(fd) as it:
+        for entry in it:
+            try:
+                est = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue  # vanished between readdir and lstat
+            if stat.S_ISDIR(est.st_mode):
+                subdirs.append(entry.name)
+            else:
+                own_bytes += est.st_blocks * 512
+                own_entries += 1
+    return own_bytes, own_entries, subdirs
+
+
+class _Frame:
+    __slots__ = ("rel", "parent", "fd", "st", "own_bytes", "own_entries", "pending",
+                 "total_bytes", "total_entries", "verified_at")
+
+    def __init__(self, rel: str, parent: str | None, fd: int, st: os.stat_result) -> None:
+        self.rel = rel
+        self.parent = parent
+        self.fd = fd
+        self.st = st
+        self.own_bytes = 0
+        self.own_entries = 0
+        self.pending: list[str] = []
+        self.total_bytes = 0
+        self.total_entries = 0
+        self.verified_at = 0
+
+
+class ScanIndex:
+    """SQLite-backed directory index. Thread-safe: the scan loop and task handlers share one."""
+
+    def __init__(self, path: str) -> None:
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        # check_same_thread=False: scans run in asyncio.to_thread pool threads; the lock serializes.
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute(_SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS dirs_owner ON dirs (lab, user)")
+        self.conn.commit()
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------ storage
+
+    def records(self, lab: str, user: str, tier: str) -> dict[str, DirRecord]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, parent, ino, mtime_ns, ctime_ns, own_bytes, own_entries, "
+                "total_bytes, total_entries, verified_at FROM dirs "
+                "WHERE lab = ? AND user = ? AND tier = ?",
+                (lab, user, tier),
+            ).fetchall()
+        return {row[0]: DirRecord(*row) for row in rows}
+
+    def _store(self, lab: str, user: str, tier: str, changed: list[DirRecord],
+               gone: set[str]) -> None:
+        with self._lock:
+            self.conn.executemany(
+                "DELETE FROM dirs WHERE lab = ? AND user = ? AND tier = ? AND path = ?",
+                [(lab, user, tier, path) for path in gone],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dirs (lab, user, tier, path, parent, ino, mtime_ns, "
+                "ctime_ns, own_bytes, own_entries, total_bytes, total_entries, verified_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(lab, user, tier, r.path, r.parent, r.ino, r.mtime_ns, r.ctime_ns, r.own_bytes,
+                  r.own_entries, r.total_bytes, r.total_entries, r.verified_at) for r in changed],
+            )
+            self.conn.commit()
+
+    def prune(self, lab: str, user: str | None = None) -> None:
+        """Forget a lab's (or one student's) indexed directories."""
+        with self._lock:
+            if user is None:
+                self.conn.execute("DELETE FROM dirs WHERE lab = ?", (lab,))
+            else:
+                self.conn.execute("DELETE FROM dirs WHERE lab = ? AND user = ?", (lab, user))
+            self.conn.commit()
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:  # pragma: no cover - best-effort
+            pass
+
+    # ------------------------------------------------------------------ walk
+
+    def measure(
+        self,
+        lab: str,
+        user: str,
+        tier: str,
+        root: str,
+        *,
+        verify_interval_s: int = 604800,
+        now: int | None = None,
+        pace: Callable[[int], None] | None = None,
+    ) -> Measurement:
+        """Allocated bytes + entry count under ``root``, reusing unchanged subtrees from the index.
+
+        ``root`` itself must be a real directory (never a symlink). Raises ``ScanIndexError`` when
+        the tree cannot be measured (root missing, nesting deeper than ``MAX_DEPTH``); the index is
+        left untouched in that case. ``pace`` (see ``scanthrottle``) is called with the number of
+        inodes each directory cost — one ``fstat`` when reused, plus one ``lstat`` per entry when
+        re-listed — and may sleep to hold the walk to a rate.
+        """
+        now = now if now is not None else now_ms()
+        stale_before = now - verify_interval_s * 1000
+        cached = self.records(lab, user, tier)
+        children: dict[str, list[str]] = {}
+        for rec in cached.values():
+            if rec.parent is not None:
+                children.setdefault(rec.parent, []).append(rec.path.rsplit("/", 1)[-1])
+        result = Measurement(used_bytes=0, entries=0)
+        changed: list[DirRecord] = []
+        seen: set[str] = set()
+
+        def enter(rel: str, parent: str | None, fd: int) -> _Frame:
+            st = os.fstat(fd)
+            frame = _Frame(rel, parent, fd, st)
+            rec = cached.get(rel)
+            if (rec is not None and rec.ino == st.st_ino and rec.mtime_ns == st.st_mtime_ns
+                    and rec.ctime_ns == st.st_ctime_ns and rec.verified_at >= stale_before):
+                frame.own_bytes, frame.own_entries = rec.own_bytes, rec.own_entries
+                frame.pending = list(children.get(rel, []))
+                frame.verified_at = rec.verified_at
+                result.dirs_reused += 1
+                cost = 1
+            else:
+                own_bytes, own_entries, frame.pending = _list_dir(fd)
+                frame.own_bytes = st.st_blocks * 512 + own_bytes
+                frame.own_entries = 1 + own_entries
+                frame.verified_at = now
+                result.dirs_listed += 1
+                cost = 1 + own_entries + len(frame.pending)
+            frame.total_bytes, frame.total_entries = frame.own_bytes, frame.own_entries
+            seen.add(rel)
+            if pace is not None:
+                pace(cost)
+            return frame
+
+        try:
+            root_fd = _open_dir(root)
+        except OSError as exc:
+            raise ScanIndexError(f"cannot open '{root}': {exc}") from exc
+        stack = [enter("", None, root_fd)]
+        try:
+            while stack:
+                top = stack[-1]
+                if top.pending:
+                    name = top.pending.pop()
+                    try:
+                        fd = _open_dir(name, top.fd)
+                    except OSError:
+                        # Gone, or replaced by a non-directory/symlink since it was indexed: the
+                        # parent's listing is wrong, so re-list the parent next time.
+                        top.verified_at = 0
+                        continue
+                    if len(stack) >= MAX_DEPTH:
+                        os.close(fd)
+                        raise ScanIndexError(f"'{root}' is nested deeper than {MAX_DEPTH} levels")
+                    try:
+                        stack.append(enter(_join(top.rel, name), top.rel, fd))
+                    except OSError:
+                        os.close(fd)
+                        top.verified_at = 0
+                    continue
+                stack.pop()
+                os.close(top.fd)
+                rec = DirRecord(top.rel, top.parent, top.st.st_ino, top.st.st_mtime_ns,
+                                top.st.st_ctime_ns, top.own_bytes, top.own_entries,
+                                top.total_bytes, top.total_entries, top.verified_at)
+                if cached.get(top.rel) != rec:
+                    changed.append(rec)
+                if stack:
+                    stack[-1].total_bytes += top.total_bytes
+                    stack[-1].total_entries += top.total_entries
+                else:
+                    result.used_bytes, result.entries = top.total_bytes, top.total_entries
+        finally:
+            for frame in stack:
+                os.close(frame.fd)
+        self._store(lab, user, tier, changed, set(cached) - seen)
+        return result
+
+
+def prune(cfg: AgentConfig, lab: str, user: str | None = None) -> None:
+    """Drop a lab's (or student's) index rows. A node that never scanned has no index to prune."""
+    if not os.path.exists(cfg.scan_index):
+        return
+    index = ScanIndex(cfg.scan_index)
+    try:
+        index.prune(lab, user)
+    finally:
+        index.close()
@@ -0,0 +1,206 @@
+"""Priority scan queue for the per-student usage scan.
+
+Every per-student scan — the controller's "Scan now", a student's ``labquota --refresh`` marker, and
+the daily fallback cadence — is submitted here as a ``ScanJob`` keyed by ``(lab, scope)``. A bounded
+pool of worker threads runs them highest priority first:
+
+    on-demand (controller)  >  student refresh marker  >  scheduled (cadence)
+
+so a "Scan now" click never waits behind a two-hour nightly scan of another lab, and independent
+labs scan concurrently (``usage_scan_concurrency``). At most one job per lab runs at a time.
+
+I/O is gated per storage tier rather than per job: the scan acquires ``slot("fast")`` around each
+fast-home walk and ``slot("slow")`` around each cold walk, so the slow HDD pool can be limited to
+one walker while the NVMe pool takes several (``usage_scan_{fast,slow}_concurrency``).
+
+Submitting a job that is already queued merges into it (keeping the higher priority) instead of
+queueing a duplicate. A job already *running* also absorbs a scheduled resubmission, and any request
+made before it started, provided it covers the same students; only a request newer than the
+running scan (or for a student it does not include) queues a follow-up. ``on_change``
+receives each lab's 1-based queue position whenever the queue changes, for ``status.json``.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+
+from .protocol import now_ms
+
+PRIORITY_ON_DEMAND = 0
+PRIORITY_REFRESH = 1
+PRIORITY_SCHEDULED = 2
+
+# Scope of a job covering every provisioned student of the lab.
+SCOPE_ALL = "*"
+# Scope of a targeted rescan of just ``users`` (student refresh markers), merged into the lab's
+# cached result. Requests from several students of one lab merge into one such job.
+SCOPE_STUDENTS = "students"
+
+
+@dataclass(eq=False)
+class ScanJob:
+    lab: str
+    scope: str = SCOPE_ALL
+    priority: int = PRIORITY_SCHEDULED
+    # Usernames to scan; None means the lab's roster as listed when the job starts.
+    users: list[str] | None = None
+    requested_at: int = field(default_factory=now_ms)  # epoch ms of the newest merged request
+    started_at: int | None = None
+    error: str | None = None
+    seq: int = 0
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return (self.lab, self.scope)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.done.wait(timeout)
+
+
+class ScanScheduler:
+    def __init__(
+        self,
+        runner: Callable[[ScanJob], None],
+        *,
+        concurrency: int = 2,
+        pool_limits: dict[str, int] | None = None,
+        on_change: Callable[[dict[str, int]], None] | None = None,
+    ) -> None:
+        self._runner = runner
+        self._concurrency = max(1, concurrency)
+        self._pools = {
+            name: threading.BoundedSemaphore(max(1, limit))
+            for name, limit in (pool_limits or {}).items()
+        }
+        self._on_change = on_change
+        self._cond = threading.Condition()
+        self._queued: list[ScanJob] = []
+        self._running: dict[str, ScanJob] = {}  # lab -> job
+        self._seq = 0
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+
+    # ------------------------------------------------------------------ queue
+
+    def submit(self, job: ScanJob) -> ScanJob:
+        """Queue ``job``, or return the queued/running job that already covers it."""
+        with self._cond:
+            for queued in self._queued:
+                if queued.key == job.key:
+                    queued.priority = min(queued.priority, job.priority)
+                    queued.requested_at = max(queued.requested_at, job.requested_at)
+                    if queued.users is None or job.users is None:
+                        queued.users = None
+                    else:
+                        queued.users = sorted(set(queued.users) | set(job.users))
+                    existing = queued
+                    break
+            else:
+                running = self._running.get(job.lab)
+                covered = running is not None and running.key == job.key and (
+                    running.users is None
+                    or (job.users is not None and set(job.users) <= set(running.users))
+                ) and (
+                    job.priority == PRIORITY_SCHEDULED
+                    or job.requested_at <= (running.started_at or 0)
+                )
+                if covered:
+                    return running
+                self._seq += 1
+                job.seq = self._seq
+                self._queued.append(job)
+                existing = job
+            self._cond.notify_all()
+        self._changed()
+        return existing
+
+    def positions(self) -> dict[str, int]:
+        """Lab -> 1-based position in dispatch order (best position if a lab has several jobs)."""
+        with self._cond:
+            ordered = sorted(self._queued, key=lambda j: (j.priority, j.seq))
+        out: dict[str, int] = {}
+        for i, job in enumerate(ordered, start=1):
+            out.setdefault(job.lab, i)
+        return out
+
+    def running(self) -> list[str]:
+        with self._cond:
+            return sorted(self._running)
+
+    def _changed(self) -> None:
+        if self._on_change is None:
+            return
+        try:
+            self._on_change(self.positions())
+        except Exception:  # position reporting is best-effort
+            pass
+
+    def _take(self) -> ScanJob | None:
+        """Block until a job is runnable (its lab is not already scanning) and claim it."""
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                ready = [j for j in self._queued if j.lab not in self._running]
+                if ready:
+                    job = min(ready, key=lambda j: (j.priority, j.seq))
+                    self._queued.remove(job)
+                    job.started_at = now_ms()
+                    self._running[job.lab] = job
+                    return job
+                self._cond.wait()
+
+    def run_one(self) -> bool:
+        """Claim and run the next job in the calling thread. False once the scheduler stops."""
+        job = self._take()
+        if job is None:
+            return False
+        self._changed()
+        try:
+            self._runner(job)
+        except Exception as exc:  # never let a worker die
+            job.error = str(exc)
+        finally:
+            with self._cond:
+                self._running.pop(job.lab, None)
+                self._cond.notify_all()
+            job.done.set()
+        return True
+
+    # ------------------------------------------------------------------ I/O slots
+
+    @contextlib.contextmanager
+    def slot(self, pool: str) -> Iterator[None]:
+        """Hold one of ``pool``'s concurrent-walker slots (unlimited for an unknown pool)."""
+        sem = self._pools.get(pool)
+        if sem is None:
+            yield
+            return
+        with sem:
+            yield
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        for i in range(self._concurrency):
+            thread = threading.Thread(target=self._worker, name=f"usage-scan-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self) -> None:
+        while self.run_one():
+            pass
+
+    def stop(self) -> None:
+        """Stop the workers after their current job; release anyone waiting on a queued job."""
+        with self._cond:
+            self._stopping = True
+            abandoned, self._queued = self._queued, []
+            self._cond.notify_all()
+        for job in abandoned:
+            job.error = "scan queue stopped"
+            job.done.set()
@@ -0,0 +1,230 @@
+"""I/O pacing for the per-student usage scan.
+
+An indexed walk (see ``scanindex``) still issues one ``lstat`` per entry of every directory it
+re-lists, and a first walk of a large home lists all of them. Left unpaced that metadata storm
+competes with students' training jobs for the same pool. Three controls keep the scan polite:
+
+* Walker threads drop to the idle I/O class (``ionice -c 3`` on the thread), so the block layer
+  serves them only when nothing else wants the disk. OpenZFS schedules its own vdev queues and
+  largely ignores I/O classes, so on ZFS the two controls below do the real work.
+* Each tier has one shared token bucket in inodes/s (``usage_scan_rate_inodes_s``). Every scan
+  walking that tier draws from it, so concurrent scans of one pool share one budget.
+* The bucket's rate adapts to the pool's live wait time from ``zpool iostat -l``: it halves while
+  latency exceeds the tier's target and grows back by a quarter per probe below it, up to the day
+  ceiling — or the night ceiling during ``usage_scan_night_hours``, when the pool is quiet.
+
+A pool that cannot be probed (an SMB cold tier, a missing ``zpool``) keeps the fixed ceiling. The
+``du`` fallback runs inside the container and is paced only by the per-tier walker slots.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from .config import SLOW_BACKEND_ZFS, AgentConfig
+from .executors.base import run
+
+# How often a throttle re-reads pool latency, and the sampling window of each read.
+PROBE_INTERVAL_S = 15.0
+PROBE_WINDOW_S = 1
+# Multiplicative decrease / increase applied per probe, and the floor as a fraction of the ceiling.
+BACKOFF = 0.5
+RECOVER = 1.25
+MIN_FRACTION = 1 / 16
+
+# ``zpool iostat -Hpl`` columns: name, alloc, free, read/write ops, read/write bandwidth, then
+# total_wait read/write (nanoseconds with -p, "-" when the window saw no I/O).
+_TOTAL_WAIT_COLS = (7, 8)
+
+
+def parse_iostat_latency(text: str) -> float | None:
+    """Worst total wait (ms) from the *last* row of ``zpool iostat -Hpl`` output, or None.
+
+    With an interval the first row is the since-boot average; the last row is the live window.
+    Pure function so it is easy to unit-test.
+    """
+    rows = [line.split("\t") for line in text.splitlines() if line.strip()]
+    if not rows:
+        return None
+    row = rows[-1]
+    if len(row) <= max(_TOTAL_WAIT_COLS):
+        return None
+    worst = 0.0
+    for col in _TOTAL_WAIT_COLS:
+        value = row[col].strip()
+        if value in ("-", ""):
+            continue  # no I/O in the window: no wait
+        try:
+            worst = max(worst, int(value) / 1e6)
+        except ValueError:
+            return None
+    return worst
+
+
+def pool_latency_ms(pool: str) -> float | None:
+    """Live worst read/write wait of ``pool`` over a short window, or None if unavailable."""
+    res = run(["zpool", "iostat", "-Hpl", pool, str(PROBE_WINDOW_S), "2"],
+              timeout=PROBE_WINDOW_S + 15)
+    if not res.ok:
+        return None
+    return parse_iostat_latency(res.stdout)
+
+
+def set_idle_io_class() -> bool:
+    """Put the calling thread in the idle I/O class. Best-effort: False if ``ionice`` failed."""
+    return run(["ionice", "-c", "3", "-p", str(threading.get_native_id())], timeout=10).ok
+
+
+def parse_hours(spec: str) -> tuple[int, int] | None:
+    """``"start-end"`` local hours (``"22-6"`` wraps midnight), or None if malformed/empty."""
+    try:
+        start, end = (int(part) for part in spec.split("-", 1))
+    except ValueError:
+        return None
+    if not (0 <= start <= 23 and 0 <= end <= 24) or start == end:
+        return None
+    return start, end
+
+
+def in_hours(window: tuple[int, int] | None, hour: int) -> bool:
+    if window is None:
+        return False
+    start, end = window
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+class ScanThrottle:
+    """Shared, latency-adaptive token bucket for one tier. Thread-safe."""
+
+    def __init__(
+        self,
+        rate: int,
+        *,
+        night_rate: int = 0,
+        night_hours: str = "",
+        latency_target_ms: float = 0.0,
+        probe: Callable[[], float | None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        hour: Callable[[], int] = lambda: time.localtime().tm_hour,
+    ) -> None:
+        self.day_rate = max(0, rate)
+        self.night_rate = max(self.day_rate, night_rate) if self.day_rate else 0
+        self.night_hours = parse_hours(night_hours)
+        self.latency_target_ms = latency_target_ms
+        self.latency_ms: float | None = None
+        self._probe = probe if latency_target_ms > 0 else None
+        self._clock = clock
+        self._sleep = sleep
+        self._hour = hour
+        self._lock = threading.Lock()
+        self.rate = float(self.day_rate)
+        self._tokens = self.rate
+        self._last = clock()
+        self._next_probe = self._last
+        self._probing = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.day_rate > 0
+
+    def ceiling(self) -> float:
+        night = in_hours(self.night_hours, self._hour())
+        return float(self.night_rate if night else self.day_rate)
+
+    def consume(self, inodes: int) -> float:
+        """Account ``inodes`` metadata reads; sleep as needed. Returns the seconds slept."""
+        if not self.enabled or inodes <= 0:
+            return 0.0
+        self._maybe_adapt()
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= inodes
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def _maybe_adapt(self) -> None:
+        # One caller probes at a time, outside the bucket lock, so other walkers keep going.
+        with self._lock:
+            if self._probing or self._clock() < self._next_probe:
+                return
+            self._probing = True
+        try:
+            latency = self._probe() if self._probe is not None else None
+        except Exception:
+            latency = None
+        with self._lock:
+            self._probing = False
+            self._next_probe = self._clock() + PROBE_INTERVAL_S
+            self.latency_ms = latency
+            ceiling = self.ceiling()
+            floor = max(1.0, ceiling * MIN_FRACTION)
+            if latency is None:
+                rate = ceiling
+            elif latency > self.latency_target_ms:
+                rate = self.rate * BACKOFF
+            else:
+                rate = self.rate * RECOVER
+            self.rate = min(ceiling, max(floor, rate))
+
+
+def tier_throttles(cfg: AgentConfig) -> dict[str, ScanThrottle]:
+    """One throttle per tier, probing the tier's pool (the slow tier only on a ZFS backend)."""
+    pools = {"fast": cfg.fast_pool}
+    if cfg.slow_backend == SLOW_BACKEND_ZFS:
+        pools["slow"] = cfg.slow_pool
+    targets = {"fast": cfg.usage_scan_fast_latency_ms, "slow": cfg.usage_scan_slow_latency_ms}
+    throttles: dict[str, ScanThrottle] = {}
+    for tier in ("fast", "slow"):
+        pool = pools.get(tier)
+        throttles[tier] = ScanThrottle(
+            cfg.usage_scan_rate_inodes_s,
+            night_rate=cfg.usage_scan_night_rate_inodes_s,
+            night_hours=cfg.usage_scan_night_hours,
+            latency_target_ms=targets[tier],
+            probe=(lambda p=pool: pool_latency_ms(p)) if pool else None,
+        )
+    return throttles
+
+
+class ScanPacer:
+    """One scan's view of the shared tier throttles: paces its walks and records what it cost."""
+
+    def __init__(self, throttles: dict[str, ScanThrottle],
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._throttles = throttles
+        self._clock = clock
+        self._started = clock()
+        self.inodes = 0
+        self.throttled_s = 0.0
+
+    def pace(self, tier: str, inodes: int) -> None:
+        self.inodes += inodes
+        throttle = self._throttles.get(tier)
+        if throttle is not None:
+            self.throttled_s += throttle.consume(inodes)
+
+    def for_tier(self, tier: str) -> Callable[[int], None]:
+        return lambda inodes: self.pace(tier, inodes)
+
+    def stats(self) -> dict[str, Any]:
+        """Effective figures for ``status.json``: achieved inodes/s, current per-tier limit
+        (None = unlimited), and the seconds this scan spent waiting on the limit."""
+        elapsed = self._clock() - self._started
+        return {
+            "inodes": self.inodes,
+            "inodes_per_s": round(self.inodes / elapsed) if elapsed > 0 else None,
+            "rate_limit": {
+                tier: round(t.rate) if t.enabled else None for tier, t in self._throttles.items()
+            },
+            "throttled_s": round(self.throttled_s, 1),
+        }
@@ -2,29 +2,78 @@
 
 Quota-disabled placements retain the original host-owned directories. A placement with a student
 quota uses a direct child dataset for that tier, mounted at the same path.
+
+``student.add_batch`` onboards a whole roster in one task: the lab's datasets are read once
+(``LabStorage``), every account is created by one in-container script with one ``chpasswd`` stream
+(``users.add_users``), and the initial SSH logins are verified on a bounded pool. Each student
+succeeds or fails on their own.
+
+``container.recreate`` plans the roster's storage before stopping the old container
+(``plan_storage``): a student needs no change, an online step (a quota set live or a directory's
+ownership/mode fixed), or a migration of a flat directory into a new quota dataset, which must wait
+for the stop. Online steps run first; migrations run in parallel while the lab is down.
 """
 
 from __future__ import annotations
 
 import os
 import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from typing import Any
 
-from . import coldstore
+from . import coldstore, scanindex
 from .config import AgentConfig
 from .executors import coldfs, docker, users, zfs
 from .executors.base import run
-from .paths import lab_fast, user_fast, user_slow
+from .paths import lab_fast, lab_slow, user_fast, user_slow
+
+# Concurrent initial-login checks in a batch; below sshd's default MaxStartups of 10.
+SSH_VERIFY_WORKERS = 8
+# Concurrent student storage preparations during recreate (zfs forks and ``cp -a`` migrations).
+STORAGE_WORKERS = 4
+
+# Storage plan actions, in increasing order of cost.
+UNCHANGED = "unchanged"
+ONLINE = "online"
+MIGRATE = "migrate"
+_ACTIONS = (UNCHANGED, ONLINE, MIGRATE)
+
+
+@dataclass
+class LabStorage:
+    """A lab's storage roots and existing student datasets (-> quota), read once for a batch."""
+
+    fast_root: str
+    cold_root: str
+    fast_datasets: dict[str, int | None]
+    cold_datasets: dict[str, int | None] | None  # None on the SMB backend
+
+
+def lab_storage(cfg: AgentConfig, lab: str) -> LabStorage:
+    fast = lab_fast(cfg, lab)
+    return LabStorage(
+        zfs.get_mountpoint(fast),
+        coldstore.lab_mount(cfg, lab),
+        zfs.list_children(fast),
+        zfs.list_children(lab_slow(cfg, lab)) if cfg.slow_is_zfs else None,
+    )
 
 
-def _ensure_user_dataset(dataset: str, path: str, quota: int | None, uid: int, gid: int) -> None:
+def _ensure_user_dataset(dataset: str, path: str, quota: int | None, uid: int, gid: int,
+                         known: dict[str, int | None] | None = None) -> None:
     """Create/promote a student directory only when quota mode is enabled.
 
     With quota unset and no existing child dataset this intentionally does nothing, preserving the
     original flat lab dataset. Promotion is called while the lab container is stopped by recreate.
+    ``known`` (existing datasets -> quota, see ``LabStorage``) replaces the per-student lookups and
+    skips a quota that is already right.
     """
-    if zfs.dataset_exists(dataset):
-        zfs.set_quota(dataset, quota)
+    exists = zfs.dataset_exists(dataset) if known is None else dataset in known
+    if exists:
+        if known is None or known[dataset] != quota:
+            zfs.set_quota(dataset, quota)
         coldfs.ensure_owned_dir(path, uid, gid)
         return
     if quota is None:
@@ -56,7 +105,8 @@ def _ensure_user_dataset(dataset: str, path: str, quota: int | None, uid: int, g
 
 
 def prepare_student_storage(cfg: AgentConfig, lab: str, username: str, uid: int, gid: int,
-                            fast_quota: int | None, cold_quota: int | None) -> None:
+                            fast_quota: int | None, cold_quota: int | None,
+                            storage: LabStorage | None = None) -> None:
     users.validate_username(username)
     for label, value in (("fast", fast_quota), ("cold", cold_quota)):
         invalid = value is not None and (
@@ -64,17 +114,92 @@ def prepare_student_storage(cfg: AgentConfig, lab: str, username: str, uid: int,
         )
         if invalid:
             raise ValueError(f"student {label} quota must be a positive integer byte count")
-    fast_root = zfs.get_mountpoint(lab_fast(cfg, lab))
+    if storage is None:
+        fast_root, fast_known = zfs.get_mountpoint(lab_fast(cfg, lab)), None
+    else:
+        fast_root, fast_known = storage.fast_root, storage.fast_datasets
     _ensure_user_dataset(user_fast(cfg, lab, username), f"{fast_root}/{username}",
-                         fast_quota, uid, gid)
-    cold_root = coldstore.lab_mount(cfg, lab)
+                         fast_quota, uid, gid, fast_known)
+    cold_root = coldstore.lab_mount(cfg, lab) if storage is None else storage.cold_root
     if cfg.slow_is_zfs:
         _ensure_user_dataset(user_slow(cfg, lab, username), f"{cold_root}/{username}",
-                             cold_quota, uid, gid)
+                             cold_quota, uid, gid, storage and storage.cold_datasets)
     else:
         coldfs.ensure_owned_dir(f"{cold_root}/{username}", uid, gid)
 
 
+@dataclass
+class StudentStorage:
+    """One student's entry in a recreate storage plan."""
+
+    username: str
+    uid: int
+    gid: int
+    action: str
+
+
+def _owned(path: str, uid: int, gid: int) -> bool:
+    """Already what ``coldfs.ensure_owned_dir`` would leave behind."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(st.st_mode) and (st.st_uid, st.st_gid) == (uid, gid)
+            and stat.S_IMODE(st.st_mode) == 0o700)
+
+
+def _tier_action(dataset: str, path: str, quota: int | None, uid: int, gid: int,
+                 known: dict[str, int | None] | None) -> str:
+    if known is not None and dataset in known:
+        return UNCHANGED if known[dataset] == quota and _owned(path, uid, gid) else ONLINE
+    if quota is not None and os.path.exists(path):
+        return MIGRATE  # flat directory with data -> quota dataset (see _ensure_user_dataset)
+    if quota is not None:
+        return ONLINE  # nothing to move: the dataset is simply created
+    return UNCHANGED if _owned(path, uid, gid) else ONLINE
+
+
+def plan_storage(cfg: AgentConfig, lab: str, usernames: list[str], fast_quota: int | None,
+                 cold_quota: int | None, storage: LabStorage) -> list[StudentStorage]:
+    """Classify each student's storage work for recreate; reads only, never changes anything.
+    Ownership comes from the student's existing fast directory."""
+    plan = []
+    for username in usernames:
+        fast_path = f"{storage.fast_root}/{username}"
+        st = os.stat(fast_path)
+        cold_path = f"{storage.cold_root}/{username}"
+        actions = [_tier_action(user_fast(cfg, lab, username), fast_path, fast_quota,
+                                st.st_uid, st.st_gid, storage.fast_datasets)]
+        if cfg.slow_is_zfs:
+            actions.append(_tier_action(user_slow(cfg, lab, username), cold_path, cold_quota,
+                                        st.st_uid, st.st_gid, storage.cold_datasets))
+        else:
+            actions.append(UNCHANGED if _owned(cold_path, st.st_uid, st.st_gid) else ONLINE)
+        plan.append(StudentStorage(username, st.st_uid, st.st_gid,
+                                   max(actions, key=_ACTIONS.index)))
+    return plan
+
+
+def apply_storage_plan(cfg: AgentConfig, lab: str, plan: list[StudentStorage],
+                       fast_quota: int | None, cold_quota: int | None,
+                       storage: LabStorage) -> list[tuple[str, Exception]]:
+    """Prepare every student in ``plan`` on ``STORAGE_WORKERS`` threads; returns the failures."""
+
+    def prepare(entry: StudentStorage) -> tuple[str, Exception] | None:
+        try:
+            prepare_student_storage(cfg, lab, entry.username, entry.uid, entry.gid,
+                                    fast_quota, cold_quota, storage)
+        except Exception as exc:
+            return entry.username, exc
+        return None
+
+    if not plan:
+        return []
+    with ThreadPoolExecutor(max_workers=min(STORAGE_WORKERS, len(plan)),
+                            thread_name_prefix="student-storage") as pool:
+        return [failed for failed in pool.map(prepare, plan) if failed is not None]
+
+
 def add_student(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
     lab = params["lab"]
     username = params["username"]
@@ -94,11 +219,102 @@ def add_student(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
 
     # The directories already have the student's stable IDs; account creation populates the home
     # and creates its cold-storage symlink.
-    users.add_user(docker.container_name(lab, cfg.node_name), username, password, uid, gid)
+    res = users.add_user(docker.container_name(lab, cfg.node_name), username, password, uid, gid)
     users.verify_ssh_login(docker.container_name(lab, cfg.node_name), username, password)
-    return {"lab": lab, "username": username, "uid": uid, "ssh_verified": True}, (
-        f"added student '{username}' (uid={uid}) to lab '{lab}'; initial SSH login verified"
-    )
+    ownership = users.ownership_reports(res.stdout).get(username)
+    msg = f"added student '{username}' (uid={uid}) to lab '{lab}'; initial SSH login verified"
+    if ownership is not None:
+        msg += (f"; home ownership converged in {ownership.elapsed_ms} ms "
+                f"({ownership.inodes} inodes changed)")
+    return {"lab": lab, "username": username, "uid": uid, "ssh_verified": True,
+            "ownership": asdict(ownership) if ownership else None}, msg
+
+
+def add_students(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
+    """``student.add_batch``: ``params["students"]`` holds ``add_student``'s per-student params.
+
+    The task succeeds once the batch has run; ``result["students"]`` reports each student in
+    order with ``ok`` and, on failure, the ``stage`` (validate, storage, account, ssh) and error.
+    """
+    lab = params["lab"]
+    entries = params.get("students") or []
+    if not entries:
+        raise ValueError("student.add_batch needs at least one student")
+    container = docker.container_name(lab, cfg.node_name)
+    rows: list[dict[str, Any]] = []
+    accepted: list[tuple[dict[str, Any], dict[str, Any], int, int]] = []
+    seen: set[Any] = set()
+
+    def fail(row: dict[str, Any], stage: str, error: str) -> None:
+        row.update(ok=False, stage=stage, error=error)
+
+    for entry in entries:
+        row: dict[str, Any] = {"username": entry.get("username"), "uid": entry.get("uid"),
+                               "ok": False, "ssh_verified": False}
+        rows.append(row)
+        try:
+            username = entry["username"]
+            uid = int(entry["uid"])
+            gid = int(entry.get("gid", uid))
+            users.validate_username(username)
+            users.validate_uid(uid, gid)
+            users.validate_password(entry["password"])
+            if username in seen or uid in seen:
+                raise ValueError(f"'{username}' (uid={uid}) appears twice in the batch")
+        except (KeyError, TypeError, ValueError, docker.DockerError) as exc:
+            fail(row, "validate", str(exc))
+            continue
+        seen.update((username, uid))
+        accepted.append((row, entry, uid, gid))
+
+    storage = lab_storage(cfg, lab) if accepted else None
+    ready = []
+    for row, entry, uid, gid in accepted:
+        try:
+            prepare_student_storage(
+                cfg, lab, entry["username"], uid, gid, entry.get("student_fast_quota_bytes"),
+                entry.get("student_cold_quota_bytes"), storage,
+            )
+        except Exception as exc:  # one student's storage must not sink the batch
+            fail(row, "storage", str(exc))
+            continue
+        ready.append((row, entry, uid, gid))
+
+    created = []
+    if ready:
+        errors, owned = users.add_users(container, [
+            (entry["username"], entry["password"], uid, gid) for _, entry, uid, gid in ready
+        ])
+        for row, entry, _uid, _gid in ready:
+            if entry["username"] in owned:
+                row["ownership"] = asdict(owned[entry["username"]])
+            error = errors.get(entry["username"])
+            if error is None:
+                created.append((row, entry))
+            else:
+                fail(row, "account", error)
+
+    def verify(item: tuple[dict[str, Any], dict[str, Any]]) -> None:
+        row, entry = item
+        try:
+            users.verify_ssh_login(container, entry["username"], entry["password"])
+        except Exception as exc:
+            fail(row, "ssh", str(exc))
+            return
+        row.update(ok=True, ssh_verified=True)
+
+    if created:
+        with ThreadPoolExecutor(max_workers=min(SSH_VERIFY_WORKERS, len(created)),
+                                thread_name_prefix="ssh-verify") as pool:
+            list(pool.map(verify, created))
+
+    added = sum(1 for row in rows if row["ok"])
+    lines = [f"added {added} of {len(rows)} students to lab '{lab}'"
+             + (f"; initial SSH logins verified for {added}" if added else "")]
+    lines += [f"  {row['username']}: {row['stage']} failed: {row['error']}"
+              for row in rows if not row["ok"]]
+    result = {"lab": lab, "students": rows, "added": added, "failed": len(rows) - added}
+    return result, "\n".join(lines)
 
 
 def remove_student(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
@@ -112,6 +328,8 @@ def remove_student(cfg: AgentConfig, params: dict[str, Any]) -> tuple[Any, str]:
             zfs.destroy_dataset(dataset, recursive=True)
         else:
             coldfs.remove_child(zfs.get_mountpoint(lab_fast(cfg, lab)), username)
+    # The scan index is a cache of this student's directories; drop it with the account.
+    scanindex.prune(cfg, lab, username)
     msg = f"removed student '{username}' from lab '{lab}'"
     result = {
         "lab": lab,
@@ -8,9 +8,18 @@ import re
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
 
+from . import gpuassign, numaplace, probegraph
 from .config import AgentConfig
 from .executors import docker
-from .executors.base import run
+from .executors.base import CommandResult, run
+from .probegraph import (
+    DOCKER_CONTAINERS,
+    DOCKER_DAEMON,
+    Probe,
+    ProbeTiming,
+    file_input,
+    mount_input,
+)
 
 
 @dataclass
@@ -41,6 +50,8 @@ class NvidiaHealth:
     userspace_driver_version: str
     cdi_ok: bool
     cdi_devices: list[str] = field(default_factory=list)
+    # lab -> pinned GPU indices (see gpuassign); labs given every GPU are absent
+    gpu_assignments: dict[str, list[str]] = field(default_factory=dict)
 
 
 @dataclass
@@ -63,6 +74,10 @@ class Capabilities:
     nvidia: NvidiaHealth
     storage: StorageHealth
     health: Health
+    # Per-probe timing and raw values of the detection run (the latter seed an incremental
+    # re-run, see ``healthwatch``); not part of the reported capabilities.
+    probes: list[ProbeTiming] = field(default_factory=list)
+    values: dict = field(default_factory=dict, repr=False)
 
     @property
     def nvidia_gpu(self) -> bool:
@@ -77,10 +92,22 @@ class Capabilities:
         return self.health.issues
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "runtime": asdict(self.runtime),
+            "nvidia": asdict(self.nvidia),
+            "storage": asdict(self.storage),
+            "health": asdict(self.health),
+        }
 
 
 DOCKER_DRIVERS_OK = ("zfs",)
+# Concurrent health probes; bounded so a sweep cannot fork-bomb a struggling node.
+PROBE_WORKERS = 8
+NVIDIA_VERSION = "/proc/driver/nvidia/version"
+CDI_SPEC = "/etc/cdi/nvidia.yaml"
+# Probes no watched input covers (GPU list, fabric manager, SSH and CUDA smoke tests) are re-run
+# by the health watch this often: as long as a deep result stays fresh in ``capcache``.
+UNWATCHED_MAX_AGE_S = 900.0
 
 
 def _issue(items: list[HealthIssue], code: str, severity: str, message: str,
@@ -149,7 +176,7 @@ def _cdi_devices() -> list[str]:
 
 def _loaded_driver_version() -> str:
     try:
-        text = open("/proc/driver/nvidia/version", encoding="utf-8").read()
+        text = open(NVIDIA_VERSION, encoding="utf-8").read()
     except OSError:
         return ""
     match = re.search(r"Kernel Module\s+([0-9.]+)", text)
@@ -286,6 +313,39 @@ def _stale_bwrap_capability_containers() -> list[str]:
     return stale
 
 
+def _numa_drift_containers() -> list[str]:
+    """Return pinned managed containers whose cpuset no longer matches their recorded NUMA
+    placement: changed behind the agent's back (``docker update``), or naming CPUs/nodes the host
+    no longer has online."""
+    listed = run([
+        "docker", "ps", "--filter", "label=lab-agent.managed=true", "--format",
+        f'{{{{.Names}}}}\t{{{{.Label "{numaplace.LABEL_CPUSET_CPUS}"}}}}\t'
+        f'{{{{.Label "{numaplace.LABEL_CPUSET_MEMS}"}}}}',
+    ], timeout=20)
+    if not listed.ok:
+        return []
+    nodes = numaplace.topology()
+    online = {cpu for cpus in nodes.values() for cpu in cpus}
+    drifted: list[str] = []
+    for line in listed.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) != 3 or not parts[1]:
+            continue  # unpinned
+        container, want_cpus, want_mems = parts
+        actual = run([
+            "docker", "inspect", "--format",
+            "{{.HostConfig.CpusetCpus}}\t{{.HostConfig.CpusetMems}}", container,
+        ], timeout=20)
+        got = actual.stdout.strip().split("\t") if actual.ok else []
+        if (len(got) != 2
+                or numaplace.parse_cpulist(got[0]) != numaplace.parse_cpulist(want_cpus)
+                or numaplace.parse_cpulist(got[1]) != numaplace.parse_cpulist(want_mems)
+                or not set(numaplace.parse_cpulist(want_cpus)) <= online
+                or not set(numaplace.parse_cpulist(want_mems)) <= set(nodes)):
+            drifted.append(container)
+    return drifted
+
+
 # Probe run inside a lab to prove the seccomp policy is enforcing: add_key(2) (syscall 248 on
 # x86_64) is outside the allow-list, so the profile fails it with defaultErrnoRet EPERM (exit 0);
 # without the profile the bogus arguments fail with a different errno such as EFAULT (exit 1).
@@ -388,109 +448,202 @@ def _smb_posix_ok(cfg: AgentConfig) -> bool:
             pass
 
 
-def detect_capabilities(cfg: AgentConfig, *, deep: bool = True) -> Capabilities:
+def _probes(cfg: AgentConfig, deep: bool) -> list[Probe]:
+    """The capability probes, what each needs and what each reads (see ``probegraph``). Values
+    only: issues are derived afterwards, in a fixed order, by ``detect_capabilities``."""
+    smoke = [
+        "bwrap", "--ro-bind", "/", "/", "--dev", "/dev", "--proc", "/proc",
+        "--unshare-pid", "--", "echo", "bwrap works",
+    ]
+    no_gpus = CommandResult(False, ["nvidia-smi", "-L"], -1, "", "")
+
+    def docker_up(v: dict) -> bool:
+        return v["docker"]
+
+    def sweeping(v: dict) -> bool:
+        return deep and v["docker"]
+
+    def sweep(name: str, fn, *inputs: str) -> Probe:
+        return Probe(name, fn, ("docker",), deadline_s=120, default=[], when=sweeping,
+                     inputs=(DOCKER_CONTAINERS, *inputs))
+
+    def driver(v: dict) -> str:
+        result = run(["docker", "info", "--format", "{{.Driver}}"], timeout=20)
+        return result.stdout.strip() if result.ok else ""
+
+    def bwrap_mode(v: dict) -> bool:
+        mode = run(["docker", "exec", v["target"][0], "stat", "-c", "%a", "/usr/bin/bwrap"],
+                   timeout=20)
+        return mode.ok and mode.stdout.strip() == "4755"
+
+    def gpu_count(v: dict) -> int:
+        return max(_smi_count(v["gpu_list"]), v["pci_gpus"])
+
+    seccomp = file_input(cfg.seccomp_profile)
+    nvidia = file_input(NVIDIA_VERSION)
+    fast_mount = mount_input(cfg.fast_mount_root)
+    cold_mount = mount_input(cfg.cold_mount_root if cfg.slow_is_zfs else cfg.slow_path)
+    subids = (file_input("/etc/subuid"), file_input("/etc/subgid"))
+    probes = [
+        Probe("zfs", lambda v: run(["zfs", "version"], timeout=15).ok, default=False),
+        Probe("pool_fast", lambda v: _pool_exists(cfg.fast_pool), ("zfs",), default=False,
+              when=lambda v: v["zfs"], inputs=(fast_mount,)),
+        Probe("pool_slow", lambda v: _pool_exists(cfg.slow_pool), ("zfs",), default=False,
+              when=lambda v: v["zfs"] and cfg.slow_is_zfs, inputs=(cold_mount,)),
+        Probe("fast_root", lambda v: _zfs_root_ok(cfg.labs_fast_root, cfg.fast_mount_root),
+              ("pool_fast",), default=False, when=lambda v: v["pool_fast"],
+              inputs=(fast_mount,)),
+        Probe("docker", lambda v: run(
+            ["docker", "version", "--format", "{{.Server.Version}}"], timeout=20).ok,
+            default=False, inputs=(DOCKER_DAEMON,)),
+        Probe("driver", driver, ("docker",), default="", when=docker_up,
+              inputs=(DOCKER_DAEMON,)),
+        Probe("docker_root", lambda v: _docker_root_ok(cfg), ("docker",), default=False,
+              when=docker_up, inputs=(DOCKER_DAEMON,)),
+        # host-prepare rewrites the subordinate ids together with the daemon's userns setting.
+        Probe("userns", lambda v: _docker_userns(cfg), ("docker",), default=False,
+              when=docker_up, inputs=(DOCKER_DAEMON, *subids)),
+        Probe("profiles", lambda v: _security_profiles_ok(cfg), default=False,
+              inputs=(seccomp,)),
+        sweep("stale_seccomp", lambda v: _stale_seccomp_containers(cfg), seccomp),
+        sweep("stale_systempaths", lambda v: _stale_systempaths_containers()),
+        sweep("stale_userns", lambda v: _stale_lab_userns_containers()),
+        sweep("stale_caps", lambda v: _stale_bwrap_capability_containers()),
+        sweep("stale_apparmor", lambda v: _stale_apparmor_containers()),
+        sweep("numa_drift", lambda v: _numa_drift_containers()),
+        Probe("target", lambda v: _first_student_container(), ("docker",), deadline_s=120,
+              when=sweeping, inputs=(DOCKER_CONTAINERS,)),
+        Probe("ssh", lambda v: docker.wait_ssh_ready(v["target"][0], timeout=10, interval=1),
+              ("target",), default=False, when=lambda v: bool(v["target"]),
+              max_age_s=UNWATCHED_MAX_AGE_S),
+        Probe("bwrap_mode", bwrap_mode, ("target",), default=False,
+              when=lambda v: bool(v["target"])),
+        Probe("bwrap_smoke", lambda v: _student_command(v["target"], smoke),
+              ("target", "bwrap_mode"), default=False, when=lambda v: v["bwrap_mode"]),
+        Probe("seccomp", lambda v: _seccomp_enforcement_ok(*v["target"]),
+              ("target", "bwrap_smoke"), default=False, when=lambda v: v["bwrap_smoke"],
+              inputs=(seccomp,)),
+        Probe("cuda", lambda v: _student_command(v["target"], ["nvcc", "--version"]),
+              ("target",), deadline_s=60, default=False, when=lambda v: bool(v["target"]),
+              max_age_s=UNWATCHED_MAX_AGE_S),
+        Probe("gpu_list", lambda v: run(["nvidia-smi", "-L"], timeout=20), default=no_gpus,
+              inputs=(nvidia,), max_age_s=UNWATCHED_MAX_AGE_S),
+        Probe("pci_gpus", lambda v: _nvidia_hardware_count(), default=0, inputs=(nvidia,)),
+        Probe("loaded", lambda v: _loaded_driver_version(), default="", inputs=(nvidia,)),
+        Probe("userspace", lambda v: _userspace_driver_version(), deadline_s=45, default="",
+              inputs=(nvidia,)),
+        Probe("fabric_failed", lambda v: run(
+            ["systemctl", "is-failed", "nvidia-fabricmanager.service"], timeout=15).ok,
+            ("gpu_list", "pci_gpus"), default=False, when=lambda v: gpu_count(v) > 0,
+            max_age_s=UNWATCHED_MAX_AGE_S),
+        Probe("cdi", lambda v: _cdi_devices(), deadline_s=35, default=[],
+              inputs=(file_input(CDI_SPEC),)),
+        Probe("assignments", lambda v: gpuassign.assignments(cfg), default={},
+              inputs=(file_input(cfg.gpu_assignments),)),
+    ]
+    if cfg.slow_is_zfs:
+        probes.append(Probe(
+            "cold", lambda v: _zfs_root_ok(cfg.labs_slow_root, cfg.cold_mount_root),
+            ("pool_slow",), default=False, when=lambda v: v["pool_slow"], inputs=(cold_mount,)))
+    else:
+        probes.append(Probe("cold_mounted", lambda v: os.path.ismount(cfg.slow_path),
+                            default=False, inputs=(cold_mount,)))
+        probes.append(Probe("cold", lambda v: _smb_posix_ok(cfg), ("cold_mounted",),
+                            deadline_s=60, default=False, when=lambda v: v["cold_mounted"],
+                            inputs=(cold_mount,)))
+    return probes
+
+
+def probe_inputs(cfg: AgentConfig, *, deep: bool = True) -> dict[str, tuple[str, ...]]:
+    """Probe name -> the inputs it reads (see ``probegraph``), for ``healthwatch``."""
+    return {p.name: p.inputs for p in _probes(cfg, deep)}
+
+
+def probe_max_ages(cfg: AgentConfig, *, deep: bool = True) -> dict[str, float]:
+    """Probe name -> how old its value may get, for the probes their inputs do not cover."""
+    return {p.name: p.max_age_s for p in _probes(cfg, deep) if p.max_age_s is not None}
+
+
+def _smi_count(gpu_list: CommandResult) -> int:
+    if not gpu_list.ok:
+        return 0
+    return sum(1 for line in gpu_list.stdout.splitlines() if line.strip().startswith("GPU"))
+
+
+def detect_capabilities(cfg: AgentConfig, *, deep: bool = True, previous: dict | None = None,
+                        changed: set[str] | None = None) -> Capabilities:
+    """Probe the node (concurrently, see ``_probes``) and derive its health issues. With
+    ``previous`` (an earlier result's ``values``) only the ``changed`` probes and whatever depends
+    on a value they changed are re-run (see ``probegraph.execute``)."""
+    v, timings = probegraph.execute(_probes(cfg, deep), workers=PROBE_WORKERS,
+                                    previous=previous, changed=changed)
     issues: list[HealthIssue] = []
-    zfs_ok = run(["zfs", "version"], timeout=15).ok
+    zfs_ok = v["zfs"]
     if not zfs_ok:
         _issue(issues, "zfs_missing", "critical", "ZFS is unavailable")
 
     # host-prepare only puts Docker's data-root on a ZFS dataset once the pool(s) it needs exist
     # (see hostprep._zfs_pools_ready); before that, a plain install on the default backing store is
     # expected and the missing pool(s) are already flagged below via fast/cold_storage_missing.
-    zfs_pools_ready = zfs_ok and _pool_exists(cfg.fast_pool) and (
-        not cfg.slow_is_zfs or _pool_exists(cfg.slow_pool)
-    )
+    zfs_pools_ready = zfs_ok and v["pool_fast"] and (not cfg.slow_is_zfs or v["pool_slow"])
 
-    docker_ok = run(["docker", "version", "--format", "{{.Server.Version}}"], timeout=20).ok
-    driver = ""
-    if docker_ok:
-        result = run(["docker", "info", "--format", "{{.Driver}}"], timeout=20)
-        driver = result.stdout.strip() if result.ok else ""
-    else:
+    docker_ok = v["docker"]
+    driver = v["driver"]
+    if not docker_ok:
         _issue(issues, "docker_unavailable", "critical", "Docker daemon is unreachable")
     if docker_ok and zfs_pools_ready and driver not in DOCKER_DRIVERS_OK:
         _issue(issues, "docker_storage_driver", "critical",
                f"Docker storage driver '{driver or 'unknown'}' is unsupported")
-    if docker_ok and not _docker_root_ok(cfg):
+    if docker_ok and not v["docker_root"]:
         _issue(issues, "docker_data_root", "critical",
                f"Docker data-root does not match '{cfg.docker_data_root}'", True)
 
-    userns_ok = docker_ok and _docker_userns(cfg)
+    userns_ok = docker_ok and v["userns"]
     if docker_ok and not userns_ok:
         _issue(issues, "docker_userns", "critical",
                "Docker userns-remap must be disabled: labs run --userns=host and a remapped daemon "
                "breaks setuid passwd/sudo inside the lab — re-run host-prepare and recreate "
                "placements")
 
-    bwrap_ok = _security_profiles_ok(cfg)
+    bwrap_ok = v["profiles"]
     cuda_ok = False
-    target: tuple[str, str] | None = None
+    target: tuple[str, str] | None = v["target"]
     if deep and docker_ok:
-        stale_seccomp = _stale_seccomp_containers(cfg)
-        if stale_seccomp:
-            _issue(
-                issues,
-                "container_seccomp_stale",
-                "critical",
-                "Managed containers require recreation after a seccomp profile update: "
-                + ", ".join(stale_seccomp),
-            )
-        stale_systempaths = _stale_systempaths_containers()
-        if stale_systempaths:
-            _issue(
-                issues,
-                "container_systempaths_stale",
-                "critical",
-                "Managed containers require recreation for nested bubblewrap procfs: "
-                + ", ".join(stale_systempaths),
-            )
-        stale_lab_userns = _stale_lab_userns_containers()
-        if stale_lab_userns:
-            _issue(
-                issues,
-                "container_userns_stale",
-                "critical",
-                "Managed containers require reinstall for bubblewrap-compatible user namespaces: "
-                + ", ".join(stale_lab_userns),
-            )
-        stale_bwrap_caps = _stale_bwrap_capability_containers()
-        if stale_bwrap_caps:
-            _issue(
-                issues,
-                "container_bwrap_caps_stale",
-                "critical",
-                "Managed containers require recreation with the setuid bubblewrap capability "
-                "contract: " + ", ".join(stale_bwrap_caps),
-            )
-        stale_apparmor = _stale_apparmor_containers()
-        if stale_apparmor:
+        sweeps = (
+            ("stale_seccomp", "container_seccomp_stale",
+             "Managed containers require recreation after a seccomp profile update: "),
+            ("stale_systempaths", "container_systempaths_stale",
+             "Managed containers require recreation for nested bubblewrap procfs: "),
+            ("stale_userns", "container_userns_stale",
+             "Managed containers require reinstall for bubblewrap-compatible user namespaces: "),
+            ("stale_caps", "container_bwrap_caps_stale",
+             "Managed containers require recreation with the setuid bubblewrap capability "
+             "contract: "),
+            ("stale_apparmor", "container_apparmor_stale",
+             "Managed containers require recreation with the unconfined AppArmor contract "
+             "(setuid bwrap breaks under confinement): "),
+        )
+        for probe, code, message in sweeps:
+            if v[probe]:
+                _issue(issues, code, "critical", message + ", ".join(v[probe]))
+        if v["numa_drift"]:
             _issue(
                 issues,
-                "container_apparmor_stale",
-                "critical",
-                "Managed containers require recreation with the unconfined AppArmor contract "
-                "(setuid bwrap breaks under confinement): " + ", ".join(stale_apparmor),
+                "container_numa_drift",
+                "warning",
+                "Managed containers no longer match their NUMA CPU/memory placement; recreate "
+                "them to re-pin: " + ", ".join(v["numa_drift"]),
             )
-        target = _first_student_container()
         if target:
-            if not docker.wait_ssh_ready(target[0], timeout=10, interval=1):
+            if not v["ssh"]:
                 _issue(
                     issues,
                     "ssh_handshake_failed",
                     "critical",
                     f"SSH key exchange failed in '{target[0]}'; inspect its Docker logs",
                 )
-            mode = run(["docker", "exec", target[0], "stat", "-c", "%a", "/usr/bin/bwrap"],
-                       timeout=20)
-            mode_ok = mode.ok and mode.stdout.strip() == "4755"
-            bwrap_smoke = [
-                "bwrap", "--ro-bind", "/", "/", "--dev", "/dev", "--proc", "/proc",
-                "--unshare-pid", "--", "echo", "bwrap works",
-            ]
-            raw_bwrap_ok = mode_ok and _student_command(target, bwrap_smoke)
-            bwrap_ok = mode_ok and raw_bwrap_ok
-            seccomp_ok = bwrap_ok and _seccomp_enforcement_ok(target[0], target[1])
-            if bwrap_ok and not seccomp_ok:
+            bwrap_ok = v["bwrap_mode"] and v["bwrap_smoke"]
+            if bwrap_ok and not v["seccomp"]:
                 _issue(
                     issues,
                     "seccomp_enforcement_failed",
@@ -499,7 +652,7 @@ def detect_capabilities(cfg: AgentConfig, *, deep: bool = True) -> Capabilities:
                     "re-run host-prepare to refresh the profile",
                     True,
                 )
-            cuda_ok = _student_command(target, ["nvcc", "--version"])
+            cuda_ok = v["cuda"]
         else:
             _issue(
                 issues,
@@ -514,12 +667,11 @@ def detect_capabilities(cfg: AgentConfig, *, deep: bool = True) -> Capabilities:
         _issue(issues, "cuda_toolkit_failed", "critical",
                "nvcc --version failed as a provisioned student")
 
-    gpu_list = run(["nvidia-smi", "-L"], timeout=20)
-    smi_count = sum(1 for line in gpu_list.stdout.splitlines()
-                    if line.strip().startswith("GPU")) if gpu_list.ok else 0
-    gpu_count = max(smi_count, _nvidia_hardware_count())
-    loaded = _loaded_driver_version()
-    userspace = _userspace_driver_version()
+    gpu_list = v["gpu_list"]
+    smi_count = _smi_count(gpu_list)
+    gpu_count = max(smi_count, v["pci_gpus"])
+    loaded = v["loaded"]
+    userspace = v["userspace"]
     nvml_ok = gpu_list.ok
     if loaded and (not nvml_ok or (userspace and loaded != userspace)):
         _issue(issues, "nvml_driver_mismatch", "critical",
@@ -533,11 +685,10 @@ def detect_capabilities(cfg: AgentConfig, *, deep: bool = True) -> Capabilities:
             "Fabric Manager, and kernel logs",
             False,
         )
-    if gpu_count and run(["systemctl", "is-failed", "nvidia-fabricmanager.service"],
-                         timeout=15).ok:
+    if gpu_count and v["fabric_failed"]:
         _issue(issues, "nvidia_fabric_manager", "critical",
                "NVIDIA Fabric Manager is failed and requires operator repair", False)
-    devices = _cdi_devices()
+    devices = v["cdi"]
     cdi_names = {device.partition("=")[2] for device in devices}
     identifiers = set(re.findall(r"\(UUID:\s*([^)]+)\)", gpu_list.stdout))
     expected = {"all", *(str(index) for index in range(smi_count)), *identifiers}
@@ -546,33 +697,31 @@ def detect_capabilities(cfg: AgentConfig, *, deep: bool = True) -> Capabilities:
         _issue(issues, "nvidia_cdi_stale", "critical",
                "NVIDIA CDI devices are missing or stale", True)
 
-    fast_ok = (
-        _pool_exists(cfg.fast_pool)
-        and _zfs_root_ok(cfg.labs_fast_root, cfg.fast_mount_root)
-        if zfs_ok else False
-    )
+    fast_ok = bool(zfs_ok and v["pool_fast"] and v["fast_root"])
     if not fast_ok:
         _issue(issues, "fast_storage_missing", "critical",
                f"Fast pool '{cfg.fast_pool}' is unavailable")
-    if cfg.slow_is_zfs:
-        cold_ok = (
-            _pool_exists(cfg.slow_pool) and _zfs_root_ok(cfg.labs_slow_root, cfg.cold_mount_root)
-            if zfs_ok else False
-        )
-    else:
-        cold_ok = os.path.ismount(cfg.slow_path) and _smb_posix_ok(cfg)
+    cold_ok = bool(v["cold"])
     if not cold_ok:
-        code = "cold_storage_missing" if cfg.slow_is_zfs or not os.path.ismount(cfg.slow_path) \
+        code = "cold_storage_missing" if cfg.slow_is_zfs or not v["cold_mounted"] \
             else "smb_posix_ownership"
         _issue(issues, code, "critical",
                f"Cold {cfg.slow_backend} storage is unavailable or lacks POSIX numeric ownership")
 
+    overdue = [t.name for t in timings if t.timed_out]
+    if overdue:
+        _issue(issues, "probe_timeout", "warning",
+               "Health probes timed out and were treated as failed: " + ", ".join(overdue))
+
     severity = {"warning": 1, "critical": 2}
     status = "healthy" if not issues else max(issues, key=lambda i: severity[i.severity]).severity
     return Capabilities(
         runtime=RuntimeHealth(docker_ok, driver, userns_ok, cfg.userns_user,
                               cfg.userns_start, cfg.userns_size, bwrap_ok, cuda_ok),
-        nvidia=NvidiaHealth(gpu_count, nvml_ok, loaded, userspace, cdi_ok, devices),
+        nvidia=NvidiaHealth(gpu_count, nvml_ok, loaded, userspace, cdi_ok, devices,
+                            v["assignments"]),
         storage=StorageHealth(zfs_ok, fast_ok, cold_ok, cfg.slow_backend),
         health=Health(status, issues),
+        probes=timings,
+        values=v,
     )
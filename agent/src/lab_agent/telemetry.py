@@ -5,7 +5,10 @@ Reports, every heartbeat:
   - per-dataset usage under the lab roots (the controller maps dataset names back to labs/students
     and stores a storage time-series),
   - ZFS scrub status per pool (so the controller can alert when a scrub finds errors),
-  - the live GPU process list (pid + VRAM, resolved to container/user where possible).
+  - the live GPU process list (pid + VRAM + windowed utilization, resolved to container/user where
+    possible),
+  - per-GPU health (utilization, memory, temperature, power, clocks, ECC, throttle reasons) as
+    min/avg/max over the samples taken since the previous heartbeat.
 
 Storage usage is **not** measured on the heartbeat: the lab-level totals (fast/slow ZFS + container
 writable-layer "image") come from the lab-usage cache (refreshed every ``lab_usage_interval_s``, see
@@ -13,18 +16,23 @@ writable-layer "image") come from the lab-usage cache (refreshed every ``lab_usa
 heartbeat just re-reports whichever cached numbers are current, so a 15s heartbeat never triggers an
 expensive ``zfs list`` / ``docker inspect`` / ``du``.
 
+The GPU list is the agent's shared GPU snapshot (see ``gpu.snapshot``), reported with its age.
 The controller stores the latest snapshot; GPU is snapshot-only (no time-series).
 """
 
 from __future__ import annotations
 
+import time
 from typing import Any
 
 from . import coldstore, usagereport
 from .config import AgentConfig
 from .executors import zfs
 from .executors.base import run
+from .gpu.devices import DeviceHistory
 from .gpu.monitor import list_gpu_processes
+from .gpu.policy import get_policy
+from .gpu.snapshot import GpuSnapshot
 
 
 def _pool_free(pool: str) -> dict[str, Any] | None:
@@ -75,12 +83,24 @@ def _usage_scans(usage_state: Any = None) -> list[dict[str, Any]]:
     ]
 
 
-def collect_heartbeat(cfg: AgentConfig, usage_state: Any = None) -> dict[str, Any]:
+def collect_heartbeat(
+    cfg: AgentConfig,
+    usage_state: Any = None,
+    gpu: GpuSnapshot | None = None,
+    devices: DeviceHistory | None = None,
+) -> dict[str, Any]:
+    """``gpu`` is the agent's latest shared GPU snapshot; without one (none taken yet, or a caller
+    outside the agent) the GPU list is read live and reported with age 0. ``devices`` is the
+    per-device sample history, summarised over the last heartbeat interval."""
+    if gpu is None:
+        gpu = GpuSnapshot(0, time.time(), tuple(list_gpu_processes(get_policy())))
     return {
         "pools": _pools(cfg),
         "storage": _storage_usage(cfg, usage_state),
         "scrub": [zfs.scrub_status(p).to_dict() for p in cfg.scrub_pools],
         "cold": coldstore.cold_status(cfg),
-        "gpu_processes": list_gpu_processes(),
+        "gpu_processes": list(gpu.processes),
+        "gpu_snapshot": gpu.to_dict(),
+        "gpu_devices": devices.summary(cfg.heartbeat_interval_s) if devices is not None else [],
         "usage_scans": _usage_scans(usage_state),
     }
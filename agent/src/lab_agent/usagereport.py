@@ -21,8 +21,9 @@ The snapshot has two kinds of numbers:
   every lab/student in a single ``zfs list -r`` per pool (see ``collect_zfs_usage``), so a publish
   is cheap regardless of scale.
 * **Container layer** — bytes a student installed into their container home (envs/software). This is
-  the one expensive measurement (``du`` per home via ``docker exec``); it is computed on a slow
-  cadence / on demand and cached in ``ContainerUsage``, never per publish.
+  the one expensive measurement (an indexed host-side walk per home, see ``scanindex``, with ``du``
+  via ``docker exec`` as the fallback); it is computed on a slow cadence / on demand and cached in
+  ``ContainerUsage``, never per publish.
 
 This module is import-safe and its parsing/build helpers are pure so they unit-test without ZFS or
 Docker. Only ``collect_*``/``run_container_scan`` and ``*_dir``/publish helpers touch the host.
@@ -30,16 +31,24 @@ Docker. Only ``collect_*``/``run_container_scan`` and ``*_dir``/publish helpers
 
 from __future__ import annotations
 
+import contextlib
+import hashlib
 import json
 import os
+import stat
+import threading
 from collections.abc import Callable
+from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
 from typing import Any
 
+from . import coldstore
 from .config import AgentConfig
 from .executors import docker, users, zfs
 from .paths import lab_fast
 from .protocol import now_ms
+from .scanindex import ScanIndex, ScanIndexError
+from .scanthrottle import ScanPacer
 
 USAGE_FILE = "usage.json"
 STATUS_FILE = "status.json"
@@ -71,6 +80,9 @@ class ContainerUsage:
     per_user_fast: dict[str, int] = field(default_factory=dict)  # username -> fast home du bytes
     per_user_slow: dict[str, int] = field(default_factory=dict)  # username -> cold-storage du bytes
     unattributed: int | None = None  # SizeRw is intentionally not attributed to bind-mounted homes
+    # username -> epoch ms of that student's last measurement. A single-student rescan advances only
+    # its own entry; ``scanned_at`` stays the last full-lab scan, which drives the scan cadence.
+    user_scanned_at: dict[str, int] = field(default_factory=dict)
 
     def to_dict(self) -> dict[str, Any]:
         return {
@@ -81,8 +93,49 @@ class ContainerUsage:
             "per_user_fast": dict(self.per_user_fast),
             "per_user_slow": dict(self.per_user_slow),
             "unattributed": self.unattributed,
+            "user_scanned_at": dict(self.user_scanned_at),
         }
 
+    def scanned_at_for(self, user: str) -> int | None:
+        return self.user_scanned_at.get(user, self.scanned_at)
+
+
+def publish_cold_usage(cfg: AgentConfig, lab: str, usage: ContainerUsage) -> None:
+    """Owner of the cold tier: share this lab's per-student cold numbers with its SMB clients."""
+    if not cfg.slow_is_zfs:
+        return
+    scanned: dict[str, int] = {}
+    for user in usage.per_user_slow:
+        at = usage.scanned_at_for(user)
+        if at is not None:
+            scanned[user] = at
+    coldstore.publish_student_usage(cfg, lab, dict(usage.per_user_slow), scanned)
+
+
+def merge_student_scan(cached: ContainerUsage, partial: ContainerUsage,
+                       usernames: list[str]) -> ContainerUsage:
+    """Fold a scan of just ``usernames`` into the lab's cached full-scan result."""
+    merged = ContainerUsage(
+        scanned_at=cached.scanned_at,
+        status="idle",
+        total_used=partial.total_used if partial.total_used is not None else cached.total_used,
+        per_user=dict(cached.per_user),
+        per_user_fast=dict(cached.per_user_fast),
+        per_user_slow=dict(cached.per_user_slow),
+        unattributed=cached.unattributed,
+        user_scanned_at=dict(cached.user_scanned_at),
+    )
+    for user in usernames:
+        for ours, theirs in ((merged.per_user_fast, partial.per_user_fast),
+                             (merged.per_user_slow, partial.per_user_slow)):
+            if user in theirs:
+                ours[user] = theirs[user]
+            else:
+                ours.pop(user, None)
+        if partial.scanned_at is not None:
+            merged.user_scanned_at[user] = partial.scanned_at
+    return merged
+
 
 @dataclass
 class LabLevelUsage:
@@ -98,6 +151,43 @@ class LabLevelUsage:
     computed_at: int | None = None  # epoch ms of the last refresh
     storage: list[dict[str, Any]] = field(default_factory=list)  # lab-level telemetry rows
 
+    def to_dict(self) -> dict[str, Any]:
+        return {"computed_at": self.computed_at, "storage": [dict(r) for r in self.storage]}
+
+
+def _int_map(value: Any) -> dict[str, int]:
+    if not isinstance(value, dict):
+        return {}
+    return {str(k): v for k, v in value.items() if isinstance(v, int) and not isinstance(v, bool)}
+
+
+def _opt_int(value: Any) -> int | None:
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def container_usage_from_dict(data: dict[str, Any]) -> ContainerUsage:
+    """Rebuild a checkpointed ``ContainerUsage``. A scan cannot survive a restart, so the restored
+    status is always idle."""
+    return ContainerUsage(
+        scanned_at=_opt_int(data.get("scanned_at")),
+        status="idle",
+        total_used=_opt_int(data.get("total_used")),
+        per_user=_int_map(data.get("per_user")),
+        per_user_fast=_int_map(data.get("per_user_fast")),
+        per_user_slow=_int_map(data.get("per_user_slow")),
+        unattributed=_opt_int(data.get("unattributed")),
+        user_scanned_at=_int_map(data.get("user_scanned_at")),
+    )
+
+
+def lab_level_from_dict(data: dict[str, Any]) -> LabLevelUsage:
+    storage = data.get("storage")
+    return LabLevelUsage(
+        computed_at=_opt_int(data.get("computed_at")),
+        storage=[dict(r) for r in storage if isinstance(r, dict)] if isinstance(storage, list)
+        else [],
+    )
+
 
 class UsageState:
     """Per-lab usage cache shared between the publish loop, the scan loop, and telemetry.
@@ -105,17 +195,71 @@ class UsageState:
     Two independently-cadenced caches: ``_container`` is the expensive per-student ``du`` breakdown
     (refreshed by the nightly / on-demand scan) and ``_lab`` is the lab-level totals (fast/slow ZFS
     + container writable layer, refreshed every ``lab_usage_interval_s`` / on demand).
+
+    With a ``path`` (``cfg.usage_state``) both caches are reloaded from disk at construction and
+    checkpointed atomically after every update, so an agent restart or upgrade keeps each lab's
+    ``scanned_at``/``computed_at``: the due checks see the real age and nothing is rescanned early.
+    The file is a disposable cache — a missing or corrupt checkpoint just starts empty.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, path: str | None = None) -> None:
         self._container: dict[str, ContainerUsage] = {}
         self._lab: dict[str, LabLevelUsage] = {}
+        self._path = path
+        self._save_lock = threading.Lock()
+        if path is not None:
+            self._load(path)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+        for key, target, parse in (
+            ("container", self._container, container_usage_from_dict),
+            ("lab", self._lab, lab_level_from_dict),
+        ):
+            entries = data.get(key)
+            if not isinstance(entries, dict):
+                continue
+            for lab, entry in entries.items():
+                if isinstance(entry, dict):
+                    target[lab] = parse(entry)
+
+    def checkpoint(self) -> None:
+        """Atomically persist both caches (no-op for an in-memory state). Best-effort: a failed
+        write keeps the previous checkpoint and never fails the scan/refresh that triggered it."""
+        if self._path is None:
+            return
+        with self._save_lock:
+            payload = {
+                "container": {lab: u.to_dict() for lab, u in dict(self._container).items()},
+                "lab": {lab: u.to_dict() for lab, u in dict(self._lab).items()},
+            }
+            tmp = f"{self._path}.tmp"
+            try:
+                parent = os.path.dirname(self._path)
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+                with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                    json.dump(payload, fh)
+                os.replace(tmp, self._path)
+            except OSError:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
 
     def container_for(self, lab: str) -> ContainerUsage:
         return self._container.get(lab, ContainerUsage())
 
     def set_container(self, lab: str, usage: ContainerUsage) -> None:
         self._container[lab] = usage
+        self.checkpoint()
 
     def all_container(self) -> dict[str, ContainerUsage]:
         return dict(self._container)
@@ -125,6 +269,7 @@ class UsageState:
 
     def set_lab_level(self, lab: str, usage: LabLevelUsage) -> None:
         self._lab[lab] = usage
+        self.checkpoint()
 
     def all_lab_level(self) -> dict[str, LabLevelUsage]:
         return dict(self._lab)
@@ -132,6 +277,17 @@ class UsageState:
     def replace_lab_level(self, mapping: dict[str, LabLevelUsage]) -> None:
         """Swap in a freshly-computed map for every lab, so labs that disappeared drop out."""
         self._lab = dict(mapping)
+        self.checkpoint()
+
+    def lab_level_due_in(self, interval_s: int, *, now: int | None = None) -> float:
+        """Seconds until the oldest cached lab-level snapshot is ``interval_s`` old (0 if any lab
+        is already due or nothing is cached), so a restarted agent resumes the cadence instead of
+        re-measuring every lab at startup."""
+        stamps = [u.computed_at for u in self._lab.values()]
+        if not stamps or any(ts is None for ts in stamps):
+            return 0.0
+        now = now if now is not None else now_ms()
+        return max(0.0, (min(stamps) + interval_s * 1000 - now) / 1000)
 
 
 # --------------------------------------------------------------------------- ZFS usage collection
@@ -184,6 +340,16 @@ def collect_zfs_usage(cfg: AgentConfig) -> dict[str, LabUsage]:
     return out
 
 
+def lab_homes(cfg: AgentConfig, lab: str) -> dict[str, str]:
+    """Provisioned students' fast homes (``username -> host path``), resolving the mount once."""
+    try:
+        root = _fast_lab_mp(cfg, lab)
+        entries = os.listdir(root)
+    except Exception:
+        return {}
+    return {e: os.path.join(root, e) for e in sorted(entries) if users.USERNAME_RE.match(e)}
+
+
 def list_lab_students(cfg: AgentConfig, lab: str) -> list[str]:
     """Enumerate provisioned students from direct children of the lab's fast mount."""
     try:
@@ -202,12 +368,84 @@ def _usage_pair(u: zfs.Usage | None) -> dict[str, int | None] | None:
     return {"used": u.used_bytes, "quota": u.quota_bytes}
 
 
+@dataclass(frozen=True)
+class _RootfsEntry:
+    container_id: str
+    quota: int | None  # ``--storage-opt size=`` in bytes
+    dataset: str | None  # writable-layer ZFS clone (``zfs`` storage driver), else None
+
+
+class RootfsCache:
+    """Lab -> the container's writable-layer identity: container ID, quota, and ZFS clone.
+
+    ``--storage-opt size=`` and the writable-layer dataset are both fixed at container creation,
+    so they only change when the container is recreated. A lookup serves the cached entry as is,
+    so the per-publish path costs nothing; a miss resolves the container (up to three forks).
+    Container create/recreate/destroy call ``forget_rootfs_quota``, and the lab-level refresh
+    (``rootfs_layers``) checks every cached entry against one listing of the managed containers'
+    IDs (``revalidate``), so a container recreated behind the agent's back is re-read on that
+    cadence; the same refresh corrects a quota changed behind the agent's back. A lab without a
+    container is not cached, so its container is picked up once it appears.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[str, _RootfsEntry] = {}
+
+    def entry(self, cfg: AgentConfig, lab: str,
+              ids: dict[str, str] | None = None) -> _RootfsEntry | None:
+        """The lab's cached entry, resolving it on a miss. ``ids`` (a ``managed_container_ids``
+        listing) stands in for a per-lab ``docker inspect`` of the container's ID."""
+        with self._lock:
+            cached = self._entries.get(lab)
+        if cached is not None:
+            return cached
+        container = docker.container_name(lab, cfg.node_name)
+        current = ids.get(container) if ids is not None else docker.container_id(container)
+        if current is None:
+            return None
+        layer = docker.layer_dataset(container)
+        cid, dataset = layer if layer is not None else (current, None)
+        fresh = _RootfsEntry(cid, docker.rootfs_quota_bytes(container), dataset)
+        with self._lock:
+            self._entries[lab] = fresh
+        return fresh
+
+    def revalidate(self, cfg: AgentConfig, ids: dict[str, str]) -> None:
+        """Drop every entry whose container is gone or now has another ID."""
+        with self._lock:
+            for lab, entry in list(self._entries.items()):
+                if ids.get(docker.container_name(lab, cfg.node_name)) != entry.container_id:
+                    del self._entries[lab]
+
+    def get(self, cfg: AgentConfig, lab: str) -> int | None:
+        entry = self.entry(cfg, lab)
+        return entry.quota if entry is not None else None
+
+    def note(self, lab: str, quota: int | None) -> None:
+        """Update a cached lab's quota from a fresh measurement (keeps the cached ID)."""
+        with self._lock:
+            entry = self._entries.get(lab)
+            if entry is not None:
+                self._entries[lab] = _RootfsEntry(entry.container_id, quota, entry.dataset)
+
+    def forget(self, lab: str) -> None:
+        with self._lock:
+            self._entries.pop(lab, None)
+
+
+_rootfs_quotas = RootfsCache()
+
+
 def lab_rootfs_quota(cfg: AgentConfig, lab: str) -> int | None:
-    """The lab container's writable-layer quota in bytes (``--storage-opt size=``), if any."""
-    container = docker.container_name(lab, cfg.node_name)
-    if not docker.container_exists(container):
-        return None
-    return docker.rootfs_quota_bytes(container)
+    """The lab container's writable-layer quota in bytes (``--storage-opt size=``), if any.
+    Cached per container (see ``RootfsCache``)."""
+    return _rootfs_quotas.get(cfg, lab)
+
+
+def forget_rootfs_quota(lab: str) -> None:
+    """Drop a lab's cached rootfs quota; call whenever its container is (re)created or removed."""
+    _rootfs_quotas.forget(lab)
 
 
 def build_snapshot(
@@ -246,6 +484,9 @@ def build_snapshot(
                 "username": name,
                 "home": home,
                 "cold": cold,
+                # When this student's home/cold sizes were last measured (a targeted rescan can
+                # be newer than the lab-wide ``usage_scanned_at``).
+                "scanned_at": container_usage.scanned_at_for(name),
             }
         )
     return {
@@ -266,22 +507,67 @@ def build_snapshot(
     }
 
 
-def live_container_storage(cfg: AgentConfig, lab: str) -> dict[str, Any] | None:
-    """The lab-level outer-container writable-layer (``SizeRw``) telemetry row.
+def rootfs_layers(cfg: AgentConfig, labs: list[str]) -> dict[str, tuple[int, int | None]]:
+    """``lab -> (used, quota)`` of each lab container's writable layer, read from one ``zfs list``
+    of the docker dataset.
 
-    This is the rootfs number, measured with one ``docker inspect --size``.
-    It is recomputed on the agent's lab-usage cadence (``lab_usage_interval_s``) and cached in
-    ``LabLevelUsage`` — not measured on every heartbeat — alongside the lab-level ZFS rows (see
-    ``lab_level_for``). Returns None when the container is absent or the measurement fails, in which
-    case the row is omitted and the controller keeps the last known value.
+    Each container's writable layer is a ZFS clone (see ``docker.layer_dataset``; the mapping is
+    cached per container in ``RootfsCache`` and checked against one ``docker ps`` of every managed
+    container's ID, not one ``docker inspect`` per lab). The clone's ``used`` is the physical space
+    the container has written on top of its image — the ZFS counterpart of ``SizeRw``, but read
+    from metadata instead of walking and diffing the container filesystem. A lab whose container is
+    on another storage driver, or whose clone is missing from the listing, is left out; callers
+    fall back to ``docker inspect --size`` for it.
     """
-    container = docker.container_name(lab, cfg.node_name)
-    if not docker.container_exists(container):
-        return None
-    total = docker.writable_layer_size(container)
-    if total is None:
-        return None
-    quota = docker.rootfs_quota_bytes(container)
+    ids = docker.managed_container_ids()
+    if ids is not None:
+        _rootfs_quotas.revalidate(cfg, ids)
+    datasets: dict[str, _RootfsEntry] = {}
+    for lab in labs:
+        entry = _rootfs_quotas.entry(cfg, lab, ids)
+        if entry is not None and entry.dataset is not None:
+            datasets[lab] = entry
+    if not datasets:
+        return {}
+    listing = {u.dataset: u for u in zfs.list_usage(cfg.docker_dataset)}
+    out: dict[str, tuple[int, int | None]] = {}
+    for lab, entry in datasets.items():
+        usage = listing.get(entry.dataset or "")
+        if usage is None:
+            _rootfs_quotas.forget(lab)  # recreated behind our back: re-resolve next time
+            continue
+        quota = usage.quota_bytes if usage.quota_bytes is not None else entry.quota
+        out[lab] = (usage.used_bytes, quota)
+    return out
+
+
+def live_container_storage(
+    cfg: AgentConfig, lab: str, layers: dict[str, tuple[int, int | None]] | None = None
+) -> dict[str, Any] | None:
+    """The lab-level outer-container writable-layer telemetry row.
+
+    This is the rootfs number, read from the container's ZFS clone (``layers``, see
+    ``rootfs_layers``; computed for this lab alone if not given) or, on any other storage driver,
+    measured with one ``docker inspect --size``. It is recomputed on the agent's lab-usage cadence
+    (``lab_usage_interval_s``) and cached in ``LabLevelUsage`` — not measured on every heartbeat —
+    alongside the lab-level ZFS rows (see ``lab_level_for``). Returns None when the container is
+    absent or the measurement fails, in which case the row is omitted and the controller keeps the
+    last known value.
+    """
+    if layers is None:
+        layers = rootfs_layers(cfg, [lab])
+    if lab in layers:
+        total, quota = layers[lab]
+    else:
+        container = docker.container_name(lab, cfg.node_name)
+        if not docker.container_exists(container):
+            return None
+        measured = docker.writable_layer_size(container)
+        if measured is None:
+            return None
+        total = measured
+        quota = docker.rootfs_quota_bytes(container)
+        _rootfs_quotas.note(lab, quota)
     return {
         "lab": lab,
         "user": None,
@@ -304,11 +590,13 @@ def _zfs_row(lab: str, tier: str, u: zfs.Usage) -> dict[str, Any]:
 
 
 def lab_level_for(
-    cfg: AgentConfig, lab: str, lab_usage: LabUsage | None = None, *, now: int | None = None
+    cfg: AgentConfig, lab: str, lab_usage: LabUsage | None = None, *, now: int | None = None,
+    layers: dict[str, tuple[int, int | None]] | None = None,
 ) -> LabLevelUsage:
     """Compute one lab's lab-level usage rows: fast/slow ZFS (+ any per-student ZFS datasets) plus
-    the container writable-layer "image" total. ``lab_usage`` may be passed in (e.g. from a single
-    ``collect_zfs_usage`` covering all labs) to avoid re-listing ZFS per lab."""
+    the container writable-layer "image" total. ``lab_usage`` and ``layers`` may be passed in (e.g.
+    from a single ``collect_zfs_usage`` / ``rootfs_layers`` covering all labs) to avoid re-listing
+    ZFS per lab."""
     now = now if now is not None else now_ms()
     if lab_usage is None:
         lab_usage = collect_zfs_usage(cfg).get(lab, LabUsage())
@@ -324,7 +612,7 @@ def lab_level_for(
                 "used_bytes": usage.used_bytes, "quota_bytes": usage.quota_bytes,
                 "available_bytes": usage.available_bytes,
             })
-    image = live_container_storage(cfg, lab)
+    image = live_container_storage(cfg, lab, layers)
     if image is not None:
         rows.append(image)
     return LabLevelUsage(computed_at=now, storage=rows)
@@ -333,17 +621,20 @@ def lab_level_for(
 def collect_lab_level(
     cfg: AgentConfig, usage_state: UsageState | None = None, *, now: int | None = None
 ) -> dict[str, LabLevelUsage]:
-    """Recompute lab-level usage for every lab: one ``zfs list`` per pool + one ``docker inspect
-    --size`` per lab. This is the work that used to run on every 15s heartbeat; it now runs on the
-    agent's lab-usage cadence and is cached. Labs are enumerated from ZFS (every lab has a fast
-    dataset), unioned with any lab present only in the container-scan cache."""
+    """Recompute lab-level usage for every lab: one ``zfs list`` per pool plus one of the docker
+    dataset for every container's writable layer (``docker inspect --size`` only for a container on
+    another storage driver). This is the work that used to run on every 15s heartbeat; it now runs
+    on the agent's lab-usage cadence and is cached. Labs are enumerated from ZFS (every lab has a
+    fast dataset), unioned with any lab present only in the container-scan cache."""
     now = now if now is not None else now_ms()
     grouped = collect_zfs_usage(cfg)
     labs = set(grouped.keys())
     if usage_state is not None:
         labs |= set(usage_state.all_container().keys())
+    layers = rootfs_layers(cfg, sorted(labs))
     return {
-        lab: lab_level_for(cfg, lab, grouped.get(lab, LabUsage()), now=now) for lab in sorted(labs)
+        lab: lab_level_for(cfg, lab, grouped.get(lab, LabUsage()), now=now, layers=layers)
+        for lab in sorted(labs)
     }
 
 
@@ -434,10 +725,77 @@ def publish_snapshot(cfg: AgentConfig, lab: str, snapshot: dict[str, Any]) -> No
     _atomic_write_json(os.path.join(labquota_dir(cfg, lab), USAGE_FILE), snapshot)
 
 
+# Snapshot keys that change on every build without the content changing.
+_VOLATILE_KEYS = ("generated_at", "last_changed_at")
+
+
+def snapshot_digest(snapshot: dict[str, Any]) -> str:
+    """Content hash of a snapshot, ignoring its timestamps."""
+    stable = {k: v for k, v in snapshot.items() if k not in _VOLATILE_KEYS}
+    encoded = json.dumps(stable, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class SnapshotPublisher:
+    """Writes ``usage.json`` only when its content changed.
+
+    An unchanged snapshot is not rewritten; the file's mtime is bumped instead (one ``utimensat``,
+    no write), so ``labquota`` can still tell the publisher is alive. A written snapshot carries
+    ``last_changed_at``, the build time of the content it holds. Digests live in memory, so the
+    first publish after a restart always writes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._digests: dict[str, str] = {}
+
+    def publish(self, cfg: AgentConfig, lab: str, snapshot: dict[str, Any]) -> bool:
+        """Publish ``snapshot`` for ``lab``. Returns True if the file was rewritten."""
+        digest = snapshot_digest(snapshot)
+        path = os.path.join(labquota_dir(cfg, lab), USAGE_FILE)
+        with self._lock:
+            if self._digests.get(lab) == digest:
+                try:
+                    os.utime(path, follow_symlinks=False)
+                    return False
+                except OSError:
+                    pass  # file gone or unwritable: fall through and rewrite it
+            snapshot = dict(snapshot, last_changed_at=snapshot.get("generated_at"))
+            publish_snapshot(cfg, lab, snapshot)
+            self._digests[lab] = digest
+        return True
+
+    def forget(self, lab: str) -> None:
+        with self._lock:
+            self._digests.pop(lab, None)
+
+
 def write_status(cfg: AgentConfig, lab: str, status: dict[str, Any]) -> None:
     _atomic_write_json(os.path.join(labquota_dir(cfg, lab), STATUS_FILE), status)
 
 
+def reset_stale_status(cfg: AgentConfig, usage_state: UsageState) -> None:
+    """Rewrite any ``status.json`` still saying "running" as idle. Called once at startup: a scan
+    interrupted by a restart would otherwise leave ``labquota --refresh`` waiting on it forever."""
+    root = os.path.dirname(labquota_dir(cfg, "_"))
+    try:
+        labs = os.listdir(root)
+    except OSError:
+        return
+    for lab in labs:
+        try:
+            with open(os.path.join(root, lab, STATUS_FILE), encoding="utf-8") as fh:
+                status = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        if isinstance(status, dict) and status.get("status") == "running":
+            scanned_at = usage_state.container_for(lab).scanned_at
+            try:
+                write_status(cfg, lab, {"status": "idle", "scanned_at": scanned_at})
+            except OSError:
+                continue
+
+
 def newest_request(cfg: AgentConfig, lab: str, users: list[str]) -> int | None:
     """Newest refresh-marker mtime (epoch ms) across the given users, or None if none pending.
 
@@ -445,22 +803,25 @@ def newest_request(cfg: AgentConfig, lab: str, users: list[str]) -> int | None:
     plants in place of the marker is ignored (and can never make root follow a link). Contents are
     never read.
     """
-    import stat as _stat
-
     newest: int | None = None
     for user in users:
-        try:
-            st = os.lstat(marker_path(cfg, lab, user))
-        except OSError:
-            continue
-        if not _stat.S_ISREG(st.st_mode):
-            continue
-        mtime = int(st.st_mtime * 1000)
-        if newest is None or mtime > newest:
+        mtime = marker_mtime(marker_path(cfg, lab, user))
+        if mtime is not None and (newest is None or mtime > newest):
             newest = mtime
     return newest
 
 
+def marker_mtime(path: str) -> int | None:
+    """mtime (epoch ms) of a refresh marker at ``path`` if it is a regular file (never followed)."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return int(st.st_mtime * 1000)
+
+
 def clear_requests(cfg: AgentConfig, lab: str, users: list[str]) -> None:
     """Remove each user's refresh marker after a scan. ``unlink`` removes only the file/symlink
     itself, never any target it might point at."""
@@ -474,6 +835,36 @@ def clear_requests(cfg: AgentConfig, lab: str, users: list[str]) -> None:
 # --------------------------------------------------------------------------- container-layer scan
 
 ProgressCb = Callable[[int, int, str], None]
+# Per-tier I/O gate: ``slot("fast")``/``slot("slow")`` is held around each walk of that tier.
+SlotCb = Callable[[str], AbstractContextManager[Any]]
+
+
+def _host_roots(cfg: AgentConfig, lab: str) -> dict[str, str]:
+    """Host paths of the lab's fast and cold roots (``tier -> path``) for the indexed walk. A tier
+    whose mountpoint cannot be resolved is omitted, and its students are measured with ``du``."""
+    roots: dict[str, str] = {}
+    for tier, resolve in (("fast", _fast_lab_mp), ("slow", coldstore.lab_mount)):
+        try:
+            roots[tier] = resolve(cfg, lab)
+        except Exception:
+            continue
+    return roots
+
+
+def _indexed_size(
+    cfg: AgentConfig, index: ScanIndex, lab: str, user: str, tier: str, root: str | None,
+    now: int, pacer: ScanPacer | None = None,
+) -> int | None:
+    if root is None:
+        return None
+    try:
+        return index.measure(
+            lab, user, tier, os.path.join(root, user),
+            verify_interval_s=cfg.usage_index_verify_interval_s, now=now,
+            pace=pacer.for_tier(tier) if pacer is not None else None,
+        ).used_bytes
+    except (OSError, ScanIndexError):
+        return None
 
 
 def run_container_scan(
@@ -482,31 +873,63 @@ def run_container_scan(
     usernames: list[str],
     *,
     progress: ProgressCb | None = None,
+    index: ScanIndex | None = None,
+    slot: SlotCb | None = None,
+    pacer: ScanPacer | None = None,
     now: int | None = None,
 ) -> ContainerUsage:
     """Measure the container writable layer + per-student usage. The expensive path (`du` per dir).
 
     For each student we ``du`` their persistent fast home (``/home/<u>``) and cold-storage
-    (``/cold-storage/<u>``). This runs on owner and SMB placements so both container views have
-    per-student numbers; controller aggregation never sums the shared cold directory. Missing
-    container / failed ``du`` degrade to None/omitted entries rather than raising, so one bad lab
-    never breaks the loop.
+    (``/cold-storage/<u>``). Only the cold tier's owner walks cold storage; an SMB client placement
+    measures its local fast tier and takes each student's cold number from the summary the owner
+    publishes on the share (see ``coldstore.published_student_usage``), so one cold directory is
+    walked once, not once per client. Controller aggregation never sums the shared cold directory.
+    Missing container / failed ``du`` / no owner summary yet degrade to None/omitted entries rather
+    than raising, so one bad lab never breaks the loop.
+
+    With an ``index`` the same directories are walked on the host through the persistent scan index
+    instead (see ``scanindex``), re-listing only what changed since the last scan; ``du`` remains
+    the fallback for any directory the index cannot measure. ``slot`` (see ``scanqueue``) bounds
+    how many scans walk the same tier at once, and ``pacer`` (see ``scanthrottle``) holds each
+    indexed walk to its tier's inode rate.
     """
     now = now if now is not None else now_ms()
     container = docker.container_name(lab, cfg.node_name)
     if not docker.container_exists(container):
         return ContainerUsage(scanned_at=now, status="idle")
-    total = docker.writable_layer_size(container)
+    layer = rootfs_layers(cfg, [lab]).get(lab)
+    total = layer[0] if layer is not None else docker.writable_layer_size(container)
     per_user_fast: dict[str, int] = {}
     per_user_slow: dict[str, int] = {}
     valid = [u for u in usernames if users.USERNAME_RE.match(u)]
+    roots = _host_roots(cfg, lab) if index is not None else {}
+    gate = slot or (lambda tier: contextlib.nullcontext())
+    # An SMB client never walks the shared cold tier; it takes the owner's published numbers.
+    owner_cold = None if cfg.slow_is_zfs else coldstore.published_student_usage(cfg, lab)
     for i, user in enumerate(valid):
         if progress is not None:
             progress(i, len(valid), user)
-        fast = docker.du_home(container, user)
+        with gate("fast"):
+            fast = None
+            if index is not None:
+                fast = _indexed_size(cfg, index, lab, user, "fast", roots.get("fast"), now,
+                                     pacer)
+            if fast is None:
+                fast = docker.du_home(container, user)
         if fast is not None:
             per_user_fast[user] = fast
-        cold = docker.du_path(container, f"/cold-storage/{user}")
+        if not cfg.slow_is_zfs:
+            if owner_cold is not None and user in owner_cold[0]:
+                per_user_slow[user] = owner_cold[0][user]
+            continue
+        with gate("slow"):
+            cold = None
+            if index is not None:
+                cold = _indexed_size(cfg, index, lab, user, "slow", roots.get("slow"), now,
+                                     pacer)
+            if cold is None:
+                cold = docker.du_path(container, f"/cold-storage/{user}")
         if cold is not None:
             per_user_slow[user] = cold
     return ContainerUsage(
@@ -516,4 +939,5 @@ def run_container_scan(
         per_user_fast=per_user_fast,
         per_user_slow=per_user_slow,
         unattributed=None,
+        user_scanned_at={user: now for user in valid},
     )
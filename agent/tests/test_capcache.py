@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from lab_agent import capcache
+from lab_agent.config import AgentConfig
+
+
+def _cfg(tmp_path):
+    return AgentConfig(controller_url="ws://x", token="t", state_db=str(tmp_path / "state.db"))
+
+
+class FakeProbe:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, cfg, *, deep):
+        self.calls.append(deep)
+        n = len(self.calls)
+        return SimpleNamespace(to_dict=lambda: {"probe": n, "deep": deep})
+
+
+def _cache(tmp_path, monkeypatch, now):
+    probe = FakeProbe()
+    monkeypatch.setattr(capcache.system, "detect_capabilities", probe)
+    return capcache.CapabilityCache(_cfg(tmp_path).capabilities_cache, clock=lambda: now[0]), probe
+
+
+def test_ttls_and_deep_answering_shallow(tmp_path, monkeypatch):
+    now = [1000.0]
+    cache, probe = _cache(tmp_path, monkeypatch, now)
+    cfg = _cfg(tmp_path)
+    deep = cache.get(cfg, deep=True)
+    assert cache.get(cfg, deep=True) is deep
+    assert cache.get(cfg, deep=False) is deep  # fresh deep result answers a shallow request
+    now[0] += capcache.SHALLOW_TTL_S + 1
+    shallow = cache.get(cfg, deep=False)
+    assert probe.calls == [True, False]
+    assert cache.get(cfg, deep=True) is deep  # still inside the deep TTL
+    assert cache.get(cfg, deep=True, max_age_s=0) is not deep
+    assert shallow.to_dict() == {"probe": 2, "deep": False}
+
+
+def test_hello_snapshot_survives_restart_and_invalidation(tmp_path, monkeypatch):
+    now = [1000.0]
+    cache, probe = _cache(tmp_path, monkeypatch, now)
+    cfg = _cfg(tmp_path)
+    assert cache.last() is None
+    cache.get(cfg, deep=False)
+    assert cache.last() is None  # only deep results are persisted for hello
+    cache.get(cfg, deep=True)
+    assert cache.last() == ({"probe": 2, "deep": True}, 1_000_000)
+
+    # A fresh process (agent restart) reads the snapshot back from disk.
+    restarted = capcache.CapabilityCache(cache.path, clock=lambda: now[0])
+    assert restarted.last() == ({"probe": 2, "deep": True}, 1_000_000)
+
+    # Invalidation from another process (host-prepare) keeps the snapshot but marks it unprobed,
+    # and the agent's in-memory copy is dropped.
+    restarted.invalidate()
+    assert cache.last() == ({"probe": 2, "deep": True}, 0)
+    cache.get(cfg, deep=True)
+    assert probe.calls == [False, True, True]
+
+
+def test_stored_result_keeps_the_age_of_its_oldest_value(tmp_path, monkeypatch):
+    now = [1000.0]
+    cache, probe = _cache(tmp_path, monkeypatch, now)
+    cfg = _cfg(tmp_path)
+    watched = cache.get(cfg, deep=True)
+    cache.store(watched, deep=True, probed_at=400.0)
+    assert cache.last() == ({"probe": 1, "deep": True}, 400_000)
+    now[0] = 400.0 + capcache.DEEP_TTL_S + 1
+    assert cache.get(cfg, deep=True) is not watched
+    assert probe.calls == [True, True]
+
+
+def test_module_helpers_share_one_cache_per_path(tmp_path, monkeypatch):
+    probe = FakeProbe()
+    monkeypatch.setattr(capcache.system, "detect_capabilities", probe)
+    monkeypatch.setattr(capcache, "_caches", {})
+    cfg = _cfg(tmp_path)
+    capcache.capabilities(cfg)
+    capcache.capabilities(cfg)
+    assert probe.calls == [True]
+    capcache.invalidate(cfg)
+    capcache.capabilities(cfg)
+    assert probe.calls == [True, True]
@@ -236,3 +236,22 @@ def test_doctor_synthesizes_config_when_missing(monkeypatch):
     assert cli.main(["doctor"]) == 0
     # Falls back to a placeholder config rather than crashing.
     assert seen["cfg"].controller_url == "(none)"
+
+
+def test_gpu_replay_reports_policy_outcome(tmp_path, capsys):
+    import json
+
+    from lab_agent.gpu.snapshot import GpuSnapshot
+    from lab_agent.gpu.trace import TraceRecorder, trace_files
+
+    rec = TraceRecorder(str(tmp_path), retain_days=1)
+    proc = {"pid": 5, "start_time": 9, "vram_bytes": 1 << 30, "util": 0.0, "managed": True,
+            "lab": "bio", "user": "alice"}
+    for i in range(40):
+        rec.record(GpuSnapshot(i + 1, 1000.0 + i * 60, (proc,)))
+    rec.close()
+    argv = ["gpu-replay", *trace_files(str(tmp_path)), "--idle-minutes", "10",
+            "--grace-minutes", "5", "--json"]
+    assert cli.main(argv) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["snapshots"] == 40 and report["warns"] == 1 and report["kills"] == 1
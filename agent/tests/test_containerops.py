@@ -23,10 +23,13 @@ def common(monkeypatch, caps=None):
     monkeypatch.setattr(containerops.coldstore, "lab_mount", lambda c, lab: "/cold/bio")
     monkeypatch.setattr(containerops.usagereport, "ensure_labquota_dirs",
                         lambda c, lab: "/run/agent/labquota/bio")
-    monkeypatch.setattr(containerops, "detect_capabilities", lambda c, deep=False: caps or healthy())
+    monkeypatch.setattr(containerops.capcache, "capabilities",
+                        lambda c, deep=False: caps or healthy())
+    monkeypatch.setattr(containerops.capcache, "invalidate", lambda c: None)
     monkeypatch.setattr(containerops.maintenance_state, "mark_unpatched", lambda c, lab: None)
     monkeypatch.setattr(containerops.docker, "wait_ssh_ready", lambda name: True)
     monkeypatch.setattr(containerops.docker, "ensure_image", lambda image: None)
+    monkeypatch.setattr(containerops.numaplace, "place", lambda lab, cpus, gpu_devices, memory: None)
 
 
 def test_mount_contract(monkeypatch):
@@ -86,3 +89,73 @@ def test_creation_removes_container_and_reports_logs_when_ssh_fails(monkeypatch)
         containerops.ensure_container(cfg(), "bio", {})
 
     assert removed == ["bio-n", "bio-n"]
+
+
+def test_gpu_count_pins_a_subset_and_records_it(monkeypatch, tmp_path):
+    caps = healthy()
+    caps.nvidia = SimpleNamespace(cdi_devices=["nvidia.com/gpu=0", "nvidia.com/gpu=1",
+                                               "nvidia.com/gpu=all"])
+    common(monkeypatch, caps)
+    monkeypatch.setattr(containerops.gpuassign, "numa_nodes", lambda: {})
+    monkeypatch.setattr(containerops.docker, "remove_container", lambda name: None)
+    got = {}
+    monkeypatch.setattr(containerops.docker, "create_container",
+                        lambda *a, gpu_devices, **kw: got.setdefault("devices", gpu_devices)
+                        or "cid")
+    c = AgentConfig(controller_url="ws://x", token="t", node_name="n",
+                    state_db=str(tmp_path / "state.db"))
+    containerops.ensure_container(c, "bio", {"gpu_count": 1})
+    assert got["devices"] == ["0"]
+    assert containerops.gpuassign.assignments(c) == {"bio": ["0"]}
+    with pytest.raises(containerops.docker.DockerError, match="only 2"):
+        containerops.ensure_container(c, "chem", {"gpu_count": 3})
+    with pytest.raises(containerops.docker.DockerError, match="cannot place lab 'chem'"):
+        containerops.ensure_container(c, "chem", {"gpu_devices": ["a"]})
+
+
+def test_numa_placement_sets_cpuset_and_labels(monkeypatch):
+    common(monkeypatch)
+    monkeypatch.setattr(containerops.numaplace, "place",
+                        lambda lab, cpus, gpu_devices, memory: containerops.numaplace.Placement(
+                            "0-15", "0"))
+    monkeypatch.setattr(containerops.docker, "remove_container", lambda name: None)
+    got = {}
+    monkeypatch.setattr(containerops.docker, "create_container",
+                        lambda name, opts, mounts, labels, **kw: got.update(
+                            opts=opts, labels=labels) or "cid")
+    containerops.ensure_container(cfg(), "bio", {"container_options": {"cpus": "8"}})
+    assert (got["opts"].cpuset_cpus, got["opts"].cpuset_mems) == ("0-15", "0")
+    assert got["labels"]["lab-agent.cpuset-cpus"] == "0-15"
+    assert got["labels"]["lab-agent.cpus"] == "8"
+
+
+def test_recreate_runs_online_storage_steps_before_stopping(monkeypatch):
+    common(monkeypatch)
+    events = []
+    from lab_agent import studentops
+
+    monkeypatch.setattr(studentops, "lab_storage", lambda c, lab: "storage")
+    monkeypatch.setattr(containerops.usagereport, "list_lab_students", lambda c, lab: ["a", "b"])
+    monkeypatch.setattr(studentops, "plan_storage", lambda c, lab, names, fq, cq, storage: [
+        studentops.StudentStorage("a", 10042, 10042, "online"),
+        studentops.StudentStorage("b", 10043, 10043, "migrate"),
+    ])
+    monkeypatch.setattr(studentops, "apply_storage_plan",
+                        lambda c, lab, plan, fq, cq, storage:
+                        events.append(("storage", [p.username for p in plan])) or [])
+    monkeypatch.setattr(containerops.docker, "container_exists", lambda name: True)
+    for action in ("stop_container", "remove_container", "rename_container", "start_container"):
+        monkeypatch.setattr(containerops.docker, action,
+                            lambda *a, action=action: events.append((action, a[0])))
+    monkeypatch.setattr(containerops.docker, "create_container", lambda *a, **kw: "cid")
+    monkeypatch.setattr(containerops.usagereport, "forget_rootfs_quota", lambda lab: None)
+    monkeypatch.setattr(containerops.gpuassign, "record", lambda c, lab, devices: None)
+
+    result, logs = containerops.recreate_container(cfg(), {"lab": "bio"})
+    assert events[:3] == [("storage", ["a"]), ("stop_container", "bio-n"),
+                          ("remove_container", "bio-n-old")]
+    assert events[4] == ("storage", ["b"])
+    plan = result["storage_plan"]
+    assert (plan["unchanged"], plan["online"], plan["migrate"]) == (0, 1, 1)
+    assert plan["downtime_ms"] >= 0
+    assert "1 migrated" in logs
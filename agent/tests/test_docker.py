@@ -145,3 +145,22 @@ def test_wait_ssh_ready_times_out(monkeypatch):
         lambda name, argv, **kwargs: CommandResult(False, argv, 1),
     )
     assert not docker.wait_ssh_ready("lab-bio", timeout=0, interval=0)
+
+
+def test_layer_dataset_reads_zfs_graph_driver(monkeypatch):
+    out = 'abc123 {"Data":{"Dataset":"fast/docker/abc123","Mountpoint":"/x"},"Name":"zfs"}\n'
+    monkeypatch.setattr(docker, "run", lambda *a, **k: CommandResult(True, [], 0, out, ""))
+    assert docker.layer_dataset("lab-bio") == ("abc123", "fast/docker/abc123")
+    overlay = 'abc123 {"Data":{"UpperDir":"/u"},"Name":"overlay2"}\n'
+    monkeypatch.setattr(docker, "run", lambda *a, **k: CommandResult(True, [], 0, overlay, ""))
+    assert docker.layer_dataset("lab-bio") is None
+    monkeypatch.setattr(docker, "run", lambda *a, **k: CommandResult(False, [], 1, "", "no such"))
+    assert docker.layer_dataset("lab-bio") is None
+
+
+def test_gpu_subset_passes_one_cdi_device_per_index():
+    args = build_run_args("lab-bio", ContainerOptions(), mounts(), gpus=True,
+                          gpu_devices=["1", "3"])
+    joined = " ".join(args)
+    assert "--device nvidia.com/gpu=1 --device nvidia.com/gpu=3" in joined
+    assert "nvidia.com/gpu=all" not in joined
@@ -0,0 +1,48 @@
+from lab_agent.executors.base import CommandResult
+from lab_agent.gpu import devices
+
+_OUT = (
+    "0, GPU-aaaa, 97, 40, 30000, 81920, 83, 310.5, 1410, 1593, 0, 0x0000000000000020\n"
+    "1, GPU-bbbb, 0, 0, 5, 81920, 34, [N/A], 210, 1593, [N/A], 0x0000000000000001\n"
+)
+
+
+def test_parse_query_gpu():
+    gpus = devices.parse_query_gpu(_OUT + "garbage line\n")
+    assert [g["index"] for g in gpus] == [0, 1]
+    assert gpus[0]["mem_used_bytes"] == 30000 * 1024 * 1024
+    assert gpus[0]["temp_c"] == 83.0 and gpus[0]["throttle_reasons"] == 0x20
+    assert gpus[1]["power_w"] is None and gpus[1]["ecc_uncorrected"] is None
+
+
+def test_query_devices_empty_without_nvidia(monkeypatch):
+    monkeypatch.setattr(devices, "run", lambda args, **kw: CommandResult(False, [], 127, "", ""))
+    assert devices.query_devices() == []
+
+
+def test_summary_min_avg_max_over_the_window():
+    now = [1000.0]
+    history = devices.DeviceHistory(clock=lambda: now[0])
+    gpus = devices.parse_query_gpu(_OUT)
+    history.record(gpus, now=900.0)  # outside a 60 s window
+    for t, util, reasons in [(950.0, 50.0, 0x4), (990.0, 100.0, 0x20)]:
+        history.record([dict(gpus[0], util_pct=util, throttle_reasons=reasons)], now=t)
+    rows = history.summary(60)
+    assert [r["index"] for r in rows] == [0]  # device 1 has no sample in the window
+    row = rows[0]
+    assert row["samples"] == 2
+    assert row["util_pct"] == {"min": 50.0, "avg": 75.0, "max": 100.0}
+    assert row["throttle_reasons"] == 0x24  # every reason seen in the window
+    assert row["ecc_uncorrected"] == 0
+
+
+def test_memory_is_the_latest_fresh_reading():
+    now = [1000.0]
+    history = devices.DeviceHistory(clock=lambda: now[0])
+    gpus = devices.parse_query_gpu(_OUT)
+    history.record(gpus, now=900.0)
+    history.record([gpus[0]], now=990.0)
+    assert history.memory(60) == {
+        "0": {"used_bytes": 30000 * 1024 * 1024, "total_bytes": 81920 * 1024 * 1024}
+    }
+    assert set(history.memory(120)) == {"0", "1"}
@@ -1,3 +1,6 @@
+import json
+import os
+
 from lab_agent.gpu.killer import GpuKiller, lab_from_container
 from lab_agent.gpu.policy import GpuPolicy
 
@@ -113,3 +116,171 @@ def test_policy_from_dict():
     })
     assert pol.enabled and pol.util_threshold == 10 and pol.idle_minutes == 5
     assert pol.whitelist_users == {"bob"} and pol.whitelist_labs == {"chem"}
+
+
+def test_window_percentile_overrides_latest_reading():
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=1, grace_minutes=1, immediate=True)
+    k = GpuKiller()
+    bursty = _proc(1, util=0)  # caught between bursts
+    bursty["util_window"] = {"samples": 30, "quantile": 60.0, "active": 0.2}
+    assert k.evaluate([bursty], pol, now=10_000) == []
+    idle = _proc(2, util=12)  # one stray blip on an otherwise idle process
+    idle["util_window"] = {"samples": 30, "quantile": 0.0, "active": 0.03}
+    assert [d.pid for d in k.evaluate([idle], pol, now=10_000)] == [2]
+
+
+def test_short_window_falls_back_to_latest_reading():
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=1, grace_minutes=1, immediate=True)
+    proc = _proc(1, util=0)
+    proc["util_window"] = {"samples": 1, "quantile": 90.0, "active": 1.0}
+    assert [d.pid for d in GpuKiller().evaluate([proc], pol, now=10_000)] == [1]
+
+
+def test_recycled_pid_does_not_inherit_idle_timer():
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=20, grace_minutes=10)
+    k = GpuKiller()
+    old = dict(_proc(100, util=0), start_time=1)
+    assert k.evaluate([old], pol, now=0) == []
+    new = dict(_proc(100, util=0), start_time=2)  # same PID, different process
+    assert k.evaluate([new], pol, now=1200) == []  # its own timer starts now
+    assert [d.action for d in k.evaluate([new], pol, now=2400)] == ["warn"]
+
+
+def test_idle_timers_survive_restart(tmp_path):
+    path = str(tmp_path / "gpu_killer.json")
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=20, grace_minutes=10)
+    procs = [dict(_proc(100, util=0), start_time=7), dict(_proc(200, util=0), start_time=8)]
+    k = GpuKiller(path, start_time=lambda pid: None)
+    k.evaluate(procs, pol, now=0)
+    assert [d.pid for d in k.evaluate(procs, pol, now=1200)] == [100, 200]  # both warned
+    k.save()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # After a 60 s restart pid 100 is the same process, pid 200 was recycled by another one.
+    live = {100: 7, 200: 99}
+    k = GpuKiller(path, start_time=live.get, clock=lambda: 1260)
+    procs[1]["start_time"] = 99
+    assert k.evaluate(procs, pol, now=1800) == []  # the restart itself is not grace time
+    d = k.evaluate(procs, pol, now=1860)
+    # pid 100's grace ran out on schedule despite the restart; pid 200's timer starts over.
+    assert [(x.pid, x.action, x.idle_s) for x in d] == [(100, "kill", 1800)]
+
+
+def test_long_outage_restarts_restored_timers(tmp_path):
+    path = str(tmp_path / "gpu_killer.json")
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=20, grace_minutes=10)
+    procs = [dict(_proc(100, util=0), start_time=7)]
+    k = GpuKiller(path, start_time=lambda pid: None)
+    k.evaluate(procs, pol, now=0)
+    assert [d.action for d in k.evaluate(procs, pol, now=1200)] == ["warn"]
+    k.save()
+
+    # Down for an hour: the first idle reading afterwards must not kill without a new warning.
+    k = GpuKiller(path, start_time=lambda pid: 7, clock=lambda: 4800)
+    assert k.evaluate(procs, pol, now=4800) == []
+    assert [d.action for d in k.evaluate(procs, pol, now=6000)] == ["warn"]
+    assert [d.action for d in k.evaluate(procs, pol, now=6600)] == ["kill"]
+
+
+def test_outage_shorter_than_the_idle_window_keeps_the_schedule(tmp_path):
+    path = str(tmp_path / "gpu_killer.json")
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=20, grace_minutes=10)
+    procs = [dict(_proc(100, util=0), start_time=7)]
+    k = GpuKiller(path, start_time=lambda pid: None)
+    k.evaluate(procs, pol, now=0)
+    assert [d.action for d in k.evaluate(procs, pol, now=1200)] == ["warn"]
+    k.save()
+
+    # A ten-minute upgrade: the grace resumes where it stopped rather than starting over.
+    k = GpuKiller(path, start_time=lambda pid: 7, clock=lambda: 1800)
+    assert k.evaluate(procs, pol, now=1800) == []
+    assert [d.action for d in k.evaluate(procs, pol, now=2400)] == ["kill"]
+
+
+def test_tracked_timers_are_resaved_as_a_liveness_mark(tmp_path):
+    path = tmp_path / "gpu_killer.json"
+    pol = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=20, grace_minutes=10)
+    procs = [dict(_proc(100, util=0), start_time=7)]
+    k = GpuKiller(str(path), start_time=lambda pid: None)
+    for now in (0, 30, 90):
+        k.evaluate(procs, pol, now=now)
+        k.save()
+    assert json.loads(path.read_text())["observed_at"] == 90  # unchanged timers, still rewritten
+
+
+def test_corrupt_killer_state_is_ignored(tmp_path):
+    path = tmp_path / "gpu_killer.json"
+    path.write_text('{"procs": [[1, 2, "x", null], "junk"]}')
+    k = GpuKiller(str(path), start_time=lambda pid: 2)
+    assert k._state == {}
+    for junk in ("[]", "null", '"x"', '{"procs": 3}'):
+        path.write_text(junk)
+        assert GpuKiller(str(path), start_time=lambda pid: 2)._state == {}
+
+
+def _on(proc, device, start):
+    return dict(proc, start_time=start, devices={device: {"vram_bytes": proc["vram_bytes"]}})
+
+
+def test_memory_pressure_reclaims_biggest_idle_holders_first():
+    pol = GpuPolicy(enabled=True, idle_minutes=20, grace_minutes=10, pressure_free_fraction=0.1,
+                    pressure_idle_minutes=2, pressure_grace_minutes=1)
+    k = GpuKiller()
+    gib = 1 << 30
+    procs = [
+        _on(_proc(1, util=0, vram=4 * gib), "0", 1),
+        _on(_proc(2, util=0, vram=30 * gib), "0", 2),
+        _on(_proc(3, util=0, vram=20 * gib), "0", 3),
+        _on(_proc(4, util=0, vram=30 * gib), "1", 4),  # GPU 1 has plenty free
+    ]
+    # GPU 0: 78 of 80 GiB used, needs 6 GiB back to reach 10% free.
+    devices = {"0": {"used_bytes": 78 * gib, "total_bytes": 80 * gib},
+               "1": {"used_bytes": 30 * gib, "total_bytes": 80 * gib}}
+    assert k.evaluate(procs, pol, now=0, devices=devices) == []
+    warned = k.evaluate(procs, pol, now=120, devices=devices)
+    assert sorted(d.pid for d in warned) == [1, 2, 3]
+    assert {d.pressure for d in warned} == {"0"}
+    # Grace over: only the largest VRAM x idle holder is killed — 30 GiB covers the deficit.
+    killed = k.evaluate(procs, pol, now=180, devices=devices)
+    assert [(d.pid, d.action, d.pressure) for d in killed] == [(2, "kill", "0")]
+    # Once the device has recovered the spared processes fall back to the normal schedule.
+    devices["0"]["used_bytes"] = 48 * gib
+    rest = [p for p in procs if p["pid"] != 2]
+    assert k.evaluate(rest, pol, now=240, devices=devices) == []
+    assert k.evaluate(rest, pol, now=120 + 600, devices=devices) == []
+    warned = k.evaluate(rest, pol, now=1200, devices=devices)
+    assert [(d.pid, d.action) for d in warned] == [(1, "warn"), (3, "warn"), (4, "warn")]
+    assert [d.pid for d in k.evaluate(rest, pol, now=1800, devices=devices)] == [1, 3, 4]
+
+
+def test_cleared_pressure_discards_the_early_warning(tmp_path):
+    pol = GpuPolicy(enabled=True, idle_minutes=30, grace_minutes=10, pressure_free_fraction=0.1,
+                    pressure_idle_minutes=5, pressure_grace_minutes=2)
+    path = str(tmp_path / "gpu_killer.json")
+    k = GpuKiller(path, start_time=lambda pid: None)
+    procs = [_on(_proc(1, util=0), "0", 1)]
+    tight = {"0": {"used_bytes": 79 << 30, "total_bytes": 80 << 30}}
+    roomy = {"0": {"used_bytes": 40 << 30, "total_bytes": 80 << 30}}
+    k.evaluate(procs, pol, now=0, devices=tight)
+    assert [d.pressure for d in k.evaluate(procs, pol, now=300, devices=tight)] == ["0"]
+    k.save()
+    k = GpuKiller(path, start_time=lambda pid: 1, clock=lambda: 300)  # remembers the schedule
+    assert k.evaluate(procs, pol, now=360, devices=roomy) == []
+    assert k.evaluate(procs, pol, now=900, devices=roomy) == []  # not killed at minute 15
+    assert [d.action for d in k.evaluate(procs, pol, now=1800, devices=roomy)] == ["warn"]
+    assert [d.action for d in k.evaluate(procs, pol, now=2400, devices=roomy)] == ["kill"]
+
+
+def test_plentiful_free_memory_relaxes_the_schedule():
+    pol = GpuPolicy(enabled=True, idle_minutes=20, grace_minutes=10, relaxed_free_fraction=0.5,
+                    relaxed_factor=2)
+    k = GpuKiller()
+    procs = [_on(_proc(1, util=0), "0", 1)]
+    devices = {"0": {"used_bytes": 10 << 30, "total_bytes": 80 << 30}}
+    assert k.evaluate(procs, pol, now=0, devices=devices) == []
+    assert k.evaluate(procs, pol, now=1200, devices=devices) == []
+    assert [d.action for d in k.evaluate(procs, pol, now=2400, devices=devices)] == ["warn"]
+    # Without memory readings the normal schedule applies.
+    k = GpuKiller()
+    k.evaluate(procs, pol, now=0)
+    assert [d.action for d in k.evaluate(procs, pol, now=1200)] == ["warn"]
@@ -0,0 +1,46 @@
+from lab_agent.gpu.ledger import HOUR_S, MAX_GAP_S, GpuLedger, accrue
+from lab_agent.gpu.snapshot import GpuSnapshot
+
+T0 = 1_700_000_000 // HOUR_S * HOUR_S  # an hour boundary
+
+
+def _proc(lab="bio", user="alice", devices=None, vram=100, util=50.0):
+    return {"pid": 1, "lab": lab, "user": user, "vram_bytes": vram, "util": util,
+            "devices": devices}
+
+
+def test_accrue_per_device_and_skips_unattributed():
+    snap = GpuSnapshot(1, T0 + 10, (
+        _proc(devices={"0": {"vram_bytes": 60, "util": 80.0},
+                       "1": {"vram_bytes": 40, "util": None}}),
+        _proc(lab=None, user=None),  # a host process: not accounted
+        _proc(user=None, devices=None),
+    ))
+    rows = accrue(snap, 10.0)
+    assert rows == {
+        (T0, "bio", "alice", "0"): [10.0, 600.0, 800.0],
+        (T0, "bio", "alice", "1"): [10.0, 400.0, 0.0],
+        (T0, "bio", "", ""): [10.0, 1000.0, 500.0],
+    }
+
+
+def test_ledger_integrates_ships_closed_hours_and_survives_restart(tmp_path):
+    path = str(tmp_path / "gpu_ledger.db")
+    procs = (_proc(devices={"0": {"vram_bytes": 100, "util": 50.0}}),)
+    ledger = GpuLedger(path)
+    ledger.record(GpuSnapshot(1, T0, procs))  # baseline only
+    ledger.record(GpuSnapshot(2, T0 + 30, procs))
+    ledger.record(GpuSnapshot(3, T0 + 30 + 1000, procs))  # a stalled sampler: gap is capped
+    assert ledger.closed(now=T0 + 60) == []  # the hour is still open
+    ledger.close()
+
+    ledger = GpuLedger(path)
+    ledger.record(GpuSnapshot(4, T0 + HOUR_S + 5, procs))  # first after restart: baseline only
+    [bucket] = ledger.closed(now=T0 + HOUR_S + 5)
+    held = 30 + MAX_GAP_S
+    assert bucket == {"hour": T0 * 1000, "lab": "bio", "user": "alice", "device": "0",
+                      "held_s": held, "vram_byte_s": int(100 * held),
+                      "sm_pct_s": round(50 * held), "samples": 2}
+    ledger.mark_shipped([bucket], now=T0 + HOUR_S + 5)
+    assert ledger.closed(now=T0 + 2 * HOUR_S) == []
+    ledger.close()
@@ -1,7 +1,17 @@
+import pytest
+
 from lab_agent.executors.base import CommandResult
 from lab_agent.gpu import monitor
 
 
+@pytest.fixture(autouse=True)
+def _no_nvml(monkeypatch):
+    # These tests drive the nvidia-smi fallback, even on a host where NVML would load.
+    monkeypatch.setattr(monitor, "_nvml", lambda: None)
+    monkeypatch.setattr(monitor, "_attribution", monitor.AttributionCache())
+    monkeypatch.setattr(monitor, "_window", monitor.UtilWindow())
+
+
 class _FakeProcFile:
     def __init__(self, files):
         self.files = files
@@ -41,6 +51,7 @@ def test_list_gpu_processes_merges_vram_and_util(monkeypatch):
     assert procs[1234]["vram_bytes"] == 2048 * 1024 * 1024
     assert procs[1234]["util"] == 0.0  # idle: holding VRAM, 0% SM
     assert procs[5678]["util"] == 87.0
+    assert procs[5678]["devices"] == {"0": {"vram_bytes": 512 * 1024 * 1024, "util": 87.0}}
     # Unresolved container -> not managed, no lab (so the killer leaves it alone).
     assert procs[1234]["managed"] is False and procs[1234]["lab"] is None
 
@@ -141,3 +152,68 @@ def test_kill_pid_proceeds_on_start_time_match(monkeypatch):
     monkeypatch.setattr("os.kill", lambda pid, sig: killed.setdefault("pid", pid))
     assert monitor.kill_pid(4242, expected_start_time=1234) is True
     assert killed["pid"] == 4242
+
+
+def test_passwd_name_matches_uid_field():
+    text = "root:x:0:0:root:/root:/bin/bash\nalice:x:10000:10000::/home/alice:/bin/bash\n"
+    assert monitor._passwd_name(text, 10000) == "alice"
+    assert monitor._passwd_name(text, 10001) is None
+
+
+def test_attribution_is_resolved_once_per_process(monkeypatch):
+    calls = []
+    monkeypatch.setattr(monitor, "_sample", lambda: ({100: 1, 101: 1}, {}, {}))
+    monkeypatch.setattr(monitor, "_container_info",
+                        lambda pid: calls.append(pid) or ("lab-bio", True, "bio"))
+    monkeypatch.setattr(monitor, "_student_user", lambda c, p: "alice")
+    monkeypatch.setattr(monitor, "proc_cmd", lambda pid: "python")
+    starts = {100: 5, 101: 6}
+    monkeypatch.setattr(monitor, "pid_start_time", lambda pid: starts[pid])
+
+    monitor.list_gpu_processes()
+    procs = {p["pid"]: p for p in monitor.list_gpu_processes()}
+    assert calls == [100, 101]  # the second tick forked nothing
+    assert procs[100]["user"] == "alice" and procs[100]["start_time"] == 5
+
+    starts[101] = 9  # PID reused by a new process: resolved afresh
+    monitor.list_gpu_processes()
+    assert calls == [100, 101, 101]
+
+
+def test_container_labels_are_inspected_once_per_container(monkeypatch):
+    inspects = []
+    monkeypatch.setattr(monitor, "_container_id", lambda pid: "abc123")
+    monkeypatch.setattr(monitor, "_inspect_container",
+                        lambda cid: inspects.append(cid) or ("lab-bio", True, "bio"))
+    assert monitor._container_info(1) == ("lab-bio", True, "bio")
+    assert monitor._container_info(2) == ("lab-bio", True, "bio")
+    assert inspects == ["abc123"]
+
+
+def test_username_is_reread_only_when_passwd_changes(monkeypatch):
+    import os
+
+    parses = []
+    real = monitor._passwd_name
+    monkeypatch.setattr(monitor, "_passwd_name", lambda text, uid: parses.append(uid) or real(text, uid))
+    monkeypatch.setattr(monitor, "_getent_user", lambda c, u: pytest.fail("forked getent"))
+    cache = monitor.AttributionCache()
+    pid = os.getpid()  # /proc/<pid>/root/etc/passwd is this host's passwd
+    assert cache.user("lab-bio", pid, 0) == "root"
+    assert cache.user("lab-bio", pid, 0) == "root"
+    assert parses == [0]
+
+    stamp, name, used = cache._users[("lab-bio", 0)]
+    cache._users[("lab-bio", 0)] = ((-1, -1, -1), name, used)  # e.g. the container restarted
+    assert cache.user("lab-bio", pid, 0) == "root"
+    assert parses == [0, 0]
+
+
+def test_pmon_placement_splits_vram_across_a_processes_gpus():
+    rows = [(0, 7, 50.0), (1, 7, 10.0), (1, 8, 0.0)]
+    placement = monitor._pmon_placement({7: 1000, 8: 64, 9: 1}, rows)
+    assert placement[7] == {0: {"vram_bytes": 500, "util": 50.0},
+                            1: {"vram_bytes": 500, "util": 10.0}}
+    assert placement[8] == {1: {"vram_bytes": 64, "util": 0.0}}
+    assert 9 not in placement  # no pmon row: device unknown
+    assert monitor._pmon_util(rows) == {7: 50.0, 8: 0.0}
@@ -0,0 +1,127 @@
+import ctypes
+
+import pytest
+
+from lab_agent.gpu import monitor, nvml
+
+
+class _Fn:
+    """Stands in for a ctypes foreign function: records argtypes/restype, calls ``impl``."""
+
+    def __init__(self, impl):
+        self.impl = impl
+        self.argtypes = None
+        self.restype = None
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.impl(*args)
+
+
+class FakeNvmlLib:
+    """A shim with the libnvidia-ml entry points ``nvml`` binds, backed by Python data.
+
+    ``procs[i]`` is ``[(pid, used_bytes)]`` for device i; ``samples[i]`` is
+    ``[(pid, timestamp_us, sm)]`` (None = per-process utilization unsupported).
+    """
+
+    def __init__(self, procs, samples, *, init_code=0):
+        self.procs = procs
+        self.samples = samples
+        self.since: list[int] = []
+        self.nvmlInit_v2 = _Fn(lambda: init_code)
+        self.nvmlShutdown = _Fn(lambda: 0)
+        self.nvmlErrorString = _Fn(lambda code: b"Unknown Error")
+        self.nvmlDeviceGetCount_v2 = _Fn(self._count)
+        self.nvmlDeviceGetHandleByIndex_v2 = _Fn(self._handle)
+        self.nvmlDeviceGetComputeRunningProcesses_v3 = _Fn(self._procs)
+        self.nvmlDeviceGetProcessUtilization = _Fn(self._util)
+
+    def _count(self, count):
+        count.value = len(self.procs)
+        return nvml.NVML_SUCCESS
+
+    def _handle(self, index, handle):
+        handle.value = 0x1000 + index
+        return nvml.NVML_SUCCESS
+
+    def _procs(self, device, count, infos):
+        rows = self.procs[device.value - 0x1000]
+        if infos is None or count.value < len(rows):
+            count.value = len(rows)
+            return nvml.NVML_ERROR_INSUFFICIENT_SIZE if rows else nvml.NVML_SUCCESS
+        for slot, (pid, used) in zip(infos, rows, strict=False):
+            slot.pid, slot.usedGpuMemory = pid, used
+        count.value = len(rows)
+        return nvml.NVML_SUCCESS
+
+    def _util(self, device, samples, count, since):
+        rows = self.samples[device.value - 0x1000]
+        if rows is None:
+            return nvml.NVML_ERROR_NOT_SUPPORTED
+        self.since.append(since)
+        rows = [r for r in rows if r[1] > since]
+        if not rows:
+            return nvml.NVML_ERROR_NOT_FOUND
+        if samples is None:
+            count.value = len(rows)
+            return nvml.NVML_ERROR_INSUFFICIENT_SIZE
+        for slot, (pid, ts, sm) in zip(samples, rows, strict=False):
+            slot.pid, slot.timeStamp, slot.smUtil = pid, ts, sm
+        count.value = len(rows)
+        return nvml.NVML_SUCCESS
+
+
+def test_sample_merges_vram_and_peak_util_across_devices():
+    lib = FakeNvmlLib(
+        procs=[[(10, 2 << 30), (11, nvml.NVML_VALUE_NOT_AVAILABLE)], [(10, 1 << 30)]],
+        samples=[[(10, 100, 5), (10, 200, 60)], [(10, 150, 80)]],
+    )
+    vram, util, placement = nvml.Nvml(lib).sample()
+    assert vram == {10: 3 << 30, 11: 0}
+    # pid 11 holds a context but took no sample in the window: idle, like pmon's "-".
+    assert util == {10: 80.0, 11: 0.0}
+    assert placement[10] == {0: {"vram_bytes": 2 << 30, "util": 60.0},
+                             1: {"vram_bytes": 1 << 30, "util": 80.0}}
+    assert lib.nvmlDeviceGetComputeRunningProcesses_v3.restype is ctypes.c_int
+
+
+def test_utilization_cursor_only_returns_new_samples():
+    lib = FakeNvmlLib(procs=[[(10, 1)]], samples=[[(10, 100, 90)]])
+    handle = nvml.Nvml(lib)
+    assert handle.sample()[1] == {10: 90.0}
+    assert handle.sample()[1] == {10: 0.0}  # nothing since timestamp 100
+    assert lib.since[-1] == 100
+    lib.samples[0].append((10, 250, 40))
+    assert handle.sample()[1] == {10: 40.0}
+
+
+def test_unsupported_utilization_leaves_util_unknown():
+    vram, util, placement = nvml.Nvml(FakeNvmlLib(procs=[[(10, 1)]], samples=[None])).sample()
+    assert vram == {10: 1} and util == {}
+    assert placement == {10: {0: {"vram_bytes": 1, "util": None}}}
+
+
+def test_init_failure_raises_nvml_error():
+    with pytest.raises(nvml.NvmlError) as exc:
+        nvml.Nvml(FakeNvmlLib(procs=[], samples=[], init_code=9))
+    assert exc.value.func == "nvmlInit_v2" and exc.value.code == 9
+
+
+def test_monitor_prefers_nvml_and_falls_back_to_nvidia_smi(monkeypatch):
+    lib = FakeNvmlLib(procs=[[(10, 1)]], samples=[[(10, 100, 70)]])
+    handle = nvml.Nvml(lib)
+    monkeypatch.setattr(monitor, "_nvml_handle", handle)
+    monkeypatch.setattr(monitor, "_nvml_retry_at", 0.0)
+    monkeypatch.setattr(monitor, "_query_compute_apps", lambda: {20: 5})
+    monkeypatch.setattr(monitor, "_pmon_rows", lambda: [(0, 20, 1.0)])
+    assert monitor._sample()[:2] == ({10: 1}, {10: 70.0})
+
+    # A failing call drops the handle and the tick is answered by nvidia-smi instead.
+    lib.nvmlDeviceGetComputeRunningProcesses_v3.impl = lambda *a: 999
+    assert monitor._sample()[:2] == ({20: 5}, {20: 1.0})
+    assert monitor._nvml_handle is None and lib.nvmlShutdown.calls == 1
+    # ...and NVML is not re-opened until the retry delay has passed.
+    monkeypatch.setattr(monitor, "Nvml", lambda: pytest.fail("retried too early"))
+    assert monitor._sample()[:2] == ({20: 5}, {20: 1.0})
@@ -21,6 +21,8 @@ def test_defaults_are_conservative():
     assert p.grace_minutes == 10.0
     assert p.immediate is False
     assert p.interval_s == 30
+    assert p.window_s == 300.0
+    assert p.util_percentile == 95.0
     assert p.whitelist_users == set()
     assert p.whitelist_labs == set()
 
@@ -82,3 +84,21 @@ def test_update_policy_handler_sets_policy_and_returns_summary():
     assert result == {"enabled": True, "idle_minutes": 15.0}
     assert "gpu policy updated" in log
     assert gpu_policy.get_policy().enabled is True
+
+
+def test_from_dict_window_settings_are_clamped():
+    p = GpuPolicy.from_dict({"window_s": 120, "util_percentile": 90})
+    assert p.window_s == 120.0 and p.util_percentile == 90.0
+    p = GpuPolicy.from_dict({"window_s": -5, "util_percentile": 250})
+    assert p.window_s == 0.0 and p.util_percentile == 100.0
+
+
+def test_from_dict_pressure_settings_are_clamped():
+    p = GpuPolicy.from_dict({"pressure_free_fraction": 0.1, "pressure_idle_minutes": 3,
+                             "relaxed_free_fraction": 0.6, "relaxed_factor": 3})
+    assert p.pressure_free_fraction == 0.1 and p.pressure_idle_minutes == 3.0
+    assert p.relaxed_free_fraction == 0.6 and p.relaxed_factor == 3.0
+    p = GpuPolicy.from_dict({"pressure_free_fraction": 2, "pressure_grace_minutes": -1,
+                             "relaxed_free_fraction": -0.5, "relaxed_factor": 0.2})
+    assert p.pressure_free_fraction == 1.0 and p.pressure_grace_minutes == 0.0
+    assert p.relaxed_free_fraction == 0.0 and p.relaxed_factor == 1.0
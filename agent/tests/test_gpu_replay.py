@@ -0,0 +1,112 @@
+import gzip
+
+from lab_agent.gpu import replay, trace
+from lab_agent.gpu.policy import GpuPolicy
+from lab_agent.gpu.snapshot import GpuSnapshot
+
+
+def _p(pid, util, vram=2 << 30, start=1):
+    return {"pid": pid, "start_time": start, "vram_bytes": vram, "util": util, "managed": True,
+            "lab": "bio", "user": "alice", "container": "lab-bio", "cmd": "python"}
+
+
+def test_trace_round_trips_and_tolerates_a_torn_tail(tmp_path):
+    rec = trace.TraceRecorder(str(tmp_path), retain_days=7)
+    rec.record(GpuSnapshot(1, 86400 * 3 + 5, (_p(1, 0.0),)))
+    rec.record(GpuSnapshot(2, 86400 * 3 + 20, (_p(1, 55.0),)))
+    rec.close()
+    [path] = trace.trace_files(str(tmp_path))
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        fh.write('{"t": 1, "p": [[')  # agent killed mid-write
+    snaps = list(trace.read_trace([path]))
+    assert [s.taken_at for s in snaps] == [86400 * 3 + 5, 86400 * 3 + 20]
+    assert snaps[1].processes[0] == {"pid": 1, "start_time": 1, "vram_bytes": 2 << 30,
+                                     "util": 55.0, "managed": True, "lab": "bio",
+                                     "user": "alice"}
+
+
+def test_trace_rotates_daily_and_prunes(tmp_path):
+    (tmp_path / "1970-01-01.jsonl.gz").write_bytes(b"")  # pre-segment name
+    rec = trace.TraceRecorder(str(tmp_path), retain_days=2, started=5)
+    for day in range(4):
+        rec.record(GpuSnapshot(day, 86400 * day + 1, ()))
+    rec.close()
+    rec = trace.TraceRecorder(str(tmp_path), retain_days=2, started=86400 * 3 + 9)
+    rec.record(GpuSnapshot(5, 86400 * 3 + 10, ()))
+    rec.close()
+    assert [p.rsplit("/", 1)[1] for p in trace.trace_files(str(tmp_path))] == [
+        "1970-01-03-0000000005.jsonl.gz", "1970-01-04-0000000005.jsonl.gz",
+        "1970-01-04-0000259209.jsonl.gz"]
+
+
+def test_trace_survives_an_agent_killed_without_close(tmp_path):
+    rec = trace.TraceRecorder(str(tmp_path), retain_days=7, started=1)
+    rec.record(GpuSnapshot(1, 86400 * 3 + 5, (_p(1, 0.0),)))
+    [path] = trace.trace_files(str(tmp_path))
+    torn = open(path, "rb").read()  # flushed, but no gzip trailer: as left by SIGKILL
+    rec.close()
+    with open(path, "wb") as fh:
+        fh.write(torn)
+
+    # The restarted agent writes its own segment instead of appending a member after the torn one.
+    rec = trace.TraceRecorder(str(tmp_path), retain_days=7, started=2)
+    rec.record(GpuSnapshot(2, 86400 * 3 + 65, (_p(1, 0.0),)))
+    rec.close()
+    assert [s.taken_at for s in trace.read_trace(trace.trace_files(str(tmp_path)))] == [
+        86400 * 3 + 5, 86400 * 3 + 65]
+
+    # A member appended after the torn one (as earlier agents did) keeps the lines before it.
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        fh.write(trace.encode(GpuSnapshot(3, 86400 * 3 + 125, ())) + "\n")
+    assert [s.taken_at for s in trace.read_trace([path])] == [86400 * 3 + 5]
+
+
+def _trace():
+    # pid 1 idles for good; pid 2 idles 25 minutes, then resumes training.
+    snaps = []
+    for i in range(0, 121):  # two hours at 60 s
+        t = i * 60.0
+        util2 = 0.0 if i < 25 else 90.0
+        snaps.append(GpuSnapshot(i + 1, t, (_p(1, 0.0), _p(2, util2, start=2))))
+    return snaps
+
+
+def test_replay_counts_kills_reclaimed_vram_and_false_positives():
+    policy = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=10, grace_minutes=5,
+                       window_s=300, util_percentile=95)
+    report = replay.replay(_trace(), policy).to_dict()
+    assert report["warns"] == 2 and report["kills"] == 2
+    # pid 2 came back to life after the kill: a false-positive candidate.
+    assert [fp["pid"] for fp in report["false_positive_candidates"]] == [2]
+    assert report["reclaimed_vram_gib_hours"] > 3
+
+
+def test_longer_idle_policy_spares_the_paused_job():
+    policy = GpuPolicy(enabled=True, util_threshold=5, idle_minutes=30, grace_minutes=10)
+    report = replay.replay(_trace(), policy).to_dict()
+    assert report["kills"] == 1 and report["false_positive_candidates"] == []
+
+
+def test_benchmark_runs():
+    result = replay.benchmark(200, ticks=3)
+    assert result["processes"] == 200 and result["mean_ms"] >= 0
+
+
+def test_replay_pressure_counts_reclaimed_memory_as_free():
+    gib = 1 << 30
+    snaps = []
+    for i in range(20):
+        procs = tuple(dict(_p(pid, 0.0, vram=vram * gib, start=pid),
+                           devices={"0": {"vram_bytes": vram * gib}})
+                      for pid, vram in ((1, 30), (2, 10)))
+        snap = GpuSnapshot(i + 1, 60.0 * i, procs,
+                           {"0": {"used_bytes": 78 * gib, "total_bytes": 80 * gib}})
+        snaps.append(trace.decode(trace.encode(snap), i + 1))
+    assert snaps[0].devices == {"0": {"used_bytes": 78 * gib, "total_bytes": 80 * gib}}
+    assert snaps[0].processes[0]["devices"] == {"0": {"vram_bytes": 30 * gib}}
+    policy = GpuPolicy(enabled=True, idle_minutes=60, grace_minutes=60,
+                       pressure_free_fraction=0.1, pressure_idle_minutes=2,
+                       pressure_grace_minutes=1)
+    report = replay.replay(snaps, policy).to_dict()
+    # The 30 GiB holder goes; with its memory released the device is no longer under pressure.
+    assert report["warns"] == 2 and report["kills"] == 1
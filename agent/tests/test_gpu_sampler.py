@@ -0,0 +1,41 @@
+from lab_agent.gpu import monitor
+from lab_agent.gpu.sampler import MAX_WINDOW_S, UtilWindow, percentile
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_percentile_nearest_rank():
+    assert percentile([0, 0, 0, 0, 100], 50) == 0
+    assert percentile([0, 0, 0, 0, 100], 95) == 100
+    assert percentile([7], 95) == 7
+
+
+def test_stats_cover_only_the_trailing_window():
+    clock = _Clock()
+    window = UtilWindow(clock)
+    for t, sm in [(0, 90), (100, 0), (200, 0), (250, 40)]:
+        window.record({(1, 5): sm}, now=t)
+    clock.now = 300
+    stats = window.stats((1, 5), window_s=250, pct=95, threshold=5)
+    assert stats == {"samples": 3, "span_s": 200.0, "mean": 13.3, "quantile": 40, "q": 95,
+                     "active": 0.333}
+    # A recycled PID (new start time) has no history.
+    assert window.stats((1, 6), window_s=250, pct=95, threshold=5) is None
+
+
+def test_processes_unseen_for_the_max_window_are_forgotten():
+    window = UtilWindow(_Clock())
+    window.record({(1, 5): 10}, now=0)
+    window.record({(2, 5): 10}, now=MAX_WINDOW_S + 1)
+    assert set(window._samples) == {(2, 5)}
+
+
+def test_background_sampling_needs_nvml(monkeypatch):
+    monkeypatch.setattr(monitor, "_nvml", lambda: None)
+    assert monitor.sample_utilization() is False
@@ -0,0 +1,27 @@
+import asyncio
+
+from lab_agent.gpu.snapshot import GpuSnapshot, SnapshotFeed
+
+
+def test_snapshot_age_and_metadata():
+    snap = GpuSnapshot(3, 100.0, ())
+    assert snap.age_s(now=112.34) == 12.3
+    assert snap.age_s(now=90.0) == 0.0
+    assert snap.to_dict(now=101.0) == {"seq": 3, "taken_at": 100_000, "age_s": 1.0}
+
+
+def test_consumer_sees_each_new_snapshot_and_skips_to_the_newest():
+    async def scenario():
+        feed = SnapshotFeed()
+        waiter = asyncio.create_task(feed.next_after(0))
+        await asyncio.sleep(0)
+        assert not waiter.done()  # nothing published yet
+        first = await feed.publish([{"pid": 1}], 10.0)
+        assert await waiter is first and first.seq == 1
+        await feed.publish([{"pid": 2}], 20.0)
+        third = await feed.publish([{"pid": 3}], 30.0)
+        # A consumer that fell behind gets the newest snapshot, not a backlog.
+        assert await feed.next_after(first.seq) is third
+        assert feed.latest is third and third.processes == ({"pid": 3},)
+
+    asyncio.run(scenario())
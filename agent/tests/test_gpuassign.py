@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+
+from lab_agent import gpuassign, system
+from lab_agent.config import AgentConfig
+from lab_agent.executors.base import CommandResult
+
+# `nvidia-ctk cdi list` on a 4-GPU node.
+_CDI_LIST = (
+    "INFO[0000] Found 9 CDI devices\n"
+    "nvidia.com/gpu=0\nnvidia.com/gpu=1\nnvidia.com/gpu=2\nnvidia.com/gpu=3\n"
+    "nvidia.com/gpu=GPU-0aa\nnvidia.com/gpu=GPU-1bb\nnvidia.com/gpu=GPU-2cc\n"
+    "nvidia.com/gpu=GPU-3dd\nnvidia.com/gpu=all\n"
+)
+
+
+def _cfg(tmp_path: Path) -> AgentConfig:
+    return AgentConfig(controller_url="ws://x", token="t", state_db=str(tmp_path / "state.db"))
+
+
+def _cdi(monkeypatch) -> list[str]:
+    monkeypatch.setattr(system, "run", lambda args, **kw: CommandResult(
+        True, list(args), 0, _CDI_LIST, ""))
+    return system._cdi_devices()
+
+
+def test_cdi_indices_from_fake_cdi_list(monkeypatch):
+    assert gpuassign.cdi_indices(_cdi(monkeypatch)) == ["0", "1", "2", "3"]
+
+
+def test_requested_count_set_or_all():
+    assert gpuassign.requested({}) is None
+    assert gpuassign.requested({"gpu_count": 2}) == 2
+    assert gpuassign.requested({"gpu_count": 1, "gpu_devices": [3, "1"]}) == ["1", "3"]
+    for bad in ({"gpu_count": -1}, {"gpu_count": "two"}, {"gpu_devices": ["0", "x"]},
+                {"gpu_devices": [-1]}, {"gpu_devices": 3}):
+        with pytest.raises(gpuassign.GpuAssignmentError):
+            gpuassign.requested(bad)
+
+
+def test_choose_balances_load_then_keeps_to_one_numa_node():
+    numa = {"0": 0, "1": 0, "2": 1, "3": 1}
+    assert gpuassign.choose(["0", "1", "2", "3"], 1, {}, numa) == ["0"]
+    # GPU 0 is taken: the least contended single device is the next free one.
+    assert gpuassign.choose(["0", "1", "2", "3"], 1, {"bio": ["0"]}, numa) == ["1"]
+    # Two free devices on NUMA node 1 beat the free pair 1+2 that spans both nodes.
+    assert gpuassign.choose(["0", "1", "2", "3"], 2, {"bio": ["0"]}, numa) == ["2", "3"]
+    with pytest.raises(gpuassign.GpuAssignmentError, match="only 4"):
+        gpuassign.choose(["0", "1", "2", "3"], 5, {}, numa)
+
+
+def test_pick_is_sticky_and_persisted(tmp_path, monkeypatch):
+    cfg = _cfg(tmp_path)
+    cdi = _cdi(monkeypatch)
+    monkeypatch.setattr(gpuassign, "numa_nodes", lambda: {})
+    assert gpuassign.pick(cfg, "bio", None, cdi) is None
+    bio = gpuassign.pick(cfg, "bio", 2, cdi)
+    assert bio == ["0", "1"]
+    gpuassign.record(cfg, "bio", bio)
+    chem = gpuassign.pick(cfg, "chem", 2, cdi)
+    assert chem == ["2", "3"]
+    gpuassign.record(cfg, "chem", chem)
+    # A recreate with the same count keeps the lab on its GPUs.
+    assert gpuassign.pick(cfg, "bio", 2, cdi) == ["0", "1"]
+    assert gpuassign.assignments(cfg) == {"bio": ["0", "1"], "chem": ["2", "3"]}
+    with pytest.raises(gpuassign.GpuAssignmentError, match="7"):
+        gpuassign.pick(cfg, "bio", ["7"], cdi)
+    gpuassign.release(cfg, "bio")
+    assert gpuassign.assignments(cfg) == {"chem": ["2", "3"]}
+
+
+def test_corrupt_file_reads_as_empty(tmp_path):
+    cfg = _cfg(tmp_path)
+    Path(cfg.gpu_assignments).write_text("{not json")
+    assert gpuassign.assignments(cfg) == {}
+
+
+def test_numa_nodes_reads_sysfs_by_bus_id(monkeypatch, tmp_path):
+    monkeypatch.setattr(gpuassign, "run", lambda args, **kw: CommandResult(
+        True, list(args), 0, "0, 00000000:3B:00.0\n1, 00000000:AF:00.0\n", ""))
+    assert gpuassign._numa_path("00000000:3B:00.0") == \
+        "/sys/bus/pci/devices/0000:3b:00.0/numa_node"
+    monkeypatch.setattr(gpuassign, "_numa_path", lambda bus: str(tmp_path / bus[-7:-5]))
+    (tmp_path / "3B").write_text("1\n")
+    assert gpuassign.numa_nodes() == {"0": 1, "1": -1}
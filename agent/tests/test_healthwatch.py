@@ -0,0 +1,222 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from lab_agent import cli, healthwatch, system
+from lab_agent.config import AgentConfig
+from lab_agent.healthwatch import DockerEvents, HealthWatch, diff, mount_table
+from lab_agent.probegraph import DOCKER_CONTAINERS, DOCKER_DAEMON, ProbeTiming
+from lab_agent.system import HealthIssue
+
+MOUNTINFO = (
+    "36 25 0:32 / /srv/labs rw,relatime shared:1 - zfs fast/labs rw,xattr\n"
+    "37 25 0:33 / /mnt/cold\\040share rw,nosuid shared:2 - cifs //nas/cold rw,vers=3.1.1\n"
+)
+
+
+def test_mount_table_keys_unescaped_mount_points():
+    table = mount_table(MOUNTINFO)
+    assert table["/srv/labs"] == "zfs fast/labs rw,relatime"
+    assert table["/mnt/cold share"] == "cifs //nas/cold rw,nosuid"
+
+
+def test_diff_reports_new_escalated_and_cleared_codes():
+    before = [HealthIssue("a", "warning", "x"), HealthIssue("b", "critical", "y")]
+    after = [HealthIssue("a", "critical", "x"), HealthIssue("c", "warning", "z")]
+    raised, cleared = diff(before, after)
+    assert [i.code for i in raised] == ["a", "c"]
+    assert [i.code for i in cleared] == ["b"]
+
+
+def caps(issues, values=None, probes=()):
+    return SimpleNamespace(issues=issues, health=SimpleNamespace(status="critical" if issues
+                                                                 else "healthy", issues=issues),
+                           values=values or {}, probes=list(probes))
+
+
+class NoEvents:
+    def fileno(self):
+        return None
+
+    def due(self):
+        return False
+
+    def start(self):
+        return False
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def watch_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(healthwatch, "SETTLE_S", 0.05)
+    profile = tmp_path / "etc" / "seccomp.json"
+    profile.parent.mkdir()
+    profile.write_text("{}")
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(MOUNTINFO)
+    inputs = {
+        "profiles": (f"file:{profile}",),
+        "stale_seccomp": (DOCKER_CONTAINERS, f"file:{profile}"),
+        "pool_fast": ("mount:/srv/labs",),
+        "docker": (DOCKER_DAEMON,),
+    }
+    monkeypatch.setattr(system, "probe_inputs", lambda cfg, deep=True: inputs)
+    runs = []
+
+    def detect(cfg, deep=True, previous=None, changed=None):
+        runs.append(changed)
+        return caps([HealthIssue("seccomp", "critical", "bad")] if profile.read_text() == "{}"
+                    else [], values={"profiles": True})
+
+    monkeypatch.setattr(system, "detect_capabilities", detect)
+
+    def make(events=None):
+        return HealthWatch(AgentConfig(controller_url="w", token="t"), poll_s=0.2,
+                           events=events or NoEvents(), mountinfo=str(mountinfo))
+
+    return SimpleNamespace(make=make, profile=profile, mountinfo=mountinfo, runs=runs)
+
+
+def test_changed_file_reruns_only_its_probes(watch_factory):
+    watch = watch_factory.make()
+    watch.start()
+    assert watch.wait(0.1) == set()
+    watch_factory.profile.write_text('{"defaultAction": "SCMP_ACT_ERRNO"}')
+    changed = watch.wait(2.0)
+    assert changed == {f"file:{watch_factory.profile}"}
+    transition = watch.evaluate(changed)
+    assert watch_factory.runs[-1] == {"profiles", "stale_seccomp"}
+    assert [i.code for i in transition.cleared] == ["seccomp"]
+    assert transition.to_event()["cleared"] == ["seccomp"]
+    assert watch.evaluate(changed) is None  # nothing new
+    watch.close()
+
+
+def test_touch_without_content_change_is_not_a_change(watch_factory):
+    watch = watch_factory.make()
+    watch.start()
+    os.utime(watch_factory.profile)
+    assert watch.wait(0.5) == set()
+    watch.close()
+
+
+def test_mount_change_is_noticed_by_polling(watch_factory):
+    watch = watch_factory.make()
+    watch.start()
+    watch_factory.mountinfo.write_text(MOUNTINFO.splitlines()[1] + "\n")
+    assert watch.wait(2.0) == {"mount:/srv/labs"}
+    watch.close()
+
+
+def test_failed_probes_are_retried(watch_factory):
+    watch = watch_factory.make()
+    watch.start()
+    watch.caps.probes = [ProbeTiming("cdi", 35.0, timed_out=True)]
+    watch.evaluate({"mount:/srv/labs"})
+    assert watch_factory.runs[-1] == {"pool_fast", "cdi"}
+    watch.close()
+
+
+def test_only_unwatched_probes_rerun_once_their_values_age(watch_factory, monkeypatch):
+    wall = [1000.0]
+
+    def detect(cfg, deep=True, previous=None, changed=None):
+        watch_factory.runs.append(changed)
+        names = ("profiles", "gpu_list")
+        return caps([], probes=[ProbeTiming(n, 1.0, reused=changed is not None
+                                            and n not in changed) for n in names])
+
+    monkeypatch.setattr(system, "detect_capabilities", detect)
+    monkeypatch.setattr(system, "probe_max_ages", lambda cfg, deep=True: {"gpu_list": 900.0})
+    watch = HealthWatch(AgentConfig(controller_url="w", token="t"), poll_s=0.2,
+                        events=NoEvents(), mountinfo=str(watch_factory.mountinfo),
+                        wall=lambda: wall[0])
+    watch.start()
+    wall[0] = 1300.0
+    watch.evaluate({f"file:{watch_factory.profile}"})
+    assert watch_factory.runs[-1] == {"profiles", "stale_seccomp"}
+    assert watch.probed_at == 1000.0  # gpu_list was reused from the first sweep
+    assert watch.wait(0.1) == set()
+
+    wall[0] = 1900.0
+    assert watch.wait(2.0) == {healthwatch.PROBE_AGE}
+    watch.evaluate({healthwatch.PROBE_AGE})
+    assert watch_factory.runs[-1] == {"gpu_list"}  # profiles is watched: it never expires
+    assert watch.probed_at == 1900.0
+    wall[0] = 5000.0
+    assert watch.expired() == {"gpu_list"}
+    watch.close()
+
+
+class PipeProc:
+    def __init__(self):
+        read, self.write = os.pipe()
+        self.stdout = os.fdopen(read, "rb")
+        self.argv = None
+
+    def kill(self):
+        pass
+
+    def wait(self, timeout=None):
+        return 0
+
+
+def test_docker_events_mark_containers_then_daemon_when_stream_ends(watch_factory):
+    procs = []
+
+    def spawn(argv, **kwargs):
+        proc = PipeProc()
+        proc.argv = argv
+        procs.append(proc)
+        return proc
+
+    watch = watch_factory.make(DockerEvents(spawn=spawn))
+    watch.start()
+    assert "label=lab-agent.managed=true" in procs[0].argv
+    os.write(procs[0].write, b"start 0123abcd\n")
+    assert watch.wait(2.0) == {DOCKER_CONTAINERS}
+    os.close(procs[0].write)
+    assert watch.wait(2.0) == {DOCKER_DAEMON, DOCKER_CONTAINERS}
+    watch.close()
+
+
+def test_doctor_watch_prints_transitions(monkeypatch, capsys):
+    import lab_agent.installer as installer
+
+    monkeypatch.setattr(installer, "service_status",
+                        lambda: {"active": "active", "enabled": "enabled"})
+    monkeypatch.setattr(cli, "load_config", lambda path: AgentConfig(controller_url="w", token="t"))
+    issue = HealthIssue("docker_unavailable", "critical", "Docker daemon is unreachable")
+
+    class FakeWatch:
+        def __init__(self, cfg, poll_s):
+            self.caps = None
+            self.waits = 0
+
+        def start(self):
+            self.caps = caps([])
+            self.caps.to_dict = lambda: {}
+            return self.caps
+
+        def wait(self, timeout):
+            self.waits += 1
+            if self.waits > 1:
+                raise KeyboardInterrupt
+            return {DOCKER_DAEMON}
+
+        def evaluate(self, changed):
+            self.caps = caps([issue])
+            return healthwatch.Transition("critical", [issue], [], sorted(changed), ["docker"])
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(healthwatch, "HealthWatch", FakeWatch)
+    assert cli.main(["doctor", "--watch"]) == 1
+    out = capsys.readouterr().out
+    assert "all checks passed" in out
+    assert "critical after docker:daemon" in out
+    assert "+ [critical] docker_unavailable" in out
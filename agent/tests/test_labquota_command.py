@@ -90,3 +90,19 @@ def test_legacy_snapshot_without_rootfs_quota_still_renders(tmp_path):
     total_row = next(line for line in result.stdout.splitlines()
                      if line.lstrip().startswith("TOTAL"))
     assert "57.0 MiB" in total_row
+
+
+def test_queued_scan_shows_queue_position(tmp_path):
+    status = {"status": "queued", "position": 2, "queued": 3, "scanned_at": 1}
+    (tmp_path / "status.json").write_text(json.dumps(status), encoding="utf-8")
+    result = run_labquota(tmp_path, snapshot_fixture(), "alice")
+
+    assert "scan queued (2nd in line)" in result.stdout
+
+
+def test_unchanged_snapshot_reports_last_check_and_change(tmp_path):
+    snapshot = snapshot_fixture()
+    snapshot["last_changed_at"] = 1
+    result = run_labquota(tmp_path, snapshot, "alice")
+
+    assert "updated 0s ago (unchanged since" in result.stdout
@@ -0,0 +1,73 @@
+from lab_agent import numaplace
+from lab_agent.executors.base import CommandResult
+
+# Dual-socket host: 16 CPUs per node.
+NODES = {0: list(range(0, 16)), 1: list(range(16, 32))}
+
+
+def test_cpulist_round_trip():
+    assert numaplace.parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert numaplace.parse_cpulist("") == []
+    assert numaplace.format_cpulist([11, 0, 1, 2, 3, 8, 10]) == "0-3,8,10-11"
+    assert numaplace.format_cpulist([5]) == "5"
+
+
+def test_topology_reads_sysfs_nodes(tmp_path):
+    for node, cpus in (("node0", "0-3"), ("node1", "4-7"), ("node2", "")):
+        (tmp_path / node).mkdir()
+        (tmp_path / node / "cpulist").write_text(cpus + "\n")
+    (tmp_path / "online").write_text("0-2\n")
+    # node2 is memory-only (no CPUs) and is not a placement target.
+    assert numaplace.topology(str(tmp_path)) == {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+
+
+def test_plan_follows_the_gpus_numa_node():
+    p = numaplace.plan(8, [1], NODES, {})
+    assert p == numaplace.Placement("16-31", "1")
+    assert p.labels("8") == {"lab-agent.cpus": "8", "lab-agent.cpuset-cpus": "16-31",
+                             "lab-agent.cpuset-mems": "1"}
+
+
+def test_plan_balances_labs_without_gpus():
+    assert numaplace.plan(4, [], NODES, {}).cpuset_mems == "0"
+    others = {"bio": (8.0, [0]), "chem": (2.0, [1])}
+    assert numaplace.plan(4, [], NODES, others).cpuset_mems == "1"
+
+
+def test_plan_leaves_whole_machine_and_single_node_unpinned():
+    # 24 CPUs do not fit one 16-CPU node; both nodes would pin nothing.
+    assert numaplace.plan(24, [0], NODES, {}) is None
+    assert numaplace.plan(4, [0], {0: NODES[0]}, {}) is None
+    # Three nodes: widen by the least loaded other node only.
+    three = {**NODES, 2: list(range(32, 48))}
+    p = numaplace.plan(24, [0], three, {"bio": (8.0, [1])})
+    assert (p.cpuset_cpus, p.cpuset_mems) == ("0-15,32-47", "0,2")
+
+
+def test_node_memory_reads_meminfo(tmp_path):
+    for node, kb in (("node0", 1024), ("node1", None)):
+        (tmp_path / node).mkdir()
+        if kb is not None:
+            (tmp_path / node / "meminfo").write_text(
+                f"Node 0 MemTotal:       {kb} kB\nNode 0 MemFree:        10 kB\n")
+    assert numaplace.node_memory(str(tmp_path)) == {0: 1024 * 1024}
+
+
+def test_plan_widens_until_the_memory_limit_fits():
+    gib = 1 << 30
+    three = {**NODES, 2: list(range(32, 48))}
+    mem = {0: 64 * gib, 1: 64 * gib, 2: 64 * gib}
+    assert numaplace.plan(8, [0], three, {}, 32 * gib, mem).cpuset_mems == "0"
+    # 100 GiB does not fit the GPU's node: add the next least loaded one.
+    p = numaplace.plan(8, [0], three, {"bio": (8.0, [1])}, 100 * gib, mem)
+    assert (p.cpuset_cpus, p.cpuset_mems) == ("0-15,32-47", "0,2")
+    # Only every node together holds it, or the node sizes are unknown: leave it unpinned.
+    assert numaplace.plan(8, [0], three, {}, 150 * gib, mem) is None
+    assert numaplace.plan(8, [0], three, {}, 32 * gib, {0: 64 * gib}) is None
+
+
+def test_placed_labs_from_container_labels(monkeypatch):
+    out = "bio\t8\t0\nchem\t4\t\nweird\tx\t1\n"
+    monkeypatch.setattr(numaplace, "run",
+                        lambda args, **kw: CommandResult(True, list(args), 0, out, ""))
+    assert numaplace.placed_labs() == {"bio": (8.0, [0])}
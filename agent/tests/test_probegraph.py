@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from lab_agent.probegraph import Probe, execute
+
+
+def test_dependencies_see_values_and_skips_yield_defaults():
+    probes = [
+        Probe("a", lambda v: 2),
+        Probe("b", lambda v: v["a"] * 10, ("a",)),
+        Probe("c", lambda v: 1 / 0, default=-1),
+        Probe("d", lambda v: "ran", ("c",), default="skipped", when=lambda v: v["c"] > 0),
+    ]
+    values, timings = execute(probes)
+    assert values == {"a": 2, "b": 20, "c": -1, "d": "skipped"}
+    assert [t.name for t in timings] == ["a", "b", "c", "d"]
+    assert timings[2].error == "division by zero"
+    assert timings[3].skipped
+
+
+def test_independent_probes_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    probes = [Probe(n, lambda v: barrier.wait() >= 0) for n in "xyz"]
+    values, _ = execute(probes, workers=3)  # would deadlock if run one at a time
+    assert values == {"x": True, "y": True, "z": True}
+
+
+def test_overdue_probe_yields_default_and_dependents_still_run():
+    release = threading.Event()
+
+    def hang(v):
+        release.wait(5)
+        return "late"
+
+    probes = [
+        Probe("slow", hang, deadline_s=0.1, default="default"),
+        Probe("after", lambda v: f"saw {v['slow']}", ("slow",)),
+    ]
+    started = time.monotonic()
+    values, timings = execute(probes)
+    release.set()
+    assert time.monotonic() - started < 2
+    assert values == {"slow": "default", "after": "saw default"}
+    assert timings[0].timed_out and not timings[1].timed_out
+
+
+def test_deadline_runs_from_start_not_from_the_worker_queue():
+    # Nine ready probes on eight workers: the ninth waits a full probe for a slot.
+    probes = [Probe(f"p{i}", lambda v: time.sleep(0.3) or "done", deadline_s=0.45,
+                    default="default") for i in range(9)]
+    values, timings = execute(probes, workers=8)
+    assert set(values.values()) == {"done"}
+    assert not any(t.timed_out for t in timings)
+
+
+def test_overdue_probe_frees_its_worker():
+    release = threading.Event()
+    probes = [Probe("hung", lambda v: release.wait(5), deadline_s=0.1, default="default"),
+              Probe("next", lambda v: "ran", deadline_s=1.0)]
+    started = time.monotonic()
+    values, timings = execute(probes, workers=1)
+    release.set()
+    assert time.monotonic() - started < 2
+    assert values == {"hung": "default", "next": "ran"}
+    assert timings[0].timed_out and not timings[1].timed_out
+
+
+def test_unknown_dependency_and_cycle_are_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        execute([Probe("a", lambda v: 1, ("nope",))])
+    with pytest.raises(ValueError, match="cycle"):
+        execute([Probe("a", lambda v: 1, ("b",)), Probe("b", lambda v: 1, ("a",))])
+
+
+def test_rerun_reuses_values_unless_inputs_or_dependencies_changed():
+    calls = []
+
+    def probe(name, value, deps=()):
+        def fn(v):
+            calls.append(name)
+            return value
+        return Probe(name, fn, deps)
+
+    previous = {"a": 1, "b": 2, "c": 3, "d": 4}
+    probes = [probe("a", 10), probe("b", 2), probe("c", 30, ("a",)), probe("d", 4, ("b",))]
+    values, timings = execute(probes, previous=previous, changed={"a", "b"})
+    # a changed value -> c re-runs; b re-ran with the same value -> d is reused.
+    assert sorted(calls) == ["a", "b", "c"]
+    assert values == {"a": 10, "b": 2, "c": 30, "d": 4}
+    assert [t.name for t in timings if t.reused] == ["d"]
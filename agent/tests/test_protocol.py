@@ -111,3 +111,10 @@ def test_frame_type_and_action_constants_are_distinct():
         P.A_NODE_SCRUB, P.A_USAGE_SCAN,
     }
     assert len(actions) == 10
+
+
+def test_hello_marks_cached_capabilities_and_refresh_frame():
+    assert "capabilities_probed_at" not in P.hello_frame("n", "t", {})
+    assert P.hello_frame("n", "t", {}, probed_at=0)["capabilities_probed_at"] == 0
+    f = P.capabilities_frame("n", {"zfs": True})
+    assert f["type"] == P.T_CAPABILITIES and f["capabilities"] == {"zfs": True}
@@ -0,0 +1,74 @@
+import errno
+import os
+import select
+
+import pytest
+
+from lab_agent.refreshwatch import Inotify, RefreshWatcher
+from lab_agent.usagereport import REFRESH_MARKER
+
+
+def drain_after(watcher):
+    select.select([watcher.fileno()], [], [], 2)
+    return watcher.drain()
+
+
+@pytest.fixture
+def homes(tmp_path):
+    for user in ("alice", "bob"):
+        (tmp_path / user).mkdir()
+    return {("bio", "alice"): str(tmp_path / "alice"), ("bio", "bob"): str(tmp_path / "bob")}
+
+
+def test_marker_touch_raises_request_for_that_student(tmp_path, homes):
+    watcher = RefreshWatcher()
+    assert watcher.available
+    watcher.sync(homes)
+    assert watcher.unwatched == []
+    (tmp_path / "alice" / REFRESH_MARKER).write_text("")
+    assert drain_after(watcher) >= 1
+    assert list(watcher.pending()) == [("bio", "alice")]
+    watcher.close()
+
+
+def test_symlinked_or_directory_markers_are_ignored(tmp_path, homes):
+    watcher = RefreshWatcher()
+    watcher.sync(homes)
+    (tmp_path / "target").write_text("")
+    os.symlink(tmp_path / "target", tmp_path / "alice" / REFRESH_MARKER)
+    (tmp_path / "bob" / REFRESH_MARKER).mkdir()
+    drain_after(watcher)
+    assert watcher.pending() == {}
+    watcher.close()
+
+
+def test_marker_present_before_watch_is_picked_up(tmp_path, homes):
+    (tmp_path / "bob" / REFRESH_MARKER).write_text("")
+    watcher = RefreshWatcher()
+    watcher.sync(homes)
+    assert list(watcher.pending()) == [("bio", "bob")]
+    watcher.close()
+
+
+class ExhaustedInotify(Inotify):
+    def __init__(self):
+        self.fd = os.open(os.devnull, os.O_RDONLY)
+
+    def add_watch(self, path, mask):
+        raise OSError(errno.ENOSPC, "no watches left", path)
+
+
+def test_unwatchable_homes_fall_back_to_polling(tmp_path, homes):
+    watcher = RefreshWatcher(ExhaustedInotify())
+    watcher.sync(homes)
+    assert watcher.unwatched == [("bio", "alice"), ("bio", "bob")]
+    (tmp_path / "alice" / REFRESH_MARKER).write_text("")
+    watcher.poll_unwatched()
+    requested = watcher.pending()[("bio", "alice")]
+    watcher.discard(("bio", "alice"), requested - 1)  # a scan older than the request
+    assert ("bio", "alice") in watcher.pending()
+    watcher.discard(("bio", "alice"), requested)
+    assert watcher.pending() == {}
+    watcher.sync({})
+    assert watcher.unwatched == []
+    watcher.close()
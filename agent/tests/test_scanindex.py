@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from lab_agent import scanindex, usagereport
+from lab_agent.config import AgentConfig
+from lab_agent.scanindex import ScanIndex, ScanIndexError
+
+
+def cfg(tmp_path, **kw):
+    return AgentConfig(controller_url="ws://x", token="t", node_name="n",
+                       state_db=str(tmp_path / "state" / "state.db"), **kw)
+
+
+def make_tree(root):
+    (root / "a" / "deep").mkdir(parents=True)
+    (root / "b").mkdir()
+    (root / "a" / "deep" / "f1").write_bytes(b"x" * 10_000)
+    (root / "b" / "f2").write_bytes(b"y" * 20_000)
+    (root / "top").write_bytes(b"z" * 5_000)
+
+
+def blocks(root):
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        total += os.lstat(dirpath).st_blocks * 512
+        total += sum(os.lstat(os.path.join(dirpath, f)).st_blocks * 512 for f in filenames)
+    return total
+
+
+def test_first_walk_matches_allocated_blocks(tmp_path):
+    home = tmp_path / "alice"
+    make_tree(home)
+    index = ScanIndex(str(tmp_path / "idx.db"))
+    m = index.measure("bio", "alice", "fast", str(home), now=1)
+    assert m.used_bytes == blocks(home)
+    assert m.entries == 7  # root, a, a/deep, b, and three files
+    assert (m.dirs_listed, m.dirs_reused) == (4, 0)
+
+
+def test_rescan_reuses_unchanged_subtrees(tmp_path):
+    home = tmp_path / "alice"
+    make_tree(home)
+    index = ScanIndex(str(tmp_path / "idx.db"))
+    first = index.measure("bio", "alice", "fast", str(home), now=1)
+    again = index.measure("bio", "alice", "fast", str(home), now=2)
+    assert again.used_bytes == first.used_bytes
+    assert (again.dirs_listed, again.dirs_reused) == (0, 4)
+
+    (home / "b" / "new").write_bytes(b"n" * 50_000)
+    changed = index.measure("bio", "alice", "fast", str(home), now=3)
+    assert changed.used_bytes == blocks(home)
+    assert changed.dirs_listed == 1  # only b/ was re-listed
+
+
+def test_index_survives_reopen_and_removed_dirs_are_forgotten(tmp_path):
+    home = tmp_path / "alice"
+    make_tree(home)
+    path = str(tmp_path / "idx.db")
+    ScanIndex(path).measure("bio", "alice", "fast", str(home), now=1)
+    for name in os.listdir(home / "a" / "deep"):
+        os.unlink(home / "a" / "deep" / name)
+    os.rmdir(home / "a" / "deep")
+
+    reopened = ScanIndex(path)
+    m = reopened.measure("bio", "alice", "fast", str(home), now=2)
+    assert m.used_bytes == blocks(home)
+    assert "a/deep" not in reopened.records("bio", "alice", "fast")
+
+
+def test_verify_interval_forces_relisting(tmp_path):
+    home = tmp_path / "alice"
+    make_tree(home)
+    index = ScanIndex(str(tmp_path / "idx.db"))
+    index.measure("bio", "alice", "fast", str(home), now=0)
+    m = index.measure("bio", "alice", "fast", str(home), verify_interval_s=60, now=61_000)
+    assert m.dirs_reused == 0
+
+
+def test_symlinks_are_never_followed(tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "big").write_bytes(b"o" * 100_000)
+    home = tmp_path / "alice"
+    home.mkdir()
+    (home / "escape").symlink_to(outside)
+    index = ScanIndex(str(tmp_path / "idx.db"))
+    assert index.measure("bio", "alice", "fast", str(home), now=1).entries == 2
+    with pytest.raises(ScanIndexError):
+        index.measure("bio", "alice", "fast", str(home / "escape"), now=1)
+
+
+def test_prune_by_student_and_lab(tmp_path):
+    c = cfg(tmp_path)
+    scanindex.prune(c, "bio")  # no index yet: nothing to do, nothing created
+    assert not os.path.exists(c.scan_index)
+    home = tmp_path / "alice"
+    make_tree(home)
+    index = ScanIndex(c.scan_index)
+    index.measure("bio", "alice", "fast", str(home), now=1)
+    index.measure("bio", "bob", "fast", str(home), now=1)
+    scanindex.prune(c, "bio", "alice")
+    assert index.records("bio", "alice", "fast") == {}
+    assert index.records("bio", "bob", "fast") != {}
+    scanindex.prune(c, "bio")
+    assert index.records("bio", "bob", "fast") == {}
+
+
+def test_container_scan_prefers_index_and_falls_back_to_du(tmp_path, monkeypatch):
+    fast = tmp_path / "fast"
+    make_tree(fast / "alice")
+    monkeypatch.setattr(usagereport.docker, "container_exists", lambda name: True)
+    monkeypatch.setattr(usagereport.docker, "writable_layer_size", lambda name: 100)
+    monkeypatch.setattr(usagereport, "_fast_lab_mp", lambda c, lab: str(fast))
+    monkeypatch.setattr(usagereport.coldstore, "lab_mount", lambda c, lab: str(tmp_path / "none"))
+    monkeypatch.setattr(usagereport.docker, "du_home", lambda name, user: pytest.fail("du used"))
+    monkeypatch.setattr(usagereport.docker, "du_path", lambda name, path: 7)
+    index = ScanIndex(str(tmp_path / "idx.db"))
+    result = usagereport.run_container_scan(cfg(tmp_path), "bio", ["alice"], index=index, now=1)
+    assert result.per_user_fast == {"alice": blocks(fast / "alice")}
+    assert result.per_user_slow == {"alice": 7}
@@ -0,0 +1,109 @@
+import threading
+
+from lab_agent.scanqueue import (
+    PRIORITY_ON_DEMAND,
+    PRIORITY_REFRESH,
+    PRIORITY_SCHEDULED,
+    SCOPE_STUDENTS,
+    ScanJob,
+    ScanScheduler,
+)
+
+
+def test_runs_highest_priority_first():
+    ran = []
+    sched = ScanScheduler(lambda job: ran.append(job.lab))
+    sched.submit(ScanJob("nightly", priority=PRIORITY_SCHEDULED))
+    sched.submit(ScanJob("student", priority=PRIORITY_REFRESH))
+    sched.submit(ScanJob("click", priority=PRIORITY_ON_DEMAND))
+    for _ in range(3):
+        assert sched.run_one()
+    assert ran == ["click", "student", "nightly"]
+
+
+def test_duplicate_submission_merges_into_queued_job():
+    changes = []
+    sched = ScanScheduler(lambda job: None, on_change=changes.append)
+    first = sched.submit(ScanJob("bio", priority=PRIORITY_SCHEDULED, users=["alice"]))
+    sched.submit(ScanJob("chem"))
+    merged = sched.submit(ScanJob("bio", priority=PRIORITY_ON_DEMAND, users=["bob"]))
+    assert merged is first
+    assert first.priority == PRIORITY_ON_DEMAND
+    assert first.users == ["alice", "bob"]
+    assert sched.positions() == {"bio": 1, "chem": 2}
+    assert changes[-1] == {"bio": 1, "chem": 2}
+
+
+def test_running_job_absorbs_older_requests_only():
+    started = threading.Event()
+    release = threading.Event()
+
+    def runner(job):
+        started.set()
+        release.wait(5)
+
+    sched = ScanScheduler(runner)
+    sched.submit(ScanJob("bio", requested_at=1))
+    worker = threading.Thread(target=sched.run_one)
+    worker.start()
+    assert started.wait(5)
+    running = sched.running()
+    assert running == ["bio"]
+
+    stale = sched.submit(ScanJob("bio", priority=PRIORITY_REFRESH, requested_at=2))
+    assert stale.requested_at == 1  # covered by the scan already in progress
+    assert sched.submit(ScanJob("bio", priority=PRIORITY_SCHEDULED)) is stale
+    newer = sched.submit(ScanJob("bio", priority=PRIORITY_REFRESH, requested_at=2**62))
+    assert newer is not stale
+    assert sched.positions() == {"bio": 1}
+    release.set()
+    worker.join(5)
+    assert stale.done.is_set()
+
+
+def test_one_job_per_lab_at_a_time():
+    sched = ScanScheduler(lambda job: None)
+    sched.submit(ScanJob("bio", scope="alice"))
+    sched.submit(ScanJob("bio", scope="bob"))
+    sched.submit(ScanJob("chem"))
+    first = sched._take()
+    second = sched._take()
+    assert (first.lab, second.lab) == ("bio", "chem")
+
+
+def test_slot_limits_concurrent_walkers():
+    sched = ScanScheduler(lambda job: None, pool_limits={"slow": 1})
+    with sched.slot("slow"):
+        assert not sched._pools["slow"].acquire(blocking=False)
+    with sched.slot("fast"):  # unknown pool: unlimited
+        pass
+    assert sched._pools["slow"].acquire(blocking=False)
+
+
+def test_stop_releases_waiters_and_workers():
+    sched = ScanScheduler(lambda job: None, concurrency=2)
+    job = sched.submit(ScanJob("bio"))
+    sched.stop()
+    assert job.wait(1)
+    assert job.error == "scan queue stopped"
+    assert sched.run_one() is False
+
+
+def test_running_student_scan_does_not_cover_another_student():
+    started = threading.Event()
+    release = threading.Event()
+
+    def runner(job):
+        started.set()
+        release.wait(5)
+
+    sched = ScanScheduler(runner)
+    sched.submit(ScanJob("bio", scope=SCOPE_STUDENTS, users=["alice"], requested_at=1))
+    worker = threading.Thread(target=sched.run_one)
+    worker.start()
+    assert started.wait(5)
+    bob = sched.submit(ScanJob("bio", scope=SCOPE_STUDENTS, users=["bob"], requested_at=1))
+    assert bob.users == ["bob"]
+    assert sched.positions() == {"bio": 1}
+    release.set()
+    worker.join(5)
@@ -0,0 +1,91 @@
+from lab_agent import scanthrottle
+from lab_agent.scanindex import ScanIndex
+from lab_agent.scanthrottle import ScanPacer, ScanThrottle, parse_iostat_latency
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+
+
+def throttle(rate, latencies=None, clock=None, hour=12, **kw):
+    clock = clock or FakeClock()
+    feed = iter(latencies or [])
+    return ScanThrottle(rate, clock=clock, sleep=clock.sleep, hour=lambda: hour,
+                        probe=lambda: next(feed, None), **kw), clock
+
+
+def test_parse_iostat_latency_uses_live_window_row():
+    boot = "tank\t1\t2\t3\t4\t5\t6\t900000\t100000\t-\t-\n"
+    live = "tank\t1\t2\t3\t4\t5\t6\t2500000\t-\t-\t-\n"
+    assert parse_iostat_latency(boot + live) == 2.5
+    assert parse_iostat_latency("tank\t1\t2\t0\t0\t0\t0\t-\t-\n") == 0.0
+    assert parse_iostat_latency("garbage") is None
+    assert parse_iostat_latency("") is None
+
+
+def test_hours_window_wraps_midnight():
+    window = scanthrottle.parse_hours("22-6")
+    assert scanthrottle.in_hours(window, 23) and scanthrottle.in_hours(window, 5)
+    assert not scanthrottle.in_hours(window, 12)
+    assert scanthrottle.parse_hours("bogus") is None
+    assert not scanthrottle.in_hours(None, 3)
+
+
+def test_bucket_holds_walk_to_rate():
+    t, clock = throttle(100)
+    slept = sum(t.consume(50) for _ in range(6))  # 300 inodes with a 100-inode burst
+    assert round(slept, 6) == 2.0
+    assert round(clock.t - 1000.0, 6) == 2.0
+
+
+def test_zero_rate_is_unlimited():
+    t, _ = throttle(0)
+    assert not t.enabled
+    assert t.consume(10**6) == 0.0
+
+
+def test_rate_backs_off_on_latency_and_recovers():
+    t, clock = throttle(1000, latencies=[80.0, 80.0, 1.0], latency_target_ms=50)
+    t.consume(1)
+    assert t.rate == 500
+    clock.t += scanthrottle.PROBE_INTERVAL_S
+    t.consume(1)
+    assert t.rate == 250
+    clock.t += scanthrottle.PROBE_INTERVAL_S
+    t.consume(1)
+    assert t.rate == 312.5
+    assert t.latency_ms == 1.0
+
+
+def test_night_hours_raise_the_ceiling():
+    t, _ = throttle(1000, latencies=[1.0], latency_target_ms=50, night_rate=4000,
+                    night_hours="0-6", hour=2)
+    t.rate = 3900
+    t.consume(1)
+    assert t.rate == 4000
+    day, _ = throttle(1000, latencies=[1.0], latency_target_ms=50, night_rate=4000,
+                      night_hours="0-6", hour=12)
+    day.consume(1)
+    assert day.rate == 1000
+
+
+def test_pacer_reports_scan_cost(tmp_path):
+    home = tmp_path / "alice"
+    (home / "d").mkdir(parents=True)
+    for i in range(5):
+        (home / "d" / f"f{i}").write_bytes(b"x")
+    t, clock = throttle(3)
+    pacer = ScanPacer({"fast": t}, clock=clock)
+    ScanIndex(str(tmp_path / "idx.db")).measure(
+        "bio", "alice", "fast", str(home), now=1, pace=pacer.for_tier("fast"))
+    stats = pacer.stats()
+    assert stats["inodes"] == 8  # two fstats + one lstat per entry (d and five files)
+    assert stats["rate_limit"] == {"fast": 3}
+    assert stats["throttled_s"] > 0
@@ -1,7 +1,10 @@
+import os
+
 import pytest
 
 from lab_agent import studentops
 from lab_agent.config import AgentConfig
+from lab_agent.executors.base import CommandResult
 from lab_agent.executors.coldfs import ColdFsError
 
 
@@ -22,9 +25,11 @@ def patch_storage(monkeypatch):
                         lambda path, uid, gid: dirs.append((path, uid, gid)))
     monkeypatch.setattr(studentops.coldfs, "remove_child",
                         lambda root, name: removed.append((root, name)))
-    monkeypatch.setattr(studentops.users, "add_user",
-                        lambda container, user, password, uid, gid:
-                        users.append(("add", container, user, uid, gid)))
+    def add_user(container, user, password, uid, gid):
+        users.append(("add", container, user, uid, gid))
+        return CommandResult(True, [], 0, f"lab-agent-ownership\t{user}\t3\t12\t0\n", "")
+
+    monkeypatch.setattr(studentops.users, "add_user", add_user)
     monkeypatch.setattr(studentops.users, "verify_ssh_login",
                         lambda container, user, password:
                         users.append(("ssh", container, user)))
@@ -39,6 +44,7 @@ def test_add_student_uses_native_host_ownership(monkeypatch):
         "lab": "bio", "username": "alice", "password": "pw", "uid": 10042, "gid": 10042,
     })
     assert result["uid"] == 10042
+    assert result["ownership"] == {"inodes": 3, "elapsed_ms": 12, "walked": False}
     assert dirs == [("/fast/bio/alice", 10042, 10042),
                     ("/cold/bio/alice", 10042, 10042)]
     assert calls == [("add", "bio-n1", "alice", 10042, 10042),
@@ -97,3 +103,79 @@ def test_cold_cleanup_is_owner_only(monkeypatch):
     client = AgentConfig(controller_url="ws://x", token="t", slow_backend="smb")
     with pytest.raises(ColdFsError, match="may not delete"):
         studentops.delete_cold_student(client, {"lab": "bio", "username": "alice"})
+
+
+def test_add_batch_reports_each_student_and_continues_past_failures(monkeypatch):
+    dirs, _, _ = patch_storage(monkeypatch)
+    monkeypatch.setattr(studentops.zfs, "list_children", lambda parent: {})
+    batches = []
+
+    def add_users(container, accounts):
+        batches.append((container, [a[0] for a in accounts]))
+        return ({name: ("useradd failed" if name == "carol" else None)
+                 for name, *_ in accounts},
+                {"alice": studentops.users.Ownership(4, 9, False)})
+
+    def verify(container, user, password):
+        if user == "dave":
+            raise studentops.docker.DockerError("ssh handshake failed")
+
+    monkeypatch.setattr(studentops.users, "add_users", add_users)
+    monkeypatch.setattr(studentops.users, "verify_ssh_login", verify)
+    students = [
+        {"username": "alice", "password": "pw", "uid": 10042},
+        {"username": "bob", "password": "pw", "uid": 99},
+        {"username": "carol", "password": "pw", "uid": 10044},
+        {"username": "dave", "password": "pw", "uid": 10045},
+        {"username": "alice", "password": "pw", "uid": 10046},
+    ]
+    result, logs = studentops.add_students(cfg(), {"lab": "bio", "students": students})
+    assert batches == [("bio-n1", ["alice", "carol", "dave"])]
+    assert [(r["username"], r["ok"], r.get("stage")) for r in result["students"]] == [
+        ("alice", True, None), ("bob", False, "validate"), ("carol", False, "account"),
+        ("dave", False, "ssh"), ("alice", False, "validate"),
+    ]
+    assert result["added"] == 1 and result["failed"] == 4
+    assert result["students"][0]["ownership"] == {"inodes": 4, "elapsed_ms": 9, "walked": False}
+    assert ("/fast/bio/dave", 10045, 10045) in dirs
+    assert "pw" not in logs
+    assert logs.splitlines()[0] == ("added 1 of 5 students to lab 'bio'; "
+                                    "initial SSH logins verified for 1")
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="chown to a student uid needs root")
+def test_recreate_plan_classifies_students(tmp_path, monkeypatch):
+    fast, cold = tmp_path / "fast", tmp_path / "cold"
+    for name in ("amy", "ben", "cat", "dan"):
+        for root in (fast, cold):
+            (root / name).mkdir(parents=True)
+            (root / name).chmod(0o700)
+            os.chown(root / name, 10042, 10042)
+    (cold / "dan").chmod(0o755)
+    storage = studentops.LabStorage(str(fast), str(cold), {
+        "fast/labs/bio/amy": 500, "fast/labs/bio/ben": 400, "fast/labs/bio/dan": 500,
+    }, {})
+    config = AgentConfig(controller_url="ws://x", token="t", slow_backend="smb")
+    plan = studentops.plan_storage(config, "bio", ["amy", "ben", "cat", "dan"], 500, None, storage)
+    assert [(p.username, p.action) for p in plan] == [
+        ("amy", "unchanged"),  # dataset at the right quota, directories already owned
+        ("ben", "online"),  # quota change applies live
+        ("cat", "migrate"),  # flat directory with data -> new quota dataset
+        ("dan", "online"),  # cold directory mode drifted
+    ]
+    assert plan[0].uid == 10042
+
+
+def test_storage_plan_is_applied_concurrently_and_reports_failures(monkeypatch):
+    seen = []
+
+    def prepare(c, lab, username, uid, gid, fast_quota, cold_quota, storage):
+        seen.append(username)
+        if username == "ben":
+            raise RuntimeError("quota busy")
+
+    monkeypatch.setattr(studentops, "prepare_student_storage", prepare)
+    plan = [studentops.StudentStorage(n, 10042, 10042, "online") for n in ("amy", "ben")]
+    failed = studentops.apply_storage_plan(cfg(), "bio", plan, 500, None, None)
+    assert sorted(seen) == ["amy", "ben"]
+    assert [(name, str(exc)) for name, exc in failed] == [("ben", "quota busy")]
@@ -1,3 +1,5 @@
+import time
+
 import pytest
 
 from lab_agent import system
@@ -67,6 +69,12 @@ def test_structured_healthy_capabilities(monkeypatch):
     assert caps.to_dict()["runtime"]["userns_start"] == 231072
 
 
+def test_only_probes_without_full_input_coverage_expire():
+    ages = system.probe_max_ages(cfg())
+    assert set(ages) == {"gpu_list", "fabric_failed", "ssh", "cuda"}
+    assert "profiles" not in ages and "pool_fast" not in ages
+
+
 def test_userns_remap_still_enabled_blocks_health(monkeypatch):
     # A remapped daemon breaks setuid passwd/sudo under --userns=host, so it must be flagged
     # critical until host-prepare removes the remap and placements are recreated.
@@ -339,3 +347,50 @@ def test_seccomp_enforcement_ok_returns_true_on_blocked(monkeypatch):
 def test_seccomp_enforcement_ok_returns_false_on_unconfined(monkeypatch):
     monkeypatch.setattr(system, "run", lambda *a, **k: CommandResult(False, [], 1, "", ""))
     assert not system._seccomp_enforcement_ok("lab-test", "alice")
+
+
+def test_numa_drift_flags_changed_or_offline_cpusets(monkeypatch):
+    runner = Runner({
+        "docker ps": (True, "bio-n\t0-15\t0\nchem-n\t16-31\t1\nphys-n\t\t\nastro-n\t0-7\t3\n"),
+        "docker inspect --format {{.HostConfig.CpusetCpus}}\t{{.HostConfig.CpusetMems}} bio-n":
+            (True, "0-15\t0"),
+        "docker inspect --format {{.HostConfig.CpusetCpus}}\t{{.HostConfig.CpusetMems}} chem-n":
+            (True, "0-31\t0,1"),
+        "docker inspect --format {{.HostConfig.CpusetCpus}}\t{{.HostConfig.CpusetMems}} astro-n":
+            (True, "0-7\t3"),
+    })
+    monkeypatch.setattr(system, "run", runner)
+    monkeypatch.setattr(system.numaplace, "topology",
+                        lambda: {0: list(range(16)), 1: list(range(16, 32))})
+    # chem was widened by hand; astro names a NUMA node the host no longer has.
+    assert system._numa_drift_containers() == ["chem-n", "astro-n"]
+
+
+def test_capabilities_dict_excludes_probe_timings(monkeypatch):
+    monkeypatch.setattr(system, "run", healthy_runner())
+    monkeypatch.setattr(system, "_security_profiles_ok", lambda cfg: True)
+    monkeypatch.setattr(system, "_loaded_driver_version", lambda: "570.1")
+    caps = system.detect_capabilities(cfg(), deep=False)
+    assert list(caps.to_dict()) == ["runtime", "nvidia", "storage", "health"]
+    names = {t.name for t in caps.probes}
+    assert {"zfs", "docker", "cdi", "cold"} <= names
+    assert next(t for t in caps.probes if t.name == "target").skipped  # shallow pass
+
+
+def test_timed_out_probe_is_reported(monkeypatch):
+    monkeypatch.setattr(system, "run", healthy_runner())
+    monkeypatch.setattr(system, "_security_profiles_ok", lambda cfg: True)
+    monkeypatch.setattr(system, "_loaded_driver_version", lambda: "570.1")
+    original = system._probes
+
+    def probes(c, deep):
+        out = original(c, deep)
+        for p in out:
+            if p.name == "cdi":
+                p.fn, p.deadline_s = (lambda v: time.sleep(2) or []), 0.05
+        return out
+
+    monkeypatch.setattr(system, "_probes", probes)
+    caps = system.detect_capabilities(cfg(), deep=False)
+    assert any(i.code == "probe_timeout" and "cdi" in i.message for i in caps.issues)
+    assert not caps.nvidia.cdi_ok
@@ -1,8 +1,11 @@
 from types import SimpleNamespace
 
+import pytest
+
 from lab_agent import telemetry, usagereport
 from lab_agent.config import AgentConfig
 from lab_agent.executors.base import CommandResult
+from lab_agent.gpu.snapshot import GpuSnapshot
 
 
 def cfg(**kw):
@@ -25,7 +28,7 @@ def test_heartbeat_uses_explicit_storage_rows(monkeypatch):
         CommandResult(True, list(args), 0, f"{args[-1]} 10 1 9", ""))
     monkeypatch.setattr(telemetry.zfs, "scrub_status",
                         lambda p: SimpleNamespace(to_dict=lambda: {"pool": p}))
-    monkeypatch.setattr(telemetry, "list_gpu_processes", lambda: [])
+    monkeypatch.setattr(telemetry, "list_gpu_processes", lambda policy=None: [])
     state = usagereport.UsageState()
     state.set_lab_level("bio", usagereport.LabLevelUsage(computed_at=1, storage=[
         {"lab": "bio", "user": None, "tier": "fast", "used_bytes": 100,
@@ -43,3 +46,17 @@ def test_heartbeat_uses_explicit_storage_rows(monkeypatch):
     assert rows[("cold", "alice")] == 1
     assert "datasets" not in hb
     assert hb["usage_scans"] == [{"lab": "bio", "scanned_at": 7}]
+
+
+def test_heartbeat_reports_the_shared_gpu_snapshot_and_its_age(monkeypatch):
+    monkeypatch.setattr(telemetry, "_pools", lambda cfg: [])
+    monkeypatch.setattr(telemetry.coldstore, "cold_status", lambda cfg: None)
+    monkeypatch.setattr(telemetry.zfs, "scrub_status",
+                        lambda p: SimpleNamespace(to_dict=lambda: {"pool": p}))
+    monkeypatch.setattr(telemetry, "list_gpu_processes",
+                        lambda policy=None: pytest.fail("read the GPUs again"))
+    monkeypatch.setattr(telemetry.time, "time", lambda: 1030.0)
+    snap = GpuSnapshot(4, 1000.0, ({"pid": 7, "vram_bytes": 1},))
+    hb = telemetry.collect_heartbeat(cfg(), None, snap)
+    assert hb["gpu_processes"] == [{"pid": 7, "vram_bytes": 1}]
+    assert hb["gpu_snapshot"] == {"seq": 4, "taken_at": 1_000_000, "age_s": 30.0}
@@ -1,3 +1,6 @@
+import os
+import subprocess
+
 import pytest
 
 from lab_agent.executors import users
@@ -67,3 +70,92 @@ def test_verify_ssh_login_uses_password_auth_without_secret_in_argv(monkeypatch)
     assert "PreferredAuthentications=password" in script
     assert "alice@127.0.0.1" in script
     assert "initial-secret" in script
+
+
+def test_add_users_is_one_exec_with_one_chpasswd_stream(monkeypatch):
+    calls = []
+
+    def fake(container, argv, input_text=None, **kwargs):
+        calls.append((argv, input_text))
+        out = ("lab-agent-ownership\talice\t2\t5\t1\n"
+               "lab-agent-account\talice\t0\t\n"
+               "lab-agent-account\tbob\t1\trefusing to replace non-symlink cold-storage path\n")
+        return CommandResult(True, argv, 0, out, "")
+
+    monkeypatch.setattr(users, "exec_in", fake)
+    errors, owned = users.add_users("lab-bio", [("alice", "s3cret:1", 10042, 10042),
+                                         ("bob", "hunter2", 10043, 10043),
+                                         ("carol", "pw", 10044, 10044)])
+    assert errors == {"alice": None,
+                      "bob": "refusing to replace non-symlink cold-storage path",
+                      "carol": "batch account script did not report this account"}
+    assert owned == {"alice": users.Ownership(2, 5, True)}
+    assert len(calls) == 1
+    argv, script = calls[0]
+    assert argv == ["sh", "-s"]
+    assert script.count("| chpasswd") == 1
+    assert "alice:s3cret:1\nbob:hunter2\ncarol:pw\n" in script
+    assert 'useradd -M -d /home/"$u" -u 10043 -g 10043' in script
+
+
+def test_add_users_rejects_multiline_passwords(monkeypatch):
+    monkeypatch.setattr(users, "exec_in", Capture())
+    with pytest.raises(DockerError):
+        users.add_users("lab-bio", [("alice", "a\nmallory:x", 10042, 10042)])
+
+
+def test_new_account_converges_ownership_without_recursive_chown(monkeypatch):
+    cap = Capture()
+    monkeypatch.setattr(users, "exec_in", cap)
+    users.add_user("lab-bio", "alice", "secret", 10042, 10042)
+    script = cap.calls[0][2]
+    assert "chown -R" not in script
+    assert 'cp -a "$src" "$dest"' in script
+    assert "-mindepth 1 -maxdepth 1 \\( ! -uid 10042 -o ! -gid 10042 \\)" in script
+    assert 'stat -c %u:%g /home/"$u")" = "10042:10042"' in script
+    assert "lab-agent-ownership" in script
+
+
+def _converge(tmp_path, home_uid):
+    skel, home = tmp_path / "skel", tmp_path / "home"
+    (skel / ".config").mkdir(parents=True)
+    (skel / ".config" / "app.conf").write_text("skel")
+    (skel / ".bashrc").write_text("skel")
+    (skel / "notes").write_text("skel")
+    (home / "data").mkdir(parents=True)
+    (home / "data" / "run.log").write_text("old")  # nested, left by root
+    (home / ".bashrc").write_text("mine")  # top-level, left by root
+    os.chown(home, home_uid, home_uid)
+    os.chown(home / "data", 10042, 10042)
+    block = users._ownership_block(10042, 10042, home=users._shell_quote(str(home)),
+                                   skel=users._shell_quote(str(skel)))
+    out = subprocess.run(["sh", "-c", f"set -e\nu=alice\n{block}"], capture_output=True,
+                         text=True, check=True).stdout
+    return home, users.ownership_reports(out)["alice"]
+
+
+def _owner(path):
+    st = os.lstat(path)
+    return st.st_uid, st.st_gid
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="chown to a student uid needs root")
+def test_ownership_block_copies_missing_skel_and_fixes_only_top_level(tmp_path):
+    home, report = _converge(tmp_path, 10042)
+    assert (home / ".config" / "app.conf").read_text() == "skel"
+    assert (home / "notes").read_text() == "skel"
+    assert (home / ".bashrc").read_text() == "mine"  # never overwritten by the skeleton
+    for path in (".config", ".config/app.conf", "notes", ".bashrc"):
+        assert _owner(home / path) == (10042, 10042)
+    assert _owner(home / "data" / "run.log") == (0, 0)  # nested: not walked
+    # .config, app.conf and notes copied; .bashrc fixed.
+    assert (report.inodes, report.walked) == (4, False)
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="chown to a student uid needs root")
+def test_ownership_block_walks_a_home_left_by_another_uid(tmp_path):
+    home, report = _converge(tmp_path, 0)
+    assert _owner(home) == (10042, 10042)
+    assert _owner(home / "data" / "run.log") == (10042, 10042)
+    # 3 copied; home, .bashrc and run.log fixed; data already the student's.
+    assert (report.inodes, report.walked) == (6, True)
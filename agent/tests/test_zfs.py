@@ -162,3 +162,12 @@ def test_scrub_status_reports_unknown_on_failure(runner):
     st = zfs.scrub_status("gone")
     assert st.healthy is False
     assert st.errors == -1
+
+
+def test_list_children_maps_unset_quota_to_none(runner):
+    runner.responses["zfs list -Hp -d 1"] = CommandResult(
+        True, [], 0,
+        "fast/labs/bio\t0\nfast/labs/bio/alice\t500\nfast/labs/bio/bob\t0\n", "")
+    assert zfs.list_children("fast/labs/bio") == {
+        "fast/labs/bio/alice": 500, "fast/labs/bio/bob": None,
+    }
@@ -679,6 +679,28 @@ If you have questions, reply to this email and {sender} ({sender_email}) will ge
       ON student_quota_alerts(placement_id, student_id, pool, ts);
     `,
   },
+  {
+    // Hourly GPU-time ledger shipped by each agent as gpu_usage events once an hour has closed. An
+    // agent re-sends a bucket it crashed before marking shipped, so rows are upserted on the bucket
+    // key; user/device are '' (not NULL) when unattributed so the key stays unique.
+    id: "0027_gpu_usage_hours",
+    sql: `
+    CREATE TABLE gpu_usage_hours (
+      node TEXT NOT NULL,
+      hour INTEGER NOT NULL,         -- epoch ms of the hour's start
+      lab TEXT NOT NULL,
+      user TEXT NOT NULL DEFAULT '',
+      device TEXT NOT NULL DEFAULT '',
+      placement_id INTEGER REFERENCES lab_placements(id) ON DELETE SET NULL,
+      held_s INTEGER NOT NULL,
+      vram_byte_s INTEGER NOT NULL,
+      sm_pct_s INTEGER NOT NULL,
+      samples INTEGER NOT NULL,
+      PRIMARY KEY (node, hour, lab, user, device)
+    );
+    CREATE INDEX idx_gpu_usage_hours_placement ON gpu_usage_hours(placement_id, hour);
+    `,
+  },
 ];
 
 function migrate(conn: Database.Database): void {
@@ -14,7 +14,7 @@ import { WebSocketServer, type WebSocket } from "ws";
 import { alertNodeOffline, alertTaskFailed, maybeAlertOnLog } from "./alerts";
 import { db } from "./db";
 import { env } from "./env";
-import { ingestTelemetry } from "./ingest";
+import { ingestGpuUsage, ingestHealth, ingestTelemetry } from "./ingest";
 import {
   completeStudentRemoval,
   confirmPlacementDestroyed,
@@ -257,6 +257,9 @@ function ingestFrame(node: string, frame: any): void {
     case "event":
       handleEvent(node, frame);
       break;
+    case "capabilities":
+      handleCapabilities(node, frame);
+      break;
     case "telemetry":
       handleTelemetry(node, frame);
       break;
@@ -265,6 +268,12 @@ function ingestFrame(node: string, frame: any): void {
   }
 }
 
+/** A fresh capability probe replaces the (possibly stale) cached set the hello frame carried. */
+function handleCapabilities(node: string, frame: any): void {
+  db().prepare("UPDATE nodes SET capabilities = ?, last_seen = ? WHERE name = ?")
+    .run(JSON.stringify(frame.capabilities ?? {}), Date.now(), node);
+}
+
 function handleResult(node: string, frame: any): void {
   // Bind the result to the node the task was queued for. A foreign/unknown UUID matches no row, so a
   // spoofing agent can't complete, fail, or poison another node's task (H-03). Drop it silently.
@@ -313,27 +322,11 @@ function handleResult(node: string, frame: any): void {
         frame.ok ? undefined : (frame.error ?? "student.add failed"),
       );
       if (frame.ok) {
-        void deliverPlacementCredential(labName, node, params.username).catch((error: unknown) => {
-          db()
-            .prepare(
-              `INSERT INTO logs (ts, node, level, source, lab, user, msg, detail)
-               VALUES (?, ?, 'ERROR', 'credential', ?, ?, 'credential delivery failed', ?)`,
-            )
-            .run(
-              Date.now(),
-              node,
-              labName,
-              params.username,
-              error instanceof Error ? error.message : String(error),
-            );
-        });
-        void maybeDeliverPlacementCompletion(labName, node).catch((error: unknown) => {
-          db().prepare(
-            `INSERT INTO logs (ts, node, level, source, lab, msg, detail)
-             VALUES (?, ?, 'ERROR', 'placement-completion', ?, 'PI completion email failed', ?)`,
-          ).run(Date.now(), node, labName, error instanceof Error ? error.message : String(error));
-        });
+        deliverCredential(labName, node, params.username);
+        deliverCompletion(labName, node);
       }
+    } else if (labName && t.action === "student.add_batch") {
+      studentBatchResult(labName, node, params, frame);
     } else if (labName && params.username && t.action === "student.remove" && frame.ok) {
       completeStudentRemoval(frame.id);
     }
@@ -348,6 +341,53 @@ function handleResult(node: string, frame: any): void {
   }
 }
 
+function deliverCredential(labName: string, node: string, username: string): void {
+  void deliverPlacementCredential(labName, node, username).catch((error: unknown) => {
+    db()
+      .prepare(
+        `INSERT INTO logs (ts, node, level, source, lab, user, msg, detail)
+         VALUES (?, ?, 'ERROR', 'credential', ?, ?, 'credential delivery failed', ?)`,
+      )
+      .run(Date.now(), node, labName, username, error instanceof Error ? error.message : String(error));
+  });
+}
+
+function deliverCompletion(labName: string, node: string): void {
+  void maybeDeliverPlacementCompletion(labName, node).catch((error: unknown) => {
+    db().prepare(
+      `INSERT INTO logs (ts, node, level, source, lab, msg, detail)
+       VALUES (?, ?, 'ERROR', 'placement-completion', ?, 'PI completion email failed', ?)`,
+    ).run(Date.now(), node, labName, error instanceof Error ? error.message : String(error));
+  });
+}
+
+/**
+ * A student.add_batch result reports each student (`result.students[]`: username, ok, stage,
+ * error). Each member is marked like a single student.add; a task that failed outright fails every
+ * student it carried.
+ */
+function studentBatchResult(labName: string, node: string, params: any, frame: any): void {
+  const rows: any[] = frame.ok && Array.isArray(frame.result?.students)
+    ? frame.result.students
+    : (Array.isArray(params.students) ? params.students : []).map((s: any) => ({
+      username: s?.username, ok: false, error: frame.error ?? "student.add_batch failed",
+    }));
+  let added = 0;
+  for (const row of rows) {
+    if (typeof row?.username !== "string") continue;
+    if (row.ok === true) {
+      markPlacementMemberState(labName, node, row.username, "active");
+      deliverCredential(labName, node, row.username);
+      added++;
+    } else {
+      const stage = typeof row.stage === "string" ? `${row.stage}: ` : "";
+      markPlacementMemberState(labName, node, row.username, "failed",
+        `${stage}${String(row.error ?? "student.add failed")}`.slice(0, 2000));
+    }
+  }
+  if (added) deliverCompletion(labName, node);
+}
+
 function handleLog(node: string, frame: any): void {
   db()
     .prepare(
@@ -397,7 +437,22 @@ function clampText(v: unknown, max: number): string | null {
 }
 
 function handleEvent(node: string, frame: any): void {
-  if (frame.kind !== "gpu") return;
+  switch (frame.kind) {
+    case "gpu":
+      handleGpuEvent(node, frame);
+      break;
+    case "gpu_usage":
+      ingestGpuUsage(node, frame.payload ?? {});
+      break;
+    case "health":
+      ingestHealth(node, frame.payload ?? {}, intOrNull(frame.ts) ?? Date.now());
+      break;
+    default:
+      break;
+  }
+}
+
+function handleGpuEvent(node: string, frame: any): void {
   const raw = frame.payload ?? {};
   // Validate the payload before it touches the DB or an email (M-01).
   const p = {
@@ -1,12 +1,12 @@
 /**
- * Ingestion of agent telemetry + scan results into the controller DB.
+ * Ingestion of agent telemetry, scan results and ledger events into the controller DB.
  *
  * A telemetry frame arrives from a specific authenticated `node`. Storage identity is explicit;
  * physical dataset names never cross the protocol boundary. Each row is resolved to the placement
  * for (lab, authenticated node), so one node cannot submit another node's usage.
  */
 
-import { alertAdmins } from "./alerts";
+import { alertAdmins, maybeAlertOnLog } from "./alerts";
 import { db } from "./db";
 import { fmtBytes } from "./format";
 import { sendQuotaEmail, sendStudentQuotaEmail } from "./mailer";
@@ -321,3 +321,111 @@ function maybeQuotaAlert(
     breakdown,
   });
 }
+
+function nonNegInt(v: unknown): number | null {
+  return typeof v === "number" && Number.isFinite(v) && v >= 0 ? Math.trunc(v) : null;
+}
+
+/** A bounded, control-char-free name field; '' when absent (ledger key columns are NOT NULL). */
+function boundedName(v: unknown, max: number): string {
+  if (typeof v !== "string") return "";
+  return Array.from(v).filter((c) => c >= " " && c !== "\x7f").join("").slice(0, max);
+}
+
+/**
+ * One closed hour of the agent's GPU-time ledger (a `gpu_usage` event). Upserted on
+ * (node, hour, lab, user, device): a bucket re-sent after an agent crash replaces itself rather
+ * than double-counting. Buckets for a lab this node does not host are dropped, like storage rows.
+ */
+export function ingestGpuUsage(node: string, payload: any): boolean {
+  const hour = nonNegInt(payload?.hour);
+  const lab = boundedName(payload?.lab, 40);
+  const held = nonNegInt(payload?.held_s);
+  const vram = nonNegInt(payload?.vram_byte_s);
+  const sm = nonNegInt(payload?.sm_pct_s);
+  const samples = nonNegInt(payload?.samples);
+  if (hour === null || !lab || held === null || vram === null || sm === null || samples === null) {
+    return false;
+  }
+  const ref = placementByLabNode(lab, node);
+  if (!ref) return false;
+  db()
+    .prepare(
+      `INSERT INTO gpu_usage_hours
+         (node, hour, lab, user, device, placement_id, held_s, vram_byte_s, sm_pct_s, samples)
+       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+       ON CONFLICT(node, hour, lab, user, device) DO UPDATE SET
+         placement_id = excluded.placement_id, held_s = excluded.held_s,
+         vram_byte_s = excluded.vram_byte_s, sm_pct_s = excluded.sm_pct_s, samples = excluded.samples`,
+    )
+    .run(node, hour, lab, boundedName(payload.user, 32), boundedName(payload.device, 64),
+      ref.placement_id, held, vram, sm, samples);
+  return true;
+}
+
+const HEALTH_STATUSES = new Set(["healthy", "warning", "critical"]);
+const HEALTH_LOG_LEVELS: Record<string, string> = { healthy: "INFO", warning: "WARN", critical: "ERROR" };
+
+interface HealthIssueRow {
+  code: string;
+  severity: string;
+  message: string;
+  repairable: boolean;
+}
+
+/**
+ * A `health` event: the agent's watch mode saw issues raised or cleared after an input changed.
+ * The node's cached capabilities take the new status and issue list (so the nodes page is current
+ * between full probes), and the transition is logged — alerting admins like any agent log line.
+ */
+export function ingestHealth(node: string, payload: any, ts: number = Date.now()): boolean {
+  const status = typeof payload?.status === "string" ? payload.status : "";
+  if (!HEALTH_STATUSES.has(status)) return false;
+  const raised: HealthIssueRow[] = (Array.isArray(payload.raised) ? payload.raised : [])
+    .slice(0, 64)
+    .map((i: any) => ({
+      code: boundedName(i?.code, 64),
+      severity: i?.severity === "critical" ? "critical" : "warning",
+      message: boundedName(i?.message, 500),
+      repairable: i?.repairable === true,
+    }))
+    .filter((i: HealthIssueRow) => i.code);
+  const cleared: string[] = (Array.isArray(payload.cleared) ? payload.cleared : [])
+    .slice(0, 64)
+    .map((c: unknown) => boundedName(c, 64))
+    .filter(Boolean);
+
+  const row = db().prepare("SELECT capabilities FROM nodes WHERE name = ?").get(node) as
+    | { capabilities: string | null }
+    | undefined;
+  if (!row) return false;
+  let caps: any = {};
+  try {
+    caps = row.capabilities ? JSON.parse(row.capabilities) : {};
+  } catch {
+    caps = {};
+  }
+  if (!caps || typeof caps !== "object" || Array.isArray(caps)) caps = {};
+  const drop = new Set([...cleared, ...raised.map((i) => i.code)]);
+  const kept = (Array.isArray(caps.health?.issues) ? caps.health.issues : []).filter(
+    (i: any) => !drop.has(i?.code),
+  );
+  caps.health = { status, issues: [...kept, ...raised] };
+  db().prepare("UPDATE nodes SET capabilities = ?, last_seen = ? WHERE name = ?")
+    .run(JSON.stringify(caps), ts, node);
+
+  const level = HEALTH_LOG_LEVELS[status];
+  const changes = [...raised.map((i) => `+${i.code}`), ...cleared.map((c) => `-${c}`)];
+  const msg = `health ${status}${changes.length ? `: ${changes.join(", ")}` : ""}`;
+  const detail = [
+    ...raised.map((i) => `[${i.severity}] ${i.code}: ${i.message}`),
+    ...cleared.map((c) => `cleared: ${c}`),
+  ].join("\n");
+  db()
+    .prepare(
+      `INSERT INTO logs (ts, node, level, source, msg, detail) VALUES (?, ?, ?, 'health', ?, ?)`,
+    )
+    .run(ts, node, level, msg, detail || null);
+  maybeAlertOnLog({ node, level, source: "health", msg, detail });
+  return true;
+}
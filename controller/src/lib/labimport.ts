@@ -19,7 +19,7 @@ import { audit } from "./audit";
 import { parseCsv } from "./csv";
 import { db } from "./db";
 import { getLab } from "./labs";
-import { listPlacements, provisionMemberOnPlacement, type ProvisionStudent } from "./placements";
+import { listPlacements, provisionMembersOnPlacement, type ProvisionStudent } from "./placements";
 
 export const MAX_IMPORT_BYTES = 1_000_000; // 1 MB
 export const MAX_IMPORT_ROWS = 5_000;
@@ -346,11 +346,8 @@ export async function applyRosterImport(labId: number, text: string, actor?: str
 
   // Provision newly-added members on any placements the lab already has. Credentials are delivered only
   // after each agent confirms success.
-  for (const student of added) {
-    for (const p of listPlacements(labId)) {
-      const res = await provisionMemberOnPlacement(p, student, actor);
-      if (res) result.provisioned += 1;
-    }
+  for (const p of listPlacements(labId)) {
+    result.provisioned += await provisionMembersOnPlacement(p, added, actor);
   }
   return result;
 }
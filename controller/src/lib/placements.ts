@@ -292,7 +292,7 @@ export async function createPlacement(input: CreatePlacementInput): Promise<Plac
        WHERE lab_members.lab_id = ? ORDER BY students.username`,
     )
     .all(input.labId) as ProvisionStudent[];
-  for (const s of roster) await provisionMemberOnPlacement(placement, s, input.actor);
+  await provisionMembersOnPlacement(placement, roster, input.actor);
 
   return placement;
 }
@@ -334,17 +334,38 @@ export function listPlacementMembers(placementId: number): PlacementMember[] {
     .all(placementId) as PlacementMember[];
 }
 
+/** One student's student.add params (student.add_batch carries a list of these). */
+function studentAddParams(
+  placement: Placement,
+  username: string,
+  password: string,
+  uid: number,
+): Record<string, unknown> {
+  return {
+    lab: placement.lab_name,
+    username,
+    password,
+    uid,
+    gid: uid,
+    student_fast_quota_bytes: placement.student_fast_quota_bytes,
+    student_cold_quota_bytes: placement.student_cold_quota_bytes,
+  };
+}
+
 /**
- * Provision one student on one placement: record the placement_member and enqueue student.add with
- * a freshly generated per-node password. The encrypted credential stays controller-side until the
- * agent reports success; only then is it emailed or made available for a one-time admin reveal.
- * Idempotent — a student already provisioned on the placement is skipped.
+ * Enqueue the accounts for one placement: a single student.add, or one student.add_batch for
+ * several so the agent reads the lab's datasets and runs the account script once per roster.
  */
-export async function provisionMemberOnPlacement(
-  placement: Placement,
-  student: ProvisionStudent,
-  actor?: string,
-): Promise<MemberProvision | null> {
+function enqueueStudentAdds(placement: Placement, adds: Record<string, unknown>[], actor?: string): void {
+  if (adds.length === 1) {
+    enqueueTask(placement.node_name, "student.add", adds[0], actor);
+  } else if (adds.length > 1) {
+    enqueueTask(placement.node_name, "student.add_batch", { lab: placement.lab_name, students: adds }, actor);
+  }
+}
+
+/** Record a provisioning placement_member with a fresh password; null if already provisioned. */
+function recordMemberProvision(placement: Placement, student: ProvisionStudent): Record<string, unknown> | null {
   const existing = db()
     .prepare("SELECT id FROM placement_members WHERE placement_id = ? AND student_id = ?")
     .get(placement.id, student.id);
@@ -359,25 +380,42 @@ export async function provisionMemberOnPlacement(
        VALUES (?, ?, 'provisioning', ?, ?, ?)`,
     )
     .run(placement.id, student.id, encryptSecret(password), now, now);
+  return studentAddParams(placement, student.username, password, student.linux_uid);
+}
 
-  enqueueTask(
-    placement.node_name,
-    "student.add",
-    {
-      lab: placement.lab_name,
-      username: student.username,
-      password,
-      uid: student.linux_uid,
-      gid: student.linux_uid,
-      student_fast_quota_bytes: placement.student_fast_quota_bytes,
-      student_cold_quota_bytes: placement.student_cold_quota_bytes,
-    },
-    actor,
-  );
-
+/**
+ * Provision one student on one placement: record the placement_member and enqueue student.add with
+ * a freshly generated per-node password. The encrypted credential stays controller-side until the
+ * agent reports success; only then is it emailed or made available for a one-time admin reveal.
+ * Idempotent — a student already provisioned on the placement is skipped.
+ */
+export async function provisionMemberOnPlacement(
+  placement: Placement,
+  student: ProvisionStudent,
+  actor?: string,
+): Promise<MemberProvision | null> {
+  const add = recordMemberProvision(placement, student);
+  if (!add) return null;
+  enqueueStudentAdds(placement, [add], actor);
   return { node: placement.node_name };
 }
 
+/**
+ * Provision several students on one placement like `provisionMemberOnPlacement`, as one
+ * student.add_batch task. Returns how many were newly provisioned.
+ */
+export async function provisionMembersOnPlacement(
+  placement: Placement,
+  students: ProvisionStudent[],
+  actor?: string,
+): Promise<number> {
+  const adds = students
+    .map((student) => recordMemberProvision(placement, student))
+    .filter((add): add is Record<string, unknown> => add !== null);
+  enqueueStudentAdds(placement, adds, actor);
+  return adds.length;
+}
+
 interface PendingCredential {
   member_id: number;
   state: MemberState;
@@ -658,8 +696,9 @@ export function updatePlacementQuota(
  * Re-add every current member of a placement. Student accounts (useradd/chpasswd) live in the
  * container's writable layer, not the bind-mounted ZFS datasets, so container.recreate wipes them
  * even though their data survives — each member needs a fresh student.add after the container comes
- * back. The agent's task queue is a single-consumer FIFO per node, so tasks enqueued here after
- * container.recreate are guaranteed to run against the new container, not the old one.
+ * back (all of them in one student.add_batch). The agent's task queue is a single-consumer FIFO per
+ * node, so tasks enqueued here after container.recreate are guaranteed to run against the new
+ * container, not the old one.
  */
 function reprovisionPlacementMembers(placement: Placement, actor?: string): void {
   const members = db()
@@ -670,7 +709,7 @@ function reprovisionPlacementMembers(placement: Placement, actor?: string): void
     )
     .all(placement.id) as { member_id: number; username: string; linux_uid: number }[];
   const now = Date.now();
-  for (const m of members) {
+  const adds = members.map((m) => {
     const password = generatePassword();
     db()
       .prepare(
@@ -679,21 +718,9 @@ function reprovisionPlacementMembers(placement: Placement, actor?: string): void
          WHERE id = ?`,
       )
       .run(encryptSecret(password), now, m.member_id);
-    enqueueTask(
-      placement.node_name,
-      "student.add",
-      {
-        lab: placement.lab_name,
-        username: m.username,
-        password,
-        uid: m.linux_uid,
-        gid: m.linux_uid,
-        student_fast_quota_bytes: placement.student_fast_quota_bytes,
-        student_cold_quota_bytes: placement.student_cold_quota_bytes,
-      },
-      actor,
-    );
-  }
+    return studentAddParams(placement, m.username, password, m.linux_uid);
+  });
+  enqueueStudentAdds(placement, adds, actor);
 }
 
 /** Recreate the container with a (possibly changed) image / container options. Preserves data. */
@@ -65,6 +65,16 @@ export const EventFrame = z.object({
   ts,
 });
 
+// Agent -> controller: capabilities re-probed after hello. Hello carries the agent's cached
+// snapshot (possibly hours old) so the link comes up without waiting on a deep probe; this frame
+// replaces it once the fresh result differs.
+export const CapabilitiesFrame = z.object({
+  type: z.literal("capabilities"),
+  node: z.string().max(63).optional(),
+  capabilities: z.record(z.string(), z.unknown()),
+  ts,
+});
+
 export const TelemetryFrame = z.object({
   type: z.literal("telemetry"),
   payload: z.record(z.string(), z.unknown()).optional(),
@@ -77,6 +87,7 @@ const InboundFrame = z.discriminatedUnion("type", [
   ReceiptFrame,
   LogFrame,
   EventFrame,
+  CapabilitiesFrame,
   TelemetryFrame,
 ]);
 
@@ -86,6 +97,7 @@ export type Result = z.infer<typeof ResultFrame>;
 export type Receipt = z.infer<typeof ReceiptFrame>;
 export type LogMsg = z.infer<typeof LogFrame>;
 export type Event = z.infer<typeof EventFrame>;
+export type Capabilities = z.infer<typeof CapabilitiesFrame>;
 export type Telemetry = z.infer<typeof TelemetryFrame>;
 
 /** Validate a parsed-JSON frame. Returns the typed frame, or null if it matches no known schema. */
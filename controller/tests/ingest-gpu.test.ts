@@ -87,4 +87,25 @@ describe("GPU telemetry ingest (Phase 9)", () => {
     });
     expect((dbmod.db().prepare("SELECT COUNT(*) AS n FROM student_quota_alerts").get() as any).n).toBe(1);
   });
+
+  it("upserts gpu_usage ledger hours on their bucket key and drops foreign labs", () => {
+    const bucket = {
+      hour: 1_700_000_000_000, lab: "bio", user: "alice", device: "GPU-0", held_s: 3600,
+      vram_byte_s: 1024, sm_pct_s: 90_000, samples: 240,
+    };
+    expect(ingest.ingestGpuUsage("gpu-1", bucket)).toBe(true);
+    // A crash before mark_shipped re-sends the same bucket: it replaces, never double-counts.
+    expect(ingest.ingestGpuUsage("gpu-1", bucket)).toBe(true);
+    expect(ingest.ingestGpuUsage("gpu-1", { ...bucket, user: null, device: null, held_s: 60 })).toBe(true);
+    expect(ingest.ingestGpuUsage("gpu-1", { ...bucket, lab: "ghost" })).toBe(false);
+    expect(ingest.ingestGpuUsage("gpu-1", { ...bucket, held_s: -1 })).toBe(false);
+    const rows = dbmod.db()
+      .prepare("SELECT user, device, held_s, placement_id FROM gpu_usage_hours ORDER BY user DESC")
+      .all() as any[];
+    expect(rows.map((r) => [r.user, r.device, r.held_s])).toEqual([
+      ["alice", "GPU-0", 3600],
+      ["", "", 60],
+    ]);
+    expect(rows[0].placement_id).not.toBeNull();
+  });
 });
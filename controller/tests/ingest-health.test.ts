@@ -0,0 +1,66 @@
+import { mkdtempSync } from "node:fs";
+import { tmpdir } from "node:os";
+import { join } from "node:path";
+import { beforeAll, describe, expect, it, vi } from "vitest";
+
+const tmp = mkdtempSync(join(tmpdir(), "lab-ctl-ingest-health-"));
+process.env.DB_PATH = join(tmp, "controller.db");
+process.env.SIGNUP_TOKEN = "t";
+process.env.AGENT_TOKEN = "t";
+process.env.SESSION_SECRET = "test-session-secret-test-session";
+
+// Count admin alerts instead of really sending email.
+const sendMail = vi.fn(async () => ({ sent: true }));
+vi.mock("../src/lib/mailer", () => ({
+  sendMail,
+  sendQuotaEmail: vi.fn(async () => ({ sent: true })),
+  sendStudentQuotaEmail: vi.fn(async () => ({ sent: true })),
+}));
+
+let dbmod: typeof import("../src/lib/db");
+let ingest: typeof import("../src/lib/ingest");
+
+beforeAll(async () => {
+  dbmod = await import("../src/lib/db");
+  ingest = await import("../src/lib/ingest");
+  const d = dbmod.db();
+  d.prepare("INSERT INTO admins (name, email, password_hash, created_at) VALUES ('A','a@uga.edu','x',0)")
+    .run();
+  const caps = {
+    zfs: true,
+    health: { status: "warning", issues: [{ code: "cdi_stale", severity: "warning", message: "old" }] },
+  };
+  d.prepare("INSERT INTO nodes (name, allowed, online, capabilities, created_at) VALUES ('gpu-1', 1, 1, ?, 0)")
+    .run(JSON.stringify(caps));
+});
+
+describe("health event ingest", () => {
+  it("applies the transition to the node's capabilities, logs it and alerts on critical", async () => {
+    const ok = ingest.ingestHealth("gpu-1", {
+      status: "critical",
+      raised: [{ code: "docker_unavailable", severity: "critical", message: "Docker daemon is unreachable" }],
+      cleared: ["cdi_stale"],
+      inputs: ["docker:daemon"],
+      probes: ["docker"],
+    }, 1_700_000_000_000);
+    expect(ok).toBe(true);
+
+    const d = dbmod.db();
+    const caps = JSON.parse((d.prepare("SELECT capabilities FROM nodes WHERE name='gpu-1'").get() as any)
+      .capabilities);
+    expect(caps.zfs).toBe(true);
+    expect(caps.health.status).toBe("critical");
+    expect(caps.health.issues.map((i: any) => i.code)).toEqual(["docker_unavailable"]);
+
+    const log = d.prepare("SELECT * FROM logs WHERE source='health'").get() as any;
+    expect(log.level).toBe("ERROR");
+    expect(log.msg).toBe("health critical: +docker_unavailable, -cdi_stale");
+    expect(log.detail).toContain("[critical] docker_unavailable: Docker daemon is unreachable");
+    await vi.waitFor(() => expect(sendMail).toHaveBeenCalled());
+  });
+
+  it("rejects an unknown status or node", () => {
+    expect(ingest.ingestHealth("gpu-1", { status: "fine", raised: [], cleared: [] })).toBe(false);
+    expect(ingest.ingestHealth("ghost", { status: "healthy", raised: [], cleared: [] })).toBe(false);
+  });
+});
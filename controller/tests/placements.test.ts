@@ -107,17 +107,20 @@ describe("createPlacement", () => {
     expect(placements.placementExists(lab.id, nodeA)).toBe(true);
   });
 
-  it("provisions the lab's existing roster onto a new placement (one student.add each)", async () => {
+  it("provisions the lab's existing roster onto a new placement in one student.add_batch", async () => {
     const lab = newLab("withroster");
     await students.addStudentToLab(lab.id, { username: "alice", email: "a@uga.edu" }, "admin");
     await students.addStudentToLab(lab.id, { username: "bob" }, "admin"); // no placement yet -> roster only
     enqueueTask.mockClear();
 
     const p = await grant(lab.id, nodeA);
-    const adds = enqueueTask.mock.calls.filter((c) => c[1] === "student.add");
-    expect(adds.map((c) => (c[2] as any).username).sort()).toEqual(["alice", "bob"]);
-    expect(adds.every((c) => Number.isInteger((c[2] as any).uid) &&
-      (c[2] as any).uid === (c[2] as any).gid)).toBe(true);
+    expect(enqueueTask.mock.calls.filter((c) => c[1] === "student.add")).toEqual([]);
+    const batches = enqueueTask.mock.calls.filter((c) => c[1] === "student.add_batch");
+    expect(batches).toHaveLength(1);
+    expect((batches[0][2] as any).lab).toBe("withroster");
+    const adds = (batches[0][2] as any).students as any[];
+    expect(adds.map((a) => a.username)).toEqual(["alice", "bob"]);
+    expect(adds.every((a) => Number.isInteger(a.uid) && a.uid === a.gid && a.password)).toBe(true);
     // placement_members recorded for both.
     const n = (dbmod.db().prepare("SELECT COUNT(*) AS n FROM placement_members WHERE placement_id=?").get(p.id) as any).n;
     expect(n).toBe(2);
@@ -256,12 +259,12 @@ describe("recreatePlacement", () => {
 
     const calls = enqueueTask.mock.calls;
     const recreateIdx = calls.findIndex((c) => c[1] === "container.recreate");
-    const addIdxs = calls.map((c, i) => (c[1] === "student.add" ? i : -1)).filter((i) => i >= 0);
+    const batchIdx = calls.findIndex((c) => c[1] === "student.add_batch");
     expect(recreateIdx).toBeGreaterThanOrEqual(0);
-    // Every re-add must be queued after container.recreate — the agent's per-node queue is a single
+    // The re-add must be queued after container.recreate — the agent's per-node queue is a single
     // FIFO consumer, so ordering here is what guarantees the add lands on the new container.
-    expect(addIdxs.every((i) => i > recreateIdx)).toBe(true);
-    expect(addIdxs.map((i) => (calls[i][2] as any).username).sort()).toEqual(["alice", "bob"]);
+    expect(batchIdx).toBeGreaterThan(recreateIdx);
+    expect(((calls[batchIdx][2] as any).students as any[]).map((a) => a.username)).toEqual(["alice", "bob"]);
 
     const n = (dbmod.db().prepare("SELECT COUNT(*) AS n FROM placement_members WHERE placement_id=?").get(p.id) as any).n;
     expect(n).toBe(2);
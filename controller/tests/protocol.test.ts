@@ -13,6 +13,15 @@ describe("parseInboundFrame", () => {
     expect(parseInboundFrame({ type: "log", msg: "hi" })?.type).toBe("log");
     expect(parseInboundFrame({ type: "event", kind: "gpu", payload: {} })?.type).toBe("event");
     expect(parseInboundFrame({ type: "telemetry", payload: {} })?.type).toBe("telemetry");
+    expect(parseInboundFrame({ type: "capabilities", node: "gpu-1", capabilities: { zfs: true } })?.type)
+      .toBe("capabilities");
+  });
+
+  it("keeps the re-probed capabilities and rejects a capabilities frame without them", () => {
+    const f = parseInboundFrame({ type: "capabilities", capabilities: { health: { status: "ok" } } }) as any;
+    expect(f.capabilities).toEqual({ health: { status: "ok" } });
+    expect(parseInboundFrame({ type: "capabilities" })).toBeNull();
+    expect(parseInboundFrame({ type: "capabilities", capabilities: "stale" })).toBeNull();
   });
 
   it("rejects unknown types and malformed frames", () => {